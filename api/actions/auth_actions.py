@@ -1,5 +1,6 @@
 from django.utils import timezone
 from api.models import ShiftInvite
+from api.utils import employer_stats
 
 
 def create_shift_invites_from_jobcore_invites(jc_invites, employee):
@@ -15,5 +16,6 @@ def create_shift_invites_from_jobcore_invites(jc_invites, employee):
                 shift_invites.append(invite)
                 # notifier.notify_invite_accepted(invite)
     ShiftInvite.objects.bulk_create(shift_invites)
+    employer_stats.refresh(invite.shift.employer_id for invite in shift_invites)
     jc_invites.delete()
     return shift_invites
@@ -0,0 +1,226 @@
+"""
+Clock in and clock out of the talents, the hot path at every shift change.
+
+A clock action reads everything it checks (the shift and its venue, whether the talent works
+the shift and the open clockins of the talent) in one query (STATE_SQL) that also locks the
+row of the talent until the end of the transaction. The open clockin cannot be locked before
+it exists, the talent row can, so two clock actions of the same talent run one after the other.
+
+A statement that waited for the lock still returns what it read before the wait, so the write
+checks the open clockin again: the clock in is a single insert (with its distance already
+calculated) that only happens if the talent has no open clockin, and the clock out a single
+update that only closes the clockin if it is still open (process_expired_shifts closes them
+too, without taking the lock). Both see what the previous holder of the lock committed.
+
+The statements are PostgreSQL only, on another database (the tests run on SQLite) the state is
+read and the clockin written with the ORM, the talent still locked first with select_for_update.
+"""
+import datetime
+import os
+
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from api.models import Clockin, Employee, Shift, ShiftEmployee
+from api.utils import employer_stats
+from api.utils.loggers import log_debug
+from api.utils.utils import haversine
+
+VALIDATE_CLOCKIN_DISTANCE = os.environ.get('VALIDATE_CLOCKIN_DISTANCE')
+DISTANCE_THRESHOLD = 0.2
+
+STATE_COLUMNS = ('employer_id', 'starting_at', 'ending_at', 'maximum_clockin_delta_minutes',
+                 'maximum_clockout_delay_minutes', 'venue_title', 'venue_latitude', 'venue_longitude',
+                 'is_employee', 'open_clockin_id', 'open_started_at', 'open_venue_title', 'open_on_shift')
+
+STATE_SQL = """
+    SELECT sh.employer_id, sh.starting_at, sh.ending_at, sh.maximum_clockin_delta_minutes,
+        sh.maximum_clockout_delay_minutes, v.title, v.latitude, v.longitude,
+        EXISTS (SELECT 1 FROM api_shiftemployee se WHERE se.shift_id = sh.id AND se.employee_id = e.id),
+        open.id, open.started_at, open.venue_title, COALESCE(open.on_shift, 0)
+    FROM api_employee e
+    JOIN api_shift sh ON sh.id = %(shift)s
+    JOIN api_venue v ON v.id = sh.venue_id
+    LEFT JOIN LATERAL (
+        SELECT c.id, c.started_at, ov.title AS venue_title,
+            COUNT(*) FILTER (WHERE c.shift_id = %(shift)s) OVER () AS on_shift
+        FROM api_clockin c
+        JOIN api_shift osh ON osh.id = c.shift_id
+        JOIN api_venue ov ON ov.id = osh.venue_id
+        WHERE c.employee_id = e.id AND c.ended_at IS NULL
+        -- the open clockin of this shift first
+        ORDER BY c.shift_id = %(shift)s DESC, c.id
+        LIMIT 1
+    ) open ON TRUE
+    WHERE e.id = %(employee)s
+    FOR UPDATE OF e
+"""
+
+CLOCKIN_SQL = """
+    INSERT INTO api_clockin ({columns})
+    SELECT {values}
+    WHERE NOT EXISTS (SELECT 1 FROM api_clockin WHERE employee_id = %s AND ended_at IS NULL)
+    RETURNING *
+"""
+
+CLOCKOUT_SQL = """
+    UPDATE api_clockin
+    SET ended_at = %(ended_at)s, latitude_out = %(latitude_out)s, longitude_out = %(longitude_out)s,
+        distance_out_miles = %(distance)s, author_id = %(author)s, updated_at = %(now)s
+    WHERE id = %(id)s AND ended_at IS NULL
+    RETURNING *
+"""
+
+
+class ClockinError(ValueError):
+    pass
+
+
+def get_state(employee_id, shift_id):
+    """What the clock actions check, locking the talent until the end of the transaction"""
+    if connection.vendor != 'postgresql':
+        return _get_state_with_orm(employee_id, shift_id)
+
+    with connection.cursor() as cursor:
+        cursor.execute(STATE_SQL, {'employee': employee_id, 'shift': shift_id})
+        row = cursor.fetchone()
+    if row is None:
+        raise ClockinError("The shift does not exist")
+    return dict(zip(STATE_COLUMNS, row))
+
+
+def _get_state_with_orm(employee_id, shift_id):
+    shift = Shift.objects.filter(id=shift_id, venue__isnull=False).values(
+        'employer_id', 'starting_at', 'ending_at', 'maximum_clockin_delta_minutes', 'maximum_clockout_delay_minutes',
+        venue_title=F('venue__title'), venue_latitude=F('venue__latitude'), venue_longitude=F('venue__longitude'),
+    ).first()
+    if shift is None or not Employee.objects.select_for_update().filter(id=employee_id).exists():
+        raise ClockinError("The shift does not exist")
+
+    # the open clockin of this shift first
+    open_clockins = sorted(
+        Clockin.objects.filter(employee_id=employee_id, ended_at__isnull=True).values_list(
+            'id', 'started_at', 'shift__venue__title', 'shift_id'),
+        key=lambda clockin: (clockin[3] != shift_id, clockin[0]))
+    open_clockin = open_clockins[0] if open_clockins else (None, None, None, None)
+    return dict(
+        shift,
+        is_employee=ShiftEmployee.objects.filter(shift_id=shift_id, employee_id=employee_id).exists(),
+        open_clockin_id=open_clockin[0], open_started_at=open_clockin[1], open_venue_title=open_clockin[2],
+        open_on_shift=len([clockin for clockin in open_clockins if clockin[3] == shift_id]),
+    )
+
+
+def ensure_distance_threshold(state, latitude, longitude, threshold=DISTANCE_THRESHOLD):
+    """Returns the distance from the talent to the venue"""
+    distance = haversine(latitude, longitude, state['venue_latitude'], state['venue_longitude'])
+
+    if distance > threshold and VALIDATE_CLOCKIN_DISTANCE != 'FALSE':
+        raise ClockinError(
+            "You need to be {} miles near {} to clock in/out. Right now you"
+            " are at {} miles".format(threshold, state['venue_title'], distance))
+
+    return round(distance, 3)
+
+
+def _insert_if_not_clocked_in(clockin):
+    if connection.vendor != 'postgresql':
+        open_clockins = Clockin.objects.filter(employee_id=clockin.employee_id, ended_at__isnull=True)
+        if open_clockins.exists():
+            return []
+        # no signals either, bulk_create only sets the id on PostgreSQL so the clockin is read back
+        Clockin.objects.bulk_create([clockin])
+        return list(open_clockins)
+
+    fields = [field for field in Clockin._meta.concrete_fields if not field.primary_key]
+    sql = CLOCKIN_SQL.format(columns=', '.join(field.column for field in fields),
+                             values=', '.join(['%s'] * len(fields)))
+    params = [field.get_db_prep_save(field.pre_save(clockin, True), connection) for field in fields]
+    return list(Clockin.objects.raw(sql, params + [clockin.employee_id]))
+
+
+def _close_if_open(clockin_id, ended_at, latitude, longitude, distance, author_id):
+    if connection.vendor != 'postgresql':
+        closed = Clockin.objects.filter(id=clockin_id, ended_at__isnull=True).update(
+            ended_at=ended_at, latitude_out=latitude, longitude_out=longitude, distance_out_miles=distance,
+            author_id=author_id, updated_at=timezone.now())
+        return list(Clockin.objects.filter(id=clockin_id)) if closed else []
+
+    return list(Clockin.objects.raw(CLOCKOUT_SQL, {
+        'id': clockin_id, 'ended_at': ended_at, 'latitude_out': latitude, 'longitude_out': longitude,
+        'distance': distance, 'author': author_id, 'now': timezone.now()}))
+
+
+def _ensure_employee(state):
+    if not state['is_employee']:
+        raise ClockinError("You cannot clock in/out to a shift that you haven't applied.")
+
+
+def clock_in(employee_id, author_id, shift_id, started_at, latitude, longitude):
+    with transaction.atomic():
+        state = get_state(employee_id, shift_id)
+
+        if state['open_clockin_id'] is not None:
+            raise ClockinError("You have already clock to a shift on " + state['open_venue_title'] + ", " +
+                               state['open_started_at'].strftime("%b %d %Y %H:%M:%S"))
+        _ensure_employee(state)
+        distance = ensure_distance_threshold(state, latitude, longitude)
+
+        # if trying to clock in after the Shift ended
+        if started_at > state['ending_at']:
+            raise ClockinError("You can't Clock in after the Shift ending time")
+
+        if state['maximum_clockin_delta_minutes'] is not None:
+            delta = datetime.timedelta(minutes=state['maximum_clockin_delta_minutes'])
+            log_debug("clockin", 'started at: %s, shift.starting_at: %s, delta: %s' % (
+                started_at, state['starting_at'], delta))
+            if started_at < state['starting_at'] - delta:
+                raise ClockinError("You can only Clock in %s minutes before the Shift has started" % delta)
+
+        # a raw insert does not send the signals, the stats of the employer are refreshed after the commit
+        clockins = _insert_if_not_clocked_in(Clockin(
+            employee_id=employee_id, author_id=author_id, shift_id=shift_id, started_at=started_at,
+            latitude_in=latitude, longitude_in=longitude, distance_in_miles=distance))
+        if not clockins:
+            # clocked in by a request that held the lock when the state was read
+            raise ClockinError("You can't Clock in with a pending Clock out")
+        employer_stats.refresh_on_commit([state['employer_id']])
+
+    return clockins[0]
+
+
+def clock_out(employee_id, author_id, shift_id, ended_at, latitude, longitude):
+    with transaction.atomic():
+        state = get_state(employee_id, shift_id)
+
+        if state['open_on_shift'] == 0:
+            raise ClockinError("There is no previous clockin for this shift")
+        if state['open_on_shift'] > 1:
+            raise ClockinError("It seems there is more than one clockin without clockout for this shift")
+        _ensure_employee(state)
+        distance = ensure_distance_threshold(state, latitude, longitude)
+
+        # only if the shift has a clockout_dely limit
+        if state['maximum_clockout_delay_minutes'] is not None:
+            delta = datetime.timedelta(minutes=state['maximum_clockout_delay_minutes'])
+            if state['ending_at'] + delta < ended_at:
+                raise ClockinError(
+                    "You can't Clock out after the Shift has ended. The System clock you out automatically")
+
+        clockins = _close_if_open(state['open_clockin_id'], ended_at, latitude, longitude, distance, author_id)
+        if not clockins:
+            # closed automatically since the state was read
+            raise ClockinError("There is no previous clockin for this shift")
+        employer_stats.refresh_on_commit([state['employer_id']])
+
+    return clockins[0]
+
+
+def clock(employee_id, author_id, data):
+    """Clocks the talent in or out with the data of a valid ClockinSerializer, raises ClockinError"""
+    if 'started_at' in data:
+        return clock_in(employee_id, author_id, data['shift_id'], data['started_at'],
+                        data['latitude_in'], data['longitude_in'])
+    return clock_out(employee_id, author_id, data['shift_id'], data['ended_at'],
+                     data['latitude_out'], data['longitude_out'])
@@ -1,6 +1,7 @@
 import pytz
 from datetime import datetime, timedelta
 from api.models import AvailabilityBlock, Position
+from api.utils import availability
 
 
 def next_weekday(d, weekday):
@@ -14,36 +15,17 @@ def create_default_availablity(employee):
 
     today = datetime.now(pytz.utc)
 
-    AvailabilityBlock.objects.filter(employee=employee).delete()
-    #   0 = Monday
-    AvailabilityBlock.objects.create(
-        employee=employee, starting_at=next_weekday(
-            today, 0), ending_at=next_weekday(
-            today, 0), allday=True, recurrent=True, recurrency_type='WEEKLY')
-    AvailabilityBlock.objects.create(
-        employee=employee, starting_at=next_weekday(
-            today, 1), ending_at=next_weekday(
-            today, 1), allday=True, recurrent=True, recurrency_type='WEEKLY')
-    AvailabilityBlock.objects.create(
-        employee=employee, starting_at=next_weekday(
-            today, 2), ending_at=next_weekday(
-            today, 2), allday=True, recurrent=True, recurrency_type='WEEKLY')
-    AvailabilityBlock.objects.create(
-        employee=employee, starting_at=next_weekday(
-            today, 3), ending_at=next_weekday(
-            today, 3), allday=True, recurrent=True, recurrency_type='WEEKLY')
-    AvailabilityBlock.objects.create(
-        employee=employee, starting_at=next_weekday(
-            today, 4), ending_at=next_weekday(
-            today, 4), allday=True, recurrent=True, recurrency_type='WEEKLY')
-    AvailabilityBlock.objects.create(
-        employee=employee, starting_at=next_weekday(
-            today, 5), ending_at=next_weekday(
-            today, 5), allday=True, recurrent=True, recurrency_type='WEEKLY')
-    AvailabilityBlock.objects.create(
-        employee=employee, starting_at=next_weekday(
-            today, 6), ending_at=next_weekday(
-            today, 6), allday=True, recurrent=True, recurrency_type='WEEKLY')
+    with availability.deferred():
+        AvailabilityBlock.objects.filter(employee=employee).delete()
+        #   0 = Monday
+        AvailabilityBlock.objects.bulk_create([
+            AvailabilityBlock(employee=employee, starting_at=next_weekday(today, weekday),
+                              ending_at=next_weekday(today, weekday), allday=True, recurrent=True,
+                              recurrency_type='WEEKLY')
+            for weekday in range(7)
+        ])
+        # bulk_create does not send the signals
+        availability.rebuild([employee.id])
 
 def add_default_positions(employee, positions=None):
     if positions is None:
@@ -0,0 +1,108 @@
+"""
+Manual invites of talents to shifts, for a whole shifts x talents matrix at once.
+
+The conflicts of every pair are read with two set queries: the talents already working on the
+shifts (ShiftEmployee) and the invites the sender already sent for them. A pair with a pending
+invite is a conflict, otherwise its last invite (rejected, expired...) is sent again: all of them
+go back to PENDING in one update and the pairs without an invite are inserted in one bulk_create.
+Each talent then gets one queued notification with all their new shifts (notifier.notify_talents_invites).
+
+Every pair gets an outcome, the pairs in conflict are reported instead of failing the batch.
+"""
+from django.utils import timezone
+
+from api.models import Employee, Shift, ShiftEmployee, ShiftInvite, PENDING
+from api.utils import employer_stats, notifier
+
+INVITED = 'INVITED'
+REINVITED = 'REINVITED'
+NOT_FOUND = 'NOT_FOUND'
+ALREADY_WORKING = 'ALREADY_WORKING'
+ALREADY_INVITED = 'ALREADY_INVITED'
+ENDED = 'ENDED'
+
+SENT = (INVITED, REINVITED)
+
+
+def _unique(ids):
+    return list(dict.fromkeys(ids))
+
+
+def _outcome(shift_id, employee_id, status, details=None, invite=None):
+    return {'shift': shift_id, 'employee': employee_id, 'status': status, 'details': details, 'invite': invite}
+
+
+def _conflict(shift, employee_id, working, pending):
+    """The outcome of a pair that cannot be invited, None when it can"""
+    if (shift.id, employee_id) in working:
+        return _outcome(shift.id, employee_id, ALREADY_WORKING, 'This talent is already working on this shift')
+    if (shift.id, employee_id) in pending:
+        return _outcome(shift.id, employee_id, ALREADY_INVITED, 'This talent already has an invite for this shift')
+    if shift.ending_at <= timezone.now():
+        return _outcome(shift.id, employee_id, ENDED,
+                        'This shift has already ended at ' + shift.ending_at.strftime('%Y-%m-%d %H:%M:%S'))
+    return None
+
+
+def invite_talents(sender, shift_ids, employee_ids, withEmail=True):
+    """
+    Invites the talents to the shifts of the employer of the sender (a Profile), returns the
+    outcome of every (shift, talent) pair in the order of the ids
+    """
+    shift_ids, employee_ids = _unique(shift_ids), _unique(employee_ids)
+    shifts = Shift.objects.filter(id__in=shift_ids, employer_id=sender.employer_id).select_related('position')
+    shifts = {shift.id: shift for shift in shifts}
+    employees = Employee.objects.filter(id__in=employee_ids).select_related('user')
+    employees = {employee.id: employee for employee in employees}
+
+    found_shifts, found_employees = list(shifts), list(employees)
+    working = set(ShiftEmployee.objects.filter(shift_id__in=found_shifts, employee_id__in=found_employees)
+                  .values_list('shift_id', 'employee_id'))
+    # a pair can have several invites, the last one is sent again unless any of them is still pending
+    invites, pending = {}, set()
+    for invite in ShiftInvite.objects.filter(sender=sender, shift_id__in=found_shifts,
+                                             employee_id__in=found_employees).order_by('id'):
+        invites[(invite.shift_id, invite.employee_id)] = invite
+        if invite.status == PENDING:
+            pending.add((invite.shift_id, invite.employee_id))
+
+    outcomes, reinvited, created = [], [], []
+    for shift_id in shift_ids:
+        for employee_id in employee_ids:
+            if shift_id not in shifts:
+                outcomes.append(_outcome(shift_id, employee_id, NOT_FOUND, 'The shift was not found'))
+                continue
+            if employee_id not in employees:
+                outcomes.append(_outcome(shift_id, employee_id, NOT_FOUND, 'The talent was not found'))
+                continue
+
+            shift, employee = shifts[shift_id], employees[employee_id]
+            outcome = _conflict(shift, employee_id, working, pending)
+            if outcome is None:
+                invite = invites.get((shift_id, employee_id))
+                if invite is not None:
+                    invite.status = PENDING
+                    reinvited.append(invite)
+                    outcome = _outcome(shift_id, employee_id, REINVITED, invite=invite)
+                else:
+                    invite = ShiftInvite(manually_created=True, employee=employee, sender=sender, shift=shift)
+                    created.append(invite)
+                    outcome = _outcome(shift_id, employee_id, INVITED, invite=invite)
+                # the shift and the talent are already loaded for the notification
+                invite.shift, invite.employee = shift, employee
+            outcomes.append(outcome)
+
+    if reinvited:
+        now = timezone.now()
+        ShiftInvite.objects.filter(id__in=[invite.id for invite in reinvited]).update(status=PENDING, updated_at=now)
+        for invite in reinvited:
+            invite.updated_at = now
+    if created:
+        notifier.create_invites(created)
+
+    sent = reinvited + created
+    if sent:
+        notifier.notify_talents_invites(sent, sender, withEmail=withEmail)
+        # bulk writes send no signals
+        employer_stats.refresh([sender.employer_id])
+    return outcomes
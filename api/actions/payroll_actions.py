@@ -0,0 +1,32 @@
+from multiprocessing import Pool
+
+from django.db import connections
+
+from api.models import Employer
+from api.serializers import payment_serializer
+
+
+def get_payroll_employers():
+    return Employer.objects.filter(payroll_period_starting_time__isnull=False)
+
+
+def generate_employer_periods(employer_id, batch_size=payment_serializer.PAYMENTS_BATCH_SIZE):
+    employer = Employer.objects.get(id=employer_id)
+    periods = payment_serializer.generate_periods_and_payments(employer, batch_size=batch_size)
+    return employer_id, len(periods)
+
+
+def generate_all_periods(workers=1):
+    """
+    Generates the missing periods of every employer with a payroll configuration,
+    with more than one worker the employers are split between worker processes.
+    Returns the number of periods generated per employer id.
+    """
+    employer_ids = list(get_payroll_employers().order_by('id').values_list('id', flat=True))
+    if workers <= 1 or len(employer_ids) <= 1:
+        return dict(generate_employer_periods(employer_id) for employer_id in employer_ids)
+
+    # the worker processes must open their own database connections
+    connections.close_all()
+    with Pool(processes=workers) as pool:
+        return dict(pool.map(generate_employer_periods, employer_ids, chunksize=1))
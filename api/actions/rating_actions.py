@@ -0,0 +1,37 @@
+from decimal import Decimal
+
+from django.db.models import Avg, Count, DecimalField, IntegerField, Max, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+from api.models import Employee, Employer, Rate
+
+
+def rebuild_aggregates(model, batch_size=5000):
+    """
+    Recalculates rating, total_ratings and rating_sum of every employee (or employer)
+    from its ratings, one UPDATE per batch of ids instead of one per row.
+    """
+    field = model._meta.model_name
+    ratings = Rate.objects.filter(**{field: OuterRef('pk')}).order_by().values(field)
+
+    def subquery(aggregate, output_field):
+        return Subquery(ratings.annotate(value=aggregate).values('value'), output_field=output_field)
+
+    average = subquery(Avg('rating'), DecimalField())
+    updated = 0
+    last_id = model.objects.aggregate(last=Max('id'))['last'] or 0
+    for start in range(0, last_id + 1, batch_size):
+        updated += model.objects.filter(id__gte=start, id__lt=start + batch_size).update(
+            rating_sum=Coalesce(subquery(Sum('rating'), DecimalField()), Value(Decimal(0))),
+            total_ratings=Coalesce(subquery(Count('id'), IntegerField()), Value(0)),
+            # employers without ratings have 0 and employees null (as when they are created)
+            rating=Coalesce(average, Value(Decimal(0))) if field == 'employer' else average,
+        )
+    return updated
+
+
+def rebuild_all_aggregates(batch_size=5000):
+    return {
+        'employees': rebuild_aggregates(Employee, batch_size=batch_size),
+        'employers': rebuild_aggregates(Employer, batch_size=batch_size),
+    }
@@ -0,0 +1,130 @@
+import time
+from datetime import timedelta
+
+from django.db.models import DateTimeField, Exists, ExpressionWrapper, F, Max, OuterRef, Q, Subquery
+from django.utils import timezone
+
+from api.models import Clockin, Shift, ShiftApplication, ShiftExpirationRun, ShiftInvite
+from api.utils import employer_stats
+
+EXPIRATION_BATCH_SIZE = 1000
+# shifts that ended since the previous run are scanned again for a while to clean up their invites
+# and applications, the lookback is never shorter than the longest clockout delay of the open shifts.
+# The open and filled shifts that ended are always scanned, however long ago they ended
+EXPIRATION_LOOKBACK = timedelta(days=1)
+
+
+def _in_batches(queryset, batch_size, action, fields=()):
+    """
+    Applies action to the rows of the queryset batch_size ids at a time,
+    the action must take the rows out of the queryset (update or delete them).
+    Returns the number of rows the action reported and the (id, *fields) of the rows processed
+    """
+    total, processed = 0, []
+    while True:
+        rows = list(queryset.order_by().values_list('id', *fields)[:batch_size])
+        if len(rows) == 0:
+            return total, processed
+        total += action(queryset.model.objects.filter(id__in=[row[0] for row in rows]))
+        processed += rows
+        if len(rows) < batch_size:
+            return total, processed
+
+
+def get_expiration_window_start(full_scan=False):
+    last_run = ShiftExpirationRun.objects.order_by('-high_water_mark').first()
+    if full_scan or last_run is None:
+        return None
+
+    longest_delay = Shift.objects.filter(status__in=['OPEN', 'FILLED']).aggregate(
+        delay=Max('maximum_clockout_delay_minutes'))['delay'] or 0
+    return last_run.high_water_mark - max(EXPIRATION_LOOKBACK, timedelta(minutes=longest_delay))
+
+
+def process_expired_shifts(batch_size=EXPIRATION_BATCH_SIZE, full_scan=False):
+    """
+    Closes the clockins nobody clocked out from, expires the shifts that ended and
+    cleans up their invites and applications with one UPDATE (or DELETE) per batch of rows.
+    Only the shifts that ended since the previous run and the ones still open or filled are
+    scanned unless full_scan is True.
+    Returns the summary of the run, it is also stored as a ShiftExpirationRun.
+    """
+    with employer_stats.deferred():
+        return _process_expired_shifts(batch_size, full_scan)
+
+
+def _process_expired_shifts(batch_size, full_scan):
+    started = time.monotonic()
+    now = timezone.now()
+    scanned_from = get_expiration_window_start(full_scan)
+
+    shifts = Shift.objects.all()
+    if scanned_from is not None:
+        # a shift with open clockins and no clockout delay expires whenever they are closed
+        shifts = shifts.filter(Q(ending_at__gt=scanned_from) | Q(status__in=['OPEN', 'FILLED'], ending_at__lte=now))
+    shift_ids = shifts.values('id')
+
+    # if now > shift.ending_at + delay the clockin is closed at shift.ending_at + delay
+    deadline = ExpressionWrapper(
+        F('ending_at') + timedelta(minutes=1) * F('maximum_clockout_delay_minutes'), output_field=DateTimeField())
+    clockins = Clockin.objects.filter(
+        shift__in=shift_ids,
+        ended_at__isnull=True,
+        status='PENDING',
+        shift__maximum_clockout_delay_minutes__isnull=False,
+        shift__ending_at__lte=now - (timedelta(minutes=1) * F('shift__maximum_clockout_delay_minutes'))
+    )
+    clockins_closed, closed_clockins = _in_batches(clockins, batch_size, lambda batch: batch.update(
+        ended_at=Subquery(Shift.objects.filter(id=OuterRef('shift_id')).annotate(
+            deadline=deadline).values('deadline')[:1]),
+        automatically_closed=True,
+        updated_at=now,
+    ), fields=('shift__employer_id',))
+
+    # also expire the shift if its still open or filled but it has ended (ended_at + delay)
+    open_clockins = Clockin.objects.filter(shift=OuterRef('pk'), ended_at__isnull=True)
+    expired = shifts.annotate(has_open_clockins=Exists(open_clockins)).filter(
+        Q(maximum_clockout_delay_minutes__isnull=False,
+          ending_at__lte=now - (timedelta(minutes=1) * F('maximum_clockout_delay_minutes'))) |
+        # or if it has passed and no clockouts are pending (delay == null)
+        Q(maximum_clockout_delay_minutes__isnull=True, ending_at__lte=now, has_open_clockins=False),
+        status__in=['OPEN', 'FILLED'],
+    )
+    shifts_expired, expired_shifts = _in_batches(expired, batch_size, lambda batch: batch.update(
+        status='EXPIRED', updated_at=now), fields=('employer_id',))
+
+    # expire pending invites and delete the applications of the expired shifts, the ones expired
+    # above are not open anymore and can be out of the window
+    expired_ids = Shift.objects.filter(status='EXPIRED')
+    if scanned_from is not None:
+        expired_ids = expired_ids.filter(Q(ending_at__gt=scanned_from) | Q(id__in=[id for id, _ in expired_shifts]))
+    expired_ids = expired_ids.values('id')
+    invites_expired, expired_invites = _in_batches(
+        ShiftInvite.objects.filter(shift__in=expired_ids, status='PENDING'), batch_size,
+        lambda batch: batch.update(status='EXPIRED', updated_at=now), fields=('shift__employer_id',))
+    applications_deleted, _ = _in_batches(
+        ShiftApplication.objects.filter(shift__in=expired_ids), batch_size,
+        lambda batch: batch.delete()[0])
+
+    # the updates skip the signals of the employer dashboard counters
+    employer_stats.refresh(set(employer_id for _, employer_id in closed_clockins + expired_shifts + expired_invites))
+
+    run = ShiftExpirationRun.objects.create(
+        high_water_mark=now,
+        scanned_from=scanned_from,
+        clockins_closed=clockins_closed,
+        shifts_expired=shifts_expired,
+        invites_expired=invites_expired,
+        applications_deleted=applications_deleted,
+        elapsed_ms=int((time.monotonic() - started) * 1000),
+    )
+
+    return {
+        'high_water_mark': run.high_water_mark,
+        'scanned_from': run.scanned_from,
+        'clockins_closed': run.clockins_closed,
+        'shifts_expired': run.shifts_expired,
+        'invites_expired': run.invites_expired,
+        'applications_deleted': run.applications_deleted,
+        'elapsed_ms': run.elapsed_ms,
+    }
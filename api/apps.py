@@ -3,3 +3,12 @@ from django.apps import AppConfig
 
 class ApiConfig(AppConfig):
     name = 'api'
+
+    def ready(self):
+        from api import authentication
+        from api.utils import availability, employer_stats, reference_cache, talent_search
+        authentication.connect_signals()
+        availability.connect_signals()
+        employer_stats.connect_signals()
+        reference_cache.connect_signals()
+        talent_search.connect_signals()
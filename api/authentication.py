@@ -0,0 +1,99 @@
+"""
+JWT authentication with a short lived cache of the authenticated principal.
+
+rest_framework_jwt loads the user on every request and the api mixins then load the profile
+and the employee or employer, the cached principal is the user with those relations already
+loaded (a single select_related query on a miss) and it is kept PRINCIPAL_TIMEOUT seconds.
+
+Every user has a version that the signals bump when the user, its profile, employee or employer
+changes. The version is part of the key so the change is seen on the next request of the same
+process; the "principals" cache is local memory by default so the other processes see it when
+their entry expires, a shared backend (redis) makes the invalidation immediate everywhere.
+"""
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.db.models.signals import post_delete, post_save
+from django.utils.translation import ugettext as _
+from rest_framework import exceptions
+from rest_framework_jwt.authentication import JSONWebTokenAuthentication
+from rest_framework_jwt.settings import api_settings
+
+CACHE_ALIAS = 'principals'
+PRINCIPAL_TIMEOUT = 60
+
+
+def get_cache():
+    return caches[CACHE_ALIAS]
+
+
+def _version_key(user_id):
+    return 'principal:{}:version'.format(user_id)
+
+
+def get_version(user_id):
+    return get_cache().get(_version_key(user_id), 0)
+
+
+def invalidate(*user_ids):
+    cache = get_cache()
+    for user_id in user_ids:
+        key = _version_key(user_id)
+        cache.add(key, 0, None)
+        try:
+            cache.incr(key)
+        except ValueError:
+            # evicted between the add and the incr
+            cache.set(key, 1, None)
+
+
+def load_principal(username):
+    """The user with its profile and the employee or employer of the profile, in one query"""
+    return User.objects.select_related('profile', 'profile__employee', 'profile__employer') \
+        .get(**{User.USERNAME_FIELD: username})
+
+
+class CachedJSONWebTokenAuthentication(JSONWebTokenAuthentication):
+    """JSONWebTokenAuthentication that reads the user from the principal cache"""
+
+    def authenticate_credentials(self, payload):
+        username = api_settings.JWT_PAYLOAD_GET_USERNAME_HANDLER(payload)
+        if not username:
+            raise exceptions.AuthenticationFailed(_('Invalid payload.'))
+
+        # old tokens without the user id are not cached
+        user_id = payload.get('user_id')
+        key = None if user_id is None else 'principal:{}:{}'.format(user_id, get_version(user_id))
+
+        user = get_cache().get(key) if key else None
+        if user is None or user.get_username() != username:
+            try:
+                user = load_principal(username)
+            except User.DoesNotExist:
+                raise exceptions.AuthenticationFailed(_('Invalid signature.'))
+            if key and user.id == user_id:
+                get_cache().set(key, user, PRINCIPAL_TIMEOUT)
+
+        if not user.is_active:
+            raise exceptions.AuthenticationFailed(_('User account is disabled.'))
+
+        return user
+
+
+def connect_signals():
+    from api.models import Employee, Employer, Profile
+
+    def user_changed(sender, instance, **kwargs):
+        invalidate(instance.id)
+
+    def profile_changed(sender, instance, **kwargs):
+        invalidate(instance.user_id)
+
+    def employer_changed(sender, instance, **kwargs):
+        # the employer is part of the principal of every user of the company
+        invalidate(*Profile.objects.filter(employer_id=instance.id).values_list('user_id', flat=True))
+
+    for model, receiver in ((User, user_changed), (Profile, profile_changed), (Employee, profile_changed),
+                            (Employer, employer_changed)):
+        label = model._meta.label_lower
+        post_save.connect(receiver, sender=model, weak=False, dispatch_uid='principal_save_{}'.format(label))
+        post_delete.connect(receiver, sender=model, weak=False, dispatch_uid='principal_delete_{}'.format(label))
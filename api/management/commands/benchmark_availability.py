@@ -0,0 +1,61 @@
+import random
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from api.models import AvailabilityBlock, AvailabilityInterval, Employee
+from api.utils import availability, benchmark
+
+
+class Command(BaseCommand):
+    help = 'Seeds thousands of talents with weekly, monthly and one time availability blocks (rolled back ' \
+           'at the end) and reports the latency of the availability index rebuild and lookups'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--employees', type=int, default=20000)
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def handle(self, *args, **options):
+        rnd = random.Random(42)
+        today = timezone.now().replace(hour=0, minute=0, second=0, microsecond=0)
+
+        with benchmark.rollback_after():
+            self.stdout.write('Seeding {} talents...'.format(options['employees']))
+            employee_ids = benchmark.seed_talents(options['employees'])
+            with availability.deferred():
+                AvailabilityBlock.objects.filter(employee_id__in=employee_ids).delete()
+
+            blocks = []
+            for employee_id in employee_ids:
+                for day in rnd.sample(range(7), rnd.randint(2, 6)):
+                    starting_at = today + timedelta(days=day, minutes=15 * rnd.randint(0, 60))
+                    blocks.append(AvailabilityBlock(
+                        employee_id=employee_id, starting_at=starting_at, allday=False, recurrent=True,
+                        recurrency_type=rnd.choice(['WEEKLY'] * 9 + ['MONTHLY']),
+                        ending_at=starting_at + timedelta(minutes=15 * rnd.randint(8, 40))))
+                if rnd.random() < 0.2:
+                    starting_at = today + timedelta(days=rnd.randint(0, 30), hours=rnd.randint(0, 12))
+                    blocks.append(AvailabilityBlock(employee_id=employee_id, starting_at=starting_at, allday=False,
+                                                    recurrent=False, ending_at=starting_at + timedelta(hours=8)))
+            AvailabilityBlock.objects.bulk_create(blocks, batch_size=benchmark.BATCH_SIZE)
+
+            stats = benchmark.measure(lambda: availability.rebuild(employee_ids), repeat=1)
+            self.stdout.write('Indexed {} blocks into {} intervals'.format(
+                len(blocks), AvailabilityInterval.objects.count()))
+            self.stdout.write(self.style.SUCCESS(benchmark.format_stats('rebuild', stats)))
+
+            one_id = employee_ids[0]
+            stats = benchmark.measure(lambda: availability.rebuild([one_id]), repeat=options['repeat'])
+            self.stdout.write(self.style.SUCCESS(benchmark.format_stats('rebuild one talent', stats)))
+
+            starting_at = today + timedelta(days=rnd.randint(1, 7), hours=rnd.randint(8, 14))
+            ending_at = starting_at + timedelta(hours=4)
+            stats = benchmark.measure(lambda: list(availability.available_employees(starting_at, ending_at)),
+                                      repeat=options['repeat'])
+            self.stdout.write('{} talents available from {} to {}'.format(len(stats['result']), starting_at, ending_at))
+            self.stdout.write(self.style.SUCCESS(benchmark.format_stats('available_employees', stats)))
+
+            stats = benchmark.measure(lambda: Employee.objects.filter(
+                id__in=availability.available_employees(starting_at, ending_at)).count(), repeat=options['repeat'])
+            self.stdout.write(self.style.SUCCESS(benchmark.format_stats('available employees count', stats)))
@@ -0,0 +1,60 @@
+import random
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from api.actions import clockin_actions
+from api.models import Clockin, Employee, Employer, Position, Shift, ShiftEmployee, Venue
+from api.utils import benchmark
+
+
+class Command(BaseCommand):
+    help = 'Seeds a shift with thousands of talents (deleted at the end) and reports the latency of their ' \
+           'clock ins and outs sent by concurrent clients, every talent sends its clock in twice at the same time'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--employees', type=int, default=2000)
+        parser.add_argument('--concurrency', type=int, default=50)
+
+    def handle(self, *args, **options):
+        position = Position.objects.create(title='Benchmark')
+        employer = Employer.objects.create(title='Benchmark')
+        employee_ids = []
+        try:
+            venue = Venue.objects.create(title='Benchmark', employer=employer, latitude=25.7617, longitude=-80.1918)
+            now = timezone.now()
+            shift = Shift.objects.create(employer=employer, venue=venue, position=position, status='FILLED',
+                                         minimum_hourly_rate=10, minimum_allowed_rating=0, starting_at=now,
+                                         ending_at=now + timedelta(hours=8), maximum_clockin_delta_minutes=None,
+                                         maximum_clockout_delay_minutes=None)
+
+            self.stdout.write('Seeding {} talents...'.format(options['employees']))
+            employee_ids = benchmark.seed_talents(options['employees'])
+            ShiftEmployee.objects.bulk_create([ShiftEmployee(shift=shift, employee_id=id) for id in employee_ids],
+                                              batch_size=benchmark.BATCH_SIZE)
+
+            requests = employee_ids * 2
+            random.Random(42).shuffle(requests)
+            stats = benchmark.measure_concurrently(
+                lambda id: clockin_actions.clock_in(id, None, shift.id, timezone.now(), venue.latitude,
+                                                    venue.longitude),
+                requests, options['concurrency'])
+            self.stdout.write(self.style.SUCCESS(benchmark.format_concurrent_stats('clock_in', stats)))
+
+            open_clockins = Clockin.objects.filter(shift=shift, ended_at__isnull=True).count()
+            self.stdout.write('{} open clockins for {} talents, {} duplicate clock ins rejected'.format(
+                open_clockins, len(employee_ids), stats['errors']))
+            if open_clockins != len(employee_ids):
+                self.stdout.write(self.style.ERROR('Some talents are clocked in more than once (or not at all)'))
+
+            stats = benchmark.measure_concurrently(
+                lambda id: clockin_actions.clock_out(id, None, shift.id, timezone.now(), venue.latitude,
+                                                     venue.longitude),
+                employee_ids, options['concurrency'])
+            self.stdout.write(self.style.SUCCESS(benchmark.format_concurrent_stats('clock_out', stats)))
+        finally:
+            employer.delete()
+            position.delete()
+            User.objects.filter(id__in=Employee.objects.filter(id__in=employee_ids).values('user_id')).delete()
@@ -0,0 +1,35 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from api.models import Employer, Position, Shift, Venue
+from api.utils import benchmark
+from api.utils.matching import get_matching_talents
+
+
+class Command(BaseCommand):
+    help = 'Seeds thousands of talents (rolled back at the end) and reports the latency of the shift talent matching'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--employees', type=int, default=50000)
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+
+        with benchmark.rollback_after():
+            position = Position.objects.create(title='Benchmark')
+            employer = Employer.objects.create(title='Benchmark')
+            venue = Venue.objects.create(title='Benchmark', employer=employer, latitude=25.7617, longitude=-80.1918)
+            starting_at = timezone.now() + timedelta(days=1)
+            shift = Shift.objects.create(employer=employer, venue=venue, position=position, status='OPEN',
+                                         application_restriction='ANYONE', minimum_hourly_rate=20,
+                                         minimum_allowed_rating=0, starting_at=starting_at,
+                                         ending_at=starting_at + timedelta(hours=8))
+
+            self.stdout.write('Seeding {} talents...'.format(options['employees']))
+            benchmark.seed_talents(options['employees'], positions=[position])
+
+            stats = benchmark.measure(lambda: get_matching_talents(shift), repeat=options['repeat'])
+            self.stdout.write('Matched {} talents'.format(len(stats['result'])))
+            self.stdout.write(self.style.SUCCESS(benchmark.format_stats('get_matching_talents', stats)))
@@ -0,0 +1,63 @@
+from django.core.management.base import BaseCommand
+from rest_framework.pagination import Cursor
+from rest_framework.test import APIRequestFactory
+
+from api.models import Employer, Position, Shift, Venue
+from api.pagination import HeaderCursorPagination
+from api.utils import benchmark
+from api.views.general_views import PublicShiftView
+
+
+class Command(BaseCommand):
+    help = 'Seeds thousands of shifts (rolled back at the end) and compares the latency of offset and cursor pagination on a deep page'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--shifts', type=int, default=20000)
+        parser.add_argument('--page', type=int, default=1000)
+        parser.add_argument('--limit', type=int, default=10)
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        limit = options['limit']
+        offset = (options['page'] - 1) * limit
+        ordering = ('-starting_at', '-id')
+        url = '/api/public/shifts'
+        factory = APIRequestFactory()
+        view = PublicShiftView.as_view()
+
+        def get(path, params=None):
+            response = view(factory.get(path, params))
+            response.render()
+            return response
+
+        with benchmark.rollback_after():
+            position = Position.objects.create(title='Benchmark')
+            employer = Employer.objects.create(title='Benchmark')
+            venue = Venue.objects.create(title='Benchmark', employer=employer, latitude=25.7617, longitude=-80.1918)
+
+            self.stdout.write('Seeding {} shifts...'.format(options['shifts']))
+            benchmark.seed_shifts(employer, venue, position, options['shifts'])
+            if offset >= Shift.objects.filter(status='OPEN').count():
+                self.stdout.write(self.style.ERROR('There are not enough shifts to reach page {}'.format(options['page'])))
+                return
+
+            # the cursor of the same page the offset pagination returns
+            last_previous = Shift.objects.filter(status='OPEN').order_by(*ordering)[offset - 1]
+            paginator = HeaderCursorPagination(ordering=ordering)
+            paginator.base_url = 'http://testserver{}?pagination=cursor&limit={}'.format(url, limit)
+            cursor_url = paginator.encode_cursor(Cursor(offset=0, reverse=False, position=str(last_previous.starting_at)))
+
+            offset_ids = [shift['id'] for shift in get(url, {'limit': limit, 'offset': offset}).data]
+            cursor_ids = [shift['id'] for shift in get(cursor_url).data]
+            if offset_ids != cursor_ids:
+                self.stdout.write(self.style.ERROR('The offset and cursor pages are different'))
+
+            for label, path, params in (
+                ('offset', url, {'limit': limit, 'offset': offset}),
+                ('cursor', cursor_url, None),
+                ('cursor with estimated count', cursor_url + '&count=estimate', None),
+                ('cursor with exact count', cursor_url + '&count=exact', None),
+            ):
+                stats = benchmark.measure(lambda: get(path, params), repeat=options['repeat'])
+                self.stdout.write(self.style.SUCCESS(benchmark.format_stats(
+                    '{} (page {})'.format(label, options['page']), stats)))
@@ -0,0 +1,42 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from api.models import Employer, PayrollPeriodPayment, Position, Venue
+from api.serializers import payment_serializer
+from api.utils import benchmark
+
+
+class Command(BaseCommand):
+    help = 'Seeds an employer with a year of clockins (rolled back at the end) and reports how long it takes to generate its payroll periods'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=365)
+        parser.add_argument('--shifts-per-day', type=int, default=4)
+        parser.add_argument('--talents-per-shift', type=int, default=10)
+        parser.add_argument('--employees', type=int, default=200)
+
+    def handle(self, *args, **options):
+
+        with benchmark.rollback_after():
+            position = Position.objects.create(title='Benchmark')
+            employer = Employer.objects.create(title='Benchmark', payroll_period_type='DAYS', payroll_period_length=7,
+                                               payroll_period_starting_time=timezone.now())
+            # the first period starts when the employer joined
+            Employer.objects.filter(id=employer.id).update(
+                created_at=timezone.now() - timedelta(days=options['days'] + 7))
+            employer.refresh_from_db()
+            venue = Venue.objects.create(title='Benchmark', employer=employer, latitude=25.7617, longitude=-80.1918)
+
+            self.stdout.write('Seeding {} days of shifts...'.format(options['days']))
+            employee_ids = benchmark.seed_talents(options['employees'], positions=[position])
+            clockins = benchmark.seed_shift_history(
+                employer, venue, position, employee_ids, days=options['days'],
+                shifts_per_day=options['shifts_per_day'], talents_per_shift=options['talents_per_shift'])
+
+            # the periods can only be generated once
+            stats = benchmark.measure(lambda: payment_serializer.generate_periods_and_payments(employer), repeat=1)
+            self.stdout.write('Generated {} periods and {} payments from {} clockins'.format(
+                len(stats['result']), PayrollPeriodPayment.objects.filter(employer=employer).count(), clockins))
+            self.stdout.write(self.style.SUCCESS(benchmark.format_stats('generate_periods_and_payments', stats)))
@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from api.models import User
+from api.utils import benchmark, talent_search
+from api.views.general_views import CatalogView
+
+
+class Command(BaseCommand):
+    help = 'Seeds thousands of talents (rolled back at the end) and measures the latency of the talent typeahead'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--talents', type=int, default=200000)
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--query', action='append', dest='queries')
+
+    def handle(self, *args, **options):
+        queries = options['queries'] or ['a', 'mar', 'garcia', 'sofia tor', 'wils 12']
+        factory = APIRequestFactory()
+        view = CatalogView.as_view()
+
+        with benchmark.rollback_after():
+            self.stdout.write('Seeding {} talents...'.format(options['talents']))
+            benchmark.seed_talents(options['talents'])
+            user = User.objects.first()
+            self.stdout.write('Search backend: {}'.format(
+                'pg_trgm' if talent_search.has_trigram() else 'substring filter'))
+
+            def get(query):
+                request = factory.get('/api/catalog/employees', {'full_name': query})
+                force_authenticate(request, user=user)
+                response = view(request, catalog_type='employees')
+                response.render()
+                return response
+
+            for query in queries:
+                stats = benchmark.measure(lambda: get(query), repeat=options['repeat'])
+                self.stdout.write(self.style.SUCCESS(benchmark.format_stats('typeahead "{}"'.format(query), stats)))
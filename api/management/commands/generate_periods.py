@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from api.actions import payroll_actions
+
+
+class Command(BaseCommand):
+    help = 'Generates the missing payroll periods (and their payments) of every employer'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=1,
+                            help='Number of worker processes, each employer is generated by one of them')
+
+    def handle(self, *args, **options):
+
+        generated = payroll_actions.generate_all_periods(workers=options['workers'])
+        self.stdout.write(self.style.SUCCESS("Successfully generated {} periods for {} employers".format(
+            sum(generated.values()), len(generated))))
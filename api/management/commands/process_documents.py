@@ -0,0 +1,35 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from api.utils import document_storage
+
+
+class Command(BaseCommand):
+    help = 'Uploads the spooled employee documents to the document storage'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=document_storage.UPLOAD_BATCH_SIZE)
+        parser.add_argument('--loop', action='store_true',
+                            help='Keep running and wait for new documents instead of exiting')
+        parser.add_argument('--sleep', type=float, default=5, help='Seconds to wait when there is nothing to upload')
+
+    def handle(self, *args, **options):
+
+        uploaded = 0
+        failed = 0
+        while True:
+            summary = document_storage.process_uploads(batch_size=options['batch_size'])
+            uploaded += summary['uploaded']
+            failed += summary['failed']
+            if summary['processed'] > 0:
+                self.stdout.write("Uploaded {uploaded} documents, {failed} failed".format(**summary))
+
+            # failing uploads are retried on the next run instead of right away
+            if summary['processed'] < options['batch_size'] or summary['uploaded'] == 0:
+                if not options['loop']:
+                    break
+                time.sleep(options['sleep'])
+
+        self.stdout.write(self.style.SUCCESS(
+            "Successfully processed documents: {} uploaded, {} failed".format(uploaded, failed)))
@@ -1,15 +1,28 @@
 from django.core.management.base import BaseCommand, CommandError
+from api.actions import shift_actions
 from api.views import hooks
 
 class Command(BaseCommand):
     help = 'Process the expired shifts, invites and clockins'
 
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=shift_actions.EXPIRATION_BATCH_SIZE)
+        parser.add_argument('--full', action='store_true',
+                            help='Scan all the shifts instead of the ones that ended since the last run')
+
     def handle(self, *args, **options):
 
-        #log = []
+        summary = hooks.process_expired_shifts(batch_size=options['batch_size'], full_scan=options['full'])
+        self.stdout.write(self.style.SUCCESS(
+            "Successfully expired shifts and clockins: {clockins_closed} clockins closed, "
+            "{shifts_expired} shifts expired, {invites_expired} invites expired and "
+            "{applications_deleted} applications deleted in {elapsed_ms}ms "
+            "(shifts ended after {scanned_from})".format(**summary)))
 
-        hooks.process_expired_shifts()
-        self.stdout.write(self.style.SUCCESS("Successfully expired shifts and clockins"))
+        def progress(done, total):
+            self.stdout.write("Deleted documents: {}/{}".format(done, total))
 
-        hooks.process_expired_documents()
-        self.stdout.write(self.style.SUCCESS("Successfully expired documents"))
\ No newline at end of file
+        summary = hooks.process_expired_documents(progress=progress)
+        self.stdout.write(self.style.SUCCESS(
+            "Successfully expired documents: {archived} archived, {deleted} deleted "
+            "and {failed} could not be deleted".format(**summary)))
@@ -0,0 +1,31 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from api.utils import notification_queue
+
+
+class Command(BaseCommand):
+    help = 'Delivers the queued email, sms and mobile notifications'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--loop', action='store_true',
+                            help='Keep running and wait for new notifications instead of exiting')
+        parser.add_argument('--sleep', type=float, default=5, help='Seconds to wait when the queue is empty')
+
+    def handle(self, *args, **options):
+
+        while True:
+            summary = notification_queue.process_queue(batch_size=options['batch_size'])
+            if summary['processed'] > 0:
+                self.stdout.write("Sent {sent} notifications, {failed} failed".format(**summary))
+
+            if summary['processed'] < options['batch_size']:
+                if not options['loop']:
+                    break
+                time.sleep(options['sleep'])
+
+        self.stdout.write(self.style.SUCCESS(
+            "Notifications waiting: {pending} ({retrying} retrying, {given_up} given up)".format(
+                **notification_queue.queue_depth())))
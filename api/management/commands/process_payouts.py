@@ -0,0 +1,36 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from api.utils import payouts
+
+
+class Command(BaseCommand):
+    help = 'Sends the charges of the payroll payouts that are processing'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=payouts.BATCH_SIZE)
+        parser.add_argument('--workers', type=int, default=payouts.WORKERS,
+                            help='Charges sent at the same time')
+        parser.add_argument('--loop', action='store_true',
+                            help='Keep running and wait for new payouts instead of exiting')
+        parser.add_argument('--sleep', type=float, default=5, help='Seconds to wait between runs')
+
+    def handle(self, *args, **options):
+
+        paid = 0
+        failed = 0
+        while True:
+            summary = payouts.process_payouts(batch_size=options['batch_size'], workers=options['workers'])
+            paid += summary['paid']
+            failed += summary['failed']
+            if summary['processed'] > 0:
+                self.stdout.write("Paid {paid} employee payments, {failed} failed".format(**summary))
+
+            # failed charges are retried on the next run instead of right away
+            if not options['loop']:
+                break
+            time.sleep(options['sleep'])
+
+        self.stdout.write(self.style.SUCCESS(
+            "Successfully processed payouts: {} paid, {} failed".format(paid, failed)))
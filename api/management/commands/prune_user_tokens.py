@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from api.utils import tokens
+
+
+class Command(BaseCommand):
+    help = 'Deletes the expired rows of the UserToken audit log and of the revoked tokens in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=tokens.PRUNE_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+
+        deleted = tokens.prune_audit_log(batch_size=options['batch_size'])
+        revoked = tokens.prune_revoked(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS("Successfully deleted {} expired tokens and {} revoked tokens".format(
+            deleted, revoked)))
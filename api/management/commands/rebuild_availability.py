@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from api.models import AvailabilityInterval, Employee
+from api.utils import availability
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the availability intervals of every employee, needed after bulk loading availability blocks'
+
+    def handle(self, *args, **options):
+
+        availability.rebuild()
+        self.stdout.write(self.style.SUCCESS(
+            "Successfully rebuilt {} availability intervals of {} employees".format(
+                AvailabilityInterval.objects.count(), Employee.objects.count())))
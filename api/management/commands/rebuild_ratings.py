@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from api.actions import rating_actions
+
+
+class Command(BaseCommand):
+    help = 'Recalculates the rating of every employee and employer from their ratings'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+
+        updated = rating_actions.rebuild_all_aggregates(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            "Successfully rebuilt the ratings of {employees} employees and {employers} employers".format(**updated)))
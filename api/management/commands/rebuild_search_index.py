@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from api.models import Employee
+from api.utils import talent_search
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the talent search document of every employee, needed after bulk loading talents'
+
+    def handle(self, *args, **options):
+
+        talent_search.refresh_documents()
+        self.stdout.write(self.style.SUCCESS(
+            "Successfully rebuilt the search documents of {} employees".format(Employee.objects.count())))
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from api.utils import employer_stats
+
+
+class Command(BaseCommand):
+    help = 'Compares the employer dashboard counters with a fresh calculation and fixes the ones that drifted'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=employer_stats.RECONCILE_BATCH_SIZE)
+        parser.add_argument('--dry-run', action='store_true', help='Only report the employers that drifted')
+
+    def handle(self, *args, **options):
+
+        summary = employer_stats.reconcile(fix=not options['dry_run'], batch_size=options['batch_size'])
+        if summary['drifted']:
+            self.stdout.write(self.style.WARNING("Counters drifted for employers: {}".format(
+                ', '.join(str(id) for id in summary['drifted']))))
+
+        self.stdout.write(self.style.SUCCESS(
+            "Successfully checked the stats of {} employers, {} drifted{}".format(
+                summary['checked'], len(summary['drifted']), ' (not fixed)' if options['dry_run'] else '')))
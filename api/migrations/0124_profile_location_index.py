@@ -0,0 +1,17 @@
+# Generated by Django 2.2.28 on 2026-10-18 17:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0123_delete_order'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='profile',
+            index=models.Index(fields=['latitude', 'longitude'], name='api_profile_latitud_a821ec_idx'),
+        ),
+    ]
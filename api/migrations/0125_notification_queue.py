@@ -0,0 +1,42 @@
+# Generated by Django 2.2.28 on 2026-10-18 17:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0124_profile_location_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notification',
+            name='attempts',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='notification',
+            name='channel',
+            field=models.CharField(choices=[('EMAIL', 'Email'), ('SMS', 'SMS'), ('FCM', 'Mobile push notification')], default='FCM', max_length=5),
+        ),
+        migrations.AddField(
+            model_name='notification',
+            name='last_error',
+            field=models.TextField(blank=True),
+        ),
+        migrations.AddField(
+            model_name='notification',
+            name='recipient',
+            field=models.CharField(blank=True, max_length=250),
+        ),
+        migrations.AddField(
+            model_name='notification',
+            name='slug',
+            field=models.CharField(blank=True, max_length=50),
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['sent', 'scheduled_at'], name='api_notific_sent_458ce3_idx'),
+        ),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 2.2.28 on 2026-10-18 17:38
+
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import Avg, Count, DecimalField, IntegerField, Max, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def rebuild_aggregates(model, rate_model, batch_size=5000):
+    # a copy of api.actions.rating_actions.rebuild_aggregates as of this migration
+    field = model._meta.model_name
+    ratings = rate_model.objects.filter(**{field: OuterRef('pk')}).order_by().values(field)
+
+    def subquery(aggregate, output_field):
+        return Subquery(ratings.annotate(value=aggregate).values('value'), output_field=output_field)
+
+    average = subquery(Avg('rating'), DecimalField())
+    last_id = model.objects.aggregate(last=Max('id'))['last'] or 0
+    for start in range(0, last_id + 1, batch_size):
+        model.objects.filter(id__gte=start, id__lt=start + batch_size).update(
+            rating_sum=Coalesce(subquery(Sum('rating'), DecimalField()), Value(Decimal(0))),
+            total_ratings=Coalesce(subquery(Count('id'), IntegerField()), Value(0)),
+            rating=Coalesce(average, Value(Decimal(0))) if field == 'employer' else average,
+        )
+
+
+def rebuild_ratings(apps, schema_editor):
+    Rate = apps.get_model('api', 'Rate')
+    rebuild_aggregates(apps.get_model('api', 'Employee'), Rate)
+    rebuild_aggregates(apps.get_model('api', 'Employer'), Rate)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0125_notification_queue'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='employee',
+            name='rating_sum',
+            field=models.DecimalField(blank=True, decimal_places=1, default=0, max_digits=12),
+        ),
+        migrations.AddField(
+            model_name='employer',
+            name='rating_sum',
+            field=models.DecimalField(blank=True, decimal_places=1, default=0, max_digits=12),
+        ),
+        migrations.RunPython(rebuild_ratings, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 2.2.28 on 2026-10-18 17:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0126_rating_sum'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ShiftExpirationRun',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('high_water_mark', models.DateTimeField()),
+                ('scanned_from', models.DateTimeField(blank=True, null=True)),
+                ('clockins_closed', models.IntegerField(default=0)),
+                ('shifts_expired', models.IntegerField(default=0)),
+                ('invites_expired', models.IntegerField(default=0)),
+                ('applications_deleted', models.IntegerField(default=0)),
+                ('elapsed_ms', models.IntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='shift',
+            index=models.Index(fields=['ending_at'], name='api_shift_ending__008314_idx'),
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 2.2.28 on 2026-10-18 18:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0127_shift_expiration_run'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='clockin',
+            index=models.Index(fields=['shift', 'employee'], name='api_clockin_shift_employee_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='clockin',
+            index=models.Index(condition=models.Q(ended_at__isnull=True), fields=['employee'], name='api_clockin_open_employee_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='clockin',
+            index=models.Index(condition=models.Q(ended_at__isnull=True), fields=['shift'], name='api_clockin_open_shift_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='employeedocument',
+            index=models.Index(fields=['status', 'expired_at'], name='api_empdoc_status_expired_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='payrollperiodpayment',
+            index=models.Index(fields=['payroll_period', 'employer', 'status'], name='api_ppp_period_employer_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='shift',
+            index=models.Index(fields=['employer', 'status', 'starting_at'], name='api_shift_employer_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='shiftinvite',
+            index=models.Index(fields=['employee', 'status'], name='api_shiftinvite_emp_status_idx'),
+        ),
+    ]
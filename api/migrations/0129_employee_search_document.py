@@ -0,0 +1,58 @@
+# Generated by Django 2.2.28 on 2026-10-18 18:15
+
+from django.db import migrations, models
+
+# pg_trgm is not available (or the user cannot create it) on every server, without
+# it the search falls back to the in-process index of api.utils.talent_search
+CREATE_TRIGRAM_INDEX = """
+DO $$
+BEGIN
+    IF EXISTS (SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm') THEN
+        CREATE EXTENSION IF NOT EXISTS pg_trgm;
+        CREATE INDEX IF NOT EXISTS api_employee_search_trgm_idx
+            ON api_employee USING GIN (search_document gin_trgm_ops);
+    END IF;
+EXCEPTION WHEN insufficient_privilege THEN
+    RAISE NOTICE 'pg_trgm could not be installed, the talent search will not use an index';
+END
+$$;
+"""
+
+DROP_TRIGRAM_INDEX = 'DROP INDEX IF EXISTS api_employee_search_trgm_idx'
+
+
+def create_trigram_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(CREATE_TRIGRAM_INDEX)
+
+
+def drop_trigram_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(DROP_TRIGRAM_INDEX)
+
+
+def refresh_documents(apps, schema_editor):
+    # a copy of api.utils.talent_search.get_document as of this migration
+    Employee = apps.get_model('api', 'Employee')
+    for employee in Employee.objects.select_related('user').prefetch_related('positions', 'badges'):
+        words = ['', employee.user.first_name, employee.user.last_name, employee.user.email]
+        words += [' '.join(item.title for item in titles) for titles in
+                  (employee.positions.all(), employee.badges.all()) if titles]
+        Employee.objects.filter(id=employee.id).update(search_document=' '.join(words).lower())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0128_hot_path_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='employee',
+            name='search_document',
+            field=models.TextField(blank=True, default='', editable=False),
+        ),
+        migrations.RunPython(create_trigram_index, drop_trigram_index),
+        migrations.RunPython(refresh_documents, migrations.RunPython.noop),
+    ]
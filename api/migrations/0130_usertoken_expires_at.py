@@ -0,0 +1,17 @@
+# Generated by Django 2.2.28 on 2026-10-18 19:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0129_employee_search_document'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='usertoken',
+            index=models.Index(fields=['expires_at'], name='api_usertok_expires_a694df_idx'),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 2.2.28 on 2026-10-18 19:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0130_usertoken_expires_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='employeedocument',
+            name='last_error',
+            field=models.TextField(blank=True),
+        ),
+        migrations.AddField(
+            model_name='employeedocument',
+            name='spooled_file',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='employeedocument',
+            name='upload_attempts',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='employeedocument',
+            name='document',
+            field=models.URLField(blank=True),
+        ),
+        migrations.AlterField(
+            model_name='employeedocument',
+            name='status',
+            field=models.CharField(choices=[('PENDING_UPLOAD', 'Pending upload'), ('UPLOAD_FAILED', 'Upload failed'), ('PENDING', 'Pending'), ('APPROVED', 'Approved'), ('ARCHIVED', 'Archived'), ('DELETED', 'Deleted'), ('REJECTED', 'Rejected')], default='PENDING', max_length=15),
+        ),
+    ]
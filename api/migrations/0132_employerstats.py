@@ -0,0 +1,30 @@
+# Generated by Django 2.2.28 on 2026-10-18 19:23
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0131_employee_document_upload'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EmployerStats',
+            fields=[
+                ('employer', models.OneToOneField(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='api.Employer')),
+                ('open_shifts', models.IntegerField(default=0)),
+                ('filled_shifts', models.IntegerField(default=0)),
+                ('upcoming_shifts', models.IntegerField(default=0)),
+                ('next_shift_starting_at', models.DateTimeField(blank=True, null=True)),
+                ('pending_applicants', models.IntegerField(default=0)),
+                ('pending_invites', models.IntegerField(default=0)),
+                ('open_clockins', models.IntegerField(default=0)),
+                ('unpaid_payments', models.IntegerField(default=0)),
+                ('unpaid_amount', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('refreshed_at', models.DateTimeField()),
+            ],
+        ),
+    ]
@@ -0,0 +1,110 @@
+# Generated by Django 2.2.28 on 2026-10-18 19:46
+
+from collections import defaultdict
+from datetime import timedelta, timezone
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+# a copy of the expansion of api.utils.availability as of this migration
+MINUTES_PER_DAY = 24 * 60
+MINUTES_PER_WEEK = 7 * MINUTES_PER_DAY
+MINUTES_PER_MONTH = 31 * MINUTES_PER_DAY
+
+
+def _epoch_minute(value):
+    return int(value.timestamp() // 60)
+
+
+def _block_intervals(starting_at, ending_at, allday, recurrent, recurrency_type):
+    if allday:
+        ending_at = starting_at + timedelta(days=1)
+    length = _epoch_minute(ending_at) - _epoch_minute(starting_at)
+    if length <= 0:
+        return []
+
+    utc = starting_at.astimezone(timezone.utc)
+    if not recurrent:
+        start = _epoch_minute(starting_at)
+        return [('DATE', start, start + length)]
+    if recurrency_type == 'MONTHLY':
+        start = (utc.day - 1) * MINUTES_PER_DAY + utc.hour * 60 + utc.minute
+        return [('MONTH', start, start + length)]
+    start = utc.weekday() * MINUTES_PER_DAY + utc.hour * 60 + utc.minute
+    return [('WEEK', start, start + length),
+            ('WEEK', start + MINUTES_PER_WEEK, start + MINUTES_PER_WEEK + length)]
+
+
+def _merge(intervals):
+    merged = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return merged
+
+
+def _employee_intervals(blocks):
+    by_period = defaultdict(list)
+    for block in blocks:
+        for period, start, end in _block_intervals(*block):
+            by_period[period].append((start, end))
+
+    intervals = []
+    for period, period_intervals in by_period.items():
+        if period == 'MONTH':
+            period_intervals += [(start - MINUTES_PER_MONTH, end - MINUTES_PER_MONTH)
+                                 for start, end in period_intervals if end > MINUTES_PER_MONTH]
+            merged = [(max(start, 0), end) for start, end in _merge(period_intervals) if end > 0]
+        elif period == 'WEEK':
+            period_intervals += [(start - MINUTES_PER_WEEK, end - MINUTES_PER_WEEK)
+                                 for start, end in period_intervals if end > MINUTES_PER_WEEK]
+            merged = [(max(start, 0), min(end, 2 * MINUTES_PER_WEEK)) for start, end in _merge(period_intervals)
+                      if end > 0]
+            if merged and merged[0][0] == 0 and merged[0][1] == 2 * MINUTES_PER_WEEK:
+                merged = [(0, None)]
+        else:
+            merged = _merge(period_intervals)
+        intervals += [(period, start, end) for start, end in merged]
+    return intervals
+
+
+def rebuild_availability(apps, schema_editor):
+    AvailabilityBlock = apps.get_model('api', 'AvailabilityBlock')
+    AvailabilityInterval = apps.get_model('api', 'AvailabilityInterval')
+
+    blocks = defaultdict(list)
+    for row in AvailabilityBlock.objects.values_list(
+            'employee_id', 'starting_at', 'ending_at', 'allday', 'recurrent', 'recurrency_type').iterator():
+        blocks[row[0]].append(row[1:])
+    AvailabilityInterval.objects.bulk_create([
+        AvailabilityInterval(employee_id=employee_id, period=period, start_minute=start, end_minute=end)
+        for employee_id, employee_blocks in blocks.items()
+        for period, start, end in _employee_intervals(employee_blocks)
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0132_employerstats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AvailabilityInterval',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.CharField(choices=[('WEEK', 'Minutes of the week'), ('MONTH', 'Minutes of the month'), ('DATE', 'Minutes since the epoch')], max_length=5)),
+                ('start_minute', models.IntegerField()),
+                ('end_minute', models.IntegerField(blank=True, null=True)),
+                ('employee', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='availability_intervals', to='api.Employee')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='availabilityinterval',
+            index=models.Index(fields=['period', 'start_minute', 'end_minute'], name='api_avail_period_minutes_idx'),
+        ),
+        migrations.RunPython(rebuild_availability, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,65 @@
+# Generated by Django 2.2.28 on 2026-10-18 20:41
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('api', '0133_availability_intervals'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PayrollPayout',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('payment_type', models.CharField(max_length=100)),
+                ('status', models.CharField(choices=[('PROCESSING', 'Processing'), ('COMPLETED', 'Completed')], default='PROCESSING', max_length=10)),
+                ('completed_at', models.DateTimeField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('employer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='payouts', to='api.Employer')),
+                ('employer_bank_account', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='api.BankAccount')),
+                ('payroll_period', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='payouts', to='api.PayrollPeriod')),
+                ('sender_user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='payouts', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='employeepayment',
+            name='payout',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='employee_payments', to='api.PayrollPayout'),
+        ),
+        migrations.AddField(
+            model_name='employeepayment',
+            name='payout_attempts',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='employeepayment',
+            name='payout_bank_account',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='api.BankAccount'),
+        ),
+        migrations.AddField(
+            model_name='employeepayment',
+            name='payout_claimed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='employeepayment',
+            name='payout_error',
+            field=models.TextField(blank=True),
+        ),
+        migrations.AddField(
+            model_name='employeepayment',
+            name='payout_status',
+            field=models.CharField(blank=True, choices=[('QUEUED', 'Queued'), ('PROCESSING', 'Processing'), ('PAID', 'Paid'), ('FAILED', 'Failed')], max_length=10),
+        ),
+        migrations.AddIndex(
+            model_name='employeepayment',
+            index=models.Index(fields=['payout', 'payout_status'], name='api_emppay_payout_idx'),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 2.2.28 on 2026-10-18 21:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0134_payroll_payouts'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='employeedocument',
+            name='spooled_file',
+        ),
+        migrations.AddField(
+            model_name='employeedocument',
+            name='spooled_content',
+            field=models.BinaryField(blank=True, null=True),
+        ),
+    ]
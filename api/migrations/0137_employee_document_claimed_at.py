@@ -0,0 +1,23 @@
+# Generated by Django 2.2.28 on 2026-10-18 22:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0136_revokedtoken'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='employeedocument',
+            name='claimed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='employeedocument',
+            name='status',
+            field=models.CharField(choices=[('PENDING_UPLOAD', 'Pending upload'), ('UPLOADING', 'Uploading'), ('UPLOAD_FAILED', 'Upload failed'), ('PENDING', 'Pending'), ('APPROVED', 'Approved'), ('ARCHIVED', 'Archived'), ('DELETED', 'Deleted'), ('REJECTED', 'Rejected')], default='PENDING', max_length=15),
+        ),
+    ]
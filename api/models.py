@@ -3,7 +3,7 @@ from decimal import Decimal
 from django.contrib.auth.models import User
 from django.contrib.postgres.fields import JSONField, ArrayField
 from django.db import models
-from django.db.models import Avg, Count
+from django.db.models import Q
 from django.utils import timezone
 from api.utils.loggers import log_debug
 
@@ -99,6 +99,8 @@ class Employer(models.Model):
     rating = models.DecimalField(
         max_digits=2, decimal_places=1, default=0, blank=True)
     total_ratings = models.IntegerField(blank=True, default=0)  # in minutes
+    # running sum of all the ratings, rating = rating_sum / total_ratings
+    rating_sum = models.DecimalField(max_digits=12, decimal_places=1, default=0, blank=True)
     badges = models.ManyToManyField(Badge, blank=True)
     status = models.CharField(max_length=25, choices=EMPLOYER_STATUS, default=APPROVED, blank=True)
    
@@ -240,6 +242,8 @@ class Employee(models.Model):
     rating = models.DecimalField(
         max_digits=2, decimal_places=1, default=None, blank=True, null=True)
     total_ratings = models.IntegerField(blank=True, default=0)  # in minutes
+    # running sum of all the ratings, rating = rating_sum / total_ratings
+    rating_sum = models.DecimalField(max_digits=12, decimal_places=1, default=0, blank=True)
     total_pending_payments = models.IntegerField(blank=True, default=0)
     maximum_job_distance_miles = models.IntegerField(default=50)
     positions = models.ManyToManyField(
@@ -249,6 +253,9 @@ class Employee(models.Model):
     created_at = models.DateTimeField(auto_now_add=True, editable=False)
     updated_at = models.DateTimeField(auto_now=True, editable=False)
 
+    # name, email, positions and badges, maintained by api.utils.talent_search
+    search_document = models.TextField(blank=True, default='', editable=False)
+
     # reponse time calculation
     response_time = models.IntegerField(blank=True, default=0)  # in minutes
     total_invites = models.IntegerField(blank=True, default=0)  # in minutes
@@ -336,6 +343,12 @@ class Profile(models.Model):
 
     status = models.CharField(max_length=25, choices=PROFILE_STATUS, default=PENDING, blank=True)
 
+    class Meta:
+        indexes = [
+            # bounding box lookups when matching talents to a venue
+            models.Index(fields=['latitude', 'longitude']),
+        ]
+
     def __str__(self):
         return self.user.username
 
@@ -384,6 +397,30 @@ class AvailabilityBlock(models.Model):
     updated_at = models.DateTimeField(auto_now=True, editable=False)
 
 
+AVAILABILITY_WEEK = 'WEEK'
+AVAILABILITY_MONTH = 'MONTH'
+AVAILABILITY_DATE = 'DATE'
+AVAILABILITY_PERIODS = (
+    (AVAILABILITY_WEEK, 'Minutes of the week'),
+    (AVAILABILITY_MONTH, 'Minutes of the month'),
+    (AVAILABILITY_DATE, 'Minutes since the epoch'),
+)
+
+
+class AvailabilityInterval(models.Model):
+    # the availability blocks of the employee expanded and merged by api.utils.availability
+    employee = models.ForeignKey(Employee, on_delete=models.CASCADE, related_name='availability_intervals')
+    period = models.CharField(max_length=5, choices=AVAILABILITY_PERIODS)
+    # [start_minute, end_minute), no end when the employee is available the whole week
+    start_minute = models.IntegerField()
+    end_minute = models.IntegerField(blank=True, null=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['period', 'start_minute', 'end_minute'], name='api_avail_period_minutes_idx'),
+        ]
+
+
 class FavoriteList(models.Model):
     title = models.TextField(max_length=100, blank=True)
     employees = models.ManyToManyField(Employee, blank=True)
@@ -505,6 +542,14 @@ class Shift(models.Model):
     maximum_clockout_delay_minutes = models.IntegerField(
         blank=True, default=15, null=True)  # in minutes
 
+    class Meta:
+        indexes = [
+            # the expiration hook only scans the shifts that ended recently
+            models.Index(fields=['ending_at']),
+            # the employer shift lists filter by status and sort by starting_at
+            models.Index(fields=['employer', 'status', 'starting_at'], name='api_shift_employer_status_idx'),
+        ]
+
     def __str__(self):
         return "{} at {} on {} - {}".format(
             self.position, self.venue, self.starting_at, self.ending_at)
@@ -559,6 +604,12 @@ class ShiftInvite(models.Model):
     created_at = models.DateTimeField(auto_now_add=True, editable=False)
     updated_at = models.DateTimeField(auto_now=True, editable=False)
 
+    class Meta:
+        indexes = [
+            # the talent pending invites
+            models.Index(fields=['employee', 'status'], name='api_shiftinvite_emp_status_idx'),
+        ]
+
     def __str__(self):
         return str(self.employee) + " for " + str(self.shift) + " on " + self.created_at.strftime(
             "%m/%d/%Y, %H:%M:%S") + " (" + self.status + ")"
@@ -571,10 +622,32 @@ class UserToken(models.Model):
     updated_at = models.DateTimeField(auto_now=True, editable=False)
     expires_at = models.DateTimeField()
 
+    class Meta:
+        indexes = [
+            # prune_user_tokens
+            models.Index(fields=['expires_at']),
+        ]
+
     def __str__(self):
         return self.email + " " + self.token
 
 
+class RevokedToken(models.Model):
+    """The token ids (jti) of the single use links that were already used (api.utils.tokens)"""
+    jti = models.CharField(max_length=32, unique=True)
+    expires_at = models.DateTimeField()
+    created_at = models.DateTimeField(auto_now_add=True, editable=False)
+
+    class Meta:
+        indexes = [
+            # prune_user_tokens
+            models.Index(fields=['expires_at']),
+        ]
+
+    def __str__(self):
+        return self.jti
+
+
 PENDING = 'PENDING'
 ACCEPTED = 'ACCEPTED'
 COMPANY_PENDING = 'COMPANY'
@@ -626,26 +699,48 @@ class Rate(models.Model):
 
     def save(self, *args, **kwargs):
         log_debug('general', 'save_rate')
+        is_new = self._state.adding
 
         super().save(*args, **kwargs)  # Call the "real" save() method.
 
-        # Calculate avg and sumatory
-        obj = None
-        if self.employee is not None:
-            obj = self.employee
-            new_ratings = (
-                Employee.objects.aggregate(new_avg=Avg('rate__rating'), new_total=Count('rate__id'))
+        if is_new:
+            Rate.update_aggregates([self])
+
+    def delete(self, *args, **kwargs):
+        Rate.update_aggregates([self], sign=-1)
+        return super().delete(*args, **kwargs)
+
+    @staticmethod
+    def update_aggregates(rates, sign=1):
+        """
+        Adds (or removes, with sign=-1) the ratings to the running sum and count
+        of the rated employees and employers. Every entity is updated once with an
+        atomic UPDATE, no matter how many of the rates are for it.
+        """
+        totals = {}
+        for rate in rates:
+            if rate.employee_id is not None:
+                key = (Employee, rate.employee_id)
+            elif rate.employer_id is not None:
+                key = (Employer, rate.employer_id)
+            else:
+                continue
+            rating_sum, count = totals.get(key, (Decimal(0), 0))
+            totals[key] = (rating_sum + Decimal(rate.rating) * sign, count + sign)
+
+        for (model, pk), (rating_sum, count) in totals.items():
+            new_sum = models.F('rating_sum') + rating_sum
+            new_total = models.F('total_ratings') + count
+            model.objects.filter(pk=pk).update(
+                rating_sum=new_sum,
+                total_ratings=new_total,
+                # the right side is evaluated with the values before the update
+                rating=models.Case(
+                    models.When(total_ratings__gt=-count, then=models.ExpressionWrapper(
+                        new_sum / new_total, output_field=models.DecimalField())),
+                    default=models.Value(Decimal(0) if model is Employer else None),
+                    output_field=models.DecimalField()),
             )
-        elif self.employer is not None:
-            obj = self.employer
-            new_ratings = (
-                Employer.objects.aggregate(new_avg=Avg('rate__rating'), new_total=Count('rate__id'))
-            )
-
-        if obj is not None:
-            obj.total_ratings = new_ratings['new_total']
-            obj.rating = new_ratings['new_avg']
-            obj.save()
 
 
 class FCMDevice(models.Model):
@@ -659,6 +754,16 @@ class FCMDevice(models.Model):
         return self.user.username
 
 
+EMAIL = 'EMAIL'
+SMS = 'SMS'
+FCM = 'FCM'
+NOTIFICATION_CHANNELS = (
+    (EMAIL, 'Email'),
+    (SMS, 'SMS'),
+    (FCM, 'Mobile push notification'),
+)
+
+
 class Notification(models.Model):
     owner = models.ForeignKey(
         Profile, related_name='notifications', on_delete=models.CASCADE,
@@ -673,7 +778,23 @@ class Notification(models.Model):
     created_at = models.DateTimeField(auto_now_add=True, editable=False)
     updated_at = models.DateTimeField(auto_now=True, editable=False)
 
+    # outbound queue, the message is rendered from the template slug when it is sent
+    channel = models.CharField(max_length=5, choices=NOTIFICATION_CHANNELS, default=FCM)
+    slug = models.CharField(max_length=50, blank=True)
+    # email address or phone number, push notifications go to the owner devices
+    recipient = models.CharField(max_length=250, blank=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+
+    class Meta:
+        indexes = [
+            # the worker only looks for pending notifications
+            models.Index(fields=['sent', 'scheduled_at']),
+        ]
+
     def __str__(self):
+        if self.owner is None:
+            return self.recipient + ":" + self.title
         return self.owner.user.email + ":" + self.title
 
 
@@ -713,11 +834,36 @@ class Clockin(models.Model):
         choices=CLOCKIN_STATUS,
         default=PENDING)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['shift', 'employee'], name='api_clockin_shift_employee_idx'),
+            # only a few clockins are open (ended_at IS NULL) at any time
+            models.Index(fields=['employee'], condition=Q(ended_at__isnull=True),
+                         name='api_clockin_open_employee_idx'),
+            models.Index(fields=['shift'], condition=Q(ended_at__isnull=True), name='api_clockin_open_shift_idx'),
+        ]
+
     def __str__(self):
         return self.employee.user.first_name + " " + self.employee.user.last_name + ", from " + str(
             self.started_at) + " to " + str(self.ended_at)
 
 
+class ShiftExpirationRun(models.Model):
+    # every process_expired run only scans the shifts that ended
+    # after the high water mark of the previous run
+    high_water_mark = models.DateTimeField()
+    scanned_from = models.DateTimeField(blank=True, null=True)
+    clockins_closed = models.IntegerField(default=0)
+    shifts_expired = models.IntegerField(default=0)
+    invites_expired = models.IntegerField(default=0)
+    applications_deleted = models.IntegerField(default=0)
+    elapsed_ms = models.IntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True, editable=False)
+
+    def __str__(self):
+        return "Expiration run up to {}".format(self.high_water_mark)
+
+
 OPEN = 'OPEN'
 FINALIZED = 'FINALIZED'
 PAID = 'PAID'
@@ -799,6 +945,42 @@ class PayrollPeriodPayment(models.Model):
     created_at = models.DateTimeField(auto_now_add=True, editable=False)
     updated_at = models.DateTimeField(auto_now=True, editable=False)
 
+    class Meta:
+        indexes = [
+            # the payments of a period are always filtered by employer and status
+            models.Index(fields=['payroll_period', 'employer', 'status'], name='api_ppp_period_employer_idx'),
+        ]
+
+
+QUEUED = 'QUEUED'
+PROCESSING = 'PROCESSING'
+FAILED = 'FAILED'
+PAYOUT_STATUS = (
+    (PROCESSING, 'Processing'),
+    (COMPLETED, 'Completed'),
+)
+EMPLOYEE_PAYOUT_STATUS = (
+    (QUEUED, 'Queued'),
+    (PROCESSING, 'Processing'),
+    (PAID, 'Paid'),
+    (FAILED, 'Failed'),
+)
+
+
+class PayrollPayout(models.Model):
+    """The payment of all the employee payments of a period at once, see api.utils.payouts"""
+    payroll_period = models.ForeignKey(PayrollPeriod, on_delete=models.PROTECT, related_name='payouts')
+    employer = models.ForeignKey(Employer, on_delete=models.CASCADE, related_name='payouts')
+    # one of PaymentTransaction.PAYMENT_TYPES
+    payment_type = models.CharField(max_length=100)
+    employer_bank_account = models.ForeignKey('BankAccount', on_delete=models.SET_NULL, blank=True, null=True,
+                                              related_name='+')
+    sender_user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='payouts')
+    status = models.CharField(max_length=10, choices=PAYOUT_STATUS, default=PROCESSING)
+    completed_at = models.DateTimeField(blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True, editable=False)
+    updated_at = models.DateTimeField(auto_now=True, editable=False)
+
 
 class EmployeePayment(models.Model):
     payroll_period = models.ForeignKey(PayrollPeriod, on_delete=models.PROTECT, related_name='employee_payments')
@@ -821,6 +1003,43 @@ class EmployeePayment(models.Model):
     created_at = models.DateTimeField(auto_now_add=True, editable=False)
     updated_at = models.DateTimeField(auto_now=True, editable=False)
 
+    # state of the payment in its last payout
+    payout = models.ForeignKey(PayrollPayout, on_delete=models.SET_NULL, blank=True, null=True,
+                               related_name='employee_payments')
+    payout_status = models.CharField(max_length=10, choices=EMPLOYEE_PAYOUT_STATUS, blank=True)
+    payout_bank_account = models.ForeignKey('BankAccount', on_delete=models.SET_NULL, blank=True, null=True,
+                                            related_name='+')
+    payout_attempts = models.IntegerField(default=0)
+    payout_error = models.TextField(blank=True)
+    # when a worker took the payment, a payment taken too long ago belongs to a crashed worker
+    payout_claimed_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        indexes = [
+            # the payout workers only look for the queued payments of a payout
+            models.Index(fields=['payout', 'payout_status'], name='api_emppay_payout_idx'),
+        ]
+
+
+class EmployerStats(models.Model):
+    # dashboard counters of the employer, kept up to date by api.utils.employer_stats
+    employer = models.OneToOneField(Employer, on_delete=models.CASCADE, primary_key=True,
+                                    db_constraint=False, related_name='stats')
+    open_shifts = models.IntegerField(default=0)
+    filled_shifts = models.IntegerField(default=0)
+    upcoming_shifts = models.IntegerField(default=0)
+    # upcoming_shifts is outdated once this shift starts
+    next_shift_starting_at = models.DateTimeField(blank=True, null=True)
+    pending_applicants = models.IntegerField(default=0)
+    pending_invites = models.IntegerField(default=0)
+    open_clockins = models.IntegerField(default=0)
+    unpaid_payments = models.IntegerField(default=0)
+    unpaid_amount = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    refreshed_at = models.DateTimeField()
+
+    def __str__(self):
+        return "Stats of {}".format(self.employer_id)
+
 
 class PaymentDeduction(models.Model):
     employer = models.ForeignKey(Employer, related_name='deductions', on_delete=models.CASCADE)
@@ -886,30 +1105,49 @@ class Document(models.Model):
 
 
 class EmployeeDocument(models.Model):
+    PENDING_UPLOAD = 'PENDING_UPLOAD'
+    UPLOADING = 'UPLOADING'
+    UPLOAD_FAILED = 'UPLOAD_FAILED'
     PENDING = 'PENDING'
     APPROVED = 'APPROVED'
     ARCHIVED = 'ARCHIVED'
     DELETED = 'DELETED'
     REJECTED = 'REJECTED'
     DOCUMENT_STATUS = (
+        (PENDING_UPLOAD, 'Pending upload'),
+        (UPLOADING, 'Uploading'),
+        (UPLOAD_FAILED, 'Upload failed'),
         (PENDING, 'Pending'),
         (APPROVED, 'Approved'),
         (ARCHIVED, 'Archived'),
         (DELETED, 'Deleted'),
         (REJECTED, 'Rejected'),
     )
-    document = models.URLField()
+    # empty until the spooled file is uploaded (api.utils.document_storage)
+    document = models.URLField(blank=True)
 
     public_id = models.CharField(max_length=80, null=True)
+    # the uploaded file until it is on the storage
+    spooled_content = models.BinaryField(blank=True, null=True)
+    upload_attempts = models.IntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    # when a worker claimed the upload (UPLOADING)
+    claimed_at = models.DateTimeField(blank=True, null=True)
 
     rejected_reason = models.CharField(max_length=255, blank=True)
-    status = models.CharField(max_length=8, choices=DOCUMENT_STATUS, default=PENDING)
+    status = models.CharField(max_length=15, choices=DOCUMENT_STATUS, default=PENDING)
     expired_at = models.DateTimeField(blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True, editable=False)
     updated_at = models.DateTimeField(auto_now=True, editable=False)
     employee = models.ForeignKey(Employee, on_delete=models.CASCADE)
     document_type = models.ForeignKey(Document, on_delete=models.CASCADE)
 
+    class Meta:
+        indexes = [
+            # the expiration hook looks for the deleted and expired documents
+            models.Index(fields=['status', 'expired_at'], name='api_empdoc_status_expired_idx'),
+        ]
+
 
 class AppVersion(models.Model):
     build_number = models.IntegerField(default=94)
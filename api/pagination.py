@@ -1,10 +1,13 @@
 
 from collections import OrderedDict
 
+from django.db import connection
 from rest_framework import pagination
 from rest_framework.response import Response
 from rest_framework.utils.urls import replace_query_param, remove_query_param
 
+from api.utils import explain
+
 
 class EnvelopingMixin:
     def paginate_queryset(self, queryset, request, view=None):
@@ -110,7 +113,36 @@ class HeaderLimitOffsetPagination(EnvelopingMixin, pagination.LimitOffsetPaginat
         return replace_query_param(url, self.offset_query_param, offset)
 
 
+def estimate_count(queryset):
+    """Row count estimated by the postgres planner, it does not scan the table like COUNT(*)"""
+    if connection.vendor != 'postgresql':
+        # only postgres has a JSON plan with the estimate
+        return queryset.count()
+    return explain.get_plan(queryset.order_by())['Plan Rows']
+
+
 class HeaderCursorPagination(EnvelopingMixin, pagination.CursorPagination):
+    """
+    Keyset pagination, the page is found with a WHERE on the first ordering field instead
+    of an OFFSET so deep pages are as fast as the first one. The ordering must end with
+    a unique field (like -id) to break the ties.
+    The x-total-count header is skipped unless ?count=estimate or ?count=exact is sent.
+    """
+    page_size_query_param = 'limit'
+    count_query_param = 'count'
+
+    def __init__(self, ordering=None):
+        if ordering is not None:
+            self.ordering = ordering
+
+    def paginate_queryset(self, queryset, request, view=None):
+        count = request.GET.get(self.count_query_param)
+        self.count = None
+        if count == 'exact':
+            self.count = queryset.count()
+        elif count == 'estimate':
+            self.count = estimate_count(queryset)
+        return super().paginate_queryset(queryset, request, view)
 
     def get_paginated_response(self, data):
         next_url = self.get_next_link()
@@ -125,11 +157,24 @@ class HeaderCursorPagination(EnvelopingMixin, pagination.CursorPagination):
                 links.append('<{}>; rel="{}"'.format(url, label))
 
         headers = {'Link': ', '.join(links)} if links else {}
+        if self.count is not None:
+            headers['x-total-count'] = self.count
 
         if self.use_envelope:
             return Response(OrderedDict([
+                ('count', self.count),
                 ('next', next_url),
                 ('previous', previous_url),
                 ('results', data)
             ]), headers=headers)
-        return Response(data, headers=headers)
\ No newline at end of file
+        return Response(data, headers=headers)
+
+
+def get_list_paginator(request, ordering):
+    """
+    Lists use limit/offset pagination unless the client opts in the cursor
+    pagination with ?pagination=cursor (the next and previous links keep it)
+    """
+    if request.GET.get('pagination') == 'cursor':
+        return HeaderCursorPagination(ordering=ordering)
+    return HeaderLimitOffsetPagination()
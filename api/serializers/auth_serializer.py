@@ -17,11 +17,10 @@ from api.actions import employee_actions, auth_actions
 from api.models import (
     User, Employer, Employee, Profile,
     JobCoreInvite, FCMDevice, UserProfile)
-from api.utils import notifier
+from api.utils import notifier, tokens
 
 jwt_payload_handler = api_settings.JWT_PAYLOAD_HANDLER
 jwt_encode_handler = api_settings.JWT_ENCODE_HANDLER
-jwt_decode_handler = api_settings.JWT_DECODE_HANDLER
 
 EMPLOYER_REGISTRATION_DEACTIVATED = os.environ.get('EMPLOYER_REGISTRATION_DEACTIVATED')
 
@@ -212,7 +211,7 @@ class UserRegisterSerializer(serializers.Serializer):
             if token:
                 employer_role = employer_role
                 try:
-                    data = jwt_decode_handler(token)
+                    data = tokens.decode(token)
                 except jwt.ExpiredSignatureError:
                     raise serializers.ValidationError(" - Token Expired. Please get a new one.")
                 except jwt.InvalidTokenError:
@@ -237,7 +236,7 @@ class UserRegisterSerializer(serializers.Serializer):
             token = self.context.get("token")
             if token:
                 # example data: {'sender_id': 1, 'invite_id': 7, 'user_email': 'a+employee5@jobcore.co', 'exp': 1560364249, 'orig_iat': 1560363349}
-                data = jwt_decode_handler(token)
+                data = tokens.decode(token)
                 if data['user_email'] == user.email:
                     status = 'ACTIVE'
 
@@ -276,7 +275,7 @@ class ChangePasswordSerializer(serializers.Serializer):
 
     def validate(self, data):
         try:
-            payload = jwt_decode_handler(data["token"])
+            payload = tokens.decode(data["token"])
         except jwt.ExpiredSignatureError:
             raise serializers.ValidationError("Token Expired. Please get a new one.")
         except jwt.InvalidTokenError:
@@ -295,7 +294,9 @@ class ChangePasswordSerializer(serializers.Serializer):
 
     def create(self, validated_data):
         try:
-            payload = jwt_decode_handler(validated_data["token"])
+            payload = tokens.decode(validated_data["token"])
+            # the reset link works only once
+            tokens.revoke(payload)
         except DecodeError:
             raise serializers.ValidationError("Invalid token")
 
@@ -1,6 +1,28 @@
 from rest_framework import serializers
 
-from api.models import EmployeeDocument, Document
+from api.models import Employee, EmployeeDocument, Document
+
+
+def update_verification_status(employee_id):
+    """Picks the new employment verification status of the employee from its documents"""
+    pending_and_approved_documents = EmployeeDocument.objects.filter(employee__id=employee_id,
+                                                                     status__in=['PENDING', 'APPROVED'])
+    validations = {"employment": False, "identity": False, "form": False}
+    # you need to have one of each type at least
+    for doc in pending_and_approved_documents.select_related('document_type'):
+        if doc.document_type.validates_employment:
+            validations["employment"] = True
+        if doc.document_type.validates_identity:
+            validations["identity"] = True
+        if doc.document_type.is_form:
+            validations["form"] = True
+
+    employee = Employee.objects.get(id=employee_id)
+    if validations["form"] and validations["identity"] and validations["employment"]:
+        employee.employment_verification_status = 'BEING_REVIEWED'
+    else:
+        employee.employment_verification_status = 'MISSING_DOCUMENTS'
+    employee.save()
 
 
 class DocumentSerializer(serializers.ModelSerializer):
@@ -12,7 +34,7 @@ class DocumentSerializer(serializers.ModelSerializer):
 class EmployeeDocumentSerializer(serializers.ModelSerializer):
     class Meta:
         model = EmployeeDocument
-        exclude = ()
+        exclude = ('spooled_content',)
 
     def create(self, validated_data):
 
@@ -44,25 +66,7 @@ class EmployeeDocumentSerializer(serializers.ModelSerializer):
         new_document = EmployeeDocument(**validated_data)
         new_document.save()
 
-        # pick the new status for the employee
-        pending_and_approved_documents = EmployeeDocument.objects.filter(employee__id=validated_data['employee'].id,
-                                                                         status__in=['PENDING', 'APPROVED'])
-        validations = {"employment": False, "identity": False, "form": False}
-        # you need to have one of each type at least
-        for doc in pending_and_approved_documents:
-            if doc.document_type.validates_employment:
-                validations["employment"] = True
-            if doc.document_type.validates_identity:
-                validations["identity"] = True
-            if doc.document_type.is_form:
-                validations["form"] = True
-
-        employee = new_document.employee
-        if validations["form"] and validations["identity"] and validations["employment"]:
-            employee.employment_verification_status = 'BEING_REVIEWED'
-        else:
-            employee.employment_verification_status = 'MISSING_DOCUMENTS'
-        employee.save()
+        update_verification_status(new_document.employee_id)
 
         return new_document
 
@@ -76,4 +80,4 @@ class EmployeeDocumentGetSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = EmployeeDocument
-        exclude = ()
+        exclude = ('spooled_content',)
@@ -1,5 +1,5 @@
 from rest_framework import serializers
-from api.models import Employer, Shift,EmployerUsers, Profile, Payrates, SubscriptionPlan, Position, Employee, User
+from api.models import Employer, Shift,EmployerUsers, Profile, Payrates, SubscriptionPlan, Position, Employee, User, EmployerStats
 from datetime import datetime
 from django.utils import timezone
 from api.serializers.badge_serializers import BadgeGetSmallSerializer
@@ -60,6 +60,12 @@ class EmployerGetSerializer(serializers.ModelSerializer):
 
 
 
+class EmployerStatsSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = EmployerStats
+        exclude = ('employer', 'next_shift_starting_at')
+
+
 class EmployerPayratePostSerializer(serializers.ModelSerializer):
         
     class Meta:
@@ -3,7 +3,8 @@ import decimal
 import itertools
 import math
 
-from django.db.models import Q, Count, Sum
+from django.db import connection, transaction
+from django.db.models import Count, Sum
 from django.utils import timezone
 
 from rest_framework import serializers
@@ -11,10 +12,13 @@ from rest_framework import serializers
 from api.models import (Badge, BankAccount, Clockin, Employee, EmployeePayment, Employer, EmployerDeduction,
                         PaymentTransaction, PayrollPeriod, PayrollPeriodPayment, Position, PreDefinedDeduction, Profile,
                         Shift, User, Venue, APPROVED, PENDING, OPEN, FINALIZED, DAYS, MONTHS)
+from api.utils import employer_stats
 from api.utils.loggers import log_debug
 from api.utils.utils import nearest_weekday
 
 DATE_FORMAT = '%Y-%m-%d'
+# payments inserted per query when a period is generated
+PAYMENTS_BATCH_SIZE = 1000
 
 #
 # NESTED
@@ -273,6 +277,107 @@ class PayrollPeriodPaymentSerializer(serializers.ModelSerializer):
         return super().update(payment, params)
 
 
+# Totals of the approved payments of every employee in a period, the hours after
+# the first 40 (in payment id order) are legal overtime paid at 1.5 times the rate.
+# Earnings are truncated to cents on every payment before they are added up.
+# PostgreSQL only (TRUNC), other databases add up the same rows in python.
+EMPLOYEE_PAYMENT_TOTALS_SQL = """
+    WITH payments AS (
+        SELECT employee_id, regular_hours, over_time, breaktime_minutes, hourly_rate,
+               regular_hours + over_time AS hours,
+               COALESCE(SUM(regular_hours + over_time) OVER (
+                   PARTITION BY employee_id ORDER BY id ROWS BETWEEN UNBOUNDED PRECEDING AND 1 PRECEDING
+               ), 0) AS previous_hours
+        FROM {payments}
+        WHERE payroll_period_id = %(period)s AND employer_id = %(employer)s AND status = %(status)s
+    ), split AS (
+        SELECT *, CASE
+            WHEN previous_hours >= 40 THEN hours
+            WHEN previous_hours + hours > 40 THEN previous_hours + hours - 40
+            ELSE 0
+        END AS legal_over_time
+        FROM payments
+    )
+    SELECT employee_id,
+           SUM(regular_hours) AS regular_hours,
+           SUM(over_time) AS over_time,
+           SUM(legal_over_time) AS legal_over_time,
+           SUM(breaktime_minutes) AS breaktime_minutes,
+           SUM(TRUNC(hours * hourly_rate, 2)) AS earnings,
+           SUM(TRUNC(legal_over_time * (hourly_rate * 1.5), 2)) AS over_time_earnings
+    FROM split
+    GROUP BY employee_id
+    ORDER BY employee_id
+"""
+
+
+def get_employee_payment_totals(period):
+    """One row (a dict) per employee with approved payments in the period, computed with a single query"""
+    if connection.vendor != 'postgresql':
+        return _employee_payment_totals_in_python(period)
+
+    sql = EMPLOYEE_PAYMENT_TOTALS_SQL.format(payments=PayrollPeriodPayment._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.execute(sql, {'period': period.id, 'employer': period.employer_id, 'status': APPROVED})
+        columns = [column[0] for column in cursor.description]
+        return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+
+def _truncate_cents(amount):
+    return amount.quantize(decimal.Decimal('0.01'), rounding=decimal.ROUND_DOWN)
+
+
+def _employee_payment_totals_in_python(period):
+    payments = PayrollPeriodPayment.objects.filter(
+        payroll_period_id=period.id, employer_id=period.employer_id, status=APPROVED
+    ).order_by('employee_id', 'id').values_list(
+        'employee_id', 'regular_hours', 'over_time', 'breaktime_minutes', 'hourly_rate')
+
+    all_totals = []
+    for employee_id, employee_payments in itertools.groupby(payments, key=lambda payment: payment[0]):
+        totals = dict(employee_id=employee_id, regular_hours=0, over_time=0, legal_over_time=0,
+                      breaktime_minutes=0, earnings=0, over_time_earnings=0)
+        previous_hours = 0
+        for _, regular_hours, over_time, breaktime_minutes, hourly_rate in employee_payments:
+            hours = regular_hours + over_time
+            legal_over_time = hours if previous_hours >= 40 else max(previous_hours + hours - 40, 0)
+            previous_hours += hours
+            totals['regular_hours'] += regular_hours
+            totals['over_time'] += over_time
+            totals['legal_over_time'] += legal_over_time
+            totals['breaktime_minutes'] += breaktime_minutes
+            totals['earnings'] += _truncate_cents(hours * hourly_rate)
+            totals['over_time_earnings'] += _truncate_cents(legal_over_time * (hourly_rate * decimal.Decimal('1.5')))
+        all_totals.append(totals)
+    return all_totals
+
+
+def create_employee_payments(period):
+    """
+    Inserts the EmployeePayment of every employee with approved payments in the period,
+    employees that already have one are skipped so finalizing twice does not duplicate them
+    """
+    existing = set(EmployeePayment.objects.filter(
+        payroll_period=period, employer_id=period.employer_id).values_list('employee_id', flat=True))
+
+    payments = EmployeePayment.objects.bulk_create([
+        EmployeePayment(payroll_period=period,
+                        employee_id=totals['employee_id'],
+                        employer_id=period.employer_id,
+                        regular_hours=totals['regular_hours'],
+                        over_time=totals['over_time'],
+                        legal_over_time=totals['legal_over_time'],
+                        breaktime_minutes=totals['breaktime_minutes'],
+                        earnings=totals['earnings'],
+                        over_time_earnings=totals['over_time_earnings'],
+                        regular_hours_earnings=totals['earnings'])
+        for totals in get_employee_payment_totals(period) if totals['employee_id'] not in existing
+    ])
+    # bulk_create skips the signals that keep the unpaid payroll counters
+    employer_stats.refresh([period.employer_id])
+    return payments
+
+
 class PayrollPeriodSerializer(serializers.ModelSerializer):
 
     class Meta:
@@ -288,76 +393,8 @@ class PayrollPeriodSerializer(serializers.ModelSerializer):
             (regular_hours + over_time) * hourly_rate; breaktime was deducted in regular_hours already"""
         employer_id = instance.employer_id
         if validated_data.get('status') == FINALIZED:
-            
             # Create EmployeePayment registries to summarize related data from PayrollPeriodPayment
-            total_regular_hours = total_regular_earnings = total_over_time = total_breaktime_minutes = gross_amount = 0
-            prev_employee_id = legal_overtime_hours = overtime_earnings = 0
-
-            for ppp in PayrollPeriodPayment.objects.filter(payroll_period_id=instance.id, employer_id=employer_id,
-                                                           status=APPROVED).order_by('employee_id', 'id'):
-                
-                if ppp.employee.id != prev_employee_id:
-                    if prev_employee_id:   # to avoid if value is 0 (fake initial value)
-                        # get_or_create is used to maintain idempotence
-                        EmployeePayment.objects.get_or_create(payroll_period=instance,
-                                                              employee_id=prev_employee_id,
-                                                              employer_id=employer_id,
-                                                              regular_hours=total_regular_hours,
-                                                              over_time=total_over_time,
-                                                              legal_over_time=legal_overtime_hours,
-                                                              breaktime_minutes=total_breaktime_minutes,
-                                                              earnings=gross_amount,
-                                                              over_time_earnings= overtime_earnings,
-                                                              regular_hours_earnings=gross_amount
-                                      
-                                                              )
-                        total_regular_hours = total_over_time = total_breaktime_minutes = gross_amount = 0
-                        legal_overtime_hours = overtime_earnings = 0
-                    prev_employee_id = ppp.employee.id
-
-                if (total_regular_hours + total_over_time) >= decimal.Decimal('40.00'):
-                    legal_overtime_hours += ppp.regular_hours + ppp.over_time
-                    overtime_earnings += decimal.Decimal(str(
-                        math.trunc((ppp.regular_hours + ppp.over_time) * (ppp.hourly_rate * decimal.Decimal('1.5')) * 100) / 100
-                    ))
-                elif (total_regular_hours + total_over_time + ppp.regular_hours + ppp.over_time) > decimal.Decimal('40.00'):
-                    overtime_hours = total_regular_hours + total_over_time + ppp.regular_hours + ppp.over_time - 40
-                    legal_overtime_hours += overtime_hours
-                    overtime_earnings += decimal.Decimal(str(
-                        math.trunc(overtime_hours * (ppp.hourly_rate * decimal.Decimal('1.5')) * 100) / 100
-                    ))
-                
-                total_regular_hours += ppp.regular_hours
-                total_over_time += ppp.over_time
-                total_breaktime_minutes += ppp.breaktime_minutes
-
-                
-                gross_amount += decimal.Decimal(str(
-                    math.trunc((ppp.regular_hours + ppp.over_time) * ppp.hourly_rate * 100) / 100
-                ))
-
-             
-                # regular_hours_earnings += decimal.Decimal(str(
-                #     math.trunc((gross_amount - overtime_earnings/decimal.Decimal('1.5')) * 100) / 100
-                # ))
-                # earnings = decimal.Decimal(str(
-                #     math.trunc((regular_hours_earnings - overtime_earnings) * 100) / 100
-                # ))
-             
-            # get_or_create is used to maintain idempotence
-            if prev_employee_id:   # to avoid if value is 0 (fake initial value)
-               
-                EmployeePayment.objects.get_or_create(payroll_period=instance,
-                                                      employee_id=prev_employee_id,
-                                                      employer_id=employer_id,
-                                                      regular_hours=total_regular_hours,
-                                                      over_time=total_over_time,
-                                                      legal_over_time=legal_overtime_hours,
-                                                      breaktime_minutes=total_breaktime_minutes,
-                                                      earnings=gross_amount,
-                                                      over_time_earnings = overtime_earnings,
-                                                      regular_hours_earnings = gross_amount,
-                                                      )
+            create_employee_payments(instance)
 
         elif validated_data.get('status') == OPEN:
             # Delete existing EmployeePayment registries for current period
@@ -394,12 +431,90 @@ class EmployerInfoPaymentSerializer(serializers.ModelSerializer):
 class EmployeeInfoPaymentSerializer(serializers.ModelSerializer):
     first_name = serializers.CharField(max_length=30, source='user.first_name')
     last_name = serializers.CharField(max_length=150, source='user.last_name')
-    bank_accounts = BankAccountSmallSerializer(source='profile_set.last.bank_accounts', many=True)
+    bank_accounts = serializers.SerializerMethodField()
 
     class Meta:
         model = Employee
         fields = ('id', 'first_name', 'last_name', 'bank_accounts', 'filing_status', 'w4_year', 'step2c_checked', "employment_verification_status")
 
+    def get_bank_accounts(self, instance):
+        # the last profile, read from profile_set.all() so a prefetch is used
+        profiles = list(instance.profile_set.all())
+        if not profiles:
+            return []
+        profile = max(profiles, key=lambda profile: profile.id)
+        return BankAccountSmallSerializer(profile.bank_accounts.all(), many=True).data
+
+
+def get_period_quantity(period):
+    """Number of periods of this length in a year"""
+    if period.length_type == DAYS and period.length == 7:
+        return 52
+    elif period.length_type == DAYS and period.length == 14:
+        return 26
+    elif period.length_type == DAYS:
+        return 260
+    return 12 / period.length
+
+
+class PayrollContext:
+    """
+    Deductions and taxes of the employee payments of a payroll run: the deduction schedule
+    (pre defined deductions followed by the employer ones) is read once per employer and every
+    payment is computed once, the payments must come with their employee and period loaded
+    (EmployeePaymentSerializer.setup_eager_loading)
+    """
+
+    def __init__(self):
+        self.schedules = {}
+        self.computed = {}
+
+    def get_deduction_schedule(self, employer_id):
+        if employer_id not in self.schedules:
+            deductions = itertools.chain(PreDefinedDeduction.objects.order_by('id'),
+                                         EmployerDeduction.objects.filter(employer_id=employer_id).order_by('id'))
+            self.schedules[employer_id] = [
+                (deduction.name, deduction.type, decimal.Decimal('{:.2f}'.format(deduction.value)))
+                for deduction in deductions
+            ]
+        return self.schedules[employer_id]
+
+    def compute_deductions(self, payment):
+        res_list = []
+        for name, deduction_type, value in self.get_deduction_schedule(payment.employer_id):
+            if deduction_type == PreDefinedDeduction.PERCENTAGE_TYPE:
+                amount = payment.earnings * value / 100
+            else:
+                amount = value
+            res_list.append({'name': name, 'amount': round(amount, 2)})
+        return res_list
+
+    def compute(self, payments):
+        for payment in payments:
+            if payment.id in self.computed:
+                continue
+            deduction_list = self.compute_deductions(payment)
+            taxes = payment.employee.calculate_tax_amount(payment.earnings,
+                                                          get_period_quantity(payment.payroll_period))
+            self.computed[payment.id] = {
+                'deduction_list': deduction_list,
+                'deductions': sum(deduction['amount'] for deduction in deduction_list),
+                'taxes': taxes,
+            }
+
+    def get(self, payment):
+        self.compute([payment])
+        return self.computed[payment.id]
+
+
+class EmployeePaymentListSerializer(serializers.ListSerializer):
+
+    def to_representation(self, data):
+        payments = list(data.all() if hasattr(data, 'all') else data)
+        # deductions and taxes of the whole run before the rows are serialized
+        self.child.get_payroll_context().compute(payments)
+        return super().to_representation(payments)
+
 
 class EmployeePaymentSerializer(serializers.ModelSerializer):
     employee = EmployeeInfoPaymentSerializer()
@@ -410,40 +525,29 @@ class EmployeePaymentSerializer(serializers.ModelSerializer):
         model = EmployeePayment
         fields = ('id', 'employee', 'regular_hours', 'over_time','legal_over_time', 'earnings', 'over_time_earnings',
                   'paid', 'payroll_period_id', 'deductions', 'deduction_list', 'taxes', 'amount')
+        list_serializer_class = EmployeePaymentListSerializer
 
-    def get_deduction_list(self, instance):
-        qs_emp_deduc = EmployerDeduction.objects.filter(employer_id=self.context['employer_id'])
-        self.context['total_deductions'] = 0
-        res_list = []
-        for deduction in itertools.chain(PreDefinedDeduction.objects.order_by('id'), qs_emp_deduc.order_by('id')):
-            if deduction.type == PreDefinedDeduction.PERCENTAGE_TYPE:
-                amount = instance.earnings * decimal.Decimal('{:.2f}'.format(deduction.value)) / 100
-            else:
-                amount = decimal.Decimal('{:.2f}'.format(deduction.value))
-            # amount = decimal.Decimal(str(
-            #     math.trunc(amount * 100) / 100
-            # ))
-            amount = round(amount, 2)
-            self.context['total_deductions'] += amount
-            res_list.append({'name': deduction.name, 'amount': amount})
-        return res_list
+    @staticmethod
+    def setup_eager_loading(queryset):
+        return queryset.select_related('payroll_period', 'employee__user').prefetch_related(
+            'employee__profile_set__bank_accounts')
+
+    def get_payroll_context(self):
+        # shared by all the rows, the context of the list serializer is the context of its child
+        if 'payroll' not in self.context:
+            self.context['payroll'] = PayrollContext()
+        return self.context['payroll']
 
+    def get_deduction_list(self, instance):
+        return self.get_payroll_context().get(instance)['deduction_list']
 
     def get_taxes(self, instance):
-        if instance.payroll_period.length_type == DAYS and instance.payroll_period.length == 7:
-            period_quantity = 52
-        elif instance.payroll_period.length_type == DAYS and instance.payroll_period.length == 14:
-            period_quantity = 26
-        elif instance.payroll_period.length_type == DAYS:
-            period_quantity = 260
-        else:
-            period_quantity = 12 / instance.payroll_period.length
-        return instance.employee.calculate_tax_amount(instance.earnings, period_quantity)
+        return self.get_payroll_context().get(instance)['taxes']
 
     def to_representation(self, instance):
         data = super().to_representation(instance)
-        data['deductions'] = self.context['total_deductions']
-        data['amount'] = instance.earnings - data['deductions'] 
+        data['deductions'] = self.get_payroll_context().get(instance)['deductions']
+        data['amount'] = instance.earnings - data['deductions']
         return data
 
 
@@ -469,6 +573,23 @@ class EmployeePaymentDataSerializer(serializers.Serializer):
             return dict_value
 
 
+class PayrollPayoutSerializer(serializers.Serializer):
+    """To check the data received to pay all the employee payments of a period"""
+    payment_type = serializers.ChoiceField(choices=PaymentTransaction.PAYMENT_TYPES)
+    employer_bank_account_id = serializers.IntegerField(required=False)
+
+    def validate(self, data):
+        if data['payment_type'] == PaymentTransaction.CHECK:
+            data['employer_bank_account'] = None
+            return data
+        try:
+            data['employer_bank_account'] = BankAccount.objects.get(
+                id=data.get('employer_bank_account_id'), user__in=self.context['employer'].profile_set.all())
+        except BankAccount.DoesNotExist:
+            raise serializers.ValidationError('Wrong employer bank account')
+        return data
+
+
 class EmployeePaymentDatesSerializer(serializers.Serializer):
     """To verify parameters for searching"""
     start_date = serializers.DateField(format=DATE_FORMAT, required=False)
@@ -582,9 +703,10 @@ def get_projected_payments(
     return result
 
 
-def generate_periods_and_payments(employer, generate_since=None):
-    log_debug('hooks','generate_periods -> Employer: '+employer.title)
-    NOW = timezone.now()
+def get_missing_periods(employer, now=None):
+    """Returns the (starting_at, ending_at) of the periods that ended since the last period generated for the employer"""
+    if now is None:
+        now = timezone.now()
 
     if employer.payroll_period_type != 'DAYS':
         raise serializers.ValidationError('The only supported period type is DAYS (for now)')
@@ -612,91 +734,99 @@ def generate_periods_and_payments(employer, generate_since=None):
         last_period_ending_date = nearest_weekday(employer.created_at, weekday, fallback_direction='backward')
         log_debug('hooks','generate_periods:Employer: This is the first payroll, and the company started existing on '+str(employer.created_at))
         last_period_ending_date = (last_period_ending_date.replace(hour=h_hour, minute=m_hour, second=s_hour) - datetime.timedelta(seconds=1))
-    
-    #log_debug('hooks','Last period generated until '+str(last_period_ending_date))
 
     # the ending date will be X days later, X = employer.payroll_period_length
-    end_date = last_period_ending_date + datetime.timedelta(days=employer.payroll_period_length)
+    length = datetime.timedelta(days=employer.payroll_period_length)
+    end_date = last_period_ending_date + length
 
-    generated_periods = []
-    if end_date >= NOW:
-        log_debug('hooks','No new periods to generate, now is '+ str(NOW) +' we have to wait until '+str(end_date))
-        return []
-     
-    while end_date < NOW:
-
-        start_date = end_date - \
-            datetime.timedelta(
-                days=employer.payroll_period_length) + datetime.timedelta(seconds=1)
-        period = PayrollPeriod(
-            starting_at=start_date,
-            ending_at=end_date,
-            employer=employer,
-            length=employer.payroll_period_length,
-            length_type=employer.payroll_period_type
-        )
-       
-        period.save()
+    periods = []
+    while end_date < now:
+        periods.append((end_date - length + datetime.timedelta(seconds=1), end_date))
+        end_date = end_date + length
 
-        # move the end_date forward to make sture the loop stops eventually
-        end_date = end_date + datetime.timedelta(days=employer.payroll_period_length)
+    return periods
 
-        # no lets start calculating the payaments
-        try:
-            all_clockins = Clockin.objects.filter(
-                Q(started_at__gte=period.starting_at) & Q(started_at__lte=period.ending_at),
-                shift__employer__id=employer.id
+
+def make_period_payment(period, clockin):
+    """Payment for the part of the (closed) clockin that is inside the period, the clockin shift must be loaded"""
+
+    # the payment needs to be inside the payment period
+    starting_time = clockin.started_at if clockin.started_at > period.starting_at else period.starting_at
+    ending_time = clockin.ended_at if clockin.ended_at < period.ending_at else period.ending_at
+    clocked_hours = round(decimal.Decimal((ending_time - starting_time).total_seconds() / 3600), 5)
+
+    # the projected payment varies depending on the payment period
+    shift = clockin.shift
+    projected_hours = round(decimal.Decimal((shift.ending_at - shift.starting_at).total_seconds() / 3600), 5)
+
+    if clocked_hours <= projected_hours:
+        regular_hours = clocked_hours
+        overtime = 0
+    else:
+        regular_hours = projected_hours
+        overtime = clocked_hours - projected_hours
+
+    return PayrollPeriodPayment(
+        payroll_period=period,
+        employee_id=clockin.employee_id,
+        employer_id=period.employer_id,
+        shift=shift,
+        clockin=clockin,
+        regular_hours=regular_hours,
+        over_time=overtime,
+        hourly_rate=shift.minimum_hourly_rate,
+        total_amount=round((regular_hours + overtime) * shift.minimum_hourly_rate, 2),
+        splited_payment=not (clockin.started_at == starting_time and ending_time == clockin.ended_at)
+    )
+
+
+def generate_period_payments(period, batch_size=PAYMENTS_BATCH_SIZE):
+    """
+    Streams the closed clockins that started inside the period (with their shift) and
+    inserts their payments batch_size at a time, returns how many payments were created
+    """
+    clockins = Clockin.objects.filter(
+        started_at__gte=period.starting_at,
+        started_at__lte=period.ending_at,
+        shift__employer__id=period.employer_id,
+        # an open clockin gets no payment, a later period only picks up the clockins started inside it
+        ended_at__isnull=False
+    ).select_related('shift').order_by('id').iterator(chunk_size=batch_size)
+
+    total_payments = 0
+    while True:
+        payments = [make_period_payment(period, clockin) for clockin in itertools.islice(clockins, batch_size)]
+        if len(payments) == 0:
+            return total_payments
+        PayrollPeriodPayment.objects.bulk_create(payments)
+        total_payments += len(payments)
+
+
+def generate_periods_and_payments(employer, generate_since=None, batch_size=PAYMENTS_BATCH_SIZE):
+    log_debug('hooks','generate_periods -> Employer: '+employer.title)
+    NOW = timezone.now()
+
+    missing_periods = get_missing_periods(employer, NOW)
+    if len(missing_periods) == 0:
+        log_debug('hooks','No new periods to generate, now is '+ str(NOW))
+        return []
+
+    generated_periods = []
+    for start_date, end_date in missing_periods:
+        # if anything fails the period is not created and neither are its payments
+        with transaction.atomic():
+            period = PayrollPeriod.objects.create(
+                starting_at=start_date,
+                ending_at=end_date,
+                employer=employer,
+                length=employer.payroll_period_length,
+                length_type=employer.payroll_period_type
             )
-            log_debug('hooks','Creating a new period for '+employer.title+' from '+str(period.starting_at)+' to '+str(period.ending_at)+ " -> "+str(len(all_clockins))+' clockins')
-            total_payments = 0
-            for clockin in all_clockins:
-                # the payment needs to be inside the payment period
-                starting_time = clockin.started_at if clockin.started_at > period.starting_at else period.starting_at
-                
-                ending_time = clockin.ended_at if clockin.ended_at is not None and clockin.ended_at < period.ending_at else period.ending_at
-                clocked_hours = (ending_time - starting_time).total_seconds() / 3600 if clockin.ended_at is not None else None
-                if clocked_hours is None:
-                    continue
-                else:
-                    clocked_hours = round(decimal.Decimal(clocked_hours), 5)
-                # the projected payment varies depending on the payment period
-                projected_starting_time = clockin.shift.starting_at
-                projected_ending_time = clockin.shift.ending_at
-                projected_hours = round(decimal.Decimal((projected_ending_time - projected_starting_time).total_seconds() / 3600), 5)
-                log_debug('hooks','Projected hours '+str(projected_hours))
-
-                if clocked_hours <= projected_hours:
-                    regular_hours = clocked_hours
-                    overtime = 0
-                    
-                else:
-                    regular_hours = projected_hours
-                    overtime = clocked_hours - projected_hours
-                payment = PayrollPeriodPayment(
-                    payroll_period=period,
-                    employee=clockin.employee,
-                    employer=employer,
-                    shift=clockin.shift,
-                    clockin=clockin,
-                    regular_hours=regular_hours,
-                    over_time=overtime,
-                    hourly_rate=clockin.shift.minimum_hourly_rate,
-                    total_amount=round((regular_hours + overtime) * clockin.shift.minimum_hourly_rate, 2),
-                    splited_payment=False if clockin.ended_at is None or (clockin.started_at == starting_time and ending_time == clockin.ended_at) else True
-                )
-                payment.save()
-                total_payments = total_payments + 1
-
-            period.total_payments = total_payments
+            period.total_payments = generate_period_payments(period, batch_size)
             period.save()
-            generated_periods.append(period)
-            
-
-        except Exception as e:
-            PayrollPeriodPayment.objects.filter(payroll_period__id=period.id).delete()
-            generated_periods = []
-            period.delete()
-            raise e
+
+        log_debug('hooks','Created a new period for '+employer.title+' from '+str(period.starting_at)+' to '+str(period.ending_at)+ " -> "+str(period.total_payments)+' payments')
+        generated_periods.append(period)
 
     return generated_periods
     
@@ -1,6 +1,7 @@
 from rest_framework import serializers
 from api.utils import notifier
 from api.models import Rate, Shift, Clockin, Venue, Employer, Profile, User, PayrollPeriodPayment
+from django.db import connection, transaction
 from django.db.models import Avg, Count
 from api.serializers.position_serializer import PositionSmallSerializer
 
@@ -54,10 +55,41 @@ class RatingGetSerializer(serializers.ModelSerializer):
         exclude = ()
 
 
+class RatingListSerializer(serializers.ListSerializer):
+
+    def create(self, validated_data):
+        rates = [Rate(**item) for item in validated_data]
+        for rate in rates:
+            if rate.employer_id is None and rate.employee_id is None:
+                raise AssertionError('Unbound rate!')
+
+        # bulk_create skips Rate.save so each rated entity is updated only once
+        with transaction.atomic():
+            rates = Rate.objects.bulk_create(rates)
+            Rate.update_aggregates(rates)
+            if not connection.features.can_return_ids_from_bulk_insert:
+                rates = _read_back(rates)
+
+        for rate in rates:
+            notifier.notify_new_rating(rate)
+
+        return rates
+
+
+def _read_back(rates):
+    """The created rates with their ids, the newest rate of each sender, shift and rated entity"""
+    created = {}
+    for rate in Rate.objects.filter(sender_id__in={rate.sender_id for rate in rates},
+                                    shift_id__in={rate.shift_id for rate in rates}).order_by('id'):
+        created[(rate.sender_id, rate.shift_id, rate.employee_id, rate.employer_id)] = rate
+    return [created[(rate.sender_id, rate.shift_id, rate.employee_id, rate.employer_id)] for rate in rates]
+
+
 class RatingSerializer(serializers.ModelSerializer):
     class Meta:
         model = Rate
         exclude = ()
+        list_serializer_class = RatingListSerializer
 
     def validate_rating(self, rating):
         if not 0 <= float(rating) <= 5:
@@ -3,8 +3,10 @@ utc = pytz.UTC
 import datetime
 from api.serializers import other_serializer, venue_serializer, employer_serializer, employee_serializer, favlist_serializer
 from rest_framework import serializers
-from api.utils import notifier
-from django.db.models import Q
+from api.utils import employer_stats, matching, notifier
+from django.db import connection
+from django.db.models import Count, IntegerField, OuterRef, Prefetch, Q, Subquery
+from django.db.models.functions import Coalesce
 from django.utils import timezone
 from api.models import Shift, ShiftInvite, ShiftApplication, Employee, Employer, ShiftEmployee, Position, Venue, User, Profile, Clockin, SHIFT_INVITE_STATUS_CHOICES, SHIFT_APPLICATION_RESTRICTIONS, FILLED, OPEN
 BROADCAST_NOTIFICATIONS_BY_EMAIL = os.environ.get('BROADCAST_NOTIFICATIONS_BY_EMAIL')
@@ -71,10 +73,24 @@ class VenueGetSmallSerializer(serializers.ModelSerializer):
         fields = ('title', 'id', 'latitude', 'longitude', 'street_address', 'zip_code')
 
 
+def annotate_employee_count(queryset):
+    """
+    Adds the employee_count used to calculate the shift status, it is a subquery
+    (not a join) so filtering by employees or candidates does not change the count
+    """
+    employees = ShiftEmployee.objects.filter(shift=OuterRef('pk')).order_by()\
+        .values('shift').annotate(total=Count('id')).values('total')
+    return queryset.annotate(employee_count=Coalesce(Subquery(employees, output_field=IntegerField()), 0))
+
+
 class ShiftStatusMixin:
 
     def get_status(self, instance):
-        if instance.employees.count() == instance.maximum_allowed_employees and instance.status == OPEN:
+        employee_count = getattr(instance, 'employee_count', None)
+        if employee_count is None:
+            employee_count = instance.employees.count()
+
+        if employee_count == instance.maximum_allowed_employees and instance.status == OPEN:
             return FILLED
         else:
             return instance.status
@@ -119,6 +135,11 @@ class ShiftGetPublicTinySerializer(ShiftStatusMixin, serializers.ModelSerializer
             'application_restriction',
             'updated_at')
 
+    @staticmethod
+    def setup_eager_loading(queryset):
+        queryset = annotate_employee_count(queryset)
+        return queryset.select_related('venue', 'position').prefetch_related('candidates', 'employees')
+
 
 class ShiftGetTinySerializer(ShiftStatusMixin, serializers.ModelSerializer):
     venue = VenueGetSmallSerializer(read_only=True)
@@ -157,8 +178,14 @@ class ShiftGetSmallSerializer(ShiftStatusMixin, serializers.ModelSerializer):
             'application_restriction',
             'updated_at')
 
+    @staticmethod
+    def setup_eager_loading(queryset):
+        queryset = annotate_employee_count(queryset)
+        return queryset.select_related('venue', 'position').prefetch_related('candidates', 'employees', 'clockin_set')
+
     def get_clockin(self, instance):
-        clockin_instances = instance.clockin_set.filter(shift=instance.id)
+        # all() instead of filter() so the prefetched clockins are used
+        clockin_instances = instance.clockin_set.all()
         return ClockinGetSmallSerializer(clockin_instances, many=True).data
 
 class ShiftGetBigListSerializer(ShiftStatusMixin, serializers.ModelSerializer):
@@ -178,8 +205,16 @@ class ShiftGetBigListSerializer(ShiftStatusMixin, serializers.ModelSerializer):
             'application_restriction',
             'updated_at')
 
+    @staticmethod
+    def setup_eager_loading(queryset):
+        queryset = annotate_employee_count(queryset)
+        return queryset.select_related('venue', 'position').prefetch_related(
+            'candidates',
+            Prefetch('employees', queryset=Employee.objects.select_related('user__profile')),
+            'clockin_set')
+
     def get_clockin(self, instance):
-        clockin_instances = instance.clockin_set.filter(shift=instance.id)
+        clockin_instances = instance.clockin_set.all()
         return ClockinGetSmallSerializer(clockin_instances, many=True).data
 
 #
@@ -221,8 +256,12 @@ class ShiftUpdateSerializer(serializers.ModelSerializer):
     def validate(self, data):
 
         data = super(ShiftUpdateSerializer, self).validate(data)
-        
-        clockins = Clockin.objects.filter(shift__id=self.instance.id).count()
+
+        # the batch updates load the shifts with clockins of the whole batch at once
+        if 'shifts_with_clockins' in self.context:
+            clockins = 1 if self.instance.id in self.context['shifts_with_clockins'] else 0
+        else:
+            clockins = Clockin.objects.filter(shift__id=self.instance.id).count()
         if clockins > 0:
             raise serializers.ValidationError(
                 'This shift cannot be updated because someone has already clock-in')
@@ -245,7 +284,8 @@ class ShiftUpdateSerializer(serializers.ModelSerializer):
                     shift.allowed_from_list.add(favlist)
             validated_data.pop('allowed_from_list')
 
-        old_shift = Shift.objects.get(pk=shift.id)
+        # the instance is not modified before the update below
+        old_shift = shift
         old_data = {
             "starting_at": old_shift.starting_at,
             "ending_at": old_shift.ending_at,
@@ -260,8 +300,8 @@ class ShiftUpdateSerializer(serializers.ModelSerializer):
         if 'pending_invites' in validated_data:
             pending_invites = [talent['value'] for talent in validated_data['pending_invites']]
         
-        if 'pending_invites' in self.context['request'].data:
-            pending_invites = [talent['value'] for talent in self.context['request'].data['pending_invites']]
+        if 'pending_invites' in self.initial_data:
+            pending_invites = [talent['value'] for talent in self.initial_data['pending_invites']]
         # before making the shift a draft or cancelled I have to let the employees know that the
         # shift is no longer available
         if 'status' in validated_data and validated_data['status'] in ['DRAFT', 'CANCELLED']:
@@ -270,6 +310,7 @@ class ShiftUpdateSerializer(serializers.ModelSerializer):
 
         # now i can finally update the shift
         Shift.objects.filter(pk=shift.id).update(**validated_data)
+        employer_stats.refresh([shift.employer_id])
         log_debug("shifts", "Updated shift "+str(shift.id)+": to "+str(shift))
 
         # I have to delete all previous employes and invite all the new prospects
@@ -280,7 +321,7 @@ class ShiftUpdateSerializer(serializers.ModelSerializer):
             shift.candidates.clear()
             shift.employees.clear()
 
-            if validated_data['status'] != 'DRAFT':
+            if validated_data.get('status', old_data['status']) != 'DRAFT':
                 notifier.notify_shift_update(
                     user=self.context['request'].user,
                     shift=shift,
@@ -362,7 +403,7 @@ class ShiftPostSerializer(serializers.ModelSerializer):
         talents = []
         includeEmailNotification = False
         if shift.application_restriction == 'SPECIFIC_PEOPLE':
-            talents = Employee.objects.filter(id__in=[talent['value'] for talent in self.context['request'].data['pending_invites']])
+            talents = Employee.objects.filter(id__in=[talent['value'] for talent in self.context['request'].data['pending_invites']]).select_related('user')
             includeEmailNotification = True
         else:
             includeEmailNotification = (BROADCAST_NOTIFICATIONS_BY_EMAIL == 'TRUE')
@@ -370,21 +411,88 @@ class ShiftPostSerializer(serializers.ModelSerializer):
 
         manual_invitations = (shift.application_restriction == 'SPECIFIC_PEOPLE')
 
-        
-        for talent in talents:
-            invite = ShiftInvite(
-                manually_created=manual_invitations,
-                employee=talent,
-                sender=self.context['request'].user.profile,
-                shift=shift)
-            invite.save()
-            notifier.notify_single_shift_invite(invite, withEmail=includeEmailNotification)
+        notifier.notify_shift_invites(shift, talents, self.context['request'].user.profile,
+                                      manually_created=manual_invitations, withEmail=includeEmailNotification)
 
         log_debug("shifts","Created shift: "+str(shift))
 
         return shift
 
 
+class ShiftDatesSerializer(serializers.Serializer):
+    starting_at = serializers.DateTimeField()
+    ending_at = serializers.DateTimeField()
+
+
+class RecurringShiftPostSerializer(ShiftPostSerializer):
+    """
+    ShiftPostSerializer for the same shift on every one of the multiple_dates: the data is
+    validated once, the shifts, their employees and invites are inserted with one bulk insert
+    each and the talents are matched once for all the dates. save() returns the list of shifts.
+    """
+    multiple_dates = serializers.ListField(child=ShiftDatesSerializer(), min_length=1, write_only=True)
+
+    class Meta:
+        model = Shift
+        exclude = ()
+        extra_kwargs = {
+            'starting_at': {'required': False},
+            'ending_at': {'required': False},
+        }
+
+    def create(self, validated_data):
+        dates = validated_data.pop('multiple_dates')
+        employees = validated_data.pop('employees', [])
+        candidates = validated_data.pop('candidates', [])
+        allowed_from_list = validated_data.pop('allowed_from_list', [])
+        required_badges = validated_data.pop('required_badges', [])
+        validated_data.pop('starting_at', None)
+        validated_data.pop('ending_at', None)
+
+        employer = validated_data['employer']
+        validated_data['maximum_clockin_delta_minutes'] = employer.maximum_clockin_delta_minutes
+        validated_data['maximum_clockout_delay_minutes'] = employer.maximum_clockout_delay_minutes
+
+        shifts = [Shift(**validated_data, **date) for date in dates]
+        if connection.features.can_return_ids_from_bulk_insert:
+            Shift.objects.bulk_create(shifts)
+        else:
+            # bulk_create only sets the ids on PostgreSQL
+            for shift in shifts:
+                shift.save()
+        Shift.allowed_from_list.through.objects.bulk_create([
+            Shift.allowed_from_list.through(shift_id=shift.id, favoritelist_id=favlist.id)
+            for shift in shifts for favlist in allowed_from_list])
+        Shift.required_badges.through.objects.bulk_create([
+            Shift.required_badges.through(shift_id=shift.id, badge_id=badge.id)
+            for shift in shifts for badge in required_badges])
+        ShiftEmployee.objects.bulk_create([
+            ShiftEmployee(shift_id=shift.id, employee_id=employee_id) for shift in shifts for employee_id in employees])
+        ShiftApplication.objects.bulk_create([
+            ShiftApplication(shift_id=shift.id, employee_id=candidate.id) for shift in shifts for candidate in candidates])
+
+        if validated_data.get('application_restriction') == 'SPECIFIC_PEOPLE':
+            talents = list(Employee.objects.filter(
+                id__in=[talent['value'] for talent in self.context['request'].data['pending_invites']]
+            ).select_related('user'))
+            shift_talents = [(shift, talents) for shift in shifts]
+            includeEmailNotification = True
+        else:
+            matches = matching.get_matching_talents_for_shifts(shifts, [favlist.id for favlist in allowed_from_list])
+            shift_talents = [(shift, matches[shift.id]) for shift in shifts]
+            includeEmailNotification = (BROADCAST_NOTIFICATIONS_BY_EMAIL == 'TRUE')
+
+        notifier.notify_shifts_invites(shift_talents, self.context['request'].user.profile,
+                                       manually_created=(validated_data.get('application_restriction') == 'SPECIFIC_PEOPLE'),
+                                       withEmail=includeEmailNotification)
+        # bulk_create skips the signals of the dashboard counters
+        employer_stats.refresh([employer.id])
+
+        log_debug("shifts", "Created {} shifts: {}".format(len(shifts), shifts[0]))
+
+        return shifts
+
+
 class ShiftGetSerializer(ShiftStatusMixin, serializers.ModelSerializer):
     venue = VenueGetSmallSerializer(read_only=True)
     position = PositionGetSmallSerializer(read_only=True)
@@ -399,6 +507,17 @@ class ShiftGetSerializer(ShiftStatusMixin, serializers.ModelSerializer):
         model = Shift
         exclude = ()
 
+    @staticmethod
+    def setup_eager_loading(queryset):
+        queryset = annotate_employee_count(queryset)
+        employees = Employee.objects.select_related('user__profile').prefetch_related(
+            'positions', 'badges', 'favoritelist_set')
+        return queryset.select_related('venue', 'position', 'employer').prefetch_related(
+            Prefetch('candidates', queryset=employees),
+            Prefetch('employees', queryset=employees),
+            'required_badges',
+            Prefetch('allowed_from_list__employees', queryset=Employee.objects.select_related('user__profile')))
+
 
 class ShiftGetBigSerializer(ShiftGetSerializer):
     employer = EmployerGetSmallSerializer(many=False, read_only=True)
@@ -1,4 +1,8 @@
+from io import StringIO
+from django.core.management import call_command
+from django.db import connection
 from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from mixer.backend.django import mixer
 import json
 from django.urls import reverse_lazy
@@ -6,6 +10,7 @@ from api.tests.mixins import WithMakeUser, WithMakeShift
 from django.apps import apps
 
 Rate = apps.get_model('api', 'Employer')
+Employer = apps.get_model('api', 'Employer')
 
 @override_settings(STATICFILES_STORAGE=None)
 class EmployeeRatingTestSuite(TestCase, WithMakeUser, WithMakeShift):
@@ -689,4 +694,54 @@ class EmployeeRatingTestSuite(TestCase, WithMakeUser, WithMakeShift):
         self.test_employer.refresh_from_db()
 
         self.assertEquals(float(self.test_employer.rating), 2.5)
-        self.assertEquals(self.test_employer.total_ratings, 2)
\ No newline at end of file
+        self.assertEquals(self.test_employer.total_ratings, 2)
+
+    def test_post_multiple_ratings_updates_employee_once(self):
+        """
+        A batch of ratings updates the rated talent only once
+        """
+        position = mixer.blend('api.Position')
+        url = reverse_lazy('api:get-ratings')
+        self.client.force_login(self.test_user_employer)
+
+        payload = []
+        for rating in [3.5, 4.5, 1.5]:
+            new_shift, _, __ = self._make_shift(
+                shiftkwargs=dict(position=position), employer=self.test_employer)
+            mixer.blend('api.Clockin', employee=self.test_employee, shift=new_shift,
+                        author=self.test_profile_employee, status='APPROVED')
+            payload.append({'employee': self.test_employee.id, 'shift': new_shift.id, 'rating': rating})
+
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.post(
+                url,
+                data=json.dumps(payload),
+                content_type="application/json")
+
+        self.assertEquals(response.status_code, 201, response.content.decode())
+        employee_updates = [q for q in ctx.captured_queries if q['sql'].startswith('UPDATE "api_employee"')]
+        self.assertEquals(len(employee_updates), 1)
+
+        self.test_employee.refresh_from_db()
+        self.assertEquals(self.test_employee.total_ratings, 3)
+        self.assertEquals(float(self.test_employee.rating_sum), 9.5)
+        self.assertEquals(float(self.test_employee.rating), 3.2)
+
+    def test_rebuild_ratings(self):
+        """
+        The rebuild_ratings command recalculates the ratings from scratch
+        """
+        mixer.blend('api.Rate', sender=self.test_profile_employee, shift=self.test_shift,
+                    employer=self.test_employer, employee=None, rating=4)
+        mixer.blend('api.Rate', sender=self.test_profile_employee, shift=self.test_shift,
+                    employer=self.test_employer, employee=None, rating=3)
+        Employer.objects.filter(id=self.test_employer.id).update(rating=0, total_ratings=10, rating_sum=0)
+
+        call_command('rebuild_ratings', stdout=StringIO())
+
+        self.test_employer.refresh_from_db()
+        self.test_employee.refresh_from_db()
+        self.assertEquals(self.test_employer.total_ratings, 2)
+        self.assertEquals(float(self.test_employer.rating), 3.5)
+        self.assertEquals(self.test_employee.total_ratings, 0)
+        self.assertEquals(self.test_employee.rating, None)
@@ -0,0 +1,119 @@
+import threading
+import time
+from datetime import timedelta
+from decimal import Decimal
+from unittest import skipUnless
+
+from django.db import connection, connections, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls.base import reverse_lazy
+from django.utils import timezone
+from mixer.backend.django import mixer
+
+from api.actions import clockin_actions
+from api.models import Clockin, EmployerStats
+from api.tests.mixins import WithMakeShift, WithMakeUser
+
+
+@override_settings(STATICFILES_STORAGE=None)
+class ClockinActionsTestSuite(TestCase, WithMakeUser, WithMakeShift):
+    """
+    Clock in/out with a fixed number of queries and the talent locked
+    """
+    def setUp(self):
+        self._make_clockin_data()
+
+    def _make_clockin_data(self):
+        self.test_user_employee, self.test_employee, self.test_profile_employee = self._make_user(
+            'employee', userkwargs=dict(username='employee1', email='employee1@testdoma.in', is_active=True))
+        _, self.test_employer, __ = self._make_user(
+            'employer', userkwargs=dict(username='employer1', email='employer@testdoma.in', is_active=True))
+        self.test_shift, _, __ = self._make_shift(
+            venuekwargs={'latitude': -64, 'longitude': 10},
+            shiftkwargs={'status': 'OPEN', 'maximum_clockin_delta_minutes': 15,
+                         'maximum_clockout_delay_minutes': 15, 'starting_at': timezone.now(),
+                         'ending_at': timezone.now() + timedelta(hours=8)},
+            employer=self.test_employer)
+        mixer.blend('api.ShiftEmployee', employee=self.test_employee, shift=self.test_shift)
+        self.url = reverse_lazy('api:me-employees-clockins')
+        self.client.force_login(self.test_user_employee)
+
+    def _statements(self, queries):
+        return [query['sql'] for query in queries.captured_queries if 'SAVEPOINT' not in query['sql']]
+
+    @skipUnless(connection.vendor == 'postgresql', 'the state and the insert are PostgreSQL statements')
+    def test_clock_in_in_three_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            clockin = clockin_actions.clock_in(self.test_employee.id, self.test_profile_employee.id,
+                                               self.test_shift.id, timezone.now(), Decimal('-64.0001'), Decimal(10))
+
+        statements = self._statements(queries)
+        # state (locking the talent), insert and the stats of the employer
+        self.assertEqual(len(statements), 3)
+        self.assertIn('FOR UPDATE OF e', statements[0])
+        self.assertTrue(statements[1].lstrip().startswith('INSERT INTO api_clockin'))
+
+        clockin.refresh_from_db()
+        self.assertGreater(clockin.distance_in_miles, 0)
+        self.assertEqual(EmployerStats.objects.get(employer=self.test_employer).open_clockins, 1)
+
+    def test_second_clock_in_is_rejected(self):
+        clockin_actions.clock_in(self.test_employee.id, None, self.test_shift.id, timezone.now(), -64, 10)
+        with self.assertRaisesMessage(clockin_actions.ClockinError, 'You have already clock to a shift'):
+            clockin_actions.clock_in(self.test_employee.id, None, self.test_shift.id, timezone.now(), -64, 10)
+        self.assertEqual(Clockin.objects.count(), 1)
+
+    def test_clock_out_closes_once(self):
+        clockin = clockin_actions.clock_in(self.test_employee.id, None, self.test_shift.id, timezone.now(), -64, 10)
+        payload = {'shift': self.test_shift.id, 'ended_at': timezone.now(), 'latitude_out': -64, 'longitude_out': 10}
+
+        response = self.client.post(self.url, data=payload)
+        self.assertEqual(response.status_code, 201, response.content.decode())
+        self.assertEqual(response.json()['id'], clockin.id)
+        self.assertIsNotNone(response.json()['ended_at'])
+        self.assertEqual(response.json()['author'], self.test_profile_employee.id)
+
+        response = self.client.post(self.url, data=payload)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'details': 'There is no previous clockin for this shift'})
+
+    def test_unknown_shift(self):
+        payload = {'shift': 0, 'started_at': timezone.now(), 'latitude_in': -64, 'longitude_in': 10}
+        response = self.client.post(self.url, data=payload)
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Clockin.objects.exists())
+
+
+@skipUnless(connection.vendor == 'postgresql', 'SQLite locks the whole database, not the talent')
+@override_settings(STATICFILES_STORAGE=None)
+class ConcurrentClockinTestSuite(TransactionTestCase, WithMakeUser, WithMakeShift):
+    """
+    Two clock ins of the same talent at the same time
+    """
+    _make_clockin_data = ClockinActionsTestSuite._make_clockin_data
+
+    def setUp(self):
+        self._make_clockin_data()
+
+    def test_concurrent_clock_in_waits_for_the_lock(self):
+        errors = []
+
+        def second_clock_in():
+            try:
+                clockin_actions.clock_in(self.test_employee.id, None, self.test_shift.id, timezone.now(), -64, 10)
+            except clockin_actions.ClockinError as e:
+                errors.append(str(e))
+            finally:
+                connections.close_all()
+
+        second = threading.Thread(target=second_clock_in)
+        with transaction.atomic():
+            clockin_actions.clock_in(self.test_employee.id, None, self.test_shift.id, timezone.now(), -64, 10)
+            second.start()
+            # the second clock in reads its state and waits for the lock
+            time.sleep(0.5)
+        second.join()
+
+        self.assertEqual(errors, ["You can't Clock in with a pending Clock out"])
+        self.assertEqual(Clockin.objects.filter(employee=self.test_employee).count(), 1)
@@ -0,0 +1,90 @@
+from datetime import datetime, timedelta
+
+from django.test import TestCase, override_settings
+from django.urls import reverse_lazy
+from django.utils import timezone
+from mixer.backend.django import mixer
+
+from api.actions.employee_actions import create_default_availablity
+from api.models import AvailabilityInterval
+from api.tests.mixins import WithMakeUser
+from api.utils import availability
+
+# a monday
+MONDAY = datetime(2026, 10, 19, tzinfo=timezone.utc)
+
+
+@override_settings(STATICFILES_STORAGE=None)
+class AvailabilityTestSuite(TestCase, WithMakeUser):
+    """
+    Interval index of the recurring availability blocks
+    """
+    def setUp(self):
+        self.test_user, self.test_employee, _ = self._make_user(
+            'employee', userkwargs=dict(username='employee1', email='employee1@testdoma.in', is_active=True))
+
+    def _block(self, starting_at, hours, **kwargs):
+        kwargs = dict(dict(allday=False, recurrent=True, recurrency_type='WEEKLY'), **kwargs)
+        return mixer.blend('api.AvailabilityBlock', employee=self.test_employee, starting_at=starting_at,
+                           ending_at=starting_at + timedelta(hours=hours), **kwargs)
+
+    def _available(self, starting_at, hours):
+        ids = set(availability.available_employees(starting_at, starting_at + timedelta(hours=hours))
+                  .values_list('employee_id', flat=True))
+        in_python = availability.covers(availability.get_intervals([self.test_employee.id])[self.test_employee.id],
+                                        starting_at, starting_at + timedelta(hours=hours))
+        self.assertEqual(self.test_employee.id in ids, in_python)
+        return in_python
+
+    def _available_ids(self, starting_at, hours):
+        return list(availability.available_employees(starting_at, starting_at + timedelta(hours=hours)))
+
+    def test_weekly_block_repeats(self):
+        self._block(MONDAY + timedelta(hours=9), 8)
+        self.assertTrue(self._available(MONDAY + timedelta(hours=10), 4))
+        self.assertTrue(self._available(MONDAY + timedelta(weeks=3, hours=9), 8))
+        # longer than the block, or on another day
+        self.assertFalse(self._available(MONDAY + timedelta(hours=10), 8))
+        self.assertFalse(self._available(MONDAY + timedelta(days=1, hours=10), 4))
+
+    def test_adjacent_blocks_across_the_week(self):
+        self._block(MONDAY + timedelta(days=6, hours=20), 4)
+        self._block(MONDAY, 6)
+        # sunday 22:00 to monday 04:00
+        self.assertTrue(self._available(MONDAY + timedelta(days=13, hours=22), 6))
+
+    def test_monthly_and_one_time_blocks(self):
+        self._block(MONDAY + timedelta(hours=9), 8, recurrency_type='MONTHLY')
+        self._block(MONDAY + timedelta(days=2, hours=9), 8, recurrent=False)
+        self.assertTrue(self._available(datetime(2026, 12, 19, 12, tzinfo=timezone.utc), 2))
+        self.assertFalse(self._available(MONDAY + timedelta(weeks=1, hours=12), 2))
+        self.assertTrue(self._available(MONDAY + timedelta(days=2, hours=12), 2))
+        self.assertFalse(self._available(MONDAY + timedelta(days=9, hours=12), 2))
+
+    def test_monthly_block_across_the_end_of_the_month(self):
+        self._block(datetime(2026, 10, 31, 22, tzinfo=timezone.utc), 4, recurrency_type='MONTHLY')
+        # the 31st at 23:00 to the 1st at 01:00, and the beginning of the 1st alone
+        self.assertTrue(self._available(datetime(2026, 12, 31, 23, tzinfo=timezone.utc), 2))
+        self.assertTrue(self._available(datetime(2027, 1, 1, 0, 30, tzinfo=timezone.utc), 1))
+        self.assertFalse(self._available(datetime(2027, 1, 1, 1, 30, tzinfo=timezone.utc), 1))
+
+    def test_default_availability_is_one_interval(self):
+        create_default_availablity(self.test_employee)
+        self.assertEqual(list(AvailabilityInterval.objects.values_list('period', 'start_minute', 'end_minute')),
+                         [('WEEK', 0, None)])
+        with self.assertNumQueries(1):
+            self.assertTrue(self._available_ids(MONDAY + timedelta(days=3), 72))
+
+    def test_view_writes_rebuild_the_index(self):
+        self.client.force_login(self.test_user)
+        url = reverse_lazy('api:me-employees-availability')
+        starting_at = MONDAY + timedelta(days=1, hours=8)
+        response = self.client.post(url, data={
+            'starting_at': starting_at.isoformat(), 'ending_at': (starting_at + timedelta(hours=8)).isoformat(),
+            'allday': False, 'recurrent': True, 'recurrency_type': 'WEEKLY'})
+        self.assertEqual(response.status_code, 200, response.content.decode())
+        self.assertTrue(self._available(starting_at + timedelta(weeks=2), 8))
+
+        url = reverse_lazy('api:me-employees-availability', kwargs={'block_id': response.json()['id']})
+        self.assertEqual(self.client.delete(url).status_code, 200)
+        self.assertFalse(AvailabilityInterval.objects.exists())
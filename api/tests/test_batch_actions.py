@@ -0,0 +1,77 @@
+from datetime import timedelta
+
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse_lazy
+from django.utils import timezone
+from mixer.backend.django import mixer
+
+from api.models import Notification, Shift
+from api.tests.mixins import WithMakeShift, WithMakeUser
+
+
+@override_settings(STATICFILES_STORAGE=None)
+class EmployerBatchActionsTestSuite(TestCase, WithMakeUser, WithMakeShift):
+    """
+    Validated, transactional batch updates of the employer shifts
+    """
+    def setUp(self):
+        self.test_user_employer, self.test_employer, self.test_profile_employer = self._make_user(
+            'employer',
+            userkwargs=dict(username='employer1', email='employer1@testdoma.in', is_active=True)
+        )
+        self.test_user_employee, self.test_employee, _ = self._make_user(
+            'employee',
+            userkwargs=dict(username='employee1', email='employee1@testdoma.in', is_active=True)
+        )
+        now = timezone.now()
+        self.shifts = [self._make_shift(self.test_employer, shiftkwargs=dict(
+            status='OPEN', maximum_allowed_employees=2, application_restriction='SPECIFIC_PEOPLE',
+            starting_at=now + timedelta(days=i + 1), ending_at=now + timedelta(days=i + 1, hours=8)))[0]
+            for i in range(3)]
+        self.url = reverse_lazy('api:me-batch-actions')
+        self.client.force_login(self.test_user_employer)
+
+    def _post(self, changes):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(self.url, {'changes': changes}, content_type='application/json')
+        return response, [query['sql'] for query in queries.captured_queries]
+
+    def test_updates_all_the_shifts(self):
+        response, _ = self._post({'shifts': {str(shift.id): {'minimum_hourly_rate': 20, 'description': 'batch'}
+                                             for shift in self.shifts}})
+        self.assertEqual(response.status_code, 200, response.content)
+        body = response.json()
+        self.assertTrue(body['applied'])
+        self.assertEqual([result['status'] for result in body['results']], ['updated'] * 3)
+        self.assertIn('sql_time_ms', body)
+        self.assertEqual(Shift.objects.filter(description='batch', minimum_hourly_rate=20).count(), 3)
+
+    def test_nothing_is_applied_if_one_change_is_invalid(self):
+        other_employer = self._make_user('employer')[1]
+        other_shift = self._make_shift(other_employer)[0]
+        mixer.blend('api.Clockin', shift=self.shifts[1], employee=self.test_employee, started_at=timezone.now())
+
+        response, _ = self._post({'shifts': {
+            str(self.shifts[0].id): {'description': 'batch'},
+            str(self.shifts[1].id): {'description': 'batch'},
+            str(other_shift.id): {'description': 'batch'},
+        }})
+        self.assertEqual(response.status_code, 400, response.content)
+        results = {result['id']: result for result in response.json()['results']}
+        self.assertEqual(results[str(self.shifts[0].id)]['status'], 'valid')
+        self.assertEqual(results[str(self.shifts[1].id)]['status'], 'error')
+        self.assertEqual(results[str(other_shift.id)]['errors'], ['This shift was not found'])
+        self.assertFalse(Shift.objects.filter(description='batch').exists())
+
+    def test_notifications_are_queued_once(self):
+        for shift in self.shifts:
+            mixer.blend('api.ShiftApplication', shift=shift, employee=self.test_employee)
+
+        response, queries = self._post({'shifts': {str(shift.id): {'status': 'CANCELLED'} for shift in self.shifts}})
+        self.assertEqual(response.status_code, 200, response.content)
+        inserts = [sql for sql in queries if sql.startswith('INSERT INTO "api_notification"')]
+        self.assertEqual(len(inserts), 1)
+        self.assertEqual(Notification.objects.filter(slug='cancelled_shift').count(), 6)
+        self.assertEqual(Shift.objects.filter(status='CANCELLED').count(), 3)
@@ -0,0 +1,115 @@
+from datetime import timedelta
+
+from django.apps import apps
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse_lazy
+from django.utils import timezone
+from mixer.backend.django import mixer
+
+from api.tests.mixins import WithMakeShift, WithMakeUser
+from api.utils import benchmark, email, notification_queue
+from api.utils.notification_queue import StubTransport
+
+Employee = apps.get_model('api', 'Employee')
+Notification = apps.get_model('api', 'Notification')
+ShiftInvite = apps.get_model('api', 'ShiftInvite')
+
+
+@override_settings(STATICFILES_STORAGE=None,
+                   NOTIFICATION_TRANSPORT='api.utils.notification_queue.StubTransport')
+class BulkInvitesTestSuite(TestCase, WithMakeUser, WithMakeShift):
+    """
+    Manual invites of several talents to several shifts in one request
+    """
+    def setUp(self):
+        StubTransport.outbox = []
+        self.test_user_employer, self.test_employer, self.test_profile_employer = self._make_user(
+            'employer', userkwargs=dict(username='employer1', email='employer@testdoma.in', is_active=True))
+        self.url = reverse_lazy('api:me-employer-get-jobinvites')
+        self.client.force_login(self.test_user_employer)
+
+    def _make_shifts(self, count, employer=None, days=1):
+        starting_at = timezone.now() + timedelta(days=days)
+        return [self._make_shift(
+            shiftkwargs=dict(status='OPEN', starting_at=starting_at + timedelta(days=i),
+                             ending_at=starting_at + timedelta(days=i, hours=8)),
+            employer=employer or self.test_employer)[0] for i in range(count)]
+
+    def _post(self, shifts, talents):
+        return self.client.post(self.url, data={
+            'shifts': [shift.id for shift in shifts],
+            'employees': [talent.id for talent in talents],
+        }, content_type='application/json')
+
+    def _count_queries(self, shifts, talents):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self._post(shifts, talents)
+        self.assertEqual(response.status_code, 201, response.content.decode())
+        return len(ctx.captured_queries)
+
+    def test_number_of_queries_does_not_depend_on_the_matrix(self):
+        few = self._count_queries(self._make_shifts(2), Employee.objects.filter(id__in=benchmark.seed_talents(2)))
+        many = self._count_queries(self._make_shifts(5, days=10),
+                                   Employee.objects.filter(id__in=benchmark.seed_talents(8)))
+        self.assertEqual(few, many)
+        self.assertEqual(ShiftInvite.objects.filter(manually_created=True, status='PENDING').count(), 2 * 2 + 5 * 8)
+
+    def test_one_notification_per_talent(self):
+        shifts = self._make_shifts(3)
+        talents = list(Employee.objects.filter(id__in=benchmark.seed_talents(4)).select_related('user'))
+        response = self._post(shifts, talents[:3])
+        self.assertEqual(response.status_code, 201, response.content.decode())
+        response = self._post(shifts[:1], talents[3:])
+        self.assertEqual(response.status_code, 201, response.content.decode())
+
+        emails = Notification.objects.filter(channel='EMAIL')
+        self.assertEqual(sorted(emails.values_list('slug', flat=True)), ['invite_to_shift'] + ['invite_to_shifts'] * 3)
+        self.assertEqual(emails.filter(slug='invite_to_shifts', recipient=talents[0].user.email).count(), 1)
+
+        summary = notification_queue.process_queue()
+        # an email and a push notification per talent
+        self.assertEqual(summary['sent'], 8)
+        message = next(message for message in StubTransport.outbox if message['to'] == [talents[0].user.email])
+        self.assertEqual(message['template']['subject'], email.get_template_info('invite_to_shifts')['subject'])
+        for shift in shifts:
+            self.assertIn('/shift/{}'.format(shift.id), message['template']['text'])
+            self.assertIn('/shift/{}'.format(shift.id), message['template']['html'])
+
+    def test_outcome_of_every_pair(self):
+        shift, ended = self._make_shifts(1)[0], self._make_shifts(1, days=-3)[0]
+        _, other_employer, __ = self._make_user(
+            'employer', userkwargs=dict(username='employer2', email='employer2@testdoma.in', is_active=True))
+        other_shift = self._make_shifts(1, employer=other_employer)[0]
+        working, invited, rejected, new = Employee.objects.filter(id__in=benchmark.seed_talents(4)).order_by('id')
+        mixer.blend('api.ShiftEmployee', shift=shift, employee=working)
+        mixer.blend('api.ShiftInvite', sender=self.test_profile_employer, shift=shift, employee=invited,
+                    status='PENDING')
+        # the pending invite is not the last one of the pair
+        mixer.blend('api.ShiftInvite', sender=self.test_profile_employer, shift=shift, employee=invited,
+                    status='REJECTED')
+        rejected_invite = mixer.blend('api.ShiftInvite', sender=self.test_profile_employer, shift=shift,
+                                      employee=rejected, status='REJECTED')
+
+        response = self._post([shift, ended, other_shift], [working, invited, rejected, new])
+
+        self.assertEqual(response.status_code, 400)
+        outcomes = {(outcome['shift'], outcome['employee']): outcome for outcome in response.json()}
+        self.assertEqual(len(outcomes), 12)
+        self.assertEqual(outcomes[shift.id, working.id]['status'], 'ALREADY_WORKING')
+        self.assertEqual(outcomes[shift.id, invited.id]['status'], 'ALREADY_INVITED')
+        self.assertEqual(outcomes[shift.id, rejected.id]['status'], 'REINVITED')
+        self.assertEqual(outcomes[shift.id, rejected.id]['invite']['id'], rejected_invite.id)
+        self.assertEqual(outcomes[shift.id, new.id]['status'], 'INVITED')
+        self.assertEqual(outcomes[shift.id, new.id]['invite']['status'], 'PENDING')
+        self.assertEqual(outcomes[shift.id, new.id]['invite']['id'],
+                         ShiftInvite.objects.get(shift=shift, employee=new).id)
+        self.assertEqual(set(outcomes[ended.id, talent.id]['status'] for talent in (rejected, new)), {'ENDED'})
+        self.assertEqual(set(outcomes[other_shift.id, talent.id]['status'] for talent in (rejected, new)),
+                         {'NOT_FOUND'})
+
+        rejected_invite.refresh_from_db()
+        self.assertEqual(rejected_invite.status, 'PENDING')
+        self.assertEqual(ShiftInvite.objects.filter(shift=shift, status='PENDING').count(), 3)
+        self.assertFalse(ShiftInvite.objects.filter(shift__in=[ended, other_shift]).exists())
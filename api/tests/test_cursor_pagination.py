@@ -0,0 +1,82 @@
+from datetime import timedelta
+
+from django.test import TestCase, override_settings
+from django.urls import reverse_lazy
+from django.utils import timezone
+
+from api.tests.mixins import WithMakeShift, WithMakeUser
+from api.utils import benchmark
+
+
+@override_settings(STATICFILES_STORAGE=None)
+class CursorPaginationTestSuite(TestCase, WithMakeUser, WithMakeShift):
+    """
+    Opt-in cursor pagination for the shift and employee lists
+    """
+    def setUp(self):
+        self.test_user_employer, self.test_employer, self.test_profile_employer = self._make_user(
+            'employer',
+            userkwargs={"username": 'employer', "email": 'employer@testdoma.in', "is_active": True},
+        )
+        starting_at = timezone.now() + timedelta(days=1)
+        self.shifts = []
+        for i in range(7):
+            # pairs of shifts start at the same time, the id breaks the tie
+            shift, _, __ = self._make_shift(
+                self.test_employer,
+                shiftkwargs={'status': 'OPEN', 'maximum_allowed_employees': 2,
+                             'starting_at': starting_at + timedelta(days=i // 2),
+                             'ending_at': starting_at + timedelta(days=i // 2, hours=8)})
+            self.shifts.append(shift)
+
+        self.client.force_login(self.test_user_employer)
+
+    def _walk(self, url, params='', limit=2):
+        ids = []
+        response = self.client.get('{}?pagination=cursor&limit={}{}'.format(url, limit, params))
+        while True:
+            self.assertEqual(response.status_code, 200, response.content.decode())
+            ids += [item['id'] for item in response.json()]
+            links = dict((rel.split('"')[1], link.strip(' <>')) for link, rel in (
+                part.split(';') for part in response.get('Link', '').split(',') if part))
+            if 'next' not in links:
+                return ids, response
+            response = self.client.get(links['next'])
+
+    def test_employer_shifts(self):
+        ids, _ = self._walk(reverse_lazy('api:me-employer-get-shifts'))
+        expected = [s.id for s in sorted(self.shifts, key=lambda s: (s.starting_at, s.id), reverse=True)]
+        self.assertEqual(ids, expected)
+
+    def test_employer_new_shifts(self):
+        ids, _ = self._walk(reverse_lazy('api:me-employer-get-new-shifts'), '&serializer=big', limit=3)
+        expected = [s.id for s in sorted(self.shifts, key=lambda s: (s.starting_at, s.id), reverse=True)]
+        self.assertEqual(ids, expected)
+
+    def test_public_shifts(self):
+        ids, _ = self._walk(reverse_lazy('api:get-shifts'))
+        self.assertEqual(sorted(ids), sorted(s.id for s in self.shifts))
+
+    def test_employees(self):
+        employee_ids = benchmark.seed_talents(5)
+        ids, _ = self._walk(reverse_lazy('api:get-employees'))
+        self.assertEqual(set(employee_ids) - set(ids), set())
+        self.assertEqual(len(ids), len(set(ids)))
+
+    def test_total_count_is_optional(self):
+        url = reverse_lazy('api:me-employer-get-shifts')
+        response = self.client.get('{}?pagination=cursor&limit=2'.format(url))
+        self.assertNotIn('x-total-count', response)
+
+        response = self.client.get('{}?pagination=cursor&limit=2&count=exact'.format(url))
+        self.assertEqual(response['x-total-count'], '7')
+
+        response = self.client.get('{}?pagination=cursor&limit=2&count=estimate&envelope=true'.format(url))
+        self.assertTrue(int(response['x-total-count']) >= 1)
+        self.assertEqual(response.json()['count'], int(response['x-total-count']))
+
+    def test_offset_pagination_is_the_default(self):
+        url = reverse_lazy('api:me-employer-get-shifts')
+        response = self.client.get('{}?limit=2&offset=2'.format(url))
+        self.assertEqual(response.status_code, 200, response.content.decode())
+        self.assertEqual(response['x-total-count'], '7')
@@ -0,0 +1,161 @@
+import os
+import shutil
+import tempfile
+from datetime import timedelta
+from io import BytesIO
+
+from django.test import TestCase, override_settings
+from django.test.client import MULTIPART_CONTENT
+from django.urls import reverse_lazy
+from django.utils import timezone
+from mixer.backend.django import mixer
+from mock import patch
+
+from api.models import EmployeeDocument
+from api.tests.mixins import WithMakeUser
+from api.utils import document_storage
+
+
+class FailingStorage(document_storage.LocalStorage):
+
+    def upload(self, file, public_id, tags):
+        raise IOError('storage unavailable')
+
+
+class RecordingStorage:
+
+    def __init__(self, failures=0):
+        self.calls = []
+        self.failures = failures
+
+    def delete(self, public_ids):
+        self.calls.append(list(public_ids))
+        if self.failures > 0:
+            self.failures -= 1
+            raise IOError('timeout')
+        return set(public_ids)
+
+
+@patch.object(document_storage, 'RETRY_DELAY_SECONDS', 0)
+class DocumentPipelineTestSuite(TestCase, WithMakeUser):
+    """
+    Spooled uploads and batched deletes of the employee documents
+    """
+    def setUp(self):
+        self.storage_dir = tempfile.mkdtemp()
+        self.settings_override = override_settings(
+            STATICFILES_STORAGE=None,
+            DOCUMENT_STORAGE='api.utils.document_storage.LocalStorage',
+            DOCUMENT_STORAGE_ROOT=self.storage_dir,
+            DOCUMENT_STORAGE_URL='http://files.testdoma.in/',
+        )
+        self.settings_override.enable()
+
+        self.test_user_employee, self.test_employee, _ = self._make_user(
+            'employee',
+            userkwargs=dict(username='employee1234', email='employee1234@testdoma.in', is_active=True)
+        )
+        self.document_type = mixer.blend('api.Document')
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.storage_dir)
+
+    def _post_document(self):
+        self.client.force_login(self.test_user_employee)
+        with BytesIO(b'the-data') as f:
+            f.name = 'scan.pdf'
+            return self.client.post(reverse_lazy('api:employee-document'),
+                                    {'document': f, 'document_type': self.document_type.id},
+                                    content_type=MULTIPART_CONTENT)
+
+    def test_upload_is_spooled(self):
+        with patch('cloudinary.uploader.upload') as mocked_uploader:
+            response = self._post_document()
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertFalse(mocked_uploader.called)
+
+        document = EmployeeDocument.objects.get(id=response.json()['id'])
+        self.assertEqual(document.status, EmployeeDocument.PENDING_UPLOAD)
+        self.assertEqual(bytes(document.spooled_content), b'the-data')
+        self.assertNotIn('spooled_content', response.json())
+
+    def test_invalid_document_type(self):
+        self.document_type.id = 999999
+        response = self._post_document()
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(EmployeeDocument.objects.exists())
+
+    def test_process_uploads(self):
+        document = EmployeeDocument.objects.get(id=self._post_document().json()['id'])
+
+        summary = document_storage.process_uploads()
+        self.assertEqual(summary, {'processed': 1, 'uploaded': 1, 'failed': 0})
+
+        document.refresh_from_db()
+        self.assertEqual(document.status, EmployeeDocument.PENDING)
+        self.assertEqual(document.document, 'http://files.testdoma.in/' + document.public_id)
+        with open(os.path.join(self.storage_dir, document.public_id), 'rb') as f:
+            self.assertEqual(f.read(), b'the-data')
+        self.assertIsNone(document.spooled_content)
+
+        self.test_employee.refresh_from_db()
+        self.assertEqual(self.test_employee.employment_verification_status, 'MISSING_DOCUMENTS')
+
+    def test_stale_claims_are_uploaded_again(self):
+        documents = [EmployeeDocument.objects.get(id=self._post_document().json()['id']) for _ in range(2)]
+        claimed_at = timezone.now()
+        stale = claimed_at - document_storage.CLAIM_TIMEOUT - timedelta(minutes=1)
+        EmployeeDocument.objects.filter(id=documents[0].id).update(status=EmployeeDocument.UPLOADING, claimed_at=stale)
+        EmployeeDocument.objects.filter(id=documents[1].id).update(status=EmployeeDocument.UPLOADING,
+                                                                   claimed_at=claimed_at)
+
+        self.assertEqual(document_storage.process_uploads(), {'processed': 1, 'uploaded': 1, 'failed': 0})
+        self.assertEqual(list(EmployeeDocument.objects.order_by('id').values_list('status', 'claimed_at')),
+                         [(EmployeeDocument.PENDING, None), (EmployeeDocument.UPLOADING, claimed_at)])
+
+    def test_failed_uploads_give_up(self):
+        document = EmployeeDocument.objects.get(id=self._post_document().json()['id'])
+
+        for attempt in range(document_storage.MAX_ATTEMPTS):
+            summary = document_storage.process_uploads(storage=FailingStorage())
+            self.assertEqual(summary['failed'], 1)
+        self.assertEqual(document_storage.process_uploads(storage=FailingStorage())['processed'], 0)
+
+        document.refresh_from_db()
+        self.assertEqual(document.status, EmployeeDocument.UPLOAD_FAILED)
+        self.assertEqual(document.upload_attempts, document_storage.MAX_ATTEMPTS)
+        self.assertEqual(document.last_error, 'storage unavailable')
+        self.assertEqual(bytes(document.spooled_content), b'the-data')
+
+    def test_delete_is_deferred(self):
+        document = mixer.blend('api.EmployeeDocument', employee=self.test_employee, public_id='1/doc')
+        self.client.force_login(self.test_user_employee)
+        response = self.client.delete(reverse_lazy('api:employee-document-detail', kwargs={'document_id': document.id}))
+        self.assertEqual(response.status_code, 204)
+        document.refresh_from_db()
+        self.assertEqual(document.status, EmployeeDocument.DELETED)
+
+    def test_delete_in_batches(self):
+        EmployeeDocument.objects.bulk_create([
+            EmployeeDocument(employee=self.test_employee, document_type=self.document_type,
+                             public_id='doc-{}'.format(i), status=EmployeeDocument.DELETED) for i in range(250)])
+        storage = RecordingStorage(failures=1)
+        progress = []
+
+        summary = document_storage.delete_documents(storage=storage, progress=lambda *p: progress.append(p))
+        self.assertEqual(summary, {'deleted': 250, 'failed': 0})
+        # the first batch is retried once
+        self.assertEqual([len(call) for call in storage.calls], [100, 100, 100, 50])
+        self.assertEqual(progress, [(100, 250), (200, 250), (250, 250)])
+        self.assertFalse(EmployeeDocument.objects.exists())
+
+    def test_failed_deletes_are_kept(self):
+        mixer.blend('api.EmployeeDocument', employee=self.test_employee, public_id='doc',
+                    status=EmployeeDocument.DELETED)
+        storage = RecordingStorage(failures=document_storage.DELETE_RETRIES + 1)
+
+        summary = document_storage.delete_documents(storage=storage)
+        self.assertEqual(summary, {'deleted': 0, 'failed': 1})
+        self.assertEqual(len(storage.calls), document_storage.DELETE_RETRIES + 1)
+        self.assertEqual(EmployeeDocument.objects.filter(status=EmployeeDocument.DELETED).count(), 1)
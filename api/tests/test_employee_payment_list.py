@@ -0,0 +1,99 @@
+import decimal
+import random
+
+from django.apps import apps
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse_lazy
+from mixer.backend.django import mixer
+
+from api.serializers import payment_serializer
+from api.tests.mixins import WithMakePayrollPeriod, WithMakeUser
+from api.utils import benchmark, taxes_functions
+
+Employee = apps.get_model('api', 'Employee')
+EmployeePayment = apps.get_model('api', 'EmployeePayment')
+Profile = apps.get_model('api', 'Profile')
+
+
+def reference_tentative_withholding(adjusted_wage, filling_status, step2c_checked):
+    """How the tentative withholding was calculated, walking the table one level at a time"""
+    table = taxes_functions.WITHHOLDING_TABLES[(filling_status, step2c_checked)]
+    ind = 0
+    while ind < len(table) - 1 and adjusted_wage >= table[ind + 1]['level_amount']:
+        ind += 1
+    return round((adjusted_wage - table[ind]['level_amount']) * table[ind]['percentage'], 2) \
+        + table[ind]['base_withholding']
+
+
+@override_settings(STATICFILES_STORAGE=None)
+class EmployeePaymentListTestSuite(TestCase, WithMakeUser, WithMakePayrollPeriod):
+    """
+    The deductions and taxes of a payroll run are computed with a fixed number of queries
+    """
+    def setUp(self):
+        self.test_user_employer, self.test_employer, self.test_profile_employer = self._make_user(
+            'employer', userkwargs=dict(username='employer1', email='employer@testdoma.in', is_active=True))
+        self.period = self._make_period(self.test_employer)
+        mixer.blend('api.PreDefinedDeduction', type='PERCENTAGE', value=7.65)
+        mixer.blend('api.EmployerDeduction', employer=self.test_employer, type='AMOUNT', value=10)
+        self.client.force_login(self.test_user_employer)
+
+    def _make_payments(self, count):
+        rnd = random.Random(count)
+        employee_ids = benchmark.seed_talents(count)
+        Employee.objects.filter(id__in=employee_ids[::2]).update(filing_status='MARRIED_JOINTLY')
+        for profile in Profile.objects.filter(employee_id__in=employee_ids[::3]):
+            mixer.blend('api.BankAccount', user=profile)
+        EmployeePayment.objects.bulk_create([
+            EmployeePayment(payroll_period=self.period, employer=self.test_employer, employee_id=employee_id,
+                            earnings=decimal.Decimal(rnd.randint(0, 300000)) / 100)
+            for employee_id in employee_ids
+        ])
+
+    def _get(self):
+        url = reverse_lazy('api:me-get-employee-payment-list', kwargs={'period_id': self.period.id})
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, response.content.decode())
+        return response.json(), len(ctx.captured_queries)
+
+    def test_number_of_queries_does_not_depend_on_the_payments(self):
+        self._make_payments(3)
+        _, few = self._get()
+        self._make_payments(30)
+        data, many = self._get()
+        self.assertEqual(len(data['payments']), 33)
+        self.assertEqual(few, many)
+
+    def test_deductions_and_taxes(self):
+        self._make_payments(10)
+        data, _ = self._get()
+        payments = {payment.id: payment for payment in EmployeePayment.objects.select_related('employee')}
+        for row in data['payments']:
+            payment = payments[row['id']]
+            percentage = round(payment.earnings * decimal.Decimal('7.65') / 100, 2)
+            self.assertEqual([decimal.Decimal(str(d['amount'])) for d in row['deduction_list']],
+                             [percentage, decimal.Decimal('10.00')])
+            self.assertEqual(decimal.Decimal(str(row['deductions'])), percentage + 10)
+            self.assertEqual(decimal.Decimal(str(row['taxes'])),
+                             payment.employee.calculate_tax_amount(
+                                 payment.earnings, payment_serializer.get_period_quantity(self.period)))
+            self.assertEqual(len(row['employee']['bank_accounts']),
+                             Profile.objects.get(employee=payment.employee).bank_accounts.count())
+
+    def test_tentative_withholding_matches_the_linear_walk(self):
+        rnd = random.Random(3)
+        for filling_status, step2c_checked in taxes_functions.WITHHOLDING_TABLES:
+            table = taxes_functions.WITHHOLDING_TABLES[(filling_status, step2c_checked)]
+            wages = [row['level_amount'] for row in table] + [row['level_amount'] - decimal.Decimal('0.01')
+                                                              for row in table[1:]]
+            wages += [decimal.Decimal(rnd.randint(0, 80000000)) / 100 for _ in range(200)]
+            for wage in wages:
+                self.assertEqual(
+                    taxes_functions.get_tentative_withholding(wage, filling_status, step2c_checked),
+                    reference_tentative_withholding(wage, filling_status, step2c_checked),
+                    '{} {} {}'.format(filling_status, step2c_checked, wage))
+        with self.assertRaises(ValueError):
+            taxes_functions.get_tentative_withholding(decimal.Decimal('100.00'), 'UNKNOWN', False)
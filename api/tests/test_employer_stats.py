@@ -0,0 +1,117 @@
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse_lazy
+from django.utils import timezone
+from mixer.backend.django import mixer
+from mock import patch
+
+from api.models import EmployerStats, ShiftEmployee, ShiftInvite
+from api.tests.mixins import WithMakeShift, WithMakeUser
+from api.utils import employer_stats
+
+
+@override_settings(STATICFILES_STORAGE=None)
+class EmployerStatsTestSuite(TestCase, WithMakeUser, WithMakeShift):
+    """
+    Dashboard counters of the employer
+    """
+    def setUp(self):
+        self.test_user_employer, self.test_employer, self.test_profile_employer = self._make_user(
+            'employer',
+            userkwargs=dict(username='employer1', email='employer1@testdoma.in', is_active=True)
+        )
+        self.test_user_employee, self.test_employee, _ = self._make_user(
+            'employee',
+            userkwargs=dict(username='employee1', email='employee1@testdoma.in', is_active=True)
+        )
+        now = timezone.now()
+        self.open_shift, *_ = self._make_shift(self.test_employer, shiftkwargs=dict(
+            status='OPEN', maximum_allowed_employees=2,
+            starting_at=now + timedelta(days=1), ending_at=now + timedelta(days=1, hours=8)))
+        self.past_shift, *_ = self._make_shift(self.test_employer, shiftkwargs=dict(
+            status='FILLED', maximum_allowed_employees=1,
+            starting_at=now - timedelta(hours=2), ending_at=now + timedelta(hours=6)))
+        ShiftEmployee.objects.create(shift=self.past_shift, employee=self.test_employee)
+        mixer.blend('api.Clockin', shift=self.past_shift, employee=self.test_employee, started_at=now, ended_at=None)
+
+    def _stats(self):
+        return EmployerStats.objects.filter(employer_id=self.test_employer.id).values(*employer_stats.COUNTERS).get()
+
+    def test_counters(self):
+        mixer.blend('api.ShiftApplication', shift=self.open_shift, employee=self.test_employee)
+        mixer.blend('api.ShiftInvite', shift=self.open_shift, employee=self.test_employee,
+                    sender=self.test_profile_employer, status='PENDING')
+        period = mixer.blend('api.PayrollPeriod', employer=self.test_employer)
+        mixer.blend('api.EmployeePayment', employer=self.test_employer, employee=self.test_employee,
+                    payroll_period=period, paid=False, amount=Decimal('120.50'), earnings=0)
+
+        stats = self._stats()
+        self.assertEqual((stats['open_shifts'], stats['filled_shifts'], stats['upcoming_shifts']), (1, 1, 1))
+        self.assertEqual(stats['next_shift_starting_at'], self.open_shift.starting_at)
+        self.assertEqual((stats['pending_applicants'], stats['pending_invites'], stats['open_clockins']), (1, 1, 1))
+        self.assertEqual((stats['unpaid_payments'], stats['unpaid_amount']), (1, Decimal('120.50')))
+
+    def test_incremental_updates(self):
+        invite = mixer.blend('api.ShiftInvite', shift=self.open_shift, employee=self.test_employee,
+                             sender=self.test_profile_employer, status='PENDING')
+        self.assertEqual(self._stats()['pending_invites'], 1)
+        invite.status = 'APPLIED'
+        invite.save()
+        self.assertEqual(self._stats()['pending_invites'], 0)
+
+        self.open_shift.employees.add(self.test_employee)
+        mixer.blend('api.ShiftEmployee', shift=self.open_shift)
+        stats = self._stats()
+        self.assertEqual((stats['open_shifts'], stats['filled_shifts']), (0, 2))
+
+        self.open_shift.delete()
+        stats = self._stats()
+        self.assertEqual((stats['filled_shifts'], stats['upcoming_shifts']), (1, 0))
+
+    def test_endpoint_single_row_read(self):
+        self.client.force_login(self.test_user_employer)
+        url = reverse_lazy('api:me-employer-stats')
+        self.client.get(url)
+
+        with self.assertNumQueries(1):
+            stats = employer_stats.get_stats(self.test_employer.id)
+        self.assertEqual(stats.open_clockins, 1)
+
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(response.json()['open_shifts'], 1)
+        self.assertEqual(response.json()['upcoming_shifts'], 1)
+
+    def test_outdated_when_the_next_shift_starts(self):
+        later = self.open_shift.starting_at + timedelta(minutes=1)
+        with patch('api.utils.employer_stats.timezone.now', return_value=later):
+            self.assertEqual(employer_stats.get_stats(self.test_employer.id).upcoming_shifts, 0)
+
+    def test_reconcile_drift(self):
+        # bulk writes skip the signals
+        ShiftInvite.objects.bulk_create([ShiftInvite(shift=self.open_shift, employee=self.test_employee,
+                                                     sender=self.test_profile_employer)] * 3)
+        other_user, other_employer, _ = self._make_user('employer')
+
+        summary = employer_stats.reconcile(fix=False)
+        self.assertEqual(summary['drifted'], [self.test_employer.id, other_employer.id])
+        self.assertEqual(self._stats()['pending_invites'], 0)
+
+        employer_stats.reconcile()
+        self.assertEqual(self._stats()['pending_invites'], 3)
+        self.assertEqual(employer_stats.reconcile()['drifted'], [])
+
+    def test_deferred_refreshes_once(self):
+        with CaptureQueriesContext(connection) as queries:
+            with employer_stats.deferred():
+                for i in range(3):
+                    mixer.blend('api.ShiftApplication', shift=self.open_shift, employee=self.test_employee)
+                self.open_shift.employees.clear()
+        refreshes = [query for query in queries.captured_queries
+                     if 'INTO api_employerstats' in query['sql'].replace('"', '')]
+        self.assertEqual(len(refreshes), 1)
+        self.assertEqual(self._stats()['pending_applicants'], 3)
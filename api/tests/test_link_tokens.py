@@ -0,0 +1,100 @@
+import json
+from datetime import timedelta
+
+import jwt
+from django.apps import apps
+from django.test import TestCase, override_settings
+from django.urls import reverse_lazy
+from django.utils import timezone
+from rest_framework_jwt.settings import api_settings
+
+from api.tests.mixins import WithMakeUser
+from api.utils import tokens
+from api.utils.jwt import internal_payload_encode
+
+RevokedToken = apps.get_model('api', 'RevokedToken')
+UserToken = apps.get_model('api', 'UserToken')
+
+jwt_payload_handler = api_settings.JWT_PAYLOAD_HANDLER
+jwt_encode_handler = api_settings.JWT_ENCODE_HANDLER
+
+
+@override_settings(STATICFILES_STORAGE=None, LINK_TOKEN_KEYS=[('k2', 'new secret'), ('k1', 'old secret')])
+class LinkTokensTestSuite(TestCase, WithMakeUser):
+    """
+    Signed tokens of the emailed links
+    """
+    def setUp(self):
+        self.test_user, *_ = self._make_user(
+            'employee',
+            userkwargs=dict(username='test_user', email='test_user@testdoma.in', is_active=True)
+        )
+
+    def test_round_trip_without_queries(self):
+        with self.assertNumQueries(0):
+            token = internal_payload_encode({"user_id": self.test_user.id}, email=self.test_user.email)
+            payload = tokens.decode(token)
+        self.assertEqual(payload['user_id'], self.test_user.id)
+        self.assertTrue(token.startswith('k2.'))
+        self.assertLess(len(token), 120)
+
+    def test_tampered_and_expired(self):
+        kid, body, signature = tokens.encode({"user_id": 1}).split('.')
+        other_body = tokens.encode({"user_id": 2}).split('.')[1]
+        with self.assertRaises(tokens.InvalidToken):
+            tokens.decode('.'.join((kid, other_body, signature)))
+
+        with self.assertRaises(jwt.ExpiredSignatureError):
+            tokens.decode(tokens.encode({"user_id": 1}, exp_min=-1))
+
+    def test_key_rotation(self):
+        with override_settings(LINK_TOKEN_KEYS=[('k1', 'old secret')]):
+            token = tokens.encode({"user_id": 1})
+        self.assertEqual(tokens.decode(token)['user_id'], 1)
+
+        with override_settings(LINK_TOKEN_KEYS=[('k3', 'newer secret'), ('k2', 'new secret')]):
+            with self.assertRaises(jwt.InvalidTokenError):
+                tokens.decode(token)
+
+    def test_links_sent_as_jwt(self):
+        token = jwt_encode_handler(jwt_payload_handler(self.test_user))
+        self.assertEqual(tokens.decode(token)['user_id'], self.test_user.id)
+
+    def test_reset_link_works_once(self):
+        token = internal_payload_encode({"user_id": self.test_user.id})
+        payload = {'token': token, 'new_password': 'n3w_p4ss', 'repeat_password': 'n3w_p4ss'}
+        url = reverse_lazy('api:password-reset-email')
+
+        response = self.client.put(url, data=json.dumps(payload), content_type="application/json")
+        self.assertEqual(response.status_code, 204)
+        response = self.client.put(url, data=json.dumps(payload), content_type="application/json")
+        self.assertEqual(response.status_code, 400)
+        self.assertTrue(tokens.is_revoked(tokens.decode(token)))
+
+    def test_revoked_tokens_are_pruned(self):
+        tokens.revoke(tokens.decode(tokens.encode({"user_id": 1})))
+        expired = dict(jti='expired', exp=int(timezone.now().timestamp()) - 60)
+        tokens.revoke(expired)
+        with self.assertRaises(tokens.InvalidToken):
+            tokens.revoke(expired)
+
+        self.assertEqual(tokens.prune_revoked(), 1)
+        self.assertEqual(RevokedToken.objects.count(), 1)
+
+    def test_audit_log_is_opt_in(self):
+        internal_payload_encode({"user_id": self.test_user.id}, email=self.test_user.email)
+        self.assertEqual(UserToken.objects.count(), 0)
+
+        with override_settings(LINK_TOKEN_AUDIT=True):
+            token = internal_payload_encode({"user_id": self.test_user.id}, exp_min=60, email=self.test_user.email)
+        audit = UserToken.objects.get()
+        self.assertEqual((audit.token, audit.email), (token, self.test_user.email))
+        self.assertAlmostEqual(audit.expires_at, timezone.now() + timedelta(minutes=60), delta=timedelta(seconds=5))
+
+    def test_prune_expired_in_batches(self):
+        now = timezone.now()
+        UserToken.objects.bulk_create(
+            [UserToken(token=str(i), email='', expires_at=now - timedelta(minutes=1)) for i in range(7)] +
+            [UserToken(token='valid', email='', expires_at=now + timedelta(minutes=1))])
+        self.assertEqual(tokens.prune_audit_log(batch_size=3), 7)
+        self.assertEqual(list(UserToken.objects.values_list('token', flat=True)), ['valid'])
@@ -0,0 +1,93 @@
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import requests
+from django.core.cache import caches
+from django.test import TestCase, override_settings
+from django.urls import reverse_lazy
+from mixer.backend.django import mixer
+
+from api.tests.mixins import WithMakeUser
+from api.utils import metrics
+
+
+class _OkHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        self.send_response(200)
+        self.end_headers()
+        self.wfile.write(b'ok')
+
+    def log_message(self, *args):
+        pass
+
+
+@override_settings(STATICFILES_STORAGE=None, METRICS_TOKEN='s3cret')
+class MetricsTestSuite(TestCase, WithMakeUser):
+    """
+    Per endpoint metrics of the PerformanceMiddleware
+    """
+    def setUp(self):
+        caches['reference'].clear()
+        self.test_user, *_ = self._make_user(
+            'employee', userkwargs=dict(username='employee1', email='employee1@testdoma.in', is_active=True))
+        mixer.cycle(3).blend('api.Position')
+        self.client.force_login(self.test_user)
+        self.url = reverse_lazy('api:admin-get-positions')
+
+    def _metrics(self):
+        return self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer s3cret').content.decode()
+
+    def test_request_metrics_by_url_name(self):
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+
+        content = self._metrics()
+        self.assertIn('jobcore_request_seconds_count{method="GET",status="2xx",view="api:admin-get-positions"}',
+                      content)
+        self.assertIn('jobcore_request_queries_count{view="api:admin-get-positions"}', content)
+        self.assertNotIn('view="metrics"', content)
+
+    @override_settings(SERVER_TIMING_HEADER=True)
+    def test_server_timing_header(self):
+        response = self.client.get(self.url)
+        self.assertRegex(response['Server-Timing'],
+                         r'^db;dur=[\d.]+;desc="\d+ queries", serialize;dur=[\d.]+, http;dur=[\d.]+, total;dur=[\d.]+$')
+
+    def test_no_server_timing_header_by_default(self):
+        self.assertFalse(self.client.get(self.url).has_header('Server-Timing'))
+
+    @override_settings(SLOW_REQUEST_MS=0)
+    def test_slow_request_logs_worst_queries(self):
+        with self.assertLogs('api.middleware', 'WARNING') as logs:
+            self.client.get(self.url)
+        self.assertIn('Slow request GET /api/positions (api:admin-get-positions)', logs.output[0])
+        self.assertIn('SELECT', logs.output[0])
+
+    def test_duplicate_queries(self):
+        request_metrics = metrics.RequestMetrics()
+        request_metrics.record_query('SELECT 1 WHERE id = %s', (1,), 0.001)
+        request_metrics.record_query('SELECT 1 WHERE id = %s', (2,), 0.001)
+        request_metrics.record_query('SELECT 1 WHERE id = %s', (1,), 0.003)
+        self.assertEqual(request_metrics.queries, 3)
+        self.assertEqual(request_metrics.duplicate_queries, 1)
+        self.assertAlmostEqual(request_metrics.worst[0][0], 0.003)
+
+    def test_outbound_calls(self):
+        server = HTTPServer(('127.0.0.1', 0), _OkHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        request_metrics = metrics.start()
+        try:
+            requests.get('http://127.0.0.1:{}/'.format(server.server_port))
+        finally:
+            metrics.stop()
+            server.shutdown()
+            server.server_close()
+
+        self.assertGreater(request_metrics.outbound['127.0.0.1'], 0)
+        self.assertIn('jobcore_outbound_seconds_count{host="127.0.0.1"}', self._metrics())
+
+    def test_metrics_token(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+        self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer wrong').status_code, 403)
+        self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer s3cret').status_code, 200)
+        with override_settings(METRICS_TOKEN=None):
+            self.assertEqual(self.client.get('/metrics').status_code, 403)
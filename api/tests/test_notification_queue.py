@@ -0,0 +1,125 @@
+from datetime import timedelta
+
+from mock import patch
+from mixer.backend.django import mixer
+
+from django.apps import apps
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from api.tests.mixins import WithMakeUser
+from api.utils import notification_queue
+from api.utils.notification_queue import StubTransport
+
+Notification = apps.get_model('api', 'Notification')
+
+
+class FailingTransport(StubTransport):
+
+    def send_email(self, slug, to, data):
+        raise Exception('Mailgun is down')
+
+    def send_fcm(self, slug, registration_ids, data):
+        raise Exception('Firebase is down')
+
+
+@override_settings(STATICFILES_STORAGE=None,
+                   NOTIFICATION_TRANSPORT='api.utils.notification_queue.StubTransport')
+class NotificationQueueTestSuite(TestCase, WithMakeUser):
+
+    def setUp(self):
+        StubTransport.outbox = []
+        self.users = []
+        for i in range(3):
+            user, _, __ = self._make_user(
+                'employee',
+                userkwargs=dict(username='employee{}'.format(i), email='employee{}@testdoma.in'.format(i),
+                                is_active=True))
+            mixer.blend('api.FCMDevice', user=user, registration_id='device{}'.format(i))
+            self.users.append(user)
+
+        self.data = {
+            "COMPANY": "Blizard Inc",
+            "POSITION": "Server",
+            "DATE": timezone.now(),
+            "DATA": {"type": "shift", "id": 1}
+        }
+
+    @patch('api.utils.email.requests')
+    def test_queue_does_not_send(self, mocked_requests):
+        notification_queue.queue_emails('new_shift', [(user.email, self.data) for user in self.users])
+        notification_queue.queue_push_notifications('new_shift', [(user.id, self.data) for user in self.users])
+
+        self.assertEqual(mocked_requests.post.called, False)
+        self.assertEqual(Notification.objects.filter(sent=False).count(), 6)
+        self.assertEqual(notification_queue.queue_depth()['due'], 6)
+
+    def test_queue_number_of_queries(self):
+        with self.assertNumQueries(2):
+            notification_queue.queue_push_notifications('new_shift', [(user.id, self.data) for user in self.users])
+
+    def test_push_notifications_are_sent_together(self):
+        notification_queue.queue_push_notifications('new_shift', [(user.id, self.data) for user in self.users])
+
+        summary = notification_queue.process_queue()
+
+        self.assertEqual(summary['sent'], 3)
+        self.assertEqual(len(StubTransport.outbox), 1)
+        self.assertEqual(sorted(StubTransport.outbox[0]['to']), ['device0', 'device1', 'device2'])
+        self.assertEqual(Notification.objects.filter(sent=True, sent_at__isnull=False).count(), 3)
+        self.assertEqual(notification_queue.queue_depth()['pending'], 0)
+
+    @patch('api.utils.notification_queue.FCM_BATCH_SIZE', 2)
+    def test_push_notifications_batch_size(self):
+        notification_queue.queue_push_notifications('new_shift', [(user.id, self.data) for user in self.users])
+
+        notification_queue.process_queue()
+
+        self.assertEqual([len(message['to']) for message in StubTransport.outbox], [2, 1])
+
+    def test_scheduled_notifications_wait(self):
+        notification_queue.queue_emails('new_shift', [(self.users[0].email, self.data)],
+                                        scheduled_at=timezone.now() + timedelta(hours=1))
+
+        summary = notification_queue.process_queue()
+
+        self.assertEqual(summary['processed'], 0)
+        self.assertEqual(notification_queue.queue_depth()['pending'], 1)
+
+    def test_failed_notifications_are_retried_later(self):
+        notification_queue.queue_emails('new_shift', [(self.users[0].email, self.data)])
+        notification_queue.queue_push_notifications('new_shift', [(self.users[0].id, self.data)])
+
+        summary = notification_queue.process_queue(transport=FailingTransport())
+        self.assertEqual(summary['failed'], 2)
+
+        for notification in Notification.objects.all():
+            self.assertEqual(notification.attempts, 1)
+            self.assertEqual(notification.sent, False)
+            self.assertGreater(notification.scheduled_at, timezone.now())
+
+        # nothing is due until the backoff expires
+        self.assertEqual(notification_queue.process_queue()['processed'], 0)
+        self.assertEqual(notification_queue.queue_depth()['retrying'], 2)
+
+    def test_claimed_notifications_are_sent_again_after_the_claim_timeout(self):
+        notification_queue.queue_emails('new_shift', [(self.users[0].email, self.data)])
+        # the worker that claimed it died before recording the result
+        notification_queue._claim(10, timezone.now())
+
+        self.assertEqual(notification_queue.process_queue()['processed'], 0)
+        with patch('api.utils.notification_queue.timezone.now',
+                   return_value=timezone.now() + notification_queue.CLAIM_TIMEOUT):
+            self.assertEqual(notification_queue.process_queue()['sent'], 1)
+        self.assertEqual(len(StubTransport.outbox), 1)
+
+    def test_give_up_after_max_attempts(self):
+        notification_queue.queue_emails('new_shift', [(self.users[0].email, self.data)])
+
+        for _ in range(notification_queue.MAX_ATTEMPTS):
+            Notification.objects.update(scheduled_at=timezone.now())
+            notification_queue.process_queue(transport=FailingTransport())
+
+        Notification.objects.update(scheduled_at=timezone.now())
+        self.assertEqual(notification_queue.process_queue()['processed'], 0)
+        self.assertEqual(notification_queue.queue_depth()['given_up'], 1)
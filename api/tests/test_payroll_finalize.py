@@ -0,0 +1,117 @@
+import decimal
+import math
+import random
+from unittest import skipUnless
+
+from django.apps import apps
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from api.serializers import payment_serializer
+from api.tests.mixins import WithMakePayrollPeriod, WithMakeShift, WithMakeUser
+from api.utils import benchmark
+
+EmployeePayment = apps.get_model('api', 'EmployeePayment')
+PayrollPeriodPayment = apps.get_model('api', 'PayrollPeriodPayment')
+
+
+def reference_totals(payments):
+    """How the totals were calculated in python, one payment at a time"""
+    totals = {}
+    for ppp in sorted(payments, key=lambda p: (p.employee_id, p.id)):
+        t = totals.setdefault(ppp.employee_id, dict(regular_hours=0, over_time=0, legal_over_time=0,
+                                                    breaktime_minutes=0, earnings=0, over_time_earnings=0))
+        worked = t['regular_hours'] + t['over_time']
+        hours = ppp.regular_hours + ppp.over_time
+        if worked >= decimal.Decimal('40.00'):
+            t['legal_over_time'] += hours
+            t['over_time_earnings'] += decimal.Decimal(str(
+                math.trunc(hours * (ppp.hourly_rate * decimal.Decimal('1.5')) * 100) / 100))
+        elif worked + hours > decimal.Decimal('40.00'):
+            overtime_hours = worked + hours - 40
+            t['legal_over_time'] += overtime_hours
+            t['over_time_earnings'] += decimal.Decimal(str(
+                math.trunc(overtime_hours * (ppp.hourly_rate * decimal.Decimal('1.5')) * 100) / 100))
+        t['regular_hours'] += ppp.regular_hours
+        t['over_time'] += ppp.over_time
+        t['breaktime_minutes'] += ppp.breaktime_minutes
+        t['earnings'] += decimal.Decimal(str(math.trunc(hours * ppp.hourly_rate * 100) / 100))
+    return totals
+
+
+@override_settings(STATICFILES_STORAGE=None)
+class PayrollFinalizeTestSuite(TestCase, WithMakeUser, WithMakeShift, WithMakePayrollPeriod):
+    """
+    The employee totals are aggregated in the database with the same results as the python loop
+    """
+    def setUp(self):
+        (
+            self.test_user_employer,
+            self.test_employer,
+            self.test_profile_employer
+        ) = self._make_user(
+            'employer',
+            userkwargs=dict(username='employer1', email='employer@testdoma.in', is_active=True),
+        )
+        self.shift, _, __ = self._make_shift(employer=self.test_employer)
+        self.period = self._make_period(self.test_employer)
+
+    def _make_payments(self, rnd, employee_ids, per_employee):
+        payments = [
+            PayrollPeriodPayment(
+                payroll_period=self.period, employer=self.test_employer, shift=self.shift, employee_id=employee_id,
+                status=rnd.choice(['APPROVED', 'APPROVED', 'APPROVED', 'REJECTED']),
+                regular_hours=decimal.Decimal(rnd.randint(0, 1200000)) / 100000,
+                over_time=decimal.Decimal(rnd.choice([0, 0, rnd.randint(0, 400000)])) / 100000,
+                hourly_rate=decimal.Decimal(rnd.randint(725, 5000)) / 100,
+                breaktime_minutes=rnd.choice([0, 15, 30]))
+            for employee_id in employee_ids for _ in range(rnd.randint(1, per_employee))
+        ]
+        rnd.shuffle(payments)
+        return PayrollPeriodPayment.objects.bulk_create(payments)
+
+    def test_totals_match_the_python_calculation(self):
+        employee_ids = benchmark.seed_talents(8)
+        for seed in range(25):
+            rnd = random.Random(seed)
+            PayrollPeriodPayment.objects.filter(payroll_period=self.period).delete()
+            self._make_payments(rnd, rnd.sample(employee_ids, rnd.randint(1, 8)), per_employee=12)
+
+            expected = reference_totals(
+                PayrollPeriodPayment.objects.filter(payroll_period=self.period, status='APPROVED'))
+            totals = payment_serializer.get_employee_payment_totals(self.period)
+
+            self.assertEqual([t['employee_id'] for t in totals], sorted(expected.keys()), seed)
+            for t in totals:
+                for key, value in expected[t['employee_id']].items():
+                    self.assertEqual(t[key], value, 'seed {} employee {} {}'.format(seed, t['employee_id'], key))
+
+    @skipUnless(connection.vendor == 'postgresql', 'the deductions of EmployeePayment are a PostgreSQL JSONField')
+    def test_employee_payments_are_created_once(self):
+        employee_ids = benchmark.seed_talents(3)
+        self._make_payments(random.Random(1), employee_ids, per_employee=3)
+        approved = set(PayrollPeriodPayment.objects.filter(
+            payroll_period=self.period, status='APPROVED').values_list('employee_id', flat=True))
+
+        payment_serializer.create_employee_payments(self.period)
+        payment_serializer.create_employee_payments(self.period)
+
+        payments = EmployeePayment.objects.filter(payroll_period=self.period)
+        self.assertEqual(sorted(payments.values_list('employee_id', flat=True)), sorted(approved))
+        for payment in payments:
+            self.assertEqual(payment.regular_hours_earnings, payment.earnings)
+
+    @skipUnless(connection.vendor == 'postgresql', 'the deductions of EmployeePayment are a PostgreSQL JSONField')
+    def test_finalizing_a_big_period(self):
+        employee_ids = benchmark.seed_talents(2000)
+        self._make_payments(random.Random(2), employee_ids, per_employee=5)
+        approved = PayrollPeriodPayment.objects.filter(
+            payroll_period=self.period, status='APPROVED').values('employee_id').distinct().count()
+
+        with CaptureQueriesContext(connection) as ctx:
+            payment_serializer.create_employee_payments(self.period)
+
+        # existing payments, totals, insert and the refresh of the employer dashboard counters
+        self.assertEqual(len(ctx.captured_queries), 4)
+        self.assertEqual(EmployeePayment.objects.filter(payroll_period=self.period).count(), approved)
@@ -0,0 +1,94 @@
+from datetime import timedelta
+from decimal import Decimal
+from unittest import skipUnless
+
+from django.apps import apps
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from api.actions import payroll_actions
+from api.serializers import payment_serializer
+from api.tests.mixins import WithMakeShift, WithMakeUser
+from api.utils import benchmark
+
+Employer = apps.get_model('api', 'Employer')
+PayrollPeriod = apps.get_model('api', 'PayrollPeriod')
+PayrollPeriodPayment = apps.get_model('api', 'PayrollPeriodPayment')
+Clockin = apps.get_model('api', 'Clockin')
+
+
+@override_settings(STATICFILES_STORAGE=None)
+class PayrollGenerationTestSuite(TestCase, WithMakeUser, WithMakeShift):
+    """
+    Generation of the missing payroll periods and their payments
+    """
+    def setUp(self):
+        (
+            self.test_user_employer,
+            self.test_employer,
+            self.test_profile_employer
+        ) = self._make_user(
+            'employer',
+            userkwargs=dict(username='employer1', email='employer@testdoma.in', is_active=True),
+            employexkwargs=dict(payroll_period_starting_time=timezone.now(), payroll_period_length=7,
+                                payroll_period_type='DAYS')
+        )
+        Employer.objects.filter(id=self.test_employer.id).update(created_at=timezone.now() - timedelta(days=30))
+        self.test_employer.refresh_from_db()
+
+        shift, _, __ = self._make_shift(employer=self.test_employer)
+        self.venue, self.position = shift.venue, shift.position
+        self.employee_ids = benchmark.seed_talents(10)
+
+    def _count_queries(self, employer):
+        with CaptureQueriesContext(connection) as ctx:
+            periods = payment_serializer.generate_periods_and_payments(employer)
+        return len(periods), len(ctx.captured_queries)
+
+    def test_payments_are_created_for_the_closed_clockins(self):
+        clockins = benchmark.seed_shift_history(self.test_employer, self.venue, self.position, self.employee_ids,
+                                                days=14, shifts_per_day=1, talents_per_shift=2)
+        # still clocked in, it gets no payment
+        Clockin.objects.filter(id=Clockin.objects.order_by('id').first().id).update(ended_at=None)
+
+        periods = payment_serializer.generate_periods_and_payments(self.test_employer, batch_size=5)
+
+        self.assertTrue(len(periods) >= 4)
+        payments = PayrollPeriodPayment.objects.filter(employer=self.test_employer)
+        self.assertEqual(payments.count(), clockins - 1)
+        self.assertEqual(sum(period.total_payments for period in periods), clockins - 1)
+        for period in periods:
+            self.assertEqual(period.payments.count(), period.total_payments)
+
+        for payment in payments.select_related('clockin', 'shift'):
+            hours = Decimal((payment.clockin.ended_at - payment.clockin.started_at).total_seconds() / 3600)
+            self.assertAlmostEqual(payment.regular_hours + payment.over_time, hours, places=4)
+            self.assertEqual(payment.hourly_rate, payment.shift.minimum_hourly_rate)
+            self.assertFalse(payment.splited_payment)
+
+        # nothing left to generate
+        self.assertEqual(payment_serializer.generate_periods_and_payments(self.test_employer), [])
+
+    @skipUnless(connection.vendor == 'postgresql', 'SQLite splits a bulk insert by its limit of parameters')
+    def test_number_of_queries_does_not_depend_on_clockins(self):
+        benchmark.seed_shift_history(self.test_employer, self.venue, self.position, self.employee_ids,
+                                     days=28, shifts_per_day=1, talents_per_shift=1)
+        few_periods, few = self._count_queries(self.test_employer)
+
+        # the same periods are generated again with more clockins on them
+        PayrollPeriod.objects.filter(employer=self.test_employer).delete()
+        benchmark.seed_shift_history(self.test_employer, self.venue, self.position, self.employee_ids,
+                                     days=28, shifts_per_day=2, talents_per_shift=5, seed=7)
+        many_periods, many = self._count_queries(self.test_employer)
+
+        self.assertEqual(few_periods, many_periods)
+        self.assertEqual(few, many)
+
+    def test_generate_all_periods(self):
+        generated = payroll_actions.generate_all_periods()
+
+        self.assertTrue(generated[self.test_employer.id] >= 4)
+        self.assertEqual(PayrollPeriod.objects.filter(employer=self.test_employer).count(),
+                         generated[self.test_employer.id])
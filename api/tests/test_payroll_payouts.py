@@ -0,0 +1,193 @@
+import decimal
+from datetime import timedelta
+
+from django.apps import apps
+from django.test import TestCase, override_settings
+from django.urls import reverse_lazy
+from django.utils import timezone
+from mixer.backend.django import mixer
+
+from api.tests.mixins import WithMakePayrollPeriod, WithMakeShift, WithMakeUser
+from api.utils import benchmark, payouts
+from api.utils.payouts import FakeTransport
+
+EmployeePayment = apps.get_model('api', 'EmployeePayment')
+PaymentTransaction = apps.get_model('api', 'PaymentTransaction')
+PayrollPayout = apps.get_model('api', 'PayrollPayout')
+PayrollPeriod = apps.get_model('api', 'PayrollPeriod')
+PayrollPeriodPayment = apps.get_model('api', 'PayrollPeriodPayment')
+Profile = apps.get_model('api', 'Profile')
+
+
+@override_settings(STATICFILES_STORAGE=None, PAYOUT_TRANSPORT='api.utils.payouts.FakeTransport')
+class PayrollPayoutTestSuite(TestCase, WithMakeUser, WithMakeShift, WithMakePayrollPeriod):
+    """
+    All the employee payments of a period are paid at once by the payout worker
+    """
+    def setUp(self):
+        FakeTransport.charges = {}
+        FakeTransport.declined = set()
+        self.test_user_employer, self.test_employer, self.test_profile_employer = self._make_user(
+            'employer', userkwargs=dict(username='employer1', email='employer@testdoma.in', is_active=True))
+        self.employer_account = mixer.blend('api.BankAccount', user=self.test_profile_employer)
+        self.period = self._make_period(self.test_employer, periodkwargs={'status': 'FINALIZED'})
+        self.url = reverse_lazy('api:me-payroll-period-payout', kwargs={'period_id': self.period.id})
+        self.client.force_login(self.test_user_employer)
+
+    def _make_payments(self, count, with_accounts=True):
+        employee_ids = benchmark.seed_talents(count)
+        if with_accounts:
+            for profile in Profile.objects.filter(employee_id__in=employee_ids):
+                mixer.blend('api.BankAccount', user=profile, stripe_account_id='acct_{}'.format(profile.id))
+        return EmployeePayment.objects.bulk_create([
+            EmployeePayment(payroll_period=self.period, employer=self.test_employer, employee_id=employee_id,
+                            earnings=decimal.Decimal(100 + i))
+            for i, employee_id in enumerate(employee_ids)
+        ])
+
+    def _start(self, payment_type='ELECTRONIC TRANSFERENCE'):
+        response = self.client.post(self.url, data={
+            'payment_type': payment_type, 'employer_bank_account_id': self.employer_account.id,
+        }, content_type='application/json')
+        self.assertEqual(response.status_code, 202, response.content.decode())
+        return response.json()
+
+    def test_pays_the_whole_period(self):
+        payments = self._make_payments(12)
+        shift, _, __ = self._make_shift(employer=self.test_employer)
+        ppp = mixer.blend('api.PayrollPeriodPayment', payroll_period=self.period, employer=self.test_employer,
+                          employee=payments[0].employee, shift=shift, status='APPROVED')
+
+        progress = self._start()
+        self.assertEqual((progress['total'], progress['queued'], progress['status']), (12, 12, 'PROCESSING'))
+
+        summary = payouts.process_payouts(batch_size=5, workers=4)
+
+        self.assertEqual(summary, {'processed': 12, 'paid': 12, 'failed': 0})
+        self.assertEqual(len(FakeTransport.charges), 12)
+        self.assertFalse(EmployeePayment.objects.filter(payroll_period=self.period, paid=False).exists())
+        self.assertEqual(PaymentTransaction.objects.count(), 12)
+        for payment in EmployeePayment.objects.filter(payroll_period=self.period).select_related(
+                'payment_transaction'):
+            self.assertEqual(payment.payment_transaction.amount, payment.amount)
+            self.assertEqual(payment.amount, payment.earnings - payment.deductions)
+            charge = FakeTransport.charges[payouts.get_idempotency_key(payment)]
+            self.assertEqual(payment.payment_transaction.payment_data['transaction_id'], charge['id'])
+        ppp.refresh_from_db()
+        self.assertEqual(ppp.status, 'PAID')
+        self.assertEqual(PayrollPeriod.objects.get(id=self.period.id).status, 'PAID')
+
+        progress = self.client.get(self.url).json()
+        self.assertEqual((progress['paid'], progress['failed'], progress['status']), (12, 0, 'COMPLETED'))
+
+    def test_starting_twice_returns_the_same_payout(self):
+        self._make_payments(3)
+        first = self._start()
+        second = self._start()
+        self.assertEqual(first['id'], second['id'])
+        self.assertEqual(PayrollPayout.objects.count(), 1)
+
+    def test_resumes_after_a_crash_without_charging_twice(self):
+        self._make_payments(4)
+        payout = PayrollPayout.objects.get(id=self._start()['id'])
+        payment = EmployeePayment.objects.filter(payout=payout).select_related('payout_bank_account').first()
+        # the worker sent the charge and died before recording it
+        charge_id = FakeTransport().charge(payment.amount, self.employer_account, payment.payout_bank_account,
+                                           payouts.get_idempotency_key(payment))
+        claimed_at = timezone.now() - payouts.CLAIM_TIMEOUT - timedelta(minutes=1)
+        EmployeePayment.objects.filter(id=payment.id).update(payout_status='PROCESSING', payout_claimed_at=claimed_at)
+
+        summary = payouts.process_payouts()
+
+        self.assertEqual(summary['paid'], 4)
+        self.assertEqual(len(FakeTransport.charges), 4)
+        payment.refresh_from_db()
+        self.assertEqual(payment.payment_transaction.payment_data['transaction_id'], charge_id)
+
+    def test_a_payment_being_sent_is_not_claimed_again(self):
+        self._make_payments(2)
+        payout = PayrollPayout.objects.get(id=self._start()['id'])
+        EmployeePayment.objects.filter(id=EmployeePayment.objects.filter(payout=payout).first().id).update(
+            payout_status='PROCESSING', payout_claimed_at=timezone.now())
+
+        self.assertEqual(payouts.process_payouts()['paid'], 1)
+        payout.refresh_from_db()
+        self.assertEqual(payout.status, 'PROCESSING')
+
+    def test_failed_charges_are_retried_and_reported(self):
+        payments = self._make_payments(3)
+        declined = Profile.objects.get(employee_id=payments[0].employee_id).bank_accounts.get()
+        FakeTransport.declined = {declined.stripe_account_id}
+        self._start()
+
+        for _ in range(payouts.MAX_ATTEMPTS):
+            payouts.process_payouts()
+
+        progress = self.client.get(self.url).json()
+        self.assertEqual((progress['paid'], progress['failed'], progress['status']), (2, 1, 'COMPLETED'))
+        self.assertEqual(progress['failures'][0]['employee_payment'], payments[0].id)
+        self.assertEqual(progress['failures'][0]['attempts'], payouts.MAX_ATTEMPTS)
+        self.assertEqual(progress['failures'][0]['error'], 'The charge was declined')
+
+        # a new payout pays the failed payments again
+        FakeTransport.declined = set()
+        progress = self._start()
+        self.assertEqual(progress['total'], 1)
+        payouts.process_payouts()
+        self.assertFalse(EmployeePayment.objects.filter(payroll_period=self.period, paid=False).exists())
+
+    def test_talents_without_bank_account(self):
+        self._make_payments(2, with_accounts=False)
+        progress = self._start()
+        self.assertEqual((progress['failed'], progress['status']), (2, 'COMPLETED'))
+        self.assertEqual(progress['failures'][0]['error'], 'The talent has no bank account')
+
+        # checks do not need one
+        progress = self._start(payment_type='CHECK')
+        self.assertEqual(progress['queued'], 2)
+        self.assertEqual(payouts.process_payouts()['paid'], 2)
+        self.assertEqual(FakeTransport.charges, {})
+
+    def _pay_one(self, payment):
+        receiver = Profile.objects.get(employee_id=payment.employee_id).bank_accounts.get()
+        url = reverse_lazy('api:me-get-employee-payment', kwargs={'employee_payment_id': payment.id})
+        return self.client.post(url, data={
+            'payment_type': 'ELECTRONIC TRANSFERENCE', 'deductions': '10', 'deductions_list': [],
+            'payment_data': {'employer_bank_account_id': self.employer_account.id,
+                             'employee_bank_account_id': receiver.id},
+        }, content_type='application/json')
+
+    def test_a_payment_of_a_payout_cannot_be_paid_on_its_own(self):
+        payments = self._make_payments(2)
+        self._start()
+
+        response = self._pay_one(payments[0])
+        self.assertEqual(response.status_code, 400, response.content.decode())
+        self.assertEqual(FakeTransport.charges, {})
+
+        payouts.process_payouts()
+        self.assertEqual(len(FakeTransport.charges), 2)
+        self.assertEqual(self._pay_one(payments[0]).status_code, 400)
+        self.assertEqual(len(FakeTransport.charges), 2)
+
+    def test_a_payment_paid_on_its_own_is_not_queued(self):
+        payments = self._make_payments(2)
+        EmployeePayment.objects.filter(id=payments[0].id).update(payout_status='PROCESSING',
+                                                                 payout_claimed_at=timezone.now())
+
+        progress = self._start()
+        self.assertEqual(progress['total'], 1)
+
+        self.assertEqual(self._pay_one(payments[0]).status_code, 400)
+        EmployeePayment.objects.filter(id=payments[0].id).update(payout_status='')
+        response = self._pay_one(payments[0])
+        self.assertEqual(response.status_code, 200, response.content.decode())
+        payment = EmployeePayment.objects.get(id=payments[0].id)
+        self.assertEqual((payment.paid, payment.payout_status), (True, 'PAID'))
+        self.assertEqual(payment.payment_transaction.payment_data['transaction_id'],
+                         FakeTransport.charges[payouts.get_idempotency_key(payment)]['id'])
+
+    def test_open_periods_cannot_be_paid(self):
+        PayrollPeriod.objects.filter(id=self.period.id).update(status='OPEN')
+        response = self.client.post(self.url, data={'payment_type': 'CHECK'}, content_type='application/json')
+        self.assertEqual(response.status_code, 400)
@@ -0,0 +1,87 @@
+import json
+from datetime import timedelta
+
+from django.apps import apps
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse_lazy
+from django.utils import timezone
+from mixer.backend.django import mixer
+
+from api.tests.mixins import WithMakeShift, WithMakeUser
+from api.utils import benchmark
+
+Employee = apps.get_model('api', 'Employee')
+
+
+@override_settings(STATICFILES_STORAGE=None)
+class PayrollShiftsTestSuite(TestCase, WithMakeUser, WithMakeShift):
+    """
+    The clockins of the employer grouped by talent, streamed one talent at a time
+    """
+    def setUp(self):
+        self.test_user_employer, self.test_employer, self.test_profile_employer = self._make_user(
+            'employer', userkwargs=dict(username='employer1', email='employer@testdoma.in', is_active=True))
+        _, self.other_employer, __ = self._make_user(
+            'employer', userkwargs=dict(username='employer2', email='employer2@testdoma.in', is_active=True))
+        self.starting_at = timezone.now() - timedelta(days=10)
+        self.shift, _, __ = self._make_shift(employer=self.test_employer)
+        self.other_shift, _, __ = self._make_shift(employer=self.other_employer)
+        self.url = reverse_lazy('api:all-payroll')
+        self.client.force_login(self.test_user_employer)
+
+    def _make_clockins(self, employees, shift, per_employee=2):
+        for employee in employees:
+            for day in range(per_employee):
+                started_at = self.starting_at + timedelta(days=day + 1)
+                mixer.blend('api.Clockin', employee=employee, shift=shift, author=None,
+                            started_at=started_at, ended_at=started_at + timedelta(hours=8))
+
+    def _get(self, **params):
+        params.setdefault('starting_at', self.starting_at.isoformat())
+        params.setdefault('ending_at', timezone.now().isoformat())
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(self.url, params)
+            self.assertEqual(response.status_code, 200)
+            data = json.loads(b''.join(response.streaming_content).decode())
+        return data, len(ctx.captured_queries)
+
+    def test_clockins_grouped_by_talent(self):
+        employees = list(Employee.objects.filter(id__in=benchmark.seed_talents(3)).order_by('id'))
+        self._make_clockins(reversed(employees), self.shift)
+        self._make_clockins(employees, self.other_shift)
+
+        data, _ = self._get()
+
+        self.assertEqual([group['talent']['id'] for group in data], [employee.id for employee in employees])
+        for group in data:
+            self.assertEqual(len(group['clockins']), 2)
+            self.assertEqual(set(clockin['shift']['id'] for clockin in group['clockins']), {self.shift.id})
+            self.assertEqual(set(clockin['employee']['id'] for clockin in group['clockins']),
+                             {group['talent']['id']})
+            started = [clockin['started_at'] for clockin in group['clockins']]
+            self.assertEqual(started, sorted(started))
+
+        data, _ = self._get(shift=self.shift.id, starting_at='', ending_at='')
+        self.assertEqual(len(data), 3)
+        data, _ = self._get(shift=self.other_shift.id)
+        self.assertEqual(data, [])
+
+    def test_number_of_queries_does_not_depend_on_the_talents(self):
+        self._make_clockins(Employee.objects.filter(id__in=benchmark.seed_talents(2)), self.shift)
+        _, few = self._get()
+        self._make_clockins(Employee.objects.filter(id__in=benchmark.seed_talents(20)), self.shift, per_employee=3)
+        data, many = self._get()
+        self.assertEqual(len(data), 22)
+        self.assertEqual(few, many)
+
+    def test_date_bounds(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get(self.url, {'starting_at': 'yesterday', 'ending_at': '2020-01-01'})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get(self.url, {'starting_at': '2020-01-01', 'ending_at': '2021-01-01'})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get(self.url, {'starting_at': '2020-01-01', 'ending_at': '2020-02-01'})
+        self.assertEqual(response.status_code, 200)
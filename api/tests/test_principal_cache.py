@@ -0,0 +1,70 @@
+from django.core.cache import caches
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse_lazy
+from rest_framework_jwt.settings import api_settings
+
+from api import authentication
+from api.tests.mixins import WithMakeUser
+
+jwt_payload_handler = api_settings.JWT_PAYLOAD_HANDLER
+jwt_encode_handler = api_settings.JWT_ENCODE_HANDLER
+
+
+@override_settings(STATICFILES_STORAGE=None)
+class PrincipalCacheTestSuite(TestCase, WithMakeUser):
+    """
+    JWT requests read the user, profile and employer from the principal cache
+    """
+    def setUp(self):
+        caches[authentication.CACHE_ALIAS].clear()
+        self.test_user_employer, self.test_employer, self.test_profile_employer = self._make_user(
+            'employer',
+            userkwargs={"username": 'employer', "email": 'employer@testdoma.in', "is_active": True},
+        )
+        token = jwt_encode_handler(jwt_payload_handler(self.test_user_employer))
+        self.auth = {'HTTP_AUTHORIZATION': 'JWT ' + token}
+        self.url = reverse_lazy('api:me-employer')
+
+    def _get(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url, **self.auth)
+        self.assertEqual(response.status_code, 200, response.content.decode())
+        return response, [query['sql'] for query in queries.captured_queries]
+
+    def test_principal_in_one_query(self):
+        _, queries = self._get()
+        principal = [sql for sql in queries if 'FROM "auth_user"' in sql]
+        self.assertEqual(len(principal), 1)
+        self.assertIn('"api_profile"', principal[0])
+        self.assertIn('"api_employer"', principal[0])
+
+    def test_fixed_query_floor(self):
+        _, first = self._get()
+        _, second = self._get()
+        _, third = self._get()
+        self.assertEqual(len(second), len(first) - 1)
+        self.assertEqual(len(third), len(second))
+        self.assertFalse([sql for sql in second if 'FROM "auth_user"' in sql])
+
+    def test_employer_change_invalidates(self):
+        self._get()
+        self.test_employer.title = 'Renamed'
+        self.test_employer.save()
+        response, _ = self._get()
+        self.assertEqual(response.json()['title'], 'Renamed')
+
+    def test_role_change_invalidates(self):
+        self._get()
+        self.test_profile_employer.employer = None
+        self.test_profile_employer.save()
+        response = self.client.get(self.url, **self.auth)
+        self.assertEqual(response.status_code, 403)
+
+    def test_deactivated_user(self):
+        self._get()
+        self.test_user_employer.is_active = False
+        self.test_user_employer.save()
+        response = self.client.get(self.url, **self.auth)
+        self.assertEqual(response.status_code, 401)
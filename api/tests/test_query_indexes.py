@@ -0,0 +1,118 @@
+import random
+from datetime import timedelta
+from unittest import skipUnless
+
+from mixer.backend.django import mixer
+
+from django.apps import apps
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from api.tests.mixins import WithMakeShift, WithMakeUser
+from api.utils import benchmark, explain
+
+Clockin = apps.get_model('api', 'Clockin')
+Employer = apps.get_model('api', 'Employer')
+EmployeeDocument = apps.get_model('api', 'EmployeeDocument')
+PayrollPeriod = apps.get_model('api', 'PayrollPeriod')
+PayrollPeriodPayment = apps.get_model('api', 'PayrollPeriodPayment')
+Shift = apps.get_model('api', 'Shift')
+ShiftInvite = apps.get_model('api', 'ShiftInvite')
+
+
+@skipUnless(connection.vendor == 'postgresql', 'the plans are read from the PostgreSQL EXPLAIN output')
+@override_settings(STATICFILES_STORAGE=None)
+class QueryIndexesTestSuite(TestCase, WithMakeUser, WithMakeShift):
+    """
+    The hot queries should use an index scan once the tables have some data
+    """
+    @classmethod
+    def setUpTestData(cls):
+        rnd = random.Random(42)
+        now = timezone.now()
+        shift = mixer.blend('api.Shift')
+        sender = mixer.blend('api.Profile')
+        employers = Employer.objects.bulk_create([Employer(title='Employer {}'.format(i)) for i in range(40)])
+        employee_ids = benchmark.seed_talents(200)
+
+        shifts = Shift.objects.bulk_create([
+            Shift(employer=employer, venue=shift.venue, position=shift.position,
+                  status=rnd.choice(['OPEN', 'FILLED', 'EXPIRED', 'CANCELLED'] + ['COMPLETED'] * 8),
+                  starting_at=now - timedelta(hours=i), ending_at=now - timedelta(hours=i - 4))
+            # the first employer has been posting shifts for years
+            for employer in employers for i in range(3000 if employer == employers[0] else 50)
+        ])
+        Clockin.objects.bulk_create([
+            Clockin(shift=shift, employee_id=employee_id, started_at=shift.starting_at,
+                    # almost all the clockins are closed
+                    ended_at=None if rnd.random() < 0.01 else shift.ending_at)
+            for shift in shifts for employee_id in rnd.sample(employee_ids, 3)
+        ])
+        ShiftInvite.objects.bulk_create([
+            ShiftInvite(shift=shift, employee_id=employee_id, sender=sender,
+                        status=rnd.choice(['PENDING', 'APPLIED', 'REJECTED', 'EXPIRED', 'EXPIRED', 'EXPIRED']))
+            for shift in shifts for employee_id in rnd.sample(employee_ids, 3)
+        ])
+        periods = PayrollPeriod.objects.bulk_create([
+            PayrollPeriod(employer=employer, starting_at=now - timedelta(days=7 * (i + 1)),
+                          ending_at=now - timedelta(days=7 * i))
+            for employer in employers for i in range(10)
+        ])
+        PayrollPeriodPayment.objects.bulk_create([
+            PayrollPeriodPayment(payroll_period=period, employer_id=period.employer_id, shift=shift,
+                                 employee_id=employee_id, status=rnd.choice(['PENDING', 'APPROVED', 'PAID']))
+            for period in periods for employee_id in rnd.sample(employee_ids, 30)
+        ])
+        document_type = mixer.blend('api.Document')
+        EmployeeDocument.objects.bulk_create([
+            EmployeeDocument(employee_id=employee_id, document_type=document_type, document='https://doc.jobcore.co',
+                             status='DELETED' if rnd.random() < 0.01 else rnd.choice(['PENDING', 'APPROVED']),
+                             expired_at=now + timedelta(days=rnd.randint(-10, 300)))
+            for employee_id in employee_ids for _ in range(20)
+        ])
+
+        explain.analyze(Shift, Clockin, ShiftInvite, PayrollPeriod, PayrollPeriodPayment, EmployeeDocument)
+        cls.employer = employers[0]
+        cls.shift = shifts[0]
+        cls.employee_id = employee_ids[0]
+        cls.period = periods[0]
+
+    def assertUsesIndex(self, queryset, *indexes):
+        scans = explain.get_index_scans(queryset)
+        self.assertTrue(scans & set(indexes), '{} not in {}\n{}'.format(indexes, scans, queryset.explain()))
+        self.assertEqual(explain.get_sequential_scans(queryset), set(), queryset.explain())
+
+    def test_employer_shifts(self):
+        self.assertUsesIndex(
+            Shift.objects.filter(employer_id=self.employer.id, status='OPEN').order_by('-starting_at')[:50],
+            'api_shift_employer_status_idx')
+
+    def test_employee_open_clockins(self):
+        self.assertUsesIndex(
+            Clockin.objects.filter(employee_id=self.employee_id, ended_at=None),
+            'api_clockin_open_employee_idx')
+
+    def test_shift_open_clockins(self):
+        self.assertUsesIndex(
+            Clockin.objects.filter(shift_id=self.shift.id, ended_at__isnull=True),
+            'api_clockin_open_shift_idx', 'api_clockin_shift_employee_idx')
+
+    def test_employee_clockins_for_shift(self):
+        self.assertUsesIndex(
+            Clockin.objects.filter(shift_id=self.shift.id, employee_id=self.employee_id),
+            'api_clockin_shift_employee_idx')
+
+    def test_employee_pending_invites(self):
+        self.assertUsesIndex(
+            ShiftInvite.objects.filter(employee_id=self.employee_id, status='PENDING'),
+            'api_shiftinvite_emp_status_idx')
+
+    def test_period_approved_payments(self):
+        self.assertUsesIndex(
+            PayrollPeriodPayment.objects.filter(payroll_period_id=self.period.id, employer_id=self.employer.id,
+                                                status='APPROVED'),
+            'api_ppp_period_employer_idx')
+
+    def test_deleted_documents(self):
+        self.assertUsesIndex(EmployeeDocument.objects.filter(status='DELETED'), 'api_empdoc_status_expired_idx')
@@ -0,0 +1,86 @@
+from datetime import timedelta
+from unittest import skipUnless
+
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse_lazy
+from django.utils import timezone
+from mixer.backend.django import mixer
+
+from api.actions.employee_actions import create_default_availablity
+from api.models import Shift, ShiftEmployee, ShiftInvite
+from api.tests.mixins import WithMakeUser
+
+
+@override_settings(STATICFILES_STORAGE=None)
+class RecurringShiftsTestSuite(TestCase, WithMakeUser):
+    """
+    Creating the same shift on multiple dates
+    """
+    def setUp(self):
+        self.test_user_employer, self.test_employer, self.test_profile_employer = self._make_user(
+            'employer',
+            userkwargs=dict(username='employer1', email='employer1@testdoma.in', is_active=True)
+        )
+        self.position = mixer.blend('api.Position')
+        self.venue = mixer.blend('api.Venue', employer=self.test_employer, latitude=40, longitude=-73)
+        self.start = timezone.now().replace(microsecond=0) + timedelta(days=1)
+
+        self.talents = []
+        for i in range(3):
+            _, employee, __ = self._make_user(
+                'employee',
+                employexkwargs=dict(minimum_hourly_rate=9, rating=5, stop_receiving_invites=False,
+                                    maximum_job_distance_miles=15, positions=[self.position.id]),
+                profilekwargs=dict(latitude=40, longitude=-73),
+                userkwargs=dict(username='employee{}'.format(i), email='employee{}@testdoma.in'.format(i)))
+            create_default_availablity(employee)
+            self.talents.append(employee)
+
+        self.client.force_login(self.test_user_employer)
+
+    def _post(self, days, url='api:me-employer-get-shifts', **data):
+        payload = dict({
+            'position': self.position.id,
+            'venue': self.venue.id,
+            'status': 'OPEN',
+            'maximum_allowed_employees': 2,
+            'minimum_hourly_rate': 12,
+            'minimum_allowed_rating': 0,
+            'application_restriction': 'ANYONE',
+            'employees': [self.talents[0].id],
+            'multiple_dates': [{'starting_at': (self.start + timedelta(days=day)).isoformat(),
+                                'ending_at': (self.start + timedelta(days=day, hours=8)).isoformat()}
+                               for day in range(days)],
+        }, **data)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(reverse_lazy(url), payload, content_type='application/json')
+        return response, len(queries.captured_queries)
+
+    def test_creates_every_date(self):
+        response, _ = self._post(30)
+        self.assertEqual(response.status_code, 201, response.content)
+        shifts = response.json()
+        self.assertEqual(len(shifts), 30)
+        self.assertEqual([shift['starting_at'][:10] for shift in shifts],
+                         [(self.start + timedelta(days=day)).isoformat()[:10] for day in range(30)])
+        self.assertEqual([employee['id'] for employee in shifts[0]['employees']], [self.talents[0].id])
+
+        self.assertEqual(Shift.objects.filter(employer=self.test_employer).count(), 30)
+        self.assertEqual(ShiftEmployee.objects.filter(employee=self.talents[0]).count(), 30)
+        # the employee of the shifts is busy, the other two talents are invited to every date
+        self.assertEqual(ShiftInvite.objects.filter(employee=self.talents[0]).count(), 0)
+        self.assertEqual(ShiftInvite.objects.filter(employee__in=self.talents[1:]).count(), 60)
+
+    @skipUnless(connection.features.can_return_ids_from_bulk_insert, 'the shifts are saved one by one')
+    def test_queries_do_not_depend_on_the_dates(self):
+        _, few = self._post(2)
+        _, many = self._post(30, url='api:me-employer-get-new-shifts')
+        self.assertEqual(few, many)
+
+    def test_invalid_date(self):
+        response, _ = self._post(2, multiple_dates=[{'starting_at': 'tomorrow', 'ending_at': 'later'}])
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('multiple_dates', response.json())
+        self.assertFalse(Shift.objects.exists())
@@ -0,0 +1,96 @@
+from mixer.backend.django import mixer
+
+from django.core.cache import caches
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.db import connection
+from django.urls import reverse_lazy
+from django.utils.http import http_date
+
+from api.tests.mixins import WithMakeUser
+from api.utils import reference_cache
+
+
+@override_settings(STATICFILES_STORAGE=None)
+class ReferenceCacheTestSuite(TestCase, WithMakeUser):
+    """
+    Read-through cache and conditional responses of the reference endpoints
+    """
+    def setUp(self):
+        caches[reference_cache.CACHE_ALIAS].clear()
+        self.test_user_employer, _, __ = self._make_user(
+            'employer',
+            userkwargs={"username": 'employer', "email": 'employer@testdoma.in', "is_active": True},
+        )
+        self.client.force_login(self.test_user_employer)
+        self.position = mixer.blend('api.Position', title='Bartender', status='ACTIVE')
+        self.badge = mixer.blend('api.Badge', title='Fast learner')
+
+    def test_second_read_is_a_hit(self):
+        url = reverse_lazy('api:get-catalog', kwargs={'catalog_type': 'positions'})
+        first = self.client.get(url)
+        self.assertEqual(first.status_code, 200)
+
+        with CaptureQueriesContext(connection) as queries:
+            second = self.client.get(url)
+        self.assertEqual(second.json(), first.json())
+        self.assertFalse([q for q in queries.captured_queries if 'api_position' in q['sql']])
+
+        stats = self.client.get(reverse_lazy('api:admin-get-reference-cache')).json()
+        self.assertEqual(stats[reference_cache.POSITIONS]['hits'], 1)
+        self.assertEqual(stats[reference_cache.POSITIONS]['misses'], 1)
+        self.assertEqual(stats[reference_cache.POSITIONS]['hit_ratio'], 0.5)
+
+    def test_if_none_match(self):
+        url = reverse_lazy('api:get-badges')
+        response = self.client.get(url)
+        self.assertIn('ETag', response)
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH='"stale"')
+        self.assertEqual(response.status_code, 200)
+
+    def test_if_modified_since(self):
+        url = reverse_lazy('api:admin-get-positions')
+        response = self.client.get(url)
+        self.assertIn('Last-Modified', response)
+
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(response.status_code, 304)
+
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=http_date(0))
+        self.assertEqual(response.status_code, 200)
+
+    def test_save_invalidates(self):
+        url = reverse_lazy('api:get-catalog', kwargs={'catalog_type': 'positions'})
+        etag = self.client.get(url)['ETag']
+
+        self.position.title = 'Barback'
+        self.position.save()
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn({'label': 'Barback', 'value': self.position.id}, response.json())
+
+    def test_delete_invalidates(self):
+        url = reverse_lazy('api:id-badges', kwargs={'id': self.badge.id})
+        self.assertEqual(self.client.get(url).status_code, 200)
+
+        self.badge.delete()
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+    def test_profile_save_invalidates_talents(self):
+        url = reverse_lazy('api:get-catalog', kwargs={'catalog_type': 'profiles'})
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        self.test_user_employer.first_name = 'Renamed'
+        self.test_user_employer.save()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_missing_version(self):
+        response = self.client.get(reverse_lazy('api:single-version', kwargs={'version': '9.9.9'}))
+        self.assertEqual(response.status_code, 404)
@@ -0,0 +1,132 @@
+from datetime import timedelta
+from io import StringIO
+
+from mixer.backend.django import mixer
+
+from django.apps import apps
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from api.actions import shift_actions
+from api.tests.mixins import WithMakeShift, WithMakeUser
+
+Clockin = apps.get_model('api', 'Clockin')
+Shift = apps.get_model('api', 'Shift')
+ShiftApplication = apps.get_model('api', 'ShiftApplication')
+ShiftExpirationRun = apps.get_model('api', 'ShiftExpirationRun')
+ShiftInvite = apps.get_model('api', 'ShiftInvite')
+
+
+@override_settings(STATICFILES_STORAGE=None)
+class ShiftExpirationTestSuite(TestCase, WithMakeUser, WithMakeShift):
+    """
+    Set based expiration of shifts, clockins, invites and applications
+    """
+    def setUp(self):
+        (
+            self.test_user_employer,
+            self.test_employer,
+            self.test_profile_employer
+        ) = self._make_user(
+            'employer',
+            userkwargs=dict(username='employer1', email='employer@testdoma.in', is_active=True),
+            employexkwargs=dict(maximum_clockout_delay_minutes=15)
+        )
+        self.employees = []
+        for i in range(5):
+            _, employee, __ = self._make_user(
+                'employee',
+                userkwargs=dict(username='employee{}'.format(i), email='employee{}@testdoma.in'.format(i),
+                                is_active=True),
+            )
+            self.employees.append(employee)
+
+    def _make_ended_shift(self, ended_ago, delay=15, status='OPEN'):
+        ending_at = timezone.now() - ended_ago
+        shift, _, __ = self._make_shift(
+            shiftkwargs=dict(status=status, starting_at=ending_at - timedelta(hours=4), ending_at=ending_at,
+                             maximum_clockout_delay_minutes=delay),
+            employer=self.test_employer)
+        return shift
+
+    def _clockin(self, shift, employee):
+        return mixer.blend('api.Clockin', shift=shift, employee=employee, author=None,
+                           started_at=shift.starting_at, ended_at=None)
+
+    def test_clockins_are_closed_in_batches(self):
+        shift = self._make_ended_shift(timedelta(minutes=30))
+        for employee in self.employees:
+            self._clockin(shift, employee)
+            mixer.blend('api.ShiftInvite', shift=shift, employee=employee, sender=self.test_profile_employer,
+                        status='PENDING')
+            mixer.blend('api.ShiftApplication', shift=shift, employee=employee)
+
+        summary = shift_actions.process_expired_shifts(batch_size=2)
+
+        self.assertEqual(summary['clockins_closed'], 5)
+        self.assertEqual(summary['shifts_expired'], 1)
+        self.assertEqual(summary['invites_expired'], 5)
+        self.assertEqual(summary['applications_deleted'], 5)
+
+        deadline = shift.ending_at + timedelta(minutes=15)
+        self.assertEqual(Clockin.objects.filter(ended_at=deadline, automatically_closed=True).count(), 5)
+        self.assertEqual(Shift.objects.get(id=shift.id).status, 'EXPIRED')
+        self.assertEqual(ShiftInvite.objects.filter(status='EXPIRED').count(), 5)
+        self.assertEqual(ShiftApplication.objects.count(), 0)
+
+    def test_clockins_within_the_delay_are_not_closed(self):
+        shift = self._make_ended_shift(timedelta(minutes=5))
+        clockin = self._clockin(shift, self.employees[0])
+
+        summary = shift_actions.process_expired_shifts()
+
+        self.assertEqual(summary['clockins_closed'], 0)
+        self.assertEqual(summary['shifts_expired'], 0)
+        self.assertIsNone(Clockin.objects.get(id=clockin.id).ended_at)
+        self.assertEqual(Shift.objects.get(id=shift.id).status, 'OPEN')
+
+    def test_only_shifts_ended_after_the_high_water_mark_are_scanned(self):
+        shift_actions.process_expired_shifts()
+        run = ShiftExpirationRun.objects.get()
+        self.assertIsNone(run.scanned_from)
+
+        recent = self._make_ended_shift(timedelta(hours=1))
+        # ended before the previous run minus the lookback, it is scanned because it is still open
+        old = self._make_ended_shift(timedelta(days=3), delay=None)
+        mixer.blend('api.ShiftInvite', shift=old, employee=self.employees[0], sender=self.test_profile_employer,
+                    status='PENDING')
+        # already expired before the window, it is not scanned anymore
+        expired = self._make_ended_shift(timedelta(days=3), status='EXPIRED')
+        mixer.blend('api.ShiftApplication', shift=expired, employee=self.employees[0])
+
+        summary = shift_actions.process_expired_shifts()
+
+        self.assertEqual(summary['shifts_expired'], 2)
+        self.assertEqual(summary['invites_expired'], 1)
+        self.assertEqual(summary['applications_deleted'], 0)
+        self.assertEqual(summary['scanned_from'], run.high_water_mark - shift_actions.EXPIRATION_LOOKBACK)
+        self.assertEqual(Shift.objects.get(id=recent.id).status, 'EXPIRED')
+        self.assertEqual(Shift.objects.get(id=old.id).status, 'EXPIRED')
+
+        summary = shift_actions.process_expired_shifts(full_scan=True)
+
+        self.assertEqual(summary['shifts_expired'], 0)
+        self.assertEqual(summary['applications_deleted'], 1)
+        self.assertEqual(ShiftExpirationRun.objects.count(), 3)
+
+    def test_the_lookback_covers_the_longest_clockout_delay(self):
+        shift_actions.process_expired_shifts()
+        run = ShiftExpirationRun.objects.get()
+        self._make_ended_shift(-timedelta(hours=1), delay=60 * 48)
+
+        self.assertEqual(shift_actions.get_expiration_window_start(), run.high_water_mark - timedelta(hours=48))
+
+    def test_command_prints_the_summary(self):
+        shift = self._make_ended_shift(timedelta(minutes=30))
+        self._clockin(shift, self.employees[0])
+
+        out = StringIO()
+        call_command('process_expired', batch_size=10, stdout=out)
+
+        self.assertIn('1 clockins closed, 1 shifts expired', out.getvalue())
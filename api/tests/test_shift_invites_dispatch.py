@@ -0,0 +1,91 @@
+from datetime import timedelta
+
+from mock import patch
+
+from django.apps import apps
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from api.tests.mixins import WithMakeUser, WithMakeShift
+from api.utils import benchmark, email, notification_queue, notifier
+from api.utils.notification_queue import StubTransport
+
+Employee = apps.get_model('api', 'Employee')
+FCMDevice = apps.get_model('api', 'FCMDevice')
+ShiftInvite = apps.get_model('api', 'ShiftInvite')
+
+
+@override_settings(STATICFILES_STORAGE=None,
+                   NOTIFICATION_TRANSPORT='api.utils.notification_queue.StubTransport')
+class ShiftInvitesDispatchTestSuite(TestCase, WithMakeUser, WithMakeShift):
+    """
+    Publishing a shift should take the same number of queries no matter how many talents are invited
+    """
+    def setUp(self):
+        StubTransport.outbox = []
+        (
+            self.test_user_employer,
+            self.test_employer,
+            self.test_profile_employer
+        ) = self._make_user(
+            'employer',
+            userkwargs=dict(
+                username='employer1',
+                email='employer@testdoma.in',
+                is_active=True,
+            )
+        )
+        starting_at = timezone.now() + timedelta(days=1)
+        self.shift, _, __ = self._make_shift(
+            shiftkwargs=dict(status='OPEN', starting_at=starting_at, ending_at=starting_at + timedelta(hours=8)),
+            employer=self.test_employer)
+
+    def _make_talents(self, count):
+        ids = benchmark.seed_talents(count)
+        talents = list(Employee.objects.filter(id__in=ids).select_related('user'))
+        FCMDevice.objects.bulk_create([
+            FCMDevice(user=talent.user, registration_id='device{}'.format(talent.id)) for talent in talents
+        ])
+        return talents
+
+    def _count_queries(self, talents):
+        with CaptureQueriesContext(connection) as ctx:
+            notifier.notify_shift_invites(self.shift, talents, self.test_profile_employer, withEmail=True)
+        return len(ctx.captured_queries)
+
+    def test_invites_are_created(self):
+        talents = self._make_talents(5)
+
+        notifier.notify_shift_invites(self.shift, talents, self.test_profile_employer, manually_created=True)
+
+        invites = ShiftInvite.objects.filter(shift=self.shift)
+        self.assertEqual(invites.count(), 5)
+        self.assertEqual(invites.filter(manually_created=True, sender=self.test_profile_employer).count(), 5)
+        self.assertEqual(notification_queue.queue_depth()['pending'], 5)
+
+    def test_number_of_queries_does_not_depend_on_talents(self):
+        few = self._count_queries(self._make_talents(2))
+        many = self._count_queries(self._make_talents(50))
+
+        self.assertEqual(few, many)
+        # the ids of the invites are read back where bulk_create does not return them
+        self.assertEqual(many, 4 if connection.features.can_return_ids_from_bulk_insert else 5)
+
+    def test_template_is_rendered_once_per_shift(self):
+        talents = self._make_talents(10)
+        notifier.notify_shift_invites(self.shift, talents, self.test_profile_employer, withEmail=True)
+
+        with patch('api.utils.notification_queue.email.get_template_content',
+                   wraps=email.get_template_content) as rendered:
+            summary = notification_queue.process_queue()
+
+        self.assertEqual(summary['sent'], 20)
+        # one for the emails and one for the push notifications
+        self.assertEqual(rendered.call_count, 2)
+
+        pushes = [message for message in StubTransport.outbox if message['channel'] == 'FCM']
+        self.assertEqual(len(pushes), 10)
+        self.assertEqual(set(push['data']['id'] for push in pushes),
+                         set(ShiftInvite.objects.filter(shift=self.shift).values_list('id', flat=True)))
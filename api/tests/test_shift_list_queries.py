@@ -0,0 +1,89 @@
+from datetime import timedelta
+
+from mixer.backend.django import mixer
+
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse_lazy
+from django.utils import timezone
+
+from api.tests.mixins import WithMakeShift, WithMakeUser
+
+
+@override_settings(STATICFILES_STORAGE=None)
+class ShiftListQueriesTestSuite(TestCase, WithMakeUser, WithMakeShift):
+    """
+    The shift lists should take the same number of queries no matter the page size
+    """
+    def setUp(self):
+        self.test_user_employer, self.test_employer, self.test_profile_employer = self._make_user(
+            'employer',
+            userkwargs={"username": 'employer', "email": 'employer@testdoma.in', "is_active": True},
+            employexkwargs={"maximum_clockin_delta_minutes": 15, "maximum_clockout_delay_minutes": 15,
+                            "rating": 0, "total_ratings": 0}
+        )
+        self.employees = []
+        for i in range(3):
+            _, employee, __ = self._make_user(
+                'employee',
+                userkwargs={"username": 'employee{}'.format(i), "email": 'employee{}@testdoma.in'.format(i),
+                            "is_active": True},
+            )
+            self.employees.append(employee)
+
+        starting_at = timezone.now() + timedelta(days=1)
+        for i in range(20):
+            shift, _, __ = self._make_shift(
+                self.test_employer,
+                shiftkwargs={'status': 'OPEN', 'maximum_allowed_employees': 2,
+                             'starting_at': starting_at + timedelta(days=i),
+                             'ending_at': starting_at + timedelta(days=i, hours=8)})
+            shift.employees.add(*self.employees[:2])
+            shift.candidates.add(self.employees[2])
+            for employee in self.employees[:2]:
+                mixer.blend('api.Clockin', shift=shift, employee=employee, author=None,
+                            started_at=shift.starting_at)
+
+        self.client.force_login(self.test_user_employer)
+
+    def _count_queries(self, url, limit, params=''):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get('{}?limit={}&offset=0{}'.format(url, limit, params))
+        self.assertEqual(response.status_code, 200, response.content.decode())
+        self.assertEqual(len(response.json()), limit)
+        return len(ctx.captured_queries)
+
+    def _assert_fixed_number_of_queries(self, url, params=''):
+        small_page = self._count_queries(url, 5, params)
+        big_page = self._count_queries(url, 20, params)
+        self.assertEqual(small_page, big_page)
+
+    def test_employer_shifts(self):
+        self._assert_fixed_number_of_queries(reverse_lazy('api:me-employer-get-shifts'))
+
+    def test_employer_shifts_big_serializer(self):
+        self._assert_fixed_number_of_queries(reverse_lazy('api:me-employer-get-shifts'), '&serializer=big')
+
+    def test_employer_new_shifts(self):
+        self._assert_fixed_number_of_queries(reverse_lazy('api:me-employer-get-new-shifts'))
+
+    def test_employer_new_shifts_big_serializer(self):
+        self._assert_fixed_number_of_queries(reverse_lazy('api:me-employer-get-new-shifts'), '&serializer=big')
+
+    def test_public_shifts(self):
+        # the shifts are filled so they are not public
+        for shift in self.test_employer.shift_set.all():
+            shift.maximum_allowed_employees = 3
+            shift.save()
+
+        self._assert_fixed_number_of_queries(reverse_lazy('api:get-shifts'))
+
+    def test_status_uses_the_employee_count(self):
+        url = reverse_lazy('api:me-employer-get-new-shifts')
+        response = self.client.get('{}?limit=5&offset=0&employee={}'.format(url, self.employees[0].id))
+        self.assertEqual(response.status_code, 200, response.content.decode())
+        for shift in response.json():
+            # filtering by employee does not change how many employees the shift has
+            self.assertEqual(shift['status'], 'FILLED', shift)
+            self.assertEqual(len(shift['clockin']), 2, shift)
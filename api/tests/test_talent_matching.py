@@ -0,0 +1,147 @@
+from datetime import timedelta
+
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from mixer.backend.django import mixer
+
+from api.actions.employee_actions import create_default_availablity
+from api.tests.mixins import WithMakeUser, WithMakeShift
+from api.utils.matching import get_matching_talents, get_matching_talents_for_shifts
+
+
+@override_settings(STATICFILES_STORAGE=None)
+class TalentMatchingTestSuite(TestCase, WithMakeUser, WithMakeShift):
+    """
+    Tests for the set based talent matching used to send shift invites
+    """
+    def setUp(self):
+        (
+            self.test_user_employer,
+            self.test_employer,
+            self.test_profile_employer
+        ) = self._make_user(
+            'employer',
+            userkwargs=dict(
+                username='employer1',
+                email='employer@testdoma.in',
+                is_active=True,
+            )
+        )
+
+        self.position = mixer.blend('api.Position')
+        self.starting_at = timezone.now() + timedelta(days=1)
+        self.ending_at = self.starting_at + timedelta(hours=8)
+
+        self.shift, _, __ = self._make_shift(
+            shiftkwargs=dict(status='OPEN', starting_at=self.starting_at, ending_at=self.ending_at,
+                             position=self.position, minimum_hourly_rate=11.50, minimum_allowed_rating=0,
+                             application_restriction='ANYONE'),
+            venuekwargs=dict(latitude=40, longitude=-73),
+            employer=self.test_employer)
+
+    def _make_talent(self, username, latitude=40, longitude=-73, **kwargs):
+        employexkwargs = dict(
+            minimum_hourly_rate=9,
+            rating=5,
+            stop_receiving_invites=False,
+            maximum_job_distance_miles=15,
+            positions=[self.position.id],
+        )
+        employexkwargs.update(kwargs)
+        _, employee, __ = self._make_user(
+            'employee',
+            employexkwargs=employexkwargs,
+            profilekwargs=dict(latitude=latitude, longitude=longitude),
+            userkwargs=dict(username=username, email=username + '@testdoma.in', is_active=True)
+        )
+        # available every day of the week
+        create_default_availablity(employee)
+        return employee
+
+    def test_talent_within_its_maximum_distance(self):
+        # ~7 miles north of the venue
+        employee = self._make_talent('employee1', latitude=40.1)
+
+        talents = get_matching_talents(self.shift)
+        self.assertEqual([t.id for t in talents], [employee.id])
+
+    def test_talent_further_than_its_maximum_distance(self):
+        # ~7 miles north of the venue but only willing to travel 5
+        self._make_talent('employee1', latitude=40.1, maximum_job_distance_miles=5)
+        # ~35 miles north of the venue
+        self._make_talent('employee2', latitude=40.5, maximum_job_distance_miles=25)
+
+        talents = get_matching_talents(self.shift)
+        self.assertEqual(len(talents), 0, 'There should be 0 talents because they are too far away')
+
+    def test_talents_sorted_by_distance(self):
+        far = self._make_talent('employee1', latitude=40.1)
+        close = self._make_talent('employee2', latitude=40.01)
+
+        talents = get_matching_talents(self.shift)
+        self.assertEqual([t.id for t in talents], [close.id, far.id])
+
+    def test_busy_talent_is_excluded(self):
+        employee = self._make_talent('employee1')
+        other_shift, _, __ = self._make_shift(
+            shiftkwargs=dict(status='FILLED', starting_at=self.starting_at + timedelta(hours=2),
+                             ending_at=self.ending_at + timedelta(hours=2)),
+            employer=self.test_employer)
+        mixer.blend('api.ShiftEmployee', shift=other_shift, employee=employee)
+
+        talents = get_matching_talents(self.shift)
+        self.assertEqual(len(talents), 0, 'There should be 0 talents because the talent is working on another shift')
+
+    def test_talents_from_favorite_lists_only(self):
+        favorite = self._make_talent('employee1')
+        self._make_talent('employee2')
+
+        favlist = mixer.blend('api.FavoriteList', employer=self.test_employer)
+        favlist.employees.add(favorite)
+        self.shift.application_restriction = 'FAVORITES'
+        self.shift.save()
+        self.shift.allowed_from_list.add(favlist)
+
+        talents = get_matching_talents(self.shift)
+        self.assertEqual([t.id for t in talents], [favorite.id])
+
+    def test_number_of_queries_does_not_depend_on_talents(self):
+        for i in range(10):
+            self._make_talent('employee{}'.format(i), latitude=40 + i * 0.01)
+
+        with self.assertNumQueries(3):
+            talents = get_matching_talents(self.shift)
+            # the user is used to build the notifications
+            emails = [t.user.email for t in talents]
+
+        self.assertEqual(len(emails), 10)
+
+    def test_many_dates_match_once(self):
+        available = self._make_talent('employee1')
+        busy_on_day_two = self._make_talent('employee2', latitude=40.01)
+        # only available around the first date
+        partial = self._make_talent('employee3', latitude=40.02)
+        partial.availabilityblock_set.all().delete()
+        mixer.blend('api.AvailabilityBlock', employee=partial, starting_at=self.starting_at, ending_at=self.ending_at,
+                    allday=False, recurrent=True, recurrency_type='WEEKLY')
+
+        shifts = [self.shift] + [
+            self._make_shift(shiftkwargs=dict(
+                status='OPEN', starting_at=self.starting_at + timedelta(days=day),
+                ending_at=self.ending_at + timedelta(days=day), position=self.position,
+                minimum_hourly_rate=11.50, minimum_allowed_rating=0, application_restriction='ANYONE'),
+                venuekwargs=dict(latitude=40, longitude=-73), employer=self.test_employer)[0]
+            for day in (1, 2)]
+        other_shift, _, __ = self._make_shift(
+            shiftkwargs=dict(status='FILLED', starting_at=shifts[1].starting_at, ending_at=shifts[1].ending_at),
+            employer=self.test_employer)
+        mixer.blend('api.ShiftEmployee', shift=other_shift, employee=busy_on_day_two)
+
+        with self.assertNumQueries(4):
+            matches = get_matching_talents_for_shifts(shifts)
+
+        self.assertEqual([t.id for t in matches[shifts[0].id]], [available.id, busy_on_day_two.id, partial.id])
+        self.assertEqual([t.id for t in matches[shifts[1].id]], [available.id])
+        self.assertEqual([t.id for t in matches[shifts[2].id]], [available.id, busy_on_day_two.id])
+        for shift in shifts:
+            self.assertEqual(matches[shift.id], get_matching_talents(shift))
@@ -0,0 +1,106 @@
+from mixer.backend.django import mixer
+
+from django.apps import apps
+from django.test import TestCase, override_settings
+from django.urls import reverse_lazy
+
+from api.tests.mixins import WithMakeUser
+from api.utils import talent_search
+
+Employee = apps.get_model('api', 'Employee')
+
+
+@override_settings(STATICFILES_STORAGE=None)
+class TalentSearchTestSuite(TestCase, WithMakeUser):
+    """
+    Search documents, ranking and typeahead of the talents
+    """
+    def setUp(self):
+        self.test_user_employer, _, __ = self._make_user(
+            'employer',
+            userkwargs={"username": 'employer', "email": 'employer@testdoma.in', "is_active": True},
+        )
+        self.bartender = mixer.blend('api.Position', title='Bartender')
+        self.talents = {}
+        for username, first_name, last_name in (
+                ('maria', 'Maria', 'Garcia'), ('mario', 'Mario', 'Bros'), ('marianne', 'Marianne', 'Smith'),
+                ('alex', 'Alejandro', 'Martinez')):
+            _, employee, __ = self._make_user('employee', userkwargs={
+                "username": username, "email": username + '@testdoma.in', "is_active": True,
+                "first_name": first_name, "last_name": last_name})
+            self.talents[username] = employee
+        self.talents['alex'].positions.add(self.bartender)
+        self.client.force_login(self.test_user_employer)
+
+    def _document(self, username):
+        return Employee.objects.get(id=self.talents[username].id).search_document
+
+    def test_document(self):
+        self.assertEqual(self._document('alex'), ' alejandro martinez alex@testdoma.in bartender')
+
+    def test_document_follows_the_changes(self):
+        user = self.talents['mario'].user
+        user.last_name = 'Rossi'
+        user.save()
+        self.assertIn(' rossi ', self._document('mario'))
+
+        self.bartender.title = 'Mixologist'
+        self.bartender.save()
+        self.assertIn(' mixologist', self._document('alex'))
+
+        self.talents['alex'].positions.remove(self.bartender)
+        self.assertNotIn('mixologist', self._document('alex'))
+
+        self.talents['mario'].positions.add(self.bartender)
+        self.bartender.delete()
+        self.assertNotIn('mixologist', self._document('mario'))
+
+    def test_login_does_not_rebuild(self):
+        user = self.talents['maria'].user
+        user.first_name = 'Stale'
+        user.save(update_fields=['last_login'])
+        self.assertNotIn('stale', self._document('maria'))
+
+    def test_word_prefix(self):
+        employees = Employee.objects.all()
+        self.assertEqual(set(talent_search.filter_queryset(employees, 'MAR')),
+                         {self.talents['maria'], self.talents['mario'], self.talents['marianne'],
+                          self.talents['alex']})
+        self.assertEqual(list(talent_search.filter_queryset(employees, 'mar gar')), [self.talents['maria']])
+        self.assertEqual(list(talent_search.filter_queryset(employees, 'bart')), [self.talents['alex']])
+        # only the start of the words
+        self.assertEqual(list(talent_search.filter_queryset(employees, 'arcia')), [])
+
+    def test_ranked_and_limited(self):
+        found = talent_search.search(Employee.objects.all(), 'mari', limit=2)
+        self.assertEqual(len(found), 2)
+        self.assertTrue(set(found) < {self.talents['maria'], self.talents['mario'], self.talents['marianne']})
+
+        found = talent_search.search(Employee.objects.exclude(id=self.talents['mario'].id), 'mario', limit=2)
+        self.assertEqual(found, [])
+
+    def test_python_index_matches_pg_trgm(self):
+        # the example of the pg_trgm documentation
+        self.assertAlmostEqual(talent_search.similarity('word', 'two words'), 0.363636, places=5)
+        self.assertAlmostEqual(talent_search.similarity('mario', 'maria'), 0.5, places=5)
+        # non alphanumeric characters separate the words
+        self.assertEqual(talent_search.similarity('ana@jobcore.co', 'ana jobcore co'), 1)
+
+        index = talent_search.PythonTalentIndex([(1, ' maria garcia'), (2, ' mario bros'), (3, ' ana maria')])
+        self.assertEqual(index.search(['mar']), [3, 2, 1])
+        self.assertEqual(index.search(['maria', 'g']), [1])
+        self.assertEqual(index.search(['zz']), [])
+
+    def test_catalog_typeahead(self):
+        url = reverse_lazy('api:get-catalog', kwargs={'catalog_type': 'employees'})
+        response = self.client.get(url, {'full_name': 'mari', 'limit': 1})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()), 1)
+
+        response = self.client.get(url, {'full_name': 'martinez', 'positions': self.bartender.id})
+        self.assertEqual(response.json(), [{'label': 'Alejandro Martinez', 'value': self.talents['alex'].id}])
+
+    def test_employee_list(self):
+        response = self.client.get(reverse_lazy('api:get-employees'), {'full_name': 'maria garcia'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([employee['id'] for employee in response.json()], [self.talents['maria'].id])
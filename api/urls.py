@@ -10,7 +10,8 @@ from api.views.subscription_payment import (
 
 from api.views.hooks import (
     DefaultAvailabilityHook, ClockOutExpiredShifts, GeneratePeriodsView,
-    AddTalentsToAllPositions, RemoveEmployeesWithoutProfile
+    AddTalentsToAllPositions, RemoveEmployeesWithoutProfile, ProcessNotificationsView, ProcessDocumentsView,
+    ProcessPayoutsView
 )
 
 from api.views.general_views import (
@@ -23,7 +24,8 @@ from api.views.general_views import (
 from api.views.bank_accounts_view import BankAccountAPIView, BankAccountDetailAPIView
 
 from api.views.admin_views import (
-    EmployeeBadgesView, PayrollPeriodView, EmailView, FMCView, AdminClockinsview,
+    EmployeeBadgesView, PayrollPeriodView, EmailView, FMCView, AdminClockinsview, NotificationQueueView,
+    ReferenceCacheView,
     # DocumentAdmin
 )
 from api.views.employee_views import (
@@ -38,12 +40,12 @@ from api.views.documents_view import (
 
 from api.views.employer_views import (
     EmployerMeView, EmployerMeUsersView, ApplicantsView, Subscription_authView,
-    EmployerMePayrollPeriodsView, EmployerMeImageView,
+    EmployerMePayrollPeriodsView, EmployerMeImageView, EmployerMeStatsView,
     EmployerShiftInviteView, EmployerVenueView,
     FavListView, FavListEmployeeView, EmployerShiftCandidatesView,
     EmployerShiftEmployeesView, EmployerShiftView, EmployerShiftNewView, EmployerBatchActions,
     EmployerMePayrollPeriodPaymentView, EmployerClockinsMeView,
-    EmployerMeEmployeePaymentView, EmployerMeEmployeePaymentListView,
+    EmployerMeEmployeePaymentView, EmployerMeEmployeePaymentListView, EmployerMePayrollPayoutView,
     EmployerMePayrollPeriodPaymentView, EmployerClockinsMeView, EmployerMePayrates,
     EmployerMeSubscriptionView, EmployerMeEmployeePaymentReportView, EmployerMeEmployeePaymentDeductionReportView, EmployerMeW4Form,EmployerMeI9Form, EmployerMeEmployeeDocument
 )
@@ -176,6 +178,8 @@ urlpatterns = [
     path('employers/me', EmployerMeView.as_view(), name="me-employer"),
     path('employers/me/<int:employer_id>', EmployerMeView.as_view(), name="me-employer"),
     path('employers/me/image', EmployerMeImageView.as_view(), name="me-employers-image"),
+    # dashboard counters
+    path('employers/me/stats', EmployerMeStatsView.as_view(), name="me-employer-stats"),
     path('employers/me/subscription', EmployerMeSubscriptionView.as_view(), name="me-employer-subscription"),
     path('employers/me/users', EmployerMeUsersView.as_view(), name="me-employer-users"),
     path('employers/me/users/<int:profile_id>', EmployerMeUsersView.as_view(), name="me-employer-single-users"),
@@ -201,6 +205,8 @@ urlpatterns = [
          name="me-single-payroll-payments"),
     path('employers/me/payroll-periods/<int:period_id>', EmployerMePayrollPeriodsView.as_view(),
          name="me-get-single-payroll-period"),
+    path('employers/me/payroll-periods/<int:period_id>/payout', EmployerMePayrollPayoutView.as_view(),
+         name="me-payroll-period-payout"),
     path('employers/me/employee-payment-list/<int:period_id>', EmployerMeEmployeePaymentListView.as_view(),
          name='me-get-employee-payment-list'),
     path('employers/me/employee-payment/<int:employee_payment_id>', EmployerMeEmployeePaymentView.as_view(),
@@ -412,6 +418,8 @@ urlpatterns = [
     # ADMIN USE ONLY
     #
     path('admin/clockins', AdminClockinsview.as_view(), name="admin-get-clockins"),
+    path('admin/notifications/queue', NotificationQueueView.as_view(), name="admin-get-notifications-queue"),
+    path('admin/cache/reference', ReferenceCacheView.as_view(), name="admin-get-reference-cache"),
     path(
         'employees/<int:employee_id>/badges',
         EmployeeBadgesView.as_view(),
@@ -451,4 +459,11 @@ urlpatterns = [
     #   - employer: optional
     path('hook/generate_periods', GeneratePeriodsView.as_view(), name="hook-generate_periods"),
 
+    # every minute if there is no worker running process_notifications --loop
+    path('hook/process_notifications', ProcessNotificationsView.as_view(), name="hook-process-notifications"),
+    # every minute if there is no worker running process_documents --loop
+    path('hook/process_documents', ProcessDocumentsView.as_view(), name="hook-process-documents"),
+    # every minute if there is no worker running process_payouts --loop
+    path('hook/process_payouts', ProcessPayoutsView.as_view(), name="hook-process-payouts"),
+
 ]
@@ -0,0 +1,226 @@
+"""
+Availability of the talents as an interval index.
+
+The availability blocks of a talent repeat every week (WEEKLY), every month (MONTHLY) or not
+at all (recurrent=False) and an allday block covers the 24 hours since its starting_at. They are
+expanded into AvailabilityInterval rows: ranges of minutes of the week, of the month (from the
+first day at 00:00) or since the epoch, merged by talent so adjacent blocks make one interval.
+The week is indexed twice in a row (minutes 0 to 2 weeks) so a window that crosses from Sunday
+to Monday is still inside one interval, and a talent available the whole week gets an unbounded
+interval. A month is indexed as 31 days, a monthly block that runs past the end of it continues
+at the beginning of the month; a window that crosses the end of a shorter month is only covered
+by the blocks of the month it starts in.
+
+The minutes are in UTC, like the datetimes of the blocks and the shifts: neither the talents nor
+the venues have a time zone, so a weekly block from 9:00 to 17:00 local time moves one hour
+earlier or later (local time) after a daylight saving change, as it did with the old range filters.
+
+"Who is available from X to Y" is then one lookup on the (period, start_minute, end_minute)
+index of the intervals: the rows that contain the window for any of the three periods
+(available_employees()).
+
+The intervals of a talent are rebuilt when a signal says one of its blocks changed, code that
+writes many blocks runs inside deferred() so every talent is rebuilt once; the
+rebuild_availability command rebuilds every talent.
+"""
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Q
+from django.db.models.signals import post_delete, post_save
+from django.utils import timezone
+
+from api.models import (
+    AvailabilityBlock, AvailabilityInterval, AVAILABILITY_DATE, AVAILABILITY_MONTH, AVAILABILITY_WEEK, MONTHLY
+)
+
+MINUTES_PER_DAY = 24 * 60
+MINUTES_PER_WEEK = 7 * MINUTES_PER_DAY
+MINUTES_PER_MONTH = 31 * MINUTES_PER_DAY
+REBUILD_BATCH_SIZE = 1000
+
+_deferred = threading.local()
+
+
+def _minute_of_week(value):
+    value = value.astimezone(timezone.utc)
+    return value.weekday() * MINUTES_PER_DAY + value.hour * 60 + value.minute
+
+
+def _minute_of_month(value):
+    value = value.astimezone(timezone.utc)
+    return (value.day - 1) * MINUTES_PER_DAY + value.hour * 60 + value.minute
+
+
+def _epoch_minute(value):
+    return int(value.timestamp() // 60)
+
+
+def _length(starting_at, ending_at):
+    return _epoch_minute(ending_at) - _epoch_minute(starting_at)
+
+
+def block_intervals(starting_at, ending_at, allday, recurrent, recurrency_type):
+    """The (period, start, end) minute intervals of an availability block"""
+    if allday:
+        ending_at = starting_at + timedelta(days=1)
+    length = _length(starting_at, ending_at)
+    if length <= 0:
+        return []
+
+    if not recurrent:
+        start = _epoch_minute(starting_at)
+        return [(AVAILABILITY_DATE, start, start + length)]
+    if recurrency_type == MONTHLY:
+        start = _minute_of_month(starting_at)
+        return [(AVAILABILITY_MONTH, start, start + length)]
+    start = _minute_of_week(starting_at)
+    # twice, the second copy continues the first week
+    return [(AVAILABILITY_WEEK, start, start + length),
+            (AVAILABILITY_WEEK, start + MINUTES_PER_WEEK, start + MINUTES_PER_WEEK + length)]
+
+
+def _merge(intervals):
+    merged = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return merged
+
+
+def employee_intervals(blocks):
+    """
+    The merged (period, start, end) intervals of the blocks of a talent, end is None when the
+    talent is available the whole week
+    """
+    by_period = defaultdict(list)
+    for block in blocks:
+        for period, start, end in block_intervals(*block):
+            by_period[period].append((start, end))
+
+    intervals = []
+    for period, period_intervals in by_period.items():
+        if period == AVAILABILITY_MONTH:
+            # a block of the end of the month continues at the beginning
+            period_intervals += [(start - MINUTES_PER_MONTH, end - MINUTES_PER_MONTH)
+                                 for start, end in period_intervals if end > MINUTES_PER_MONTH]
+            merged = [(max(start, 0), end) for start, end in _merge(period_intervals) if end > 0]
+        elif period == AVAILABILITY_WEEK:
+            # a block of the end of the week continues at the beginning
+            period_intervals += [(start - MINUTES_PER_WEEK, end - MINUTES_PER_WEEK)
+                                 for start, end in period_intervals if end > MINUTES_PER_WEEK]
+            merged = [(max(start, 0), min(end, 2 * MINUTES_PER_WEEK)) for start, end in _merge(period_intervals)
+                      if end > 0]
+            if merged and merged[0][0] == 0 and merged[0][1] == 2 * MINUTES_PER_WEEK:
+                merged = [(0, None)]
+        else:
+            merged = _merge(period_intervals)
+        intervals += [(period, start, end) for start, end in merged]
+    return intervals
+
+
+def window(starting_at, ending_at):
+    """The minute ranges of every period the interval of a talent must contain to cover the window"""
+    length = max(_length(starting_at, ending_at), 1)
+    week_start = _minute_of_week(starting_at)
+    month_start = _minute_of_month(starting_at)
+    epoch_start = _epoch_minute(starting_at)
+    return {
+        AVAILABILITY_WEEK: (week_start, week_start + length),
+        AVAILABILITY_MONTH: (month_start, month_start + length),
+        AVAILABILITY_DATE: (epoch_start, epoch_start + length),
+    }
+
+
+def window_filter(starting_at, ending_at, prefix=''):
+    """Q of the AvailabilityInterval rows that cover the window"""
+    query = Q()
+    for period, (start, end) in window(starting_at, ending_at).items():
+        query |= (Q(**{prefix + 'period': period, prefix + 'start_minute__lte': start})
+                  & (Q(**{prefix + 'end_minute__gte': end}) | Q(**{prefix + 'end_minute__isnull': True})))
+    return query
+
+
+def available_employees(starting_at, ending_at):
+    """The ids of the talents available the whole window, a values() queryset to use as a subquery"""
+    return AvailabilityInterval.objects.filter(window_filter(starting_at, ending_at)).values('employee_id')
+
+
+def covers(intervals, starting_at, ending_at):
+    """Same as available_employees() for the (period, start, end) intervals of one talent, in python"""
+    ranges = window(starting_at, ending_at)
+    for period, start, end in intervals:
+        window_start, window_end = ranges[period]
+        if start <= window_start and (end is None or window_end <= end):
+            return True
+    return False
+
+
+def get_intervals(employee_ids):
+    """{employee id: [(period, start, end)]} from the index"""
+    intervals = defaultdict(list)
+    for employee_id, period, start, end in AvailabilityInterval.objects.filter(
+            employee_id__in=list(employee_ids)).values_list('employee_id', 'period', 'start_minute', 'end_minute'):
+        intervals[employee_id].append((period, start, end))
+    return intervals
+
+
+def _rebuild(employee_ids):
+    blocks = defaultdict(list)
+    for row in AvailabilityBlock.objects.filter(employee_id__in=employee_ids).values_list(
+            'employee_id', 'starting_at', 'ending_at', 'allday', 'recurrent', 'recurrency_type'):
+        blocks[row[0]].append(row[1:])
+
+    with transaction.atomic():
+        AvailabilityInterval.objects.filter(employee_id__in=employee_ids).delete()
+        AvailabilityInterval.objects.bulk_create([
+            AvailabilityInterval(employee_id=employee_id, period=period, start_minute=start, end_minute=end)
+            for employee_id, employee_blocks in blocks.items()
+            for period, start, end in employee_intervals(employee_blocks)
+        ], batch_size=REBUILD_BATCH_SIZE)
+
+
+def rebuild(employee_ids=None):
+    """Rebuilds the intervals of the talents (all of them when None), at the end of deferred() inside one"""
+    from api.models import Employee
+
+    pending = getattr(_deferred, 'pending', None)
+    if pending is not None and employee_ids is not None:
+        pending.update(employee_ids)
+        return
+
+    if employee_ids is None:
+        employee_ids = Employee.objects.order_by('id').values_list('id', flat=True)
+    employee_ids = sorted(set(employee_ids))
+    for start in range(0, len(employee_ids), REBUILD_BATCH_SIZE):
+        _rebuild(employee_ids[start:start + REBUILD_BATCH_SIZE])
+
+
+@contextmanager
+def deferred():
+    """Collects the talents whose blocks change and rebuilds each one once on exit"""
+    if getattr(_deferred, 'pending', None) is not None:
+        # nested, the outermost block rebuilds
+        yield
+        return
+
+    pending = _deferred.pending = set()
+    try:
+        yield
+    finally:
+        _deferred.pending = None
+    rebuild(pending)
+
+
+def connect_signals():
+
+    def block_changed(sender, instance, **kwargs):
+        rebuild([instance.employee_id])
+
+    post_save.connect(block_changed, sender=AvailabilityBlock, weak=False, dispatch_uid='availability_save')
+    post_delete.connect(block_changed, sender=AvailabilityBlock, weak=False, dispatch_uid='availability_delete')
@@ -0,0 +1,218 @@
+"""
+Helpers for the benchmark management commands.
+
+Benchmarks seed their data inside a transaction that is always rolled back,
+so they can run against a development database without leaving anything behind.
+Concurrent benchmarks need the data committed (every client has its own connection),
+they delete what they seeded at the end instead.
+"""
+import random
+import statistics
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.db import connection, connections, transaction
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from api.models import AvailabilityBlock, Clockin, Employee, Profile, Shift
+from api.utils import availability, explain, talent_search
+
+BATCH_SIZE = 5000
+FIRST_NAMES = ('Ana', 'Alejandro', 'Brian', 'Carla', 'Daniel', 'Elena', 'Gabriel', 'Maria', 'Paula', 'Sofia')
+LAST_NAMES = ('Alvarez', 'Brown', 'Garcia', 'Johnson', 'Martinez', 'Perez', 'Rodriguez', 'Smith', 'Torres', 'Wilson')
+
+
+@contextmanager
+def rollback_after():
+    with transaction.atomic():
+        yield
+        transaction.set_rollback(True)
+
+
+def measure(fn, repeat=5):
+    """Runs fn several times and returns latency (in milliseconds) and query stats"""
+    timings = []
+    queries = 0
+    result = None
+    for _ in range(repeat):
+        with CaptureQueriesContext(connection) as ctx:
+            start = time.perf_counter()
+            result = fn()
+            timings.append((time.perf_counter() - start) * 1000)
+        queries = len(ctx.captured_queries)
+
+    timings.sort()
+    return {
+        'result': result,
+        'runs': repeat,
+        'queries': queries,
+        'min_ms': timings[0],
+        'median_ms': statistics.median(timings),
+        'p95_ms': percentile(timings, 95),
+        'max_ms': timings[-1],
+    }
+
+
+def percentile(timings, p):
+    """The p percentile (0-100) of the sorted timings"""
+    return timings[min(len(timings) - 1, max(0, int(round(len(timings) * p / 100.0)) - 1))]
+
+
+def measure_concurrently(fn, items, concurrency):
+    """
+    Calls fn(item) for every item from `concurrency` threads (each one with its own database
+    connection) and returns the latency stats of the calls, fn exceptions are counted as errors
+    """
+    def timed(item):
+        start = time.perf_counter()
+        try:
+            fn(item)
+            error = False
+        except Exception:
+            error = True
+        finally:
+            elapsed = (time.perf_counter() - start) * 1000
+        return elapsed, error
+
+    def run(chunk):
+        try:
+            return [timed(item) for item in chunk]
+        finally:
+            connections.close_all()
+
+    chunks = [items[i::concurrency] for i in range(concurrency)]
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = [result for chunk in executor.map(run, chunks) for result in chunk]
+    wall = time.perf_counter() - start
+
+    timings = sorted(elapsed for elapsed, _ in results)
+    return {
+        'calls': len(results),
+        'errors': sum(1 for _, error in results if error),
+        'concurrency': concurrency,
+        'throughput': len(results) / wall if wall else 0,
+        'median_ms': statistics.median(timings) if timings else 0,
+        'p95_ms': percentile(timings, 95) if timings else 0,
+        'p99_ms': percentile(timings, 99) if timings else 0,
+        'max_ms': timings[-1] if timings else 0,
+    }
+
+
+def format_concurrent_stats(label, stats):
+    return '{}: calls={calls} errors={errors} concurrency={concurrency} throughput={throughput:.0f}/s ' \
+           'median={median_ms:.1f}ms p95={p95_ms:.1f}ms p99={p99_ms:.1f}ms max={max_ms:.1f}ms'.format(label, **stats)
+
+
+def format_stats(label, stats):
+    return '{}: runs={runs} queries={queries} min={min_ms:.1f}ms median={median_ms:.1f}ms ' \
+           'p95={p95_ms:.1f}ms max={max_ms:.1f}ms'.format(label, **stats)
+
+
+def seed_talents(count, positions=None, latitude=25.7617, longitude=-80.1918, spread_degrees=1.0, seed=42):
+    """
+    Bulk creates `count` talents (user, employee, profile and all-day availability blocks for
+    every day of the week) spread around the given coordinates. Returns the list of employee ids.
+    """
+    rnd = random.Random(seed)
+    prefix = 'bench{}_'.format(uuid.uuid4().hex[:8])
+    now = timezone.now()
+
+    users = User.objects.bulk_create([
+        User(username=prefix + str(i), email=prefix + str(i) + '@bench.jobcore.co',
+             first_name=rnd.choice(FIRST_NAMES), last_name='{} {}'.format(rnd.choice(LAST_NAMES), i),
+             password='!', is_active=True)
+        for i in range(count)
+    ], batch_size=BATCH_SIZE)
+    # bulk_create only sets the ids on PostgreSQL, elsewhere the rows are read back
+    if not connection.features.can_return_ids_from_bulk_insert:
+        users = list(User.objects.filter(username__startswith=prefix).order_by('id'))
+
+    employees = Employee.objects.bulk_create([
+        Employee(user=user, minimum_hourly_rate=rnd.choice([8, 9, 10, 12, 15]),
+                 rating=rnd.choice([None, 2, 3, 4, 5]),
+                 maximum_job_distance_miles=rnd.choice([5, 10, 25, 50]))
+        for user in users
+    ], batch_size=BATCH_SIZE)
+    if not connection.features.can_return_ids_from_bulk_insert:
+        employees = list(Employee.objects.filter(user__username__startswith=prefix).select_related('user')
+                         .order_by('id'))
+
+    Profile.objects.bulk_create([
+        Profile(user=employee.user, employee=employee, status='ACTIVE',
+                latitude=latitude + rnd.uniform(-spread_degrees, spread_degrees),
+                longitude=longitude + rnd.uniform(-spread_degrees, spread_degrees))
+        for employee in employees
+    ], batch_size=BATCH_SIZE)
+
+    AvailabilityBlock.objects.bulk_create([
+        AvailabilityBlock(employee=employee, starting_at=now + timedelta(days=day),
+                          ending_at=now + timedelta(days=day), allday=True, recurrent=True)
+        for employee in employees for day in range(7)
+    ], batch_size=BATCH_SIZE)
+
+    if positions:
+        through = Employee.positions.through
+        through.objects.bulk_create([
+            through(employee_id=employee.id, position_id=position.id)
+            for employee in employees for position in positions
+        ], batch_size=BATCH_SIZE)
+
+    employee_ids = [employee.id for employee in employees]
+    # without statistics of the new rows postgres plans the refresh with nested loops
+    explain.analyze(User, Employee)
+    talent_search.refresh_documents(employee_ids)
+    availability.rebuild(employee_ids)
+    return employee_ids
+
+
+def seed_shifts(employer, venue, position, count, status='OPEN', seed=42):
+    """Bulk creates `count` upcoming shifts for the employer, one hour apart. Returns the shifts."""
+    rnd = random.Random(seed)
+    starting_at = timezone.now().replace(minute=0, second=0, microsecond=0) + timedelta(days=1)
+
+    return Shift.objects.bulk_create([
+        Shift(employer=employer, venue=venue, position=position, status=status,
+              maximum_allowed_employees=rnd.randint(1, 10), minimum_hourly_rate=rnd.choice([8, 10, 12, 15]),
+              minimum_allowed_rating=0, starting_at=starting_at + timedelta(hours=i),
+              ending_at=starting_at + timedelta(hours=i + 4))
+        for i in range(count)
+    ], batch_size=BATCH_SIZE)
+
+
+def seed_shift_history(employer, venue, position, employee_ids, days=365, shifts_per_day=2,
+                       talents_per_shift=5, seed=42):
+    """
+    Bulk creates `days` of past shifts for the employer, each one with closed clockins
+    of `talents_per_shift` talents. Returns the number of clockins created.
+    """
+    rnd = random.Random(seed)
+    today = timezone.now().replace(hour=9, minute=0, second=0, microsecond=0)
+
+    shifts = [
+        Shift(employer=employer, venue=venue, position=position, status='COMPLETED',
+              minimum_hourly_rate=rnd.choice([8, 10, 12, 15]), minimum_allowed_rating=0,
+              starting_at=today - timedelta(days=day, hours=-4 * i),
+              ending_at=today - timedelta(days=day, hours=-4 * i - 4))
+        for day in range(1, days + 1) for i in range(shifts_per_day)
+    ]
+    if connection.features.can_return_ids_from_bulk_insert:
+        Shift.objects.bulk_create(shifts, batch_size=BATCH_SIZE)
+    else:
+        # bulk_create only sets the ids on PostgreSQL and the shifts have nothing unique to read them back by
+        for shift in shifts:
+            shift.save()
+
+    clockins = Clockin.objects.bulk_create([
+        Clockin(shift=shift, employee_id=employee_id, status='APPROVED',
+                started_at=shift.starting_at + timedelta(minutes=rnd.randint(-10, 10)),
+                ended_at=shift.ending_at + timedelta(minutes=rnd.randint(-10, 60)))
+        for shift in shifts for employee_id in rnd.sample(employee_ids, talents_per_shift)
+    ], batch_size=BATCH_SIZE)
+
+    return len(clockins)
@@ -0,0 +1,207 @@
+"""
+Upload and deletion pipeline of the employee documents (I-9 scans, forms, ids).
+
+The upload request only keeps the file on the document row (spooled_content) with the
+PENDING_UPLOAD status, the process_documents command (or the hook/process_documents cron hook)
+pushes the spooled files to the storage and deletes the DELETED documents from it in batches.
+The file is spooled in the database and not on the disk of the web dyno, which is not shared with
+the workers and is lost on every restart.
+
+A worker claims a batch (UPLOADING, claimed_at) in a short transaction, uploads the files with no
+transaction open and records the results in a second one. A document left UPLOADING by a worker
+that crashed is claimed again after CLAIM_TIMEOUT, uploading it twice overwrites the same public id.
+
+The storage is pluggable with settings.DOCUMENT_STORAGE: CloudinaryStorage in production and
+LocalStorage (a directory served under DOCUMENT_STORAGE_URL) for development and tests.
+"""
+import os
+import shutil
+import time
+from datetime import datetime, timedelta
+from io import BytesIO
+
+import cloudinary.api
+import cloudinary.uploader
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.crypto import get_random_string
+from django.utils.module_loading import import_string
+
+from api.models import EmployeeDocument
+from api.utils.loggers import log_debug
+
+MAX_ATTEMPTS = 5
+UPLOAD_BATCH_SIZE = 20
+# cloudinary does not accept more public ids on a single delete_resources call
+DELETE_BATCH_SIZE = 100
+DELETE_RETRIES = 3
+RETRY_DELAY_SECONDS = 1
+CLAIM_TIMEOUT = timedelta(minutes=10)
+
+
+class CloudinaryStorage:
+
+    def upload(self, file, public_id, tags):
+        result = cloudinary.uploader.upload(file, public_id=public_id, tags=tags, resource_type='auto')
+        return result['secure_url']
+
+    def delete(self, public_ids):
+        """Returns the public ids that are not on the storage anymore"""
+        gone = set(public_ids)
+        # the documents are uploaded with resource_type auto: images (pdfs too) or raw files
+        for resource_type in ('image', 'raw'):
+            result = cloudinary.api.delete_resources(list(public_ids), resource_type=resource_type)
+            gone &= set(public_id for public_id, outcome in result.get('deleted', {}).items()
+                        if outcome in ('deleted', 'not_found'))
+        return gone
+
+
+class LocalStorage:
+    """Keeps the documents on settings.DOCUMENT_STORAGE_ROOT"""
+
+    def _path(self, public_id):
+        return os.path.join(settings.DOCUMENT_STORAGE_ROOT, public_id)
+
+    def upload(self, file, public_id, tags):
+        destination = self._path(public_id)
+        os.makedirs(os.path.dirname(destination), exist_ok=True)
+        with open(destination, 'wb') as f:
+            shutil.copyfileobj(file, f)
+        return settings.DOCUMENT_STORAGE_URL.rstrip('/') + '/' + public_id
+
+    def delete(self, public_ids):
+        for public_id in public_ids:
+            if os.path.exists(self._path(public_id)):
+                os.remove(self._path(public_id))
+        return set(public_ids)
+
+
+def get_storage():
+    return import_string(settings.DOCUMENT_STORAGE)()
+
+
+def spool_upload(employee, document_type, uploaded_file):
+    """Keeps the uploaded file on a new PENDING_UPLOAD document and returns it"""
+    name = f'profile-{employee.user_id}-{datetime.now().strftime("%d-%m")}-{get_random_string(length=32)}'
+    public_id = f'{employee.user_id}/i9_documents/{name}'
+
+    return EmployeeDocument.objects.create(employee=employee, document_type=document_type, document='',
+                                           public_id=public_id,
+                                           spooled_content=b''.join(uploaded_file.chunks()),
+                                           status=EmployeeDocument.PENDING_UPLOAD)
+
+
+def _claim_uploads(batch_size):
+    now = timezone.now()
+    with transaction.atomic():
+        documents = list(EmployeeDocument.objects.filter(
+            Q(status=EmployeeDocument.PENDING_UPLOAD) |
+            Q(status=EmployeeDocument.UPLOADING, claimed_at__lt=now - CLAIM_TIMEOUT)
+        ).select_for_update(skip_locked=True).order_by('id')[:batch_size])
+        for document in documents:
+            document.status = EmployeeDocument.UPLOADING
+            document.claimed_at = now
+        EmployeeDocument.objects.bulk_update(documents, ['status', 'claimed_at'])
+    return documents
+
+
+def process_uploads(batch_size=UPLOAD_BATCH_SIZE, storage=None):
+    """
+    Pushes one batch of spooled documents to the storage and returns a summary of the run.
+    Rows are claimed with SKIP LOCKED so several workers can run at the same time.
+    """
+    from api.serializers.documents_serializer import update_verification_status
+
+    if storage is None:
+        storage = get_storage()
+
+    documents = _claim_uploads(batch_size)
+    uploaded = []
+    failed = []
+    for document in documents:
+        document.claimed_at = None
+        try:
+            document.document = storage.upload(
+                BytesIO(document.spooled_content), document.public_id,
+                tags=['i9_document', 'profile-{}'.format(document.public_id.split('/')[0])])
+        except Exception as e:
+            document.upload_attempts += 1
+            document.last_error = str(e)
+            document.status = EmployeeDocument.PENDING_UPLOAD
+            if document.upload_attempts >= MAX_ATTEMPTS:
+                document.status = EmployeeDocument.UPLOAD_FAILED
+            log_debug('general', 'Document {} upload failed ({} attempts): {}'.format(
+                document.id, document.upload_attempts, e))
+            failed.append(document)
+            continue
+        document.status = EmployeeDocument.PENDING
+        document.spooled_content = None
+        uploaded.append(document)
+
+    with transaction.atomic():
+        EmployeeDocument.objects.bulk_update(uploaded, ['document', 'status', 'spooled_content', 'claimed_at'])
+        EmployeeDocument.objects.bulk_update(failed, ['upload_attempts', 'last_error', 'status', 'claimed_at'])
+
+    for employee_id in set(document.employee_id for document in uploaded):
+        update_verification_status(employee_id)
+
+    return {
+        'processed': len(documents),
+        'uploaded': len(uploaded),
+        'failed': len(failed),
+    }
+
+
+def _delete_with_retries(storage, public_ids, retries):
+    for attempt in range(retries + 1):
+        try:
+            return storage.delete(public_ids)
+        except Exception as e:
+            log_debug('general', 'Deleting {} documents failed (attempt {}): {}'.format(len(public_ids), attempt + 1, e))
+            if attempt == retries:
+                return set()
+            time.sleep(RETRY_DELAY_SECONDS * 2 ** attempt)
+
+
+def delete_documents(batch_size=DELETE_BATCH_SIZE, retries=DELETE_RETRIES, storage=None, progress=None):
+    """
+    Removes the DELETED documents from the storage, batch_size public ids per call, and then
+    from the database. progress(done, total) is called after every batch. The documents the
+    storage could not delete stay DELETED for the next run.
+    """
+    if storage is None:
+        storage = get_storage()
+
+    pending = list(EmployeeDocument.objects.filter(status=EmployeeDocument.DELETED)
+                   .order_by('id').values_list('id', 'public_id'))
+    deleted = 0
+    failed = 0
+    for start in range(0, len(pending), batch_size):
+        batch = pending[start:start + batch_size]
+        public_ids = [public_id for _, public_id in batch if public_id]
+        removed = _delete_with_retries(storage, public_ids, retries) if public_ids else set()
+
+        ids = [id for id, public_id in batch if not public_id or public_id in removed]
+        EmployeeDocument.objects.filter(id__in=ids).delete()
+
+        deleted += len(ids)
+        failed += len(batch) - len(ids)
+        if progress is not None:
+            progress(start + len(batch), len(pending))
+
+    return {
+        'deleted': deleted,
+        'failed': failed,
+    }
+
+
+def process_expired_documents(progress=None):
+    """Archives the expired documents and deletes the DELETED ones from the storage"""
+    archived = EmployeeDocument.objects.filter(expired_at__isnull=False, expired_at__lte=timezone.now()) \
+        .exclude(status__in=[EmployeeDocument.ARCHIVED, EmployeeDocument.DELETED]) \
+        .update(status=EmployeeDocument.ARCHIVED)
+    summary = delete_documents(progress=progress)
+    summary['archived'] = archived
+    return summary
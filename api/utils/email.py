@@ -20,25 +20,34 @@ def send_email_message(slug, to, data={}):
     if settings.EMAIL_NOTIFICATIONS_ENABLED:
         template = get_template_content(slug, data, ["email"])
         print('Email notification '+slug+' sent')
-        return requests.post(
-            "https://api.mailgun.net/v3/mailgun.jobcore.co/messages",
-            auth=(
-                "api",
-                os.environ.get('MAILGUN_API_KEY')),
-            data={
-                "from": os.environ.get('MAILGUN_FROM') +
-                " <mailgun@mailgun.jobcore.co>",
-                "to": to,
-                "subject": template['subject'],
-                "text": template['text'],
-                "html": template['html']}).status_code == 200
+        return send_rendered_email(to, template)
     else:
         # print('Email not sent because notifications are not enabled')
         return True
 
+
+def send_rendered_email(to, template):
+    return requests.post(
+        "https://api.mailgun.net/v3/mailgun.jobcore.co/messages",
+        auth=(
+            "api",
+            os.environ.get('MAILGUN_API_KEY')),
+        data={
+            "from": os.environ.get('MAILGUN_FROM') +
+            " <mailgun@mailgun.jobcore.co>",
+            "to": to,
+            "subject": template['subject'],
+            "text": template['text'],
+            "html": template['html']}).status_code == 200
+
+
 def send_sms(slug, phone_number, data={}):
 
     template = get_template_content(slug, data, ["sms"])
+    return send_rendered_sms(phone_number, template)
+
+
+def send_rendered_sms(phone_number, template):
     # Your Account Sid and Auth Token from twilio.com/console
     # DANGER! This is insecure. See http://twil.io/secure
     TWILLIO_SID = os.environ.get('TWILLIO_SID')
@@ -85,31 +94,35 @@ def send_fcm(slug, registration_ids, data={}):
                 slug +
                 " does not seem to have a valid FMS version")
 
-        message_title = template['subject']
-        message_body = template['fms']
         if 'DATA' not in data:
             raise Exception("There is no data for the notification")
-        message_data = data['DATA']
-
-        print('registration_ids', registration_ids)
-        print('message_title', message_title)
-        print('message_body', message_body)
-        print('message_data', message_data)
-
-        result = push_service.notify_multiple_devices(
-            registration_ids=registration_ids,
-            message_title=message_title,
-            message_body=message_body,
-            data_message=message_data)
-
-        # if(result["failure"] or not result["success"]):
-        #     raise APIException("Problem sending the notification")
-        print('fcm result', result)
-        return result
+
+        return send_rendered_fcm(registration_ids, template, data['DATA'])
     else:
         return False
 
 
+def send_rendered_fcm(registration_ids, template, message_data):
+    message_title = template['subject']
+    message_body = template['fms']
+
+    print('registration_ids', registration_ids)
+    print('message_title', message_title)
+    print('message_body', message_body)
+    print('message_data', message_data)
+
+    result = push_service.notify_multiple_devices(
+        registration_ids=registration_ids,
+        message_title=message_title,
+        message_body=message_body,
+        data_message=message_data)
+
+    # if(result["failure"] or not result["success"]):
+    #     raise APIException("Problem sending the notification")
+    print('fcm result', result)
+    return result
+
+
 def send_fcm_notification(slug, user_id, data={}):
     device_set = FCMDevice.objects.filter(user=user_id)
     registration_ids = [device.registration_id for device in device_set]
@@ -174,6 +187,10 @@ def get_template_info(slug):
             "type": "invite",
             "subject": "You have been invited to work on a shift"
         },
+        "invite_to_shifts": {
+            "type": "invite",
+            "subject": "You have been invited to work on several shifts"
+        },
         "invite_accepted": {
             "type": "registration",
             "subject": "Someone you invited has join JobCore"
@@ -0,0 +1,273 @@
+"""
+Dashboard counters of the employers (open, filled and upcoming shifts, pending applicants and
+invites, open clockins and unpaid payroll) so the employer app reads one EmployerStats row
+instead of counting the shift, invite and payroll lists.
+
+The row of an employer is recalculated with a single upsert (REFRESH_SQL) when a signal says one
+of its shifts, shift employees, applications, invites, clockins or payments changed; code that
+writes with update() or bulk_create() calls refresh() itself (refresh_on_commit() from the hot
+paths that hold row locks, so the upsert does not run under them), and code that changes many rows
+runs inside deferred() so each employer is recalculated once at the end. upcoming_shifts depends
+on the time so get_stats() recalculates the row once the next upcoming shift starts.
+
+The reconcile_employer_stats command compares every row with a fresh calculation, reports the
+employers whose counters drifted and fixes them.
+
+STATS_SQL and REFRESH_SQL are PostgreSQL only, on another database (the tests run on SQLite) the
+counters are calculated with ORM aggregates and the rows replaced in a transaction.
+"""
+import threading
+from contextlib import contextmanager
+from decimal import Decimal
+
+from django.db import connection, transaction
+from django.db.models import Count, Sum
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.utils import timezone
+
+from api.models import EmployerStats
+
+COUNTERS = ('open_shifts', 'filled_shifts', 'upcoming_shifts', 'next_shift_starting_at', 'pending_applicants',
+            'pending_invites', 'open_clockins', 'unpaid_payments', 'unpaid_amount')
+RECONCILE_BATCH_SIZE = 1000
+
+STATS_SQL = """
+    SELECT e.id,
+        COALESCE(s.open_shifts, 0), COALESCE(s.filled_shifts, 0), COALESCE(s.upcoming_shifts, 0),
+        s.next_shift_starting_at,
+        (SELECT COUNT(*) FROM api_shiftapplication a JOIN api_shift sh ON sh.id = a.shift_id
+         WHERE sh.employer_id = e.id),
+        (SELECT COUNT(*) FROM api_shiftinvite i JOIN api_profile p ON p.id = i.sender_id
+         WHERE p.employer_id = e.id AND i.status = 'PENDING'),
+        (SELECT COUNT(*) FROM api_clockin c JOIN api_shift sh ON sh.id = c.shift_id
+         WHERE sh.employer_id = e.id AND c.ended_at IS NULL),
+        (SELECT COUNT(*) FROM api_employeepayment ep WHERE ep.employer_id = e.id AND NOT ep.paid),
+        (SELECT COALESCE(SUM(ep.amount), 0) FROM api_employeepayment ep WHERE ep.employer_id = e.id AND NOT ep.paid)
+    FROM api_employer e
+    LEFT JOIN LATERAL (
+        SELECT
+            COUNT(*) FILTER (WHERE sh.status = 'OPEN' AND sh.accepted < sh.maximum_allowed_employees) AS open_shifts,
+            COUNT(*) FILTER (WHERE sh.accepted >= sh.maximum_allowed_employees) AS filled_shifts,
+            COUNT(*) FILTER (WHERE sh.starting_at >= %(now)s) AS upcoming_shifts,
+            MIN(sh.starting_at) FILTER (WHERE sh.starting_at >= %(now)s) AS next_shift_starting_at
+        FROM (
+            SELECT sh.status, sh.starting_at, sh.maximum_allowed_employees,
+                (SELECT COUNT(*) FROM api_shiftemployee se WHERE se.shift_id = sh.id) AS accepted
+            FROM api_shift sh
+            WHERE sh.employer_id = e.id AND sh.status IN ('OPEN', 'FILLED')
+        ) sh
+    ) s ON TRUE
+"""
+
+REFRESH_SQL = """
+    INSERT INTO api_employerstats (employer_id, {columns}, refreshed_at)
+    SELECT *, %(now)s FROM ({stats} WHERE e.id IN (SELECT UNNEST(%(ids)s))) stats
+    ON CONFLICT (employer_id) DO UPDATE SET {updates}, refreshed_at = EXCLUDED.refreshed_at
+""".format(
+    columns=', '.join(COUNTERS),
+    stats=STATS_SQL,
+    updates=', '.join('{0} = EXCLUDED.{0}'.format(column) for column in COUNTERS),
+)
+
+
+_deferred = threading.local()
+
+
+def _ids(employer_ids):
+    return sorted(set(int(id) for id in employer_ids if id is not None))
+
+
+def calculate(employer_ids, now=None):
+    """The fresh counters of the employers, {employer id: {counter: value}}"""
+    now = now or timezone.now()
+    if connection.vendor != 'postgresql':
+        return _calculate_with_orm(_ids(employer_ids), now)
+
+    with connection.cursor() as cursor:
+        cursor.execute(STATS_SQL + " WHERE e.id IN (SELECT UNNEST(%(ids)s))", {'now': now, 'ids': _ids(employer_ids)})
+        return {row[0]: dict(zip(COUNTERS, row[1:])) for row in cursor.fetchall()}
+
+
+def _calculate_with_orm(ids, now):
+    from api.models import Clockin, Employer, EmployeePayment, Shift, ShiftApplication, ShiftInvite
+
+    stats = {id: dict(open_shifts=0, filled_shifts=0, upcoming_shifts=0, next_shift_starting_at=None,
+                      pending_applicants=0, pending_invites=0, open_clockins=0, unpaid_payments=0,
+                      unpaid_amount=Decimal(0))
+             for id in Employer.objects.filter(id__in=ids).values_list('id', flat=True)}
+
+    shifts = (Shift.objects.filter(employer_id__in=stats, status__in=['OPEN', 'FILLED'])
+              .annotate(accepted=Count('employees'))
+              .values_list('employer_id', 'status', 'starting_at', 'maximum_allowed_employees', 'accepted'))
+    for employer_id, status, starting_at, maximum, accepted in shifts:
+        row = stats[employer_id]
+        if accepted >= maximum:
+            row['filled_shifts'] += 1
+        elif status == 'OPEN':
+            row['open_shifts'] += 1
+        if starting_at >= now:
+            row['upcoming_shifts'] += 1
+            if row['next_shift_starting_at'] is None or starting_at < row['next_shift_starting_at']:
+                row['next_shift_starting_at'] = starting_at
+
+    counts = (
+        ('pending_applicants', 'shift__employer_id', ShiftApplication.objects.all()),
+        ('pending_invites', 'sender__employer_id', ShiftInvite.objects.filter(status='PENDING')),
+        ('open_clockins', 'shift__employer_id', Clockin.objects.filter(ended_at__isnull=True)),
+    )
+    for counter, employer, queryset in counts:
+        rows = queryset.filter(**{employer + '__in': stats}).values_list(employer).annotate(count=Count('id'))
+        for employer_id, count in rows.order_by():
+            stats[employer_id][counter] = count
+
+    payments = (EmployeePayment.objects.filter(employer_id__in=stats, paid=False).values_list('employer_id')
+                .annotate(count=Count('id'), amount=Sum('amount')).order_by())
+    for employer_id, count, amount in payments:
+        stats[employer_id].update(unpaid_payments=count, unpaid_amount=amount)
+    return stats
+
+
+def refresh(employer_ids):
+    """Recalculates (or creates) the stats rows of the employers, at the end of deferred() inside one"""
+    pending = getattr(_deferred, 'pending', None)
+    if pending is not None:
+        pending['employers'].update(employer_ids)
+        return
+
+    ids = _ids(employer_ids)
+    if not ids:
+        return
+    now = timezone.now()
+    if connection.vendor != 'postgresql':
+        stats = calculate(ids, now)
+        with transaction.atomic():
+            EmployerStats.objects.filter(employer_id__in=ids).delete()
+            EmployerStats.objects.bulk_create(EmployerStats(employer_id=id, refreshed_at=now, **counters)
+                                              for id, counters in stats.items())
+        return
+
+    with connection.cursor() as cursor:
+        cursor.execute(REFRESH_SQL, {'now': now, 'ids': ids})
+
+
+def refresh_on_commit(employer_ids):
+    """refresh() once the current transaction commits, right away outside of one"""
+    ids = _ids(employer_ids)
+    transaction.on_commit(lambda: refresh(ids))
+
+
+def _changed(employer_ids=(), shift_ids=(), sender_ids=()):
+    """Refreshes the employers of the shifts and invite senders now or at the end of deferred()"""
+    pending = getattr(_deferred, 'pending', None)
+    if pending is not None:
+        pending['employers'].update(employer_ids)
+        pending['shifts'].update(shift_ids)
+        pending['senders'].update(sender_ids)
+        return
+
+    from api.models import Profile, Shift
+    employer_ids = set(employer_ids)
+    if shift_ids:
+        employer_ids.update(Shift.objects.filter(id__in=list(shift_ids)).values_list('employer_id', flat=True))
+    if sender_ids:
+        employer_ids.update(Profile.objects.filter(id__in=list(sender_ids)).values_list('employer_id', flat=True))
+    refresh(employer_ids)
+
+
+@contextmanager
+def deferred():
+    """Collects the changes the signals see and refreshes every employer once on exit"""
+    if getattr(_deferred, 'pending', None) is not None:
+        # nested, the outermost block refreshes
+        yield
+        return
+
+    pending = _deferred.pending = {'employers': set(), 'shifts': set(), 'senders': set()}
+    try:
+        yield
+    finally:
+        _deferred.pending = None
+    _changed(pending['employers'], pending['shifts'], pending['senders'])
+
+
+def _is_outdated(next_shift_starting_at, now):
+    return next_shift_starting_at is not None and next_shift_starting_at <= now
+
+
+def get_stats(employer_id):
+    """The stats row of the employer, recalculated first when it is missing or outdated"""
+    stats = EmployerStats.objects.filter(employer_id=employer_id).first()
+    if stats is None or _is_outdated(stats.next_shift_starting_at, timezone.now()):
+        refresh([employer_id])
+        stats = EmployerStats.objects.get(employer_id=employer_id)
+    return stats
+
+
+def reconcile(fix=True, batch_size=RECONCILE_BATCH_SIZE):
+    """
+    Compares the stats rows with a fresh calculation batch_size employers at a time and returns
+    the ids of the employers whose row drifted (or is missing), they are refreshed unless fix is False
+    """
+    from api.models import Employer
+
+    # orphans of deleted employers (the row has no foreign key constraint)
+    EmployerStats.objects.exclude(employer_id__in=Employer.objects.values('id')).delete()
+
+    now = timezone.now()
+    drifted = []
+    employer_ids = list(Employer.objects.order_by('id').values_list('id', flat=True))
+    for start in range(0, len(employer_ids), batch_size):
+        batch = employer_ids[start:start + batch_size]
+        fresh = calculate(batch, now)
+        stored = {row['employer_id']: row for row in
+                  EmployerStats.objects.filter(employer_id__in=batch).values('employer_id', *COUNTERS)}
+        batch_drifted = [id for id in batch if id not in stored or
+                         any(stored[id][counter] != fresh[id][counter] for counter in COUNTERS)]
+        # rows whose next shift started are outdated, not drifted, get_stats() refreshes them anyway
+        outdated = [id for id in batch_drifted
+                    if id in stored and _is_outdated(stored[id]['next_shift_starting_at'], now)]
+        batch_drifted = [id for id in batch_drifted if id not in outdated]
+        if fix:
+            refresh(batch_drifted + outdated)
+        drifted += batch_drifted
+
+    return {
+        'checked': len(employer_ids),
+        'drifted': drifted,
+    }
+
+
+def connect_signals():
+    from api.models import Clockin, Employer, EmployeePayment, Shift, ShiftApplication, ShiftEmployee, ShiftInvite
+
+    def employer_changed(sender, instance, **kwargs):
+        _changed(employer_ids=[instance.employer_id])
+
+    def shift_child_changed(sender, instance, **kwargs):
+        _changed(shift_ids=[instance.shift_id])
+
+    def invite_changed(sender, instance, **kwargs):
+        _changed(sender_ids=[instance.sender_id])
+
+    def shift_employees_changed(sender, instance, action, reverse, pk_set, **kwargs):
+        if action not in ('post_add', 'post_remove', 'post_clear'):
+            return
+        if not reverse:
+            _changed(employer_ids=[instance.employer_id])
+        elif pk_set:
+            _changed(shift_ids=pk_set)
+
+    def employer_deleted(sender, instance, **kwargs):
+        EmployerStats.objects.filter(employer_id=instance.id).delete()
+
+    for model, receiver in ((Shift, employer_changed), (ShiftEmployee, shift_child_changed),
+                            (ShiftApplication, shift_child_changed), (Clockin, shift_child_changed),
+                            (ShiftInvite, invite_changed), (EmployeePayment, employer_changed)):
+        label = model._meta.label_lower
+        post_save.connect(receiver, sender=model, weak=False, dispatch_uid='employer_stats_save_{}'.format(label))
+        post_delete.connect(receiver, sender=model, weak=False,
+                            dispatch_uid='employer_stats_delete_{}'.format(label))
+
+    m2m_changed.connect(shift_employees_changed, sender=Shift.employees.through, weak=False,
+                        dispatch_uid='employer_stats_m2m_shift_employees')
+    post_delete.connect(employer_deleted, sender=Employer, weak=False, dispatch_uid='employer_stats_employer')
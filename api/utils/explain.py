@@ -0,0 +1,42 @@
+"""
+Helpers to check how postgres plans a query, used by the index tests and the pagination count estimate.
+"""
+import json
+
+from django.db import connection
+
+INDEX_SCANS = ('Index Scan', 'Index Only Scan', 'Bitmap Index Scan')
+
+
+def get_plan(queryset):
+    """The root node of the EXPLAIN (FORMAT JSON) plan of the queryset"""
+    sql, params = queryset.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute('EXPLAIN (FORMAT JSON) ' + sql, params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return plan[0]['Plan']
+
+
+def iter_nodes(node):
+    yield node
+    for child in node.get('Plans', []):
+        yield from iter_nodes(child)
+
+
+def get_index_scans(queryset):
+    """Names of the indexes the plan scans"""
+    return set(node['Index Name'] for node in iter_nodes(get_plan(queryset)) if node['Node Type'] in INDEX_SCANS)
+
+
+def get_sequential_scans(queryset):
+    """Tables the plan reads from start to end"""
+    return set(node['Relation Name'] for node in iter_nodes(get_plan(queryset)) if node['Node Type'] == 'Seq Scan')
+
+
+def analyze(*models):
+    """Refreshes the planner statistics after seeding, the estimates of an empty table are useless"""
+    with connection.cursor() as cursor:
+        for model in models:
+            cursor.execute('ANALYZE {}'.format(connection.ops.quote_name(model._meta.db_table)))
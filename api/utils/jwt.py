@@ -1,11 +1,6 @@
 from api.serializers import user_serializer
-import datetime
-from calendar import timegm
-from rest_framework_jwt.settings import api_settings
-from api.models import UserToken
+from api.utils import tokens
 from rest_framework.exceptions import APIException
-from django.contrib.auth.models import User
-jwt_encode_handler = api_settings.JWT_ENCODE_HANDLER
 
 def jwt_response_payload_handler(token, user=None, request=None):
     return {
@@ -16,35 +11,9 @@ def jwt_response_payload_handler(token, user=None, request=None):
                 'request': request}).data}
 
 
-def internal_payload_encode(payload, exp_min=15):
-
-    payload['exp'] = datetime.datetime.utcnow() + datetime.timedelta(seconds=(60 * exp_min)) # 15 min
-
-    # Include original issued at time for a brand new token,
-    # to allow token refresh
-    if api_settings.JWT_ALLOW_REFRESH:
-        payload['orig_iat'] = timegm(
-            datetime.datetime.utcnow().utctimetuple()
-        )
-
-    if api_settings.JWT_AUDIENCE is not None:
-        payload['aud'] = api_settings.JWT_AUDIENCE
-
-    if api_settings.JWT_ISSUER is not None:
-        payload['iss'] = api_settings.JWT_ISSUER
-
-    # get user email to generate token
-    email = None
-    if 'user_email' in payload:
-        email = payload['user_email']
-    elif 'user_id' in payload:
-        user = User.objects.get(id=payload['user_id'])
-        email = user.email
-    else:
+def internal_payload_encode(payload, exp_min=15, email=None):
+    """Token for the links we email, see api.utils.tokens (no database access unless LINK_TOKEN_AUDIT)"""
+    if 'user_email' not in payload and 'user_id' not in payload:
         raise APIException("User email or id has to be specified on the token payload")
 
-    token = jwt_encode_handler(payload)
-    user_token = UserToken(token=token, email=email, expires_at=datetime.datetime.fromtimestamp(payload['exp'] / 1e3))
-    user_token.save()
-
-    return token
+    return tokens.encode(payload, exp_min=exp_min, email=email or payload.get('user_email'))
@@ -0,0 +1,173 @@
+"""
+Set based talent matching for new shifts.
+
+All the rules that decide if a talent gets invited to a shift (position,
+minimum rating, minimum hourly rate, availability, overlapping shifts and
+distance to the venue) are resolved by the database in a fixed number of
+queries, no matter how many talents are in the area.
+
+get_matching_talents_for_shifts() matches the same shift repeated on many dates
+(the multiple_dates of a new shift): the talent pool is queried once for all the
+dates and the availability and overlapping shifts are then checked for every date.
+
+The availability (with the recurrence of the blocks) comes from the interval
+index of api.utils.availability.
+"""
+from collections import defaultdict
+from math import cos, radians
+
+from django.db.models import (
+    Exists, ExpressionWrapper, F, FloatField, Max, OuterRef, Q, Value
+)
+from django.db.models.functions import ASin, Cast, Cos, Power, Radians, Sin, Sqrt
+
+from api.models import Employee, FavoriteList, ShiftEmployee, FILLED, OPEN, SPECIFIC
+from api.utils import availability
+
+EARTH_RADIUS_MILES = 3958.8
+MILES_PER_LATITUDE_DEGREE = 69.0
+
+
+def distance_in_miles(latitude, longitude, lat_field='profile__latitude', lon_field='profile__longitude'):
+    """Haversine distance (in miles) between a point and the given fields, computed by the database"""
+    lat1 = radians(float(latitude))
+    lon1 = radians(float(longitude))
+    lat2 = Radians(Cast(lat_field, FloatField()))
+    lon2 = Radians(Cast(lon_field, FloatField()))
+
+    a = ExpressionWrapper(
+        Power(Sin((lat2 - Value(lat1)) / 2), 2) +
+        Value(cos(lat1)) * Cos(lat2) * Power(Sin((lon2 - Value(lon1)) / 2), 2),
+        output_field=FloatField())
+
+    return ExpressionWrapper(2 * EARTH_RADIUS_MILES * ASin(Sqrt(a)), output_field=FloatField())
+
+
+def bounding_box(latitude, longitude, miles):
+    """Returns (min_lat, max_lat, min_lon, max_lon) for a square of side 2*miles around the point"""
+    latitude = float(latitude)
+    longitude = float(longitude)
+    lat_delta = miles / MILES_PER_LATITUDE_DEGREE
+    # avoid dividing by zero close to the poles
+    lon_delta = miles / (MILES_PER_LATITUDE_DEGREE * max(cos(radians(latitude)), 0.01))
+    return latitude - lat_delta, latitude + lat_delta, longitude - lon_delta, longitude + lon_delta
+
+
+def overlapping_shifts_filter(starting_at, ending_at, prefix=''):
+    return Q(**{
+        prefix + 'starting_at__lte': ending_at,
+        prefix + 'ending_at__gte': starting_at,
+    })
+
+
+def get_talent_pool(shift, favorite_lists):
+    """
+    The employees that match everything but the dates of the shift (position, rating, rate
+    and distance), None when no talent is willing to travel
+    """
+    # the biggest distance any talent is willing to travel defines the search area,
+    # the exact distance of every talent is checked later against its own preference
+    max_distance = Employee.objects.aggregate(miles=Max('maximum_job_distance_miles'))['miles']
+    if max_distance is None:
+        return None
+
+    venue = shift.venue
+    min_lat, max_lat, min_lon, max_lon = bounding_box(venue.latitude, venue.longitude, max_distance)
+
+    talents = Employee.objects.filter(
+        Q(rating__gte=shift.minimum_allowed_rating) | Q(rating__isnull=True),
+        # the employee gets to pick the minimum hourly rate
+        minimum_hourly_rate__lte=shift.minimum_hourly_rate,
+        # is accepting invites
+        stop_receiving_invites=False,
+        positions__id=shift.position_id,
+        profile__latitude__range=(min_lat, max_lat),
+        profile__longitude__range=(min_lon, max_lon),
+    ).exclude(
+        Q(profile__latitude=0) | Q(profile__longitude=0)
+    ).annotate(
+        distance=distance_in_miles(venue.latitude, venue.longitude),
+    ).filter(
+        distance__lte=F('maximum_job_distance_miles'),
+    )
+
+    if len(favorite_lists) > 0:
+        # the employer gets to pick employees only from his favlists
+        on_favlists = FavoriteList.employees.through.objects.filter(
+            favoritelist_id__in=favorite_lists, employee_id=OuterRef('pk'))
+        talents = talents.annotate(on_favlists=Exists(on_favlists)).filter(on_favlists=True)
+
+    return talents
+
+
+def get_matching_talents(shift):
+    """
+    Returns the list of employees that should get an invite for the shift.
+
+    The number of queries does not depend on the number of talents:
+    one for the favorite lists, one for the search radius and one for the talents.
+    """
+    if shift.status != OPEN or shift.application_restriction == SPECIFIC:
+        return []
+
+    talents = get_talent_pool(shift, list(shift.allowed_from_list.values_list('id', flat=True)))
+    if talents is None:
+        return []
+
+    # exclude the talent if it has other shifts during the same time
+    busy = ShiftEmployee.objects.filter(
+        overlapping_shifts_filter(shift.starting_at, shift.ending_at, prefix='shift__'),
+        shift__status__in=[OPEN, FILLED],
+        employee=OuterRef('pk'),
+    )
+
+    talents = talents.filter(
+        id__in=availability.available_employees(shift.starting_at, shift.ending_at),
+    ).annotate(
+        is_busy=Exists(busy),
+    ).filter(
+        is_busy=False,
+    )
+
+    return list(talents.select_related('user').order_by('distance', 'id'))
+
+
+def _overlaps(intervals, starting_at, ending_at):
+    return any(start <= ending_at and end >= starting_at for start, end in intervals)
+
+
+def get_matching_talents_for_shifts(shifts, favorite_lists=()):
+    """
+    Returns {shift id: employees to invite} for shifts that only differ on their dates,
+    with the same rules as get_matching_talents. It takes the same four queries for any
+    number of dates: the search radius, the talent pool, its availability and its shifts.
+    """
+    matches = {shift.id: [] for shift in shifts}
+    if len(shifts) == 0 or shifts[0].status != OPEN or shifts[0].application_restriction == SPECIFIC:
+        return matches
+
+    pool = get_talent_pool(shifts[0], list(favorite_lists))
+    if pool is None:
+        return matches
+    pool = list(pool.select_related('user').order_by('distance', 'id'))
+    pool_ids = [talent.id for talent in pool]
+
+    first_start = min(shift.starting_at for shift in shifts)
+    last_end = max(shift.ending_at for shift in shifts)
+
+    intervals = availability.get_intervals(pool_ids)
+
+    busy = defaultdict(list)
+    for employee_id, starting_at, ending_at in ShiftEmployee.objects.filter(
+            overlapping_shifts_filter(first_start, last_end, prefix='shift__'),
+            shift__status__in=[OPEN, FILLED],
+            employee_id__in=pool_ids).values_list('employee_id', 'shift__starting_at', 'shift__ending_at'):
+        busy[employee_id].append((starting_at, ending_at))
+
+    for shift in shifts:
+        matches[shift.id] = [
+            talent for talent in pool
+            if availability.covers(intervals[talent.id], shift.starting_at, shift.ending_at)
+            and not _overlaps(busy[talent.id], shift.starting_at, shift.ending_at)
+        ]
+    return matches
@@ -0,0 +1,210 @@
+"""
+Performance metrics of the api, exposed for prometheus at /metrics.
+
+PerformanceMiddleware (api.utils.middleware) opens a RequestMetrics for every request and
+records, labelled with the resolved url name, its latency, the number and time of its queries
+(a database execute wrapper counts them), how many of those repeat a query of the same request
+with the same parameters, the time spent rendering serializers and the time spent on outbound
+http calls. install() wraps the serializer data property and urllib3, under requests (Mailgun,
+FCM, Twilio, Stripe, Plaid) and cloudinary, so the outbound calls of the workers and commands
+are measured too, by host.
+
+With several gunicorn workers set prometheus_multiproc_dir (an empty directory shared by the
+workers) and /metrics adds up the metrics of all of them. settings.METRICS_TOKEN is required
+as a bearer token to read /metrics, the endpoint is closed when it is not set.
+"""
+import hashlib
+import hmac
+import os
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connection
+from django.http import HttpResponse, HttpResponseForbidden
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, generate_latest
+from prometheus_client import Counter as PrometheusCounter
+from prometheus_client import Histogram
+
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+# the queries kept per request to report the worst ones of a slow request
+WORST_QUERIES = 5
+
+REQUEST_SECONDS = Histogram('jobcore_request_seconds', 'Latency of the requests',
+                            ['view', 'method', 'status'])
+REQUEST_QUERIES = Histogram('jobcore_request_queries', 'Queries per request', ['view'], buckets=QUERY_BUCKETS)
+REQUEST_SQL_SECONDS = Histogram('jobcore_request_sql_seconds', 'Time of the queries of a request', ['view'])
+REQUEST_DUPLICATE_QUERIES = PrometheusCounter('jobcore_request_duplicate_queries',
+                                              'Queries repeating a query of the same request', ['view'])
+REQUEST_SERIALIZER_SECONDS = Histogram('jobcore_request_serializer_seconds',
+                                       'Time rendering the serializers of a request', ['view'])
+OUTBOUND_SECONDS = Histogram('jobcore_outbound_seconds', 'Latency of the outbound http calls', ['host'])
+
+_local = threading.local()
+
+
+class RequestMetrics:
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.sql_seconds = 0.0
+        self.serializer_seconds = 0.0
+        self.outbound_seconds = 0.0
+        self.outbound = defaultdict(float)
+        self.executed = Counter()
+        self.worst = []
+        self.serializing = False
+
+    def record_query(self, sql, params, seconds):
+        self.queries += 1
+        self.sql_seconds += seconds
+        self.executed[hashlib.md5('{}{!r}'.format(sql, params).encode('utf-8')).digest()] += 1
+        if len(self.worst) < WORST_QUERIES or seconds > self.worst[-1][0]:
+            self.worst = sorted(self.worst + [(seconds, sql)], key=lambda query: -query[0])[:WORST_QUERIES]
+
+    @property
+    def duplicate_queries(self):
+        return sum(count - 1 for count in self.executed.values())
+
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    def server_timing(self, total):
+        timings = [('db', self.sql_seconds, '{} queries'.format(self.queries)),
+                   ('serialize', self.serializer_seconds, None),
+                   ('http', self.outbound_seconds, None),
+                   ('total', total, None)]
+        return ', '.join('{};dur={:.1f}'.format(name, seconds * 1000) + (';desc="{}"'.format(desc) if desc else '')
+                         for name, seconds, desc in timings)
+
+    def observe(self, view, method, status):
+        total = self.elapsed()
+        REQUEST_SECONDS.labels(view, method, '{}xx'.format(status // 100)).observe(total)
+        REQUEST_QUERIES.labels(view).observe(self.queries)
+        REQUEST_SQL_SECONDS.labels(view).observe(self.sql_seconds)
+        REQUEST_SERIALIZER_SECONDS.labels(view).observe(self.serializer_seconds)
+        if self.duplicate_queries:
+            REQUEST_DUPLICATE_QUERIES.labels(view).inc(self.duplicate_queries)
+        return total
+
+
+def current():
+    """The metrics of the request being handled by this thread, None outside requests"""
+    return getattr(_local, 'metrics', None)
+
+
+def start():
+    _local.metrics = RequestMetrics()
+    return _local.metrics
+
+
+def stop():
+    _local.metrics = None
+
+
+def execute_wrapper(execute, sql, params, many, context):
+    """Database execute wrapper (connection.execute_wrapper) counting the queries of the request"""
+    metrics = current()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.record_query(sql, params, time.perf_counter() - started)
+
+
+@contextmanager
+def count_queries():
+    """RequestMetrics with only the queries run inside the block, for views that report them"""
+    block = RequestMetrics()
+
+    def wrapper(execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            block.record_query(sql, params, time.perf_counter() - started)
+
+    with connection.execute_wrapper(wrapper):
+        yield block
+
+
+def record_outbound(host, seconds):
+    OUTBOUND_SECONDS.labels(host).observe(seconds)
+    metrics = current()
+    if metrics is not None:
+        metrics.outbound_seconds += seconds
+        metrics.outbound[host] += seconds
+
+
+def _wrap_serializer_data():
+    from rest_framework.serializers import BaseSerializer
+
+    data = BaseSerializer.data
+
+    def timed_data(self):
+        metrics = current()
+        if metrics is None or metrics.serializing:
+            return data.fget(self)
+        metrics.serializing = True
+        started = time.perf_counter()
+        try:
+            return data.fget(self)
+        finally:
+            metrics.serializing = False
+            metrics.serializer_seconds += time.perf_counter() - started
+
+    BaseSerializer.data = property(timed_data)
+
+
+def _wrap_urllib3():
+    from urllib3.connectionpool import HTTPConnectionPool
+
+    urlopen = HTTPConnectionPool.urlopen
+
+    def timed_urlopen(self, *args, **kwargs):
+        # retries and redirects call urlopen again, only the outermost call is measured
+        if getattr(_local, 'in_urlopen', False):
+            return urlopen(self, *args, **kwargs)
+        _local.in_urlopen = True
+        started = time.perf_counter()
+        try:
+            return urlopen(self, *args, **kwargs)
+        finally:
+            _local.in_urlopen = False
+            record_outbound(self.host, time.perf_counter() - started)
+
+    HTTPConnectionPool.urlopen = timed_urlopen
+
+
+_installed = False
+
+
+def install():
+    global _installed
+    if _installed:
+        return
+    _installed = True
+    _wrap_serializer_data()
+    _wrap_urllib3()
+
+
+def get_registry():
+    if 'prometheus_multiproc_dir' in os.environ or 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+        from prometheus_client import multiprocess
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return registry
+    return REGISTRY
+
+
+def metrics_view(request):
+    token = getattr(settings, 'METRICS_TOKEN', None)
+    authorization = request.META.get('HTTP_AUTHORIZATION', '')
+    if not token or not hmac.compare_digest(authorization.encode(), 'Bearer {}'.format(token).encode()):
+        return HttpResponseForbidden()
+    return HttpResponse(generate_latest(get_registry()), content_type=CONTENT_TYPE_LATEST)
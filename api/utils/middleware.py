@@ -1,4 +1,5 @@
-from django.db import IntegrityError
+from django.conf import settings
+from django.db import IntegrityError, connection
 from django.http import HttpResponseBadRequest
 
 import json
@@ -26,3 +27,46 @@ class ValueErrorMiddleware:
         if isinstance(exception, ValueError):
             return HttpResponseBadRequest(content_type='application/json',
                                           content=json.dumps({"error": str(exception)}))
+
+
+class PerformanceMiddleware:
+    """
+    Records the latency, queries, serializer and outbound time of every request
+    in api.utils.metrics, adds the Server-Timing header (settings.SERVER_TIMING_HEADER)
+    and logs the requests slower than settings.SLOW_REQUEST_MS with their worst queries
+    """
+    def __init__(self, get_response):
+        from api.utils import metrics
+        self.get_response = get_response
+        self.metrics = metrics
+        metrics.install()
+
+    def __call__(self, request):
+        if request.path == '/metrics':
+            return self.get_response(request)
+
+        request_metrics = self.metrics.start()
+        try:
+            with connection.execute_wrapper(self.metrics.execute_wrapper):
+                response = self.get_response(request)
+        finally:
+            self.metrics.stop()
+
+        resolver_match = getattr(request, 'resolver_match', None)
+        # unresolved paths are not used as labels, anyone can make up new ones
+        view = resolver_match.view_name if resolver_match is not None else '<unresolved>'
+        total = request_metrics.observe(view, request.method, response.status_code)
+
+        if getattr(settings, 'SERVER_TIMING_HEADER', False):
+            response['Server-Timing'] = request_metrics.server_timing(total)
+
+        if total * 1000 >= getattr(settings, 'SLOW_REQUEST_MS', 1000):
+            log.warning('Slow request %s %s (%s): %.0fms, %s queries (%s duplicated) in %.0fms, '
+                        'serializers %.0fms, outbound %s\n%s', request.method, request.path, view, total * 1000,
+                        request_metrics.queries, request_metrics.duplicate_queries,
+                        request_metrics.sql_seconds * 1000, request_metrics.serializer_seconds * 1000,
+                        ', '.join('{} {:.0f}ms'.format(host, seconds * 1000)
+                                  for host, seconds in request_metrics.outbound.items()) or 'none',
+                        '\n'.join('{:.1f}ms {}'.format(seconds * 1000, sql) for seconds, sql in request_metrics.worst))
+
+        return response
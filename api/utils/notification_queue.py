@@ -0,0 +1,308 @@
+"""
+Persistent queue for the outbound notifications (email, sms and mobile push).
+
+Views and serializers only insert rows on the Notification table, the messages
+are rendered and delivered later by the process_notifications command
+(or the hook/process_notifications cron hook) so a request never waits
+for Mailgun, Twilio or Firebase. Code that notifies about many objects at once
+runs inside deferred() so all the rows are inserted together at the end.
+
+A worker claims a batch by moving its scheduled_at CLAIM_TIMEOUT ahead and commits before
+sending, so no transaction is open (and no row locked) while the messages are sent. The
+results are recorded in a second transaction; the notifications of a worker that died in
+between are due again once the claim times out.
+"""
+import json
+import threading
+from collections import OrderedDict, defaultdict
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models import Count, Min, Q
+from django.utils import formats, timezone
+from django.utils.module_loading import import_string
+
+from api.models import EMAIL, FCM, SMS, FCMDevice, Notification, Profile
+from api.utils import email
+from api.utils.loggers import log_debug
+
+MAX_ATTEMPTS = 5
+RETRY_DELAY = timedelta(minutes=1)
+MAX_RETRY_DELAY = timedelta(hours=1)
+CLAIM_TIMEOUT = timedelta(minutes=10)
+# firebase does not accept more registration ids on a single multicast
+FCM_BATCH_SIZE = 1000
+
+TEMPLATE_FORMATS = {
+    EMAIL: ['email'],
+    SMS: ['sms'],
+    FCM: ['fms'],
+}
+
+
+class TemplateDataEncoder(DjangoJSONEncoder):
+    """Dates are stored the same way the templates would display them"""
+
+    def default(self, o):
+        if isinstance(o, (datetime, date)):
+            return formats.localize(timezone.template_localtime(o))
+        return super().default(o)
+
+
+class DefaultTransport:
+    """Delivers the (already rendered) messages using Mailgun, Twilio and Firebase"""
+
+    def send_email(self, to, template):
+        if not settings.EMAIL_NOTIFICATIONS_ENABLED:
+            return True
+        return email.send_rendered_email(to, template)
+
+    def send_sms(self, phone_number, template):
+        return email.send_rendered_sms(phone_number, template)
+
+    def send_fcm(self, registration_ids, template, data_message):
+        if email.push_service is None:
+            # firebase is not configured
+            return True
+        email.send_rendered_fcm(registration_ids, template, data_message)
+        return True
+
+
+class StubTransport:
+    """Keeps the messages in memory instead of sending them, useful for tests and offline development"""
+    outbox = []
+
+    def send_email(self, to, template):
+        self.outbox.append({'channel': EMAIL, 'to': [to], 'template': template})
+        return True
+
+    def send_sms(self, phone_number, template):
+        self.outbox.append({'channel': SMS, 'to': [phone_number], 'template': template})
+        return True
+
+    def send_fcm(self, registration_ids, template, data_message):
+        self.outbox.append({'channel': FCM, 'to': list(registration_ids), 'template': template,
+                            'data': data_message})
+        return True
+
+
+def get_transport():
+    return import_string(settings.NOTIFICATION_TRANSPORT)()
+
+
+_deferred = threading.local()
+
+
+def _enqueue(channel, slug, rows, scheduled_at=None):
+    # fails fast (on the request) if the template does not exist
+    title = email.get_template_info(slug)['subject']
+    if scheduled_at is None:
+        scheduled_at = timezone.now()
+
+    notifications = [
+        Notification(channel=channel, slug=slug, title=title, body='', owner_id=owner_id,
+                     recipient=recipient, data=json.dumps(data, cls=TemplateDataEncoder),
+                     scheduled_at=scheduled_at)
+        for owner_id, recipient, data in rows
+    ]
+    pending = getattr(_deferred, 'pending', None)
+    if pending is not None:
+        pending.extend(notifications)
+        return notifications
+    return Notification.objects.bulk_create(notifications)
+
+
+@contextmanager
+def deferred():
+    """Keeps the notifications queued inside the block and inserts them all at once when it ends"""
+    if getattr(_deferred, 'pending', None) is not None:
+        # nested, the outermost block inserts
+        yield
+        return
+
+    pending = _deferred.pending = []
+    try:
+        yield
+    finally:
+        _deferred.pending = None
+    Notification.objects.bulk_create(pending)
+
+
+def queue_emails(slug, messages, scheduled_at=None):
+    """messages is a list of (email address, template data) tuples, they are all inserted at once"""
+    return _enqueue(EMAIL, slug, [(None, to, data) for to, data in messages], scheduled_at)
+
+
+def queue_sms(slug, messages, scheduled_at=None):
+    """messages is a list of (phone number, template data) tuples"""
+    return _enqueue(SMS, slug, [(None, phone, data) for phone, data in messages], scheduled_at)
+
+
+def queue_push_notifications(slug, messages, scheduled_at=None):
+    """messages is a list of (user id, template data) tuples, they are delivered to all the user devices"""
+    messages = list(messages)
+    profiles = dict(Profile.objects.filter(
+        user__id__in=[user_id for user_id, _ in messages]).values_list('user_id', 'id'))
+
+    return _enqueue(FCM, slug, [
+        (profiles[user_id], '', data) for user_id, data in messages if user_id in profiles
+    ], scheduled_at)
+
+
+class TemplateRenderer:
+    """
+    Renders every template once per run, the DATA payload (the ids the mobile
+    app uses to open the right screen) is not part of the message text so the
+    invites of a shift share the same rendered template.
+    """
+
+    def __init__(self):
+        self._rendered = {}
+
+    def render(self, notification):
+        data = json.loads(notification.data)
+        text_data = {key: value for key, value in data.items() if key != 'DATA'}
+        key = (notification.channel, notification.slug, json.dumps(text_data, sort_keys=True))
+        if key not in self._rendered:
+            self._rendered[key] = email.get_template_content(
+                notification.slug, text_data, TEMPLATE_FORMATS[notification.channel])
+        return self._rendered[key], data
+
+
+def get_retry_delay(attempts):
+    return min(RETRY_DELAY * (2 ** (attempts - 1)), MAX_RETRY_DELAY)
+
+
+def get_pending_notifications():
+    return Notification.objects.filter(sent=False, attempts__lt=MAX_ATTEMPTS).exclude(slug='')
+
+
+def _device_batches(notifications, devices):
+    # groups the notifications without going over the multicast limit,
+    # a batch is sent (or retried) as a whole
+    batch, registration_ids = [], []
+    for notification in notifications:
+        ids = devices.get(notification.owner_id, [])
+        if len(batch) > 0 and len(registration_ids) + len(ids) > FCM_BATCH_SIZE:
+            yield batch, registration_ids
+            batch, registration_ids = [], []
+        batch.append(notification)
+        registration_ids = registration_ids + ids
+    if len(batch) > 0:
+        yield batch, registration_ids
+
+
+def _send_push_notifications(notifications, transport, renderer, sent, failed):
+    devices = defaultdict(list)
+    owners = set(n.owner_id for n in notifications)
+    for owner_id, registration_id in FCMDevice.objects.filter(
+            user__profile__id__in=owners).values_list('user__profile__id', 'registration_id'):
+        devices[owner_id].append(registration_id)
+
+    # the same message is sent to all the devices at once
+    messages = OrderedDict()
+    for notification in notifications:
+        messages.setdefault((notification.slug, notification.data), []).append(notification)
+
+    for group in messages.values():
+        for batch, registration_ids in _device_batches(group, devices):
+            if len(registration_ids) == 0:
+                # nobody to deliver to
+                sent.extend(batch)
+                continue
+            try:
+                template, data = renderer.render(batch[0])
+                for i in range(0, len(registration_ids), FCM_BATCH_SIZE):
+                    transport.send_fcm(registration_ids[i:i + FCM_BATCH_SIZE], template, data.get('DATA', {}))
+                sent.extend(batch)
+            except Exception as e:
+                failed.extend((notification, str(e)) for notification in batch)
+
+
+def _send_one_by_one(notifications, send, renderer, sent, failed):
+    for notification in notifications:
+        try:
+            template, _ = renderer.render(notification)
+            if send(notification.recipient, template):
+                sent.append(notification)
+            else:
+                failed.append((notification, 'The message was not accepted'))
+        except Exception as e:
+            failed.append((notification, str(e)))
+
+
+def _claim(batch_size, now):
+    with transaction.atomic():
+        notifications = list(
+            get_pending_notifications().filter(scheduled_at__lte=now)
+            .select_for_update(skip_locked=True).order_by('scheduled_at', 'id')[:batch_size])
+        Notification.objects.filter(id__in=[n.id for n in notifications]).update(scheduled_at=now + CLAIM_TIMEOUT)
+    return notifications
+
+
+def _record(sent, failed, now):
+    with transaction.atomic():
+        if len(sent) > 0:
+            Notification.objects.filter(id__in=[n.id for n in sent]).update(sent=True, sent_at=now)
+
+        for notification, error in failed:
+            notification.attempts += 1
+            notification.last_error = error
+            notification.scheduled_at = now + get_retry_delay(notification.attempts)
+            log_debug('general', 'Notification {} failed ({} attempts): {}'.format(
+                notification.id, notification.attempts, error))
+        Notification.objects.bulk_update(
+            [n for n, _ in failed], ['attempts', 'last_error', 'scheduled_at'])
+
+
+def process_queue(batch_size=500, transport=None):
+    """
+    Delivers one batch of due notifications and returns a summary of the run.
+    Rows are claimed with SKIP LOCKED so several workers can run at the same time.
+    """
+    if transport is None:
+        transport = get_transport()
+
+    now = timezone.now()
+    sent = []
+    failed = []
+    notifications = _claim(batch_size, now)
+
+    by_channel = defaultdict(list)
+    for notification in notifications:
+        by_channel[notification.channel].append(notification)
+
+    # no transaction is open while the messages are sent
+    renderer = TemplateRenderer()
+    _send_one_by_one(by_channel[EMAIL], transport.send_email, renderer, sent, failed)
+    _send_one_by_one(by_channel[SMS], transport.send_sms, renderer, sent, failed)
+    _send_push_notifications(by_channel[FCM], transport, renderer, sent, failed)
+
+    _record(sent, failed, timezone.now())
+
+    return {
+        'processed': len(notifications),
+        'sent': len(sent),
+        'failed': len(failed),
+    }
+
+
+def queue_depth():
+    """Number of notifications waiting to be delivered"""
+    now = timezone.now()
+    retrying = Q(attempts__gt=0, attempts__lt=MAX_ATTEMPTS)
+    pending = Q(attempts__lt=MAX_ATTEMPTS)
+
+    stats = Notification.objects.filter(sent=False).exclude(slug='').aggregate(
+        pending=Count('id', filter=pending),
+        due=Count('id', filter=pending & Q(scheduled_at__lte=now)),
+        retrying=Count('id', filter=retrying),
+        given_up=Count('id', filter=Q(attempts__gte=MAX_ATTEMPTS)),
+        oldest=Min('scheduled_at', filter=pending),
+    )
+    oldest = stats.pop('oldest')
+    stats['oldest_due_seconds'] = max(0, int((now - oldest).total_seconds())) if oldest else 0
+    return stats
@@ -1,12 +1,11 @@
 import os
-from django.db.models import Q
-from api.models import Employee, ShiftInvite, Shift, Profile, AvailabilityBlock
-from api.utils.email import send_email_message, send_fcm_notification, send_sms, send_sms_valdation
+from django.db import connection
+from api.models import Employee, ShiftInvite, Shift, Profile
+from api.utils.email import send_email_message, send_sms, send_sms_valdation
+from api.utils.matching import get_matching_talents
+from api.utils.notification_queue import queue_emails, queue_push_notifications
 import api.utils.jwt
 from rest_framework_jwt.settings import api_settings
-from django.utils import timezone
-from math import sin, cos, sqrt, atan2, radians
-from datetime import datetime, timedelta
 API_URL = os.environ.get('API_URL')
 EMPLOYER_URL = os.environ.get('EMPLOYER_URL')
 EMPLOYEE_URL = os.environ.get('EMPLOYEE_URL')
@@ -17,88 +16,14 @@ jwt_encode_handler = api_settings.JWT_ENCODE_HANDLER
 
 
 def get_talents_to_notify(shift):
-
-    talents_to_notify = []
-    if shift.status == 'OPEN' and shift.application_restriction != 'SPECIFIC_PEOPLE':
-
-        non_expired_shifts = Shift.objects.filter(
-            Q(status__in=["OPEN", "FILLED"]),
-            Q(starting_at__range=[shift.starting_at, shift.ending_at]) | Q(ending_at__range=[shift.starting_at, shift.ending_at]) | 
-            Q(starting_at__lte=shift.starting_at, ending_at__gte=shift.ending_at)
-        )
-
-        
-        rating = shift.minimum_allowed_rating
-        favorite_lists = shift.allowed_from_list.all()
-        shift_lat = shift.venue.latitude
-        shift_lon = shift.venue.longitude
-
-       
-        for emp in Profile.objects.filter(
-            Q(employee__isnull=False),
-            Q(employee__rating__gte=rating) | Q(employee__rating__isnull=True),
-            # the employee gets to pick the minimum hourly rate
-            Q(employee__minimum_hourly_rate__lte=shift.minimum_hourly_rate),
-            # is accepting invites
-            Q(employee__stop_receiving_invites=False),
-            # positions not in shift
-            Q(employee__positions__id=shift.position.id),
-            ).exclude(employee__shift_accepted_employees__in=[s.id for s in non_expired_shifts]
-            ):
-            print('PROFILE EMP @@@', emp)
-            if(
-            AvailabilityBlock.objects.filter(
-            Q(employee = emp.employee),
-            Q(allday = True) | Q(starting_at__range=[shift.starting_at, shift.ending_at]) | Q(ending_at__range=[shift.starting_at, shift.ending_at]) | 
-            Q(starting_at__lte=shift.starting_at, ending_at__gte=shift.ending_at)
-            ).exists()
-            ):
-                print('longitude emp', emp)
-                if emp.longitude and emp.latitude:
-                    R = 6373.0
-
-                    lat1 = radians(shift_lat)
-                    lon1 = radians(shift_lon)
-                    lat2 = radians(emp.latitude)
-                    lon2 = radians(emp.longitude)
-
-                    dlon = lon2 - lon1
-                    dlat = lat2 - lat1
-
-                    a = sin(dlat / 2)**2 + cos(lat1) * cos(lat2) * sin(dlon / 2)**2
-                    c = 2 * atan2(sqrt(a), sqrt(1 - a))
-
-                    distance = R * c
-                    print('pog ---', emp)
-                    if distance <= 50:
-                        print('employee ---', emp)
-                        talents_to_notify.append(emp.employee)
-
-
-        # talents_to_notify = Employee.objects.filter(
-        #     Q(rating__gte=rating) | Q(rating__isnull=True),
-        #     # the employee gets to pick the minimum hourly rate
-        #     Q(minimum_hourly_rate__lte=shift.minimum_hourly_rate),
-        #     # is accepting invites
-        #     Q(stop_receiving_invites=False),
-        #     # positions not in shift
-        #     Q(positions__id=shift.position.id),
-        # ).exclude(shift_accepted_employees__in=[s.id for s in non_expired_shifts])
-        # exclude the talent if it has other shifts during the same time
-       
-        if len(favorite_lists) > 0:
-            talents_to_notify = talents_to_notify.filter(
-                # the employer gets to pick employers only from his favlists 
-                Q(favoritelist__in=favorite_lists)
-            )
-    return talents_to_notify
+    return get_matching_talents(shift)
 
 
 def notify_password_reset_code(user):
     # password reset
     token = api.utils.jwt.internal_payload_encode({
         "user_id": user.id
-    })
+    }, email=user.email)
 
     send_email_message("password_reset_link", user.email, {
         "link": API_URL + '/api/user/password/reset?token=' + token
@@ -111,7 +36,7 @@ def notify_email_validation(user):
     # user registration
     token = api.utils.jwt.internal_payload_encode({
         "user_id": user.id
-    })
+    }, email=user.email)
     
     send_email_message("registration", user.email, {
         "SUBJECT": "Please validate your email in JobCore",
@@ -125,7 +50,7 @@ def notify_sms_validation(user):
     # user registration
     token = api.utils.jwt.internal_payload_encode({
         "user_id": user.id
-    })
+    }, email=user.email)
     send_sms_valdation(user.profile.phone_number)
 
 
@@ -135,7 +60,7 @@ def notify_employee_email_validation(user):
     # user registration
     token = api.utils.jwt.internal_payload_encode({
         "user_id": user.id
-    })
+    }, email=user.email)
 
 
     send_email_message("registration_employee", user.email, {
@@ -153,7 +78,7 @@ def notify_company_invite_confirmation(user,employer,employer_role):
         "user_id": user.id,
         "employer_id": employer.id,
         "employer_role": employer_role
-    })
+    }, email=user.email)
     send_email_message("invite_to_jobcore_employer", user.email, {
         "SENDER": '{} {}'.format(user.first_name, user.last_name),
         "EMAIL": user.email,
@@ -167,27 +92,25 @@ def notify_company_invite_confirmation(user,employer,employer_role):
 
 def notify_shift_cancellation(user, shift):
     # automatic notification
-    shift = Shift.objects.get(id=shift.id)  # IMPORTANT: override the shift
-    talents_to_notify = shift.candidates.all() | shift.employees.all()
-    for talent in talents_to_notify:
+    shift = Shift.objects.select_related('employer', 'position').get(id=shift.id)  # IMPORTANT: override the shift
+    talents_to_notify = list((shift.candidates.all() | shift.employees.all()).distinct().select_related('user'))
+
+    email_data = {
+        "COMPANY": shift.employer.title,
+        "POSITION": shift.position.title,
+        "DATE": shift.starting_at,
+        "DATA": {"type": "shift", "id": shift.id}
+    }
+    fcm_data = {
+        "COMPANY": user.profile.employer.title,
+        "POSITION": shift.position.title,
+        "LINK": EMPLOYEE_URL,
+        "DATE": shift.starting_at.strftime('%m/%d/%Y'),
+        "DATA": {"type": "shift", "id": shift.id}
+    }
+    queue_emails('cancelled_shift', [(talent.user.email, email_data) for talent in talents_to_notify])
+    queue_push_notifications('cancelled_shift', [(talent.user.id, fcm_data) for talent in talents_to_notify])
 
-        send_email_message('cancelled_shift', talent.user.email, {
-            "COMPANY": shift.employer.title,
-            "POSITION": shift.position.title,
-            "DATE": shift.starting_at,
-            "DATA": {"type": "shift", "id": shift.id}
-        })
- 
-        send_fcm_notification("cancelled_shift", talent.user.id, {
-            "SENDER": '{} {}'.format(
-            talent.user.first_name , talent.user.last_name),
-            "COMPANY": user.profile.employer.title,
-            "POSITION": shift.position.title,
-            "LINK": EMPLOYEE_URL,
-            "DATE": shift.starting_at.strftime('%m/%d/%Y'),
-            "DATA": {"type": "shift", "id": shift.id}
-        })
-        
 
 def notify_shift_update(user, shift, pending_invites=[]):
     # automatic notification
@@ -195,72 +118,53 @@ def notify_shift_update(user, shift, pending_invites=[]):
 
     talents_to_notify = []
     if shift.application_restriction == 'SPECIFIC_PEOPLE':
-        talents_to_notify = Employee.objects.filter(id__in=pending_invites)
+        talents_to_notify = list(Employee.objects.filter(id__in=pending_invites).select_related('user'))
     else:
         talents_to_notify = get_talents_to_notify(shift)
 
-    for talent in talents_to_notify:
+    ShiftInvite.objects.bulk_create([
+        ShiftInvite(sender=user.profile, shift=shift, employee=talent)
+        for talent in talents_to_notify
+    ])
 
-        ShiftInvite.objects.create(
-            sender=user.profile,
-            shift=shift,
-            employee=talent
-        )
-
-        if BROADCAST_NOTIFICATIONS_BY_EMAIL == 'TRUE' or shift.application_restriction == 'SPECIFIC_PEOPLE':
-            send_email_message('new_shift', talent.user.email, {
-                "COMPANY": shift.employer.title,
-                "POSITION": shift.position.title,
-                "DATE": shift.starting_at,
-                "DATA": {"type": "shift", "id": shift.id}
-            })
-
-        send_fcm_notification("new_shift", talent.user.id, {
-            "SENDER": '{} {}'.format(
-            talent.user.first_name , talent.user.last_name),            
-            "COMPANY": user.profile.employer.title,
-            "POSITION": shift.position.title,
-            "LINK": EMPLOYEE_URL,
-            "DATE": shift.starting_at.strftime('%m/%d/%Y'),
-            "DATA": {"type": "shift", "id": shift.id}
-        })
-
-def notify_shift_candidate_update(user, shift, talents_to_notify=[]):
-
-    for talent in talents_to_notify['accepted']:
-
-        send_email_message('applicant_accepted', talent.user.email, {
+    if BROADCAST_NOTIFICATIONS_BY_EMAIL == 'TRUE' or shift.application_restriction == 'SPECIFIC_PEOPLE':
+        email_data = {
             "COMPANY": shift.employer.title,
             "POSITION": shift.position.title,
             "DATE": shift.starting_at,
             "DATA": {"type": "shift", "id": shift.id}
-        })
-        send_fcm_notification('applicant_accepted', talent.user.id, {
-            "SENDER": '{} {}'.format(
-            talent.user.first_name , talent.user.last_name), 
-            "COMPANY": shift.employer.title,
-            "POSITION": shift.position.title,
-            "LINK": EMPLOYEE_URL,
-            "DATE": shift.starting_at,
-            "DATA": {"type": "shift", "id": shift.id}
-        })
+        }
+        queue_emails('new_shift', [(talent.user.email, email_data) for talent in talents_to_notify])
+
+    fcm_data = {
+        "COMPANY": user.profile.employer.title,
+        "POSITION": shift.position.title,
+        "LINK": EMPLOYEE_URL,
+        "DATE": shift.starting_at.strftime('%m/%d/%Y'),
+        "DATA": {"type": "shift", "id": shift.id}
+    }
+    queue_push_notifications('new_shift', [(talent.user.id, fcm_data) for talent in talents_to_notify])
 
-    for talent in talents_to_notify['rejected']:
-        send_email_message('applicant_rejected', talent.user.email, {
-            "COMPANY": shift.employer.title,
-            "POSITION": shift.position.title,
-            "DATE": shift.starting_at,
-            "DATA": {"type": "shift", "id": shift.id}
-        })
-        send_fcm_notification('applicant_rejected', talent.user.id, {
-            "SENDER": '{} {}'.format(
-            talent.user.first_name , talent.user.last_name), 
-            "COMPANY": shift.employer.title,
-            "POSITION": shift.position.title,
-            "LINK": EMPLOYEE_URL,
-            "DATE": shift.starting_at,
-            "DATA": {"type": "shift", "id": shift.id}
-        })
+def notify_shift_candidate_update(user, shift, talents_to_notify=[]):
+
+    email_data = {
+        "COMPANY": shift.employer.title,
+        "POSITION": shift.position.title,
+        "DATE": shift.starting_at,
+        "DATA": {"type": "shift", "id": shift.id}
+    }
+    fcm_data = {
+        "COMPANY": shift.employer.title,
+        "POSITION": shift.position.title,
+        "LINK": EMPLOYEE_URL,
+        "DATE": shift.starting_at,
+        "DATA": {"type": "shift", "id": shift.id}
+    }
+
+    for slug, talents in [('applicant_accepted', talents_to_notify['accepted']),
+                          ('applicant_rejected', talents_to_notify['rejected'])]:
+        queue_emails(slug, [(talent.user.email, email_data) for talent in talents])
+        queue_push_notifications(slug, [(talent.user.id, fcm_data) for talent in talents])
 
 
 def notify_jobcore_invite(invite, include_sms=False, employer_role=""):
@@ -321,21 +225,61 @@ def notify_invite_shift_accepted(employee, invite):
     })
 
 
-def notify_single_shift_invite(invite, withEmail=False):
+def notify_shift_invites(shift, talents, sender, manually_created=False, withEmail=False):
+    """
+    Creates the invites of all the talents with one insert and queues their notifications,
+    it takes the same number of queries no matter how many talents are invited.
+    The talents should come with their user already loaded.
+    """
+    return notify_shifts_invites([(shift, talents)], sender, manually_created, withEmail)
+
+
+def create_invites(invites):
+    """Inserts the invites at once and sets their ids, returns them"""
+    ShiftInvite.objects.bulk_create(invites)
+    if invites and not connection.features.can_return_ids_from_bulk_insert:
+        # bulk_create only sets the ids on PostgreSQL, the newest invite of a pair is the one just inserted
+        ids = {(shift_id, employee_id): id for shift_id, employee_id, id in ShiftInvite.objects.filter(
+            shift_id__in=set(invite.shift_id for invite in invites),
+            employee_id__in=set(invite.employee_id for invite in invites),
+        ).order_by('id').values_list('shift_id', 'employee_id', 'id')}
+        for invite in invites:
+            invite.id = ids[(invite.shift_id, invite.employee_id)]
+    return invites
+
+
+def notify_shifts_invites(shift_talents, sender, manually_created=False, withEmail=False):
+    """notify_shift_invites for a list of (shift, talents), all the invites are inserted at once"""
+    invites = create_invites([
+        ShiftInvite(manually_created=manually_created, employee=talent, sender=sender, shift=shift)
+        for shift, talents in shift_talents for talent in talents
+    ])
+
+    # everything but the invite id is the same for all the talents of a shift
+    shift_data = {
+        shift.id: {
+            "SENDER": '{} {}'.format(sender.user.first_name, sender.user.last_name),
+            "COMPANY": sender.employer.title,
+            "POSITION": shift.position.title,
+            "DATE": shift.starting_at.strftime('%m/%d/%Y'),
+            "LINK": EMPLOYEE_URL + '/shift/'+str(shift.id),
+        }
+        for shift, _ in shift_talents
+    }
+    messages = [(invite.employee.user, dict(shift_data[invite.shift.id], DATA={"type": "invite", "id": invite.id}))
+                for invite in invites]
 
-    # invite.employee.user.email
     if withEmail:
-        send_email_message("invite_to_shift", invite.employee.user.email, {
-            "SENDER": '{} {}'.format(
-                invite.sender.user.first_name, invite.sender.user.last_name),
-            "COMPANY": invite.sender.user.profile.employer.title,
-            "POSITION": invite.shift.position.title,
-            "DATE": invite.shift.starting_at.strftime('%m/%d/%Y'),
-            "LINK": EMPLOYEE_URL + '/shift/'+str(invite.shift.id),
-            "DATA": {"type": "invite", "id": invite.id}
-        })
+        queue_emails("invite_to_shift", [(user.email, invite_data) for user, invite_data in messages])
+
+    queue_push_notifications("invite_to_shift", [(user.id, invite_data) for user, invite_data in messages])
+
+    return invites
 
-    send_fcm_notification("invite_to_shift", invite.employee.user.id, {
+
+def notify_single_shift_invite(invite, withEmail=False):
+
+    data = {
         "SENDER": '{} {}'.format(
             invite.sender.user.first_name, invite.sender.user.last_name),
         "COMPANY": invite.sender.user.profile.employer.title,
@@ -343,38 +287,77 @@ def notify_single_shift_invite(invite, withEmail=False):
         "DATE": invite.shift.starting_at.strftime('%m/%d/%Y'),
         "LINK": EMPLOYEE_URL + '/shift/'+str(invite.shift.id),
         "DATA": {"type": "invite", "id": invite.id}
-    })
+    }
+
+    # invite.employee.user.email
+    if withEmail:
+        queue_emails("invite_to_shift", [(invite.employee.user.email, data)])
+
+    queue_push_notifications("invite_to_shift", [(invite.employee.user.id, data)])
+
+
+def notify_talents_invites(invites, sender, withEmail=False):
+    """
+    One notification per talent for a list of invites, a talent invited to several shifts gets
+    invite_to_shifts with all of them, a talent invited to one shift the usual invite_to_shift
+    """
+    by_talent = {}
+    for invite in sorted(invites, key=lambda invite: invite.shift.starting_at):
+        by_talent.setdefault(invite.employee.user, []).append(invite)
+
+    sender_name = '{} {}'.format(sender.user.first_name, sender.user.last_name)
+    messages = {"invite_to_shift": [], "invite_to_shifts": []}
+    for user, talent_invites in by_talent.items():
+        shifts = [{
+            "POSITION": invite.shift.position.title,
+            "DATE": invite.shift.starting_at.strftime('%m/%d/%Y'),
+            "LINK": EMPLOYEE_URL + '/shift/'+str(invite.shift.id),
+        } for invite in talent_invites]
+        data = dict(shifts[0], SENDER=sender_name, COMPANY=sender.employer.title,
+                    DATA={"type": "invite", "id": talent_invites[0].id})
+        if len(shifts) == 1:
+            messages["invite_to_shift"].append((user, data))
+        else:
+            messages["invite_to_shifts"].append((user, dict(data, SHIFTS=shifts, TOTAL=len(shifts))))
+
+    for slug, slug_messages in messages.items():
+        if not slug_messages:
+            continue
+        if withEmail:
+            queue_emails(slug, [(user.email, data) for user, data in slug_messages])
+        queue_push_notifications(slug, [(user.id, data) for user, data in slug_messages])
+
 
 def notify_new_rating(rating):
     print('the new rating', rating)
     if rating.employee is not None:
-        send_email_message("new_rating", rating.employee.user.email, {
+        queue_emails("new_rating", [(rating.employee.user.email, {
             "SENDER": rating.sender.employer.title,
             "VENUE": rating.shift.venue.title,
             "DATE": rating.shift.starting_at.strftime('%m/%d/%Y'),
             "LINK": EMPLOYEE_URL + '/rating/' + str(rating.id),
             "DATA": {"type": "rating", "id": rating.id}
-        })
+        })])
 
-        send_fcm_notification("new_rating", rating.employee.user.id, {
+        queue_push_notifications("new_rating", [(rating.employee.user.id, {
             "SENDER": rating.sender.employer.title,
             "VENUE": rating.shift.venue.title,
             "RATING": rating.rating,
             "DATE": rating.shift.ending_at.strftime('%m/%d/%Y'),
             "LINK": EMPLOYEE_URL+'/rating/'+str(rating.id),
             "DATA": {"type": "rating", "id": rating.id}
-        })
+        })])
 
     elif rating.employer is not None:
         employer_users = Profile.objects.filter(
-            employer__id=rating.employer.id)
-        for profile in employer_users:
-            send_email_message("new_rating", profile.user.email, {
-                "SENDER": '{} {}'.format(
-                    rating.sender.user.first_name,
-                    rating.sender.user.last_name),
-                "VENUE": rating.shift.venue.title,
-                "DATE": rating.shift.starting_at.strftime('%m/%d/%Y'),
-                "LINK": EMPLOYEE_URL + '/rating/' + str(rating.id),
-                "DATA": {"type": "rating", "id": rating.id}
-            })
+            employer__id=rating.employer.id).select_related('user')
+        data = {
+            "SENDER": '{} {}'.format(
+                rating.sender.user.first_name,
+                rating.sender.user.last_name),
+            "VENUE": rating.shift.venue.title,
+            "DATE": rating.shift.starting_at.strftime('%m/%d/%Y'),
+            "LINK": EMPLOYEE_URL + '/rating/' + str(rating.id),
+            "DATA": {"type": "rating", "id": rating.id}
+        }
+        queue_emails("new_rating", [(profile.user.email, data) for profile in employer_users])
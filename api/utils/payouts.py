@@ -0,0 +1,364 @@
+"""
+Payouts of all the employee payments of a payroll period at once.
+
+start_payout locks the period and the unpaid payments, computes their deductions, taxes and net
+amount (payment_serializer.PayrollContext) and queues them on a PayrollPayout. The process_payouts
+command (or the hook/process_payouts cron hook) claims the queued payments with SKIP LOCKED,
+sends the charges from a pool of threads outside of any database transaction and records the
+results in bulk. Every charge is sent with an idempotency key made of the payment and its amount,
+a payment left PROCESSING by a worker that crashed is claimed again after CLAIM_TIMEOUT and sent
+with the same key, so it is never charged twice, not even by a later payout of the period.
+
+A single payment paid from the employer (EmployerMeEmployeePaymentView) is claimed the same way
+with claim_employee_payment and paid with pay_employee_payment, so it cannot be charged while a
+payout is sending it.
+
+The charges go through settings.PAYOUT_TRANSPORT: StripeTransport in production and FakeTransport
+(in memory) for tests and offline development. FAKE payouts always use FakeTransport.
+"""
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+import stripe
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count, Q, Sum
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from api.models import (EmployeePayment, PaymentTransaction, PayrollPayout, PayrollPeriod, PayrollPeriodPayment,
+                        APPROVED, COMPLETED, FAILED, PAID, PROCESSING, QUEUED)
+from api.utils import employer_stats
+from api.utils.loggers import log_debug
+from api.utils.utils import DecimalEncoder
+
+MAX_ATTEMPTS = 3
+BATCH_SIZE = 100
+# stripe calls running at the same time
+WORKERS = 8
+CLAIM_TIMEOUT = timedelta(minutes=10)
+
+
+class PayoutError(Exception):
+    pass
+
+
+class StripeTransport:
+
+    def charge(self, amount, sender_account, receiver_account, idempotency_key):
+        charge = stripe.Charge.create(amount='{:.0f}'.format(amount * 100),
+                                      currency='usd',
+                                      customer=sender_account.stripe_customer_id,
+                                      source=sender_account.stripe_bankaccount_id,
+                                      transfer_data={'destination': receiver_account.stripe_account_id},
+                                      idempotency_key=idempotency_key)
+        return charge.id
+
+
+class FakeTransport:
+    """
+    Keeps the charges in memory instead of sending them, a key that was already charged gets
+    the same charge back like on Stripe. Charges to the accounts in declined fail.
+    """
+    charges = {}
+    declined = set()
+    _lock = threading.Lock()
+
+    def charge(self, amount, sender_account, receiver_account, idempotency_key):
+        with self._lock:
+            if idempotency_key not in self.charges:
+                if receiver_account.stripe_account_id in self.declined:
+                    raise PayoutError('The charge was declined')
+                self.charges[idempotency_key] = {
+                    'id': 'fake_{}'.format(len(self.charges) + 1),
+                    'amount': amount,
+                    'sender': sender_account.id,
+                    'receiver': receiver_account.id,
+                }
+            return self.charges[idempotency_key]['id']
+
+
+def get_transport(payment_type=None):
+    if payment_type == PaymentTransaction.FAKE:
+        return FakeTransport()
+    return import_string(settings.PAYOUT_TRANSPORT)()
+
+
+def get_idempotency_key(payment):
+    return 'employee-payment-{}-{:.0f}'.format(payment.id, payment.amount * 100)
+
+
+def get_receiver_account(employee):
+    """The newest bank account of the last profile of the talent, read from the prefetched profiles"""
+    profiles = list(employee.profile_set.all())
+    if not profiles:
+        return None
+    accounts = list(max(profiles, key=lambda profile: profile.id).bank_accounts.all())
+    if not accounts:
+        return None
+    return max(accounts, key=lambda account: account.id)
+
+
+def start_payout(period, payment_type, sender_user, employer_bank_account=None):
+    """
+    Queues the unpaid employee payments of the period on a new payout and returns it, the
+    payout that is already processing when there is one
+    """
+    from api.serializers.payment_serializer import EmployeePaymentSerializer, PayrollContext
+
+    with transaction.atomic():
+        # two requests cannot start the payout of the same period at the same time
+        period = PayrollPeriod.objects.select_for_update().get(id=period.id)
+        payout = PayrollPayout.objects.filter(payroll_period=period, status=PROCESSING).first()
+        if payout is not None:
+            return payout
+
+        payout = PayrollPayout.objects.create(payroll_period=period, employer_id=period.employer_id,
+                                              payment_type=payment_type, sender_user=sender_user,
+                                              employer_bank_account=employer_bank_account)
+        payments = list(EmployeePaymentSerializer.setup_eager_loading(
+            EmployeePayment.objects.filter(payroll_period=period, employer_id=period.employer_id, paid=False))
+            # a payment paid on its own right now is left alone
+            .exclude(payout_status=PROCESSING, payout_claimed_at__gte=timezone.now() - CLAIM_TIMEOUT)
+            .select_for_update(of=('self',)).order_by('id'))
+
+        context = PayrollContext()
+        context.compute(payments)
+        for payment in payments:
+            computed = context.get(payment)
+            payment.deductions = computed['deductions']
+            payment.deduction_list = json.loads(json.dumps(computed['deduction_list'], cls=DecimalEncoder))
+            payment.taxes = computed['taxes']
+            payment.amount = payment.earnings - payment.deductions
+            payment.payout = payout
+            payment.payout_status = QUEUED
+            payment.payout_attempts = 0
+            payment.payout_error = ''
+            payment.payout_claimed_at = None
+            if payment_type != PaymentTransaction.CHECK:
+                payment.payout_bank_account = get_receiver_account(payment.employee)
+                if payment.payout_bank_account is None:
+                    payment.payout_status = FAILED
+                    payment.payout_error = 'The talent has no bank account'
+        EmployeePayment.objects.bulk_update(payments, [
+            'deductions', 'deduction_list', 'taxes', 'amount', 'payout', 'payout_status', 'payout_bank_account',
+            'payout_attempts', 'payout_error', 'payout_claimed_at'])
+
+        if not any(payment.payout_status == QUEUED for payment in payments):
+            _complete(payout)
+    return payout
+
+
+def _claim(payout, batch_size, attempted):
+    now = timezone.now()
+    with transaction.atomic():
+        payments = list(
+            EmployeePayment.objects.filter(payout=payout)
+            .filter(Q(payout_status=QUEUED) | Q(payout_status=PROCESSING, payout_claimed_at__lt=now - CLAIM_TIMEOUT))
+            .exclude(id__in=attempted)
+            .select_related('payout_bank_account', 'employee__user')
+            .select_for_update(skip_locked=True, of=('self',)).order_by('id')[:batch_size])
+        for payment in payments:
+            payment.payout_status = PROCESSING
+            payment.payout_claimed_at = now
+        EmployeePayment.objects.bulk_update(payments, ['payout_status', 'payout_claimed_at'])
+    return payments
+
+
+def _send(transport, payout, payment):
+    """Returns the (transaction id, error) of the charge of the payment"""
+    if payout.payment_type == PaymentTransaction.CHECK:
+        return None, None
+    try:
+        return transport.charge(payment.amount, payout.employer_bank_account, payment.payout_bank_account,
+                                get_idempotency_key(payment)), None
+    except Exception as e:
+        return None, str(e) or e.__class__.__name__
+
+
+def _record(payout, payments, results):
+    paid = [payment for payment, (_, error) in zip(payments, results) if error is None]
+    failed = [(payment, error) for payment, (_, error) in zip(payments, results) if error is not None]
+
+    with transaction.atomic():
+        transactions = [
+            PaymentTransaction(
+                amount=payment.amount, sender_user=payout.sender_user, receiver_user=payment.employee.user,
+                payment_type=payout.payment_type,
+                payment_data={} if payout.payment_type == PaymentTransaction.CHECK else {
+                    "service_name": "Stripe",
+                    "sender_stripe_token": payout.employer_bank_account.stripe_bankaccount_id,
+                    "receiver_stripe_token": payment.payout_bank_account.stripe_bankaccount_id,
+                    "transaction_id": transaction_id,
+                })
+            for payment, (transaction_id, error) in zip(payments, results) if error is None
+        ]
+        if connection.features.can_return_ids_from_bulk_insert:
+            PaymentTransaction.objects.bulk_create(transactions)
+        else:
+            # bulk_create only sets the ids on PostgreSQL
+            for payment_transaction in transactions:
+                payment_transaction.save()
+        for payment, payment_transaction in zip(paid, transactions):
+            payment.payment_transaction = payment_transaction
+            payment.paid = True
+            payment.payout_status = PAID
+            payment.payout_error = ''
+        EmployeePayment.objects.bulk_update(paid, ['payment_transaction', 'paid', 'payout_status', 'payout_error'])
+
+        for payment, error in failed:
+            payment.payout_attempts += 1
+            payment.payout_error = error
+            payment.payout_status = FAILED if payment.payout_attempts >= MAX_ATTEMPTS else QUEUED
+            log_debug('general', 'Payout of employee payment {} failed ({} attempts): {}'.format(
+                payment.id, payment.payout_attempts, error))
+        EmployeePayment.objects.bulk_update([payment for payment, _ in failed],
+                                            ['payout_attempts', 'payout_error', 'payout_status'])
+
+        if paid:
+            PayrollPeriodPayment.objects.filter(payroll_period_id=payout.payroll_period_id,
+                                                employer_id=payout.employer_id,
+                                                employee_id__in=[payment.employee_id for payment in paid],
+                                                status=APPROVED).update(status=PAID)
+            PayrollPeriod.objects.filter(id=payout.payroll_period_id).update(status=PAID)
+    return len(paid), len(failed)
+
+
+def _complete(payout):
+    payout.status = COMPLETED
+    payout.completed_at = timezone.now()
+    payout.save(update_fields=['status', 'completed_at', 'updated_at'])
+
+
+def process_payout(payout, batch_size=BATCH_SIZE, workers=WORKERS, transport=None):
+    """
+    Sends the queued charges of the payout, batch_size payments at a time with up to workers
+    charges at the same time, and returns a summary of the run. A payment that fails is tried
+    again on the next run until MAX_ATTEMPTS.
+    """
+    if transport is None:
+        transport = get_transport(payout.payment_type)
+
+    attempted = []
+    paid = failed = 0
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        while True:
+            payments = _claim(payout, batch_size, attempted)
+            if not payments:
+                break
+            attempted.extend(payment.id for payment in payments)
+            # no transaction is open while the charges are sent
+            results = list(pool.map(lambda payment: _send(transport, payout, payment), payments))
+            batch_paid, batch_failed = _record(payout, payments, results)
+            paid += batch_paid
+            failed += batch_failed
+
+    if paid:
+        # bulk updates send no signals
+        employer_stats.refresh([payout.employer_id])
+    if not EmployeePayment.objects.filter(payout=payout, payout_status__in=[QUEUED, PROCESSING]).exists():
+        _complete(payout)
+
+    return {
+        'processed': len(attempted),
+        'paid': paid,
+        'failed': failed,
+    }
+
+
+def claim_employee_payment(employee_payment, receiver_account=None):
+    """
+    Locks the employee payment and saves it PROCESSING, with the deductions, taxes and amount
+    already set on the instance, before it is paid on its own. A payment that is paid, queued on
+    a payout or being sent cannot be claimed.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        locked = EmployeePayment.objects.select_for_update().get(id=employee_payment.id)
+        if locked.paid or locked.payout_status == QUEUED or (
+                locked.payout_status == PROCESSING and locked.payout_claimed_at > now - CLAIM_TIMEOUT):
+            raise PayoutError('The selected employee payment can not be paid')
+        employee_payment.payout = None
+        employee_payment.payout_status = PROCESSING
+        employee_payment.payout_claimed_at = now
+        employee_payment.payout_bank_account = receiver_account
+        employee_payment.save(update_fields=['deductions', 'deduction_list', 'taxes', 'amount', 'payout',
+                                             'payout_status', 'payout_claimed_at', 'payout_bank_account'])
+    return employee_payment
+
+
+def pay_employee_payment(employee_payment, payment_type, sender_user, receiver_user, sender_account=None,
+                         transport=None):
+    """
+    Pays an employee payment claimed with claim_employee_payment and returns its PaymentTransaction.
+    The charge is sent outside of any transaction with the same idempotency key as the payouts,
+    when it fails the payment is saved FAILED and the error raised.
+    """
+    payment_data = {}
+    if payment_type in (PaymentTransaction.ELECT_TRANSF, PaymentTransaction.FAKE):
+        if transport is None:
+            transport = get_transport(payment_type)
+        try:
+            transaction_id = transport.charge(employee_payment.amount, sender_account,
+                                              employee_payment.payout_bank_account,
+                                              get_idempotency_key(employee_payment))
+        except Exception as e:
+            employee_payment.payout_attempts += 1
+            employee_payment.payout_error = str(e) or e.__class__.__name__
+            employee_payment.payout_status = FAILED
+            employee_payment.save(update_fields=['payout_attempts', 'payout_error', 'payout_status'])
+            raise
+        payment_data = {"service_name": "Stripe",
+                        "sender_stripe_token": sender_account.stripe_bankaccount_id,
+                        "receiver_stripe_token": employee_payment.payout_bank_account.stripe_bankaccount_id,
+                        "transaction_id": transaction_id}
+
+    with transaction.atomic():
+        if payment_data:
+            payment_transaction = PaymentTransaction.objects.create(
+                amount=employee_payment.amount, sender_user=sender_user, receiver_user=receiver_user,
+                payment_type=payment_type, payment_data=payment_data)
+        else:
+            payment_transaction = PaymentTransaction.objects.create(
+                amount=employee_payment.amount, sender_user=sender_user, receiver_user=receiver_user)
+        # set status for related entries as paid
+        employee_payment.payment_transaction = payment_transaction
+        employee_payment.paid = True
+        employee_payment.payout_status = PAID
+        employee_payment.payout_error = ''
+        employee_payment.save()
+        PayrollPeriodPayment.objects.filter(payroll_period=employee_payment.payroll_period,
+                                            employee=employee_payment.employee,
+                                            employer=employee_payment.employer,
+                                            status=APPROVED).update(status=PAID)
+        employee_payment.payroll_period.status = PAID
+        employee_payment.payroll_period.save()
+    return payment_transaction
+
+
+def process_payouts(**kwargs):
+    """Runs every payout that is still processing"""
+    summaries = [process_payout(payout, **kwargs)
+                 for payout in PayrollPayout.objects.filter(status=PROCESSING).select_related(
+                     'employer_bank_account', 'sender_user').order_by('id')]
+    return {key: sum(summary[key] for summary in summaries) for key in ('processed', 'paid', 'failed')}
+
+
+def get_progress(payout):
+    stats = EmployeePayment.objects.filter(payout=payout).aggregate(
+        total=Count('id'),
+        queued=Count('id', filter=Q(payout_status=QUEUED)),
+        processing=Count('id', filter=Q(payout_status=PROCESSING)),
+        paid=Count('id', filter=Q(payout_status=PAID)),
+        failed=Count('id', filter=Q(payout_status=FAILED)),
+        paid_amount=Sum('amount', filter=Q(payout_status=PAID)),
+    )
+    failures = EmployeePayment.objects.filter(payout=payout, payout_status=FAILED).order_by('id') \
+        .values('id', 'employee_id', 'payout_attempts', 'payout_error')
+    return dict(stats, id=payout.id, payroll_period=payout.payroll_period_id, status=payout.status,
+                payment_type=payout.payment_type, paid_amount=stats['paid_amount'] or 0,
+                failures=[{'employee_payment': failure['id'], 'employee': failure['employee_id'],
+                           'attempts': failure['payout_attempts'], 'error': failure['payout_error']}
+                          for failure in failures])
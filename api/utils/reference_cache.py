@@ -0,0 +1,174 @@
+"""
+Read-through cache for the endpoints that serve reference data (positions, badges,
+cities, subscription plans, app versions and the catalogs).
+
+Every namespace has a version, the time in milliseconds when it was last invalidated,
+and the version is part of the cache keys: invalidating a namespace only writes a new
+version and the old entries expire on their own. Only get, set, add and incr are used
+so any django cache backend works (local memory, file or a redis backend), it is
+configured with the "reference" alias of settings.CACHES.
+
+The entries and the versions expire after the TIMEOUT of the alias. With the default local
+memory backend every process has its own copy and only sees the invalidations of its own
+process, so the TIMEOUT is kept short (60 seconds) and bounds how stale the other processes
+can be; it can be raised with a backend shared by all the processes.
+
+The responses carry an ETag (hash of the data) and a Last-Modified (the version) so the
+apps can revalidate with If-None-Match or If-Modified-Since and get a 304.
+"""
+import hashlib
+import json
+import time
+
+from django.core.cache import caches
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models.signals import post_delete, post_save
+from django.utils.http import http_date, parse_http_date_safe, parse_etags, quote_etag
+
+from rest_framework import status
+from rest_framework.response import Response
+
+CACHE_ALIAS = 'reference'
+
+POSITIONS = 'positions'
+BADGES = 'badges'
+CITIES = 'cities'
+SUBSCRIPTIONS = 'subscriptions'
+APP_VERSIONS = 'app_versions'
+TALENTS = 'talents'
+NAMESPACES = (POSITIONS, BADGES, CITIES, SUBSCRIPTIONS, APP_VERSIONS, TALENTS)
+
+
+def get_cache():
+    return caches[CACHE_ALIAS]
+
+
+def _key(namespace, *parts):
+    return ':'.join(('reference', namespace) + tuple(str(part) for part in parts))
+
+
+def get_version(namespace):
+    cache = get_cache()
+    version = cache.get(_key(namespace, 'version'))
+    if version is None:
+        # never invalidated (expired or evicted), a new version is always safe
+        version = int(time.time() * 1000)
+        if not cache.add(_key(namespace, 'version'), version):
+            version = cache.get(_key(namespace, 'version'), version)
+    return version
+
+
+def invalidate(*namespaces):
+    cache = get_cache()
+    for namespace in namespaces:
+        previous = cache.get(_key(namespace, 'version'), 0)
+        cache.set(_key(namespace, 'version'), max(int(time.time() * 1000), previous + 1))
+
+
+def _count(namespace, outcome):
+    cache = get_cache()
+    key = _key(namespace, outcome)
+    cache.add(key, 0, None)
+    try:
+        cache.incr(key)
+    except ValueError:
+        # evicted between the add and the incr
+        cache.set(key, 1, None)
+
+
+def get_stats():
+    """Hits, misses and hit ratio of every namespace"""
+    cache = get_cache()
+    stats = {}
+    for namespace in NAMESPACES:
+        hits = cache.get(_key(namespace, 'hits'), 0)
+        misses = cache.get(_key(namespace, 'misses'), 0)
+        stats[namespace] = {
+            'hits': hits,
+            'misses': misses,
+            'hit_ratio': round(hits / (hits + misses), 4) if hits + misses > 0 else None,
+        }
+    return stats
+
+
+def get_etag(data):
+    content = json.dumps(data, cls=DjangoJSONEncoder, sort_keys=True)
+    return hashlib.md5(content.encode('utf-8')).hexdigest()
+
+
+def get_or_build(namespace, key, build):
+    """
+    Returns (data, etag, version) from the cache, build() is only called on a miss.
+    build must return data that can be pickled, None is returned as is and not cached.
+    """
+    cache = get_cache()
+    version = get_version(namespace)
+    cache_key = _key(namespace, version, key)
+
+    entry = cache.get(cache_key)
+    if entry is not None:
+        _count(namespace, 'hits')
+        return entry + (version,)
+
+    _count(namespace, 'misses')
+    data = build()
+    if data is None:
+        return None, None, version
+    entry = (data, get_etag(data))
+    cache.set(cache_key, entry)
+    return entry + (version,)
+
+
+def conditional_response(request, data, etag=None, last_modified=None):
+    """Response with ETag and Last-Modified headers, or a 304 if the client already has this data"""
+    if etag is None:
+        etag = get_etag(data)
+    headers = {'ETag': quote_etag(etag)}
+    if last_modified is not None:
+        headers['Last-Modified'] = http_date(last_modified)
+
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if if_none_match:
+        etags = parse_etags(if_none_match)
+        if '*' in etags or quote_etag(etag) in etags:
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    elif last_modified is not None:
+        if_modified_since = parse_http_date_safe(request.META.get('HTTP_IF_MODIFIED_SINCE', ''))
+        if if_modified_since is not None and int(last_modified) <= if_modified_since:
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    return Response(data, status=status.HTTP_200_OK, headers=headers)
+
+
+def cached_response(request, namespace, key, build):
+    """
+    Read-through response for the reference endpoints, returns None when build() returns None
+    so the view can answer with its own 404
+    """
+    data, etag, version = get_or_build(namespace, key, build)
+    if data is None:
+        return None
+    return conditional_response(request, data, etag, last_modified=version / 1000)
+
+
+def connect_signals():
+    from api.models import AppVersion, Badge, City, Employee, Position, Profile, SubscriptionPlan, User
+
+    invalidated_by = (
+        (Position, (POSITIONS,)),
+        (Badge, (BADGES,)),
+        (City, (CITIES,)),
+        (SubscriptionPlan, (SUBSCRIPTIONS,)),
+        (AppVersion, (APP_VERSIONS,)),
+        # the talent and profile catalogs list names
+        (User, (TALENTS,)),
+        (Profile, (TALENTS,)),
+        (Employee, (TALENTS,)),
+    )
+    for model, namespaces in invalidated_by:
+        def receiver(sender, namespaces=namespaces, **kwargs):
+            invalidate(*namespaces)
+        post_save.connect(receiver, sender=model, weak=False,
+                          dispatch_uid='reference_cache_save_{}'.format(model._meta.label_lower))
+        post_delete.connect(receiver, sender=model, weak=False,
+                            dispatch_uid='reference_cache_delete_{}'.format(model._meta.label_lower))
@@ -0,0 +1,223 @@
+"""
+Talent search for the employee list and the talent catalog.
+
+Every employee has a search_document: the lowercased name, email, positions and badges of the
+talent, each word preceded by a space so a word prefix is a plain substring (" bar" matches
+"bartender"). The documents are rebuilt with one set based UPDATE for the talents a signal
+touches (one UPDATE per talent on another database), bulk loaded talents need a refresh_documents()
+call (or the rebuild_search_index command).
+
+When pg_trgm is installed migration 0129 adds a GIN trigram index on the document, the
+substring filters use it and the results are ranked by trigram similarity. Without the
+extension (or on another database) the same filters scan the documents and only the first
+matches are ranked, in Python. PythonTalentIndex ranks like pg_trgm for the tests and the
+benchmarks, it is not used to serve requests: every process would keep its own stale copy.
+"""
+import bisect
+import heapq
+import re
+
+from django.contrib.postgres.search import TrigramSimilarity
+from django.db import connection
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+
+SEARCH_LIMIT = 20
+MAX_SEARCH_LIMIT = 100
+MAX_TERMS = 5
+WORD = re.compile(r'[^\W_]+')
+
+REFRESH_DOCUMENTS_SQL = """
+    UPDATE api_employee AS e
+    SET search_document = LOWER(CONCAT_WS(' ', '', u.first_name, u.last_name, u.email,
+        (SELECT STRING_AGG(p.title, ' ') FROM api_employee_positions ep
+         JOIN api_position p ON p.id = ep.position_id WHERE ep.employee_id = e.id),
+        (SELECT STRING_AGG(b.title, ' ') FROM api_employee_badges eb
+         JOIN api_badge b ON b.id = eb.badge_id WHERE eb.employee_id = e.id)))
+    FROM auth_user AS u
+    WHERE u.id = e.user_id
+"""
+
+_has_trigram = {}
+
+
+def has_trigram():
+    """True when the database can use the pg_trgm index and similarity ranking"""
+    if connection.vendor != 'postgresql':
+        return False
+    if connection.alias not in _has_trigram:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+            _has_trigram[connection.alias] = cursor.fetchone() is not None
+    return _has_trigram[connection.alias]
+
+
+def get_terms(query):
+    return (query or '').lower().split()[:MAX_TERMS]
+
+
+def get_limit(value, default=SEARCH_LIMIT):
+    try:
+        return max(1, min(int(value), MAX_SEARCH_LIMIT))
+    except (TypeError, ValueError):
+        return default
+
+
+def get_document(user, positions, badges):
+    """Same text as REFRESH_DOCUMENTS_SQL, CONCAT_WS skips the aggregate of no titles"""
+    words = ['', user.first_name, user.last_name, user.email]
+    words += [' '.join(titles) for titles in (positions, badges) if titles]
+    return ' '.join(words).lower()
+
+
+def refresh_documents(employee_ids=None):
+    """Rebuilds the search_document of the given employees, or of all of them"""
+    if connection.vendor != 'postgresql':
+        return _refresh_documents_one_by_one(employee_ids)
+
+    sql, params = REFRESH_DOCUMENTS_SQL, []
+    if employee_ids is not None:
+        employee_ids = list(employee_ids)
+        if not employee_ids:
+            return
+        sql += ' AND e.id IN (SELECT UNNEST(%s))'
+        params.append(employee_ids)
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+
+
+def _refresh_documents_one_by_one(employee_ids):
+    from api.models import Employee
+
+    employees = Employee.objects.select_related('user').prefetch_related('positions', 'badges')
+    if employee_ids is not None:
+        employees = employees.filter(id__in=list(employee_ids))
+    for employee in employees:
+        document = get_document(employee.user, [position.title for position in employee.positions.all()],
+                                [badge.title for badge in employee.badges.all()])
+        # a queryset update, saving the employee would send the signal again
+        Employee.objects.filter(id=employee.id).update(search_document=document)
+
+
+def filter_queryset(queryset, query):
+    """Employees that have a word starting with every term of the query"""
+    for term in get_terms(query):
+        queryset = queryset.filter(search_document__contains=' ' + term)
+    return queryset
+
+
+def search(queryset, query, limit=SEARCH_LIMIT):
+    """Up to `limit` employees of the queryset matching the query, best match first"""
+    terms = get_terms(query)
+    if not terms:
+        return []
+
+    if has_trigram():
+        return list(filter_queryset(queryset, query)
+                    .annotate(rank=TrigramSimilarity('search_document', ' '.join(terms)))
+                    .order_by('-rank', 'id')[:limit])
+
+    # without the index every match would have to be read to rank them all, only the first ones are
+    candidates = list(filter_queryset(queryset, query).order_by('id')[:limit * 4])
+    query_trigrams = trigrams(' '.join(terms))
+    candidates.sort(key=lambda employee: (-_similarity(trigrams(employee.search_document), query_trigrams),
+                                          employee.id))
+    return candidates[:limit]
+
+
+def trigrams(text):
+    """The trigrams pg_trgm extracts from a text: every alphanumeric word padded with two spaces before and one after"""
+    result = set()
+    for word in WORD.findall(text.lower()):
+        padded = '  ' + word + ' '
+        result.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return result
+
+
+def similarity(a, b):
+    """Same as pg_trgm similarity(): shared trigrams over the trigrams of both texts"""
+    return _similarity(trigrams(a), trigrams(b))
+
+
+def _similarity(a, b):
+    if not a or not b:
+        return 0
+    shared = len(a & b)
+    return shared / (len(a) + len(b) - shared)
+
+
+class PythonTalentIndex:
+    """Sorted (word, employee id) pairs, a prefix lookup is a bisect and a scan"""
+
+    def __init__(self, documents):
+        self.trigrams = {}
+        self.words = []
+        for id, document in documents:
+            self.trigrams[id] = frozenset(trigrams(document))
+            self.words += [(word, id) for word in set(document.split())]
+        self.words.sort()
+        self.keys = [word for word, _ in self.words]
+
+    def prefix(self, term):
+        ids = set()
+        for word, id in self.words[bisect.bisect_left(self.keys, term):]:
+            if not word.startswith(term):
+                break
+            ids.add(id)
+        return ids
+
+    def search(self, terms, limit=None):
+        """Ids of the employees matching all the terms (or the `limit` first ones), best match first"""
+        matches = set.intersection(*[self.prefix(term) for term in terms])
+        query = trigrams(' '.join(terms))
+        ranked = ((-_similarity(self.trigrams[id], query), id) for id in matches)
+        if limit is not None:
+            return [id for _, id in heapq.nsmallest(limit, ranked)]
+        return [id for _, id in sorted(ranked)]
+
+
+def connect_signals():
+    from api.models import Badge, Employee, Position, User
+
+    def user_saved(sender, instance, update_fields=None, **kwargs):
+        # the last_login update on every login does not change the document
+        if update_fields is not None and not {'first_name', 'last_name', 'email'} & set(update_fields):
+            return
+        refresh_documents(Employee.objects.filter(user_id=instance.id).values_list('id', flat=True))
+
+    def employee_saved(sender, instance, update_fields=None, **kwargs):
+        # a full save writes back the (possibly stale) document of the instance
+        if update_fields is None or 'search_document' in update_fields:
+            refresh_documents([instance.id])
+
+    def talents_changed(sender, instance, action, reverse, pk_set, **kwargs):
+        if action not in ('post_add', 'post_remove', 'post_clear'):
+            return
+        if not reverse:
+            refresh_documents([instance.id])
+        elif action == 'post_clear':
+            # the ids are not sent on a clear from the position/badge side
+            refresh_documents()
+        else:
+            refresh_documents(pk_set)
+
+    def title_saved(sender, instance, created, **kwargs):
+        if not created:
+            refresh_documents(instance.employee_set.values_list('id', flat=True))
+
+    def title_deleting(sender, instance, **kwargs):
+        instance._search_employee_ids = list(instance.employee_set.values_list('id', flat=True))
+
+    def title_deleted(sender, instance, **kwargs):
+        refresh_documents(getattr(instance, '_search_employee_ids', []))
+
+    post_save.connect(user_saved, sender=User, weak=False, dispatch_uid='talent_search_user')
+    post_save.connect(employee_saved, sender=Employee, weak=False, dispatch_uid='talent_search_employee')
+    for model, through in ((Position, Employee.positions.through), (Badge, Employee.badges.through)):
+        label = model._meta.label_lower
+        m2m_changed.connect(talents_changed, sender=through, weak=False,
+                            dispatch_uid='talent_search_m2m_{}'.format(label))
+        post_save.connect(title_saved, sender=model, weak=False, dispatch_uid='talent_search_save_{}'.format(label))
+        pre_delete.connect(title_deleting, sender=model, weak=False,
+                           dispatch_uid='talent_search_deleting_{}'.format(label))
+        post_delete.connect(title_deleted, sender=model, weak=False,
+                            dispatch_uid='talent_search_delete_{}'.format(label))
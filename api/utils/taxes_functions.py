@@ -1,4 +1,6 @@
+from bisect import bisect_right
 from decimal import Decimal
+from functools import lru_cache
 
 from api.models import HEAD, MARRIED_JOINTLY, MARRIED_SEPARATELY, SINGLE, WIDOWER
 
@@ -69,28 +71,39 @@ MARRIED_WITHHOLDING_DUAL_RATE = (
 )
 
 
-def get_tentative_withholding(adjusted_wage, filling_status, step2c_checked):
-    if filling_status == SINGLE or filling_status == MARRIED_SEPARATELY:
-        if step2c_checked:
-            table = SINGLE_WITHHOLDING_DUAL_RATE
-        else:
-            table = SINGLE_WITHHOLDING_STANDARD_RATE
-    elif filling_status == MARRIED_JOINTLY or filling_status == WIDOWER:
-        if step2c_checked:
-            table = MARRIED_WITHHOLDING_DUAL_RATE
-        else:
-            table = MARRIED_WITHHOLDING_STANDARD_RATE
-    elif filling_status == HEAD:
-        if step2c_checked:
-            table = HOH_WITHHOLDING_DUAL_RATE
-        else:
-            table = HOH_WITHHOLDING_STANDARD_RATE
-    else:
+# (filing status, step 2c checked) -> withholding table
+WITHHOLDING_TABLES = {
+    (SINGLE, False): SINGLE_WITHHOLDING_STANDARD_RATE,
+    (SINGLE, True): SINGLE_WITHHOLDING_DUAL_RATE,
+    (MARRIED_SEPARATELY, False): SINGLE_WITHHOLDING_STANDARD_RATE,
+    (MARRIED_SEPARATELY, True): SINGLE_WITHHOLDING_DUAL_RATE,
+    (MARRIED_JOINTLY, False): MARRIED_WITHHOLDING_STANDARD_RATE,
+    (MARRIED_JOINTLY, True): MARRIED_WITHHOLDING_DUAL_RATE,
+    (WIDOWER, False): MARRIED_WITHHOLDING_STANDARD_RATE,
+    (WIDOWER, True): MARRIED_WITHHOLDING_DUAL_RATE,
+    (HEAD, False): HOH_WITHHOLDING_STANDARD_RATE,
+    (HEAD, True): HOH_WITHHOLDING_DUAL_RATE,
+}
+
+
+@lru_cache(maxsize=None)
+def get_withholding_brackets(filling_status, step2c_checked):
+    """
+    The brackets of a withholding table sorted by level amount, as the list of level amounts
+    (to bisect) and the list of (level amount, base withholding, percentage)
+    """
+    try:
+        table = WITHHOLDING_TABLES[(filling_status, bool(step2c_checked))]
+    except KeyError:
         raise ValueError('Invalid filling_status')
-    ind = 0
-    limit = len(table) - 1
-    while ind < limit and adjusted_wage >= table[ind + 1].get('level_amount'):
-        ind += 1
-    total = round((adjusted_wage - table[ind].get('level_amount')) * table[ind].get('percentage'), 2) \
-        + table[ind].get('base_withholding')
+    brackets = sorted((row['level_amount'], row['base_withholding'], row['percentage']) for row in table)
+    return [bracket[0] for bracket in brackets], brackets
+
+
+def get_tentative_withholding(adjusted_wage, filling_status, step2c_checked):
+    levels, brackets = get_withholding_brackets(filling_status, step2c_checked)
+    # the highest bracket whose level amount is not above the wage
+    ind = max(bisect_right(levels, adjusted_wage) - 1, 0)
+    level_amount, base_withholding, percentage = brackets[ind]
+    total = round((adjusted_wage - level_amount) * percentage, 2) + base_withholding
     return total
@@ -0,0 +1,145 @@
+"""
+Signed tokens for the links we email (password reset, email validation and invitations).
+
+A token is "<key id>.<payload>.<signature>": the payload is compact json in base64url and the
+signature a truncated HMAC-SHA256 of the key id and payload, nothing is read or written in the
+database to create or check one. settings.LINK_TOKEN_KEYS is a list of (key id, secret), the
+first key signs and all of them verify, so a key is rotated by adding a new one first and
+removing the old one once its tokens expired.
+
+Single use links revoke their token id (jti) before acting, it is saved as a RevokedToken row
+(unique, so two requests with the same link cannot both use it) that every process sees. With
+settings.LINK_TOKEN_AUDIT every token is also saved as a UserToken row, prune_user_tokens deletes
+the expired rows of both.
+
+The links sent before these tokens existed are JWTs, decode() still accepts them.
+"""
+import base64
+import hashlib
+import hmac
+import json
+import time
+import uuid
+from datetime import datetime, timezone
+
+import jwt
+from django.conf import settings
+from django.utils import timezone as django_timezone
+from rest_framework_jwt.settings import api_settings
+
+SIGNATURE_BYTES = 16
+DEFAULT_EXP_MINUTES = 15
+PRUNE_BATCH_SIZE = 5000
+
+
+class InvalidToken(jwt.DecodeError):
+    pass
+
+
+class TokenExpired(jwt.ExpiredSignatureError):
+    pass
+
+
+def _b64encode(data):
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode('ascii')
+
+
+def _b64decode(data):
+    return base64.urlsafe_b64decode(data + '=' * (-len(data) % 4))
+
+
+def get_keys():
+    keys = getattr(settings, 'LINK_TOKEN_KEYS', None)
+    return list(keys) if keys else [('k0', settings.SECRET_KEY)]
+
+
+def _sign(secret, message):
+    return hmac.new(secret.encode('utf-8'), message.encode('ascii'), hashlib.sha256).digest()[:SIGNATURE_BYTES]
+
+
+def encode(payload, exp_min=DEFAULT_EXP_MINUTES, email=None):
+    """Signed token with the payload, a token id and an expiration `exp_min` minutes from now"""
+    payload = dict(payload, exp=int(time.time()) + 60 * exp_min, jti=uuid.uuid4().hex[:12])
+    kid, secret = get_keys()[0]
+    body = _b64encode(json.dumps(payload, separators=(',', ':'), sort_keys=True).encode('utf-8'))
+    message = '{}.{}'.format(kid, body)
+    token = '{}.{}'.format(message, _b64encode(_sign(secret, message)))
+
+    if getattr(settings, 'LINK_TOKEN_AUDIT', False):
+        from api.models import UserToken
+        UserToken.objects.create(token=token, email=email or payload.get('user_email', ''),
+                                 expires_at=datetime.fromtimestamp(payload['exp'], timezone.utc))
+    return token
+
+
+def decode(token):
+    """
+    The payload of a valid token, raises TokenExpired or InvalidToken (subclasses of the jwt
+    exceptions so the callers catching those keep working)
+    """
+    if not token:
+        raise InvalidToken('Missing token')
+
+    parts = token.split('.')
+    keys = dict(get_keys())
+    if len(parts) != 3 or parts[0] not in keys:
+        # links sent before the signed tokens
+        return api_settings.JWT_DECODE_HANDLER(token)
+
+    kid, body, signature = parts
+    try:
+        valid = hmac.compare_digest(_b64decode(signature), _sign(keys[kid], '{}.{}'.format(kid, body)))
+        payload = json.loads(_b64decode(body).decode('utf-8')) if valid else None
+    except (ValueError, TypeError):
+        raise InvalidToken('Malformed token')
+    if not valid:
+        raise InvalidToken('Invalid signature')
+
+    if payload.get('exp', 0) < time.time():
+        raise TokenExpired('Token expired')
+    return payload
+
+
+def revoke(payload):
+    """
+    Uses the token of the payload for a link that works only once, raises InvalidToken when it
+    was already used. Call it before acting on the link.
+    """
+    from api.models import RevokedToken
+
+    jti = payload.get('jti')
+    if jti is None:
+        return
+    _, created = RevokedToken.objects.get_or_create(
+        jti=jti, defaults={'expires_at': datetime.fromtimestamp(payload.get('exp', 0), timezone.utc)})
+    if not created:
+        raise InvalidToken('Token already used')
+
+
+def is_revoked(payload):
+    from api.models import RevokedToken
+
+    jti = payload.get('jti')
+    return jti is not None and RevokedToken.objects.filter(jti=jti).exists()
+
+
+def _prune(model, batch_size):
+    deleted = 0
+    expired = model.objects.filter(expires_at__lt=django_timezone.now())
+    while True:
+        ids = list(expired.values_list('id', flat=True)[:batch_size])
+        if not ids:
+            return deleted
+        deleted += model.objects.filter(id__in=ids).delete()[0]
+
+
+def prune_audit_log(batch_size=PRUNE_BATCH_SIZE):
+    """Deletes the expired UserToken rows a batch at a time, returns how many were deleted"""
+    from api.models import UserToken
+    return _prune(UserToken, batch_size)
+
+
+def prune_revoked(batch_size=PRUNE_BATCH_SIZE):
+    """Deletes the RevokedToken rows of the expired tokens, they cannot be used anyway"""
+    from api.models import RevokedToken
+    return _prune(RevokedToken, batch_size)
@@ -3,7 +3,7 @@ import json
 from decimal import Decimal
 from math import radians, cos, sin, asin, sqrt
 
-from django.utils.dateparse import parse_datetime
+from django.utils.dateparse import parse_date, parse_datetime
 from django.utils.timezone import is_aware, make_aware
 
 
@@ -46,6 +46,30 @@ def get_aware_datetime(date_str):
     return ret
 
 
+def parse_aware_datetime(value):
+    """Like get_aware_datetime but also takes plain dates (midnight), None when the value is not valid"""
+    try:
+        ret = parse_datetime(value)
+        if ret is None:
+            date = parse_date(value)
+            if date is None:
+                return None
+            ret = datetime.datetime.combine(date, datetime.time.min)
+    except ValueError:
+        return None
+    if not is_aware(ret):
+        ret = make_aware(ret)
+    return ret
+
+
+def stream_json_list(items, encoder=None):
+    """Encodes the items as a JSON array one item at a time, to be sent with a StreamingHttpResponse"""
+    yield '['
+    for i, item in enumerate(items):
+        yield (',' if i > 0 else '') + json.dumps(item, cls=encoder)
+    yield ']'
+
+
 def nearest_weekday(d, weekday, fallback_direction='forward'):
     days_ahead = weekday - d.weekday()
     if days_ahead <= 0: # Target day already happened this week
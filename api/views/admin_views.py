@@ -12,6 +12,7 @@ from rest_framework.permissions import AllowAny, IsAuthenticated, IsAuthenticate
 from django.db.models import Q
 
 from api.utils.email import send_fcm
+from api.utils import notification_queue, reference_cache
 from django.contrib.auth.tokens import PasswordResetTokenGenerator
 from django.contrib.auth.models import User
 from oauth2_provider.models import AccessToken
@@ -76,6 +77,18 @@ class FMCView(APIView):
         return Response(result, status=status.HTTP_200_OK)
 
 
+class NotificationQueueView(APIView):
+
+    def get(self, request):
+        return Response(notification_queue.queue_depth(), status=status.HTTP_200_OK)
+
+
+class ReferenceCacheView(APIView):
+
+    def get(self, request):
+        return Response(reference_cache.get_stats(), status=status.HTTP_200_OK)
+
+
 class EmployeeBadgesView(APIView):
     def put(self, request, employee_id=None):
         request_data = request.data.copy()
@@ -5,10 +5,8 @@ from api.utils import validators
 from api.serializers import documents_serializer
 from django.http import JsonResponse
 from api.mixins import EmployeeView
-import cloudinary.uploader
+from api.utils import document_storage
 import logging
-from django.utils.crypto import get_random_string
-from datetime import datetime
 
 u'rRXVe68NO7m3mHoBS488KdHaqQPD6Ofv'
 
@@ -25,47 +23,26 @@ class EmployeeDocumentAPI(EmployeeView):
         if 'document' not in request.FILES:
             return Response(validators.error_object('Please specify a document'), status=status.HTTP_400_BAD_REQUEST)
 
-        public_id = f'profile-{str(self.request.user.id)}-{datetime.now().strftime("%d-%m")}-{get_random_string(length=32)}'
-        file_name = f'{str(self.request.user.id)}/i9_documents/{public_id}'
+        document_type = Document.objects.filter(id=request.data['document_type']).first() \
+            if str(request.data['document_type']).isdigit() else None
+        if document_type is None:
+            return Response(validators.error_object('Invalid document type'), status=status.HTTP_400_BAD_REQUEST)
 
-        try:
-            result = cloudinary.uploader.upload(
-                request.FILES['document'],
-                public_id=file_name,
-                tags=['i9_document', 'profile-' + str(self.request.user.id), ],
-                use_filename=1,
-                unique_filename=1,
-                resource_type='auto'
-            )
-            print(result)
-        except Exception as e:
-            print(e)
-            return JsonResponse({"error": str(e)}, status=400)
-            
-        data = {
-            'document': result['secure_url'],
-            'employee': self.employee.id,
-            'document_type': request.data['document_type'],
-            'public_id': public_id,
-        }
-        print('data picker', data)
-        serializer = documents_serializer.EmployeeDocumentSerializer(data=data)
-        if serializer.is_valid():
-            serializer.save()
-            return Response(serializer.data, status=status.HTTP_201_CREATED)
-
-        cloudinary.uploader.destroy(public_id)
-        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        # the file is uploaded to the storage later by the process_documents command
+        document = document_storage.spool_upload(self.employee, document_type, request.FILES['document'])
+
+        serializer = documents_serializer.EmployeeDocumentSerializer(document)
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
 
     def get(self, request):
-        documents = EmployeeDocument.objects.filter(employee_id=self.employee.id)
+        documents = EmployeeDocument.objects.filter(employee_id=self.employee.id).defer('spooled_content')
 
         qStatus = request.GET.get('status')
         if qStatus:
             documents = documents.filter(status=qStatus)
         else:
             # by default, archived documents will be hidden
-            documents = documents.filter(status__in=['PENDING', 'APPROVED', 'REJECTED'])
+            documents = documents.filter(status__in=['PENDING_UPLOAD', 'UPLOADING', 'UPLOAD_FAILED', 'PENDING', 'APPROVED', 'REJECTED'])
 
         qType = request.GET.get('type')
         if qType:
@@ -88,14 +65,14 @@ class EmployeeDocumentDetailAPI(EmployeeView):
     def delete(self, request, document_id):
         try:
             document = EmployeeDocument.objects.get(id=document_id)
-
-            cloudinary.uploader.destroy(document.public_id)
-
-            document.delete()
         except EmployeeDocument.DoesNotExist:
             return Response(validators.error_object(
                 'Not found.'), status=status.HTTP_404_NOT_FOUND)
 
+        # removed from the storage (and the database) by the next process_documents run
+        document.status = EmployeeDocument.DELETED
+        document.save()
+
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
@@ -9,6 +9,7 @@ from api.utils.notifier import (
     notify_shift_candidate_update
 )
 from api.utils import validators, utils
+from api.actions import clockin_actions
 from api.serializers import (
     clockin_serializer, notification_serializer, payment_serializer,
     shift_serializer, employee_serializer, other_serializer,
@@ -358,35 +359,19 @@ class ClockinsMeView(EmployeeView):
                 validators.error_object("You need to specify started_at or ended_at"),  # NOQA
                 status=status.HTTP_400_BAD_REQUEST)
 
-        instance = None
-
-        if 'ended_at' in request_data:
-            logger.info('ClockinsMeView:post: Is a Clock out Request')
-            try:
-                instance = Clockin.objects.get(
-                    shift=request_data["shift"],
-                    employee=request_data["employee"],
-                    ended_at=None)
-            except Clockin.DoesNotExist:
-                return Response(
-                    validators.error_object(
-                        "There is no previous clockin for this shift"),
-                    status=status.HTTP_400_BAD_REQUEST)
-            except Clockin.MultipleObjectsReturned:
-                return Response(
-                    validators.error_object(
-                        "It seems there is more than one clockin without clockout for this shift"),  # NOQA
-                    status=status.HTTP_400_BAD_REQUEST)
-
         logger.info('ClockinsMeView:post:serializer')
-        serializer = clockin_serializer.ClockinSerializer(
-            instance, data=request_data, context={"request": request})
+        serializer = clockin_serializer.ClockinSerializer(data=request_data, context={"request": request})
 
         if not serializer.is_valid():
             return Response(serializer.errors,
                             status=status.HTTP_400_BAD_REQUEST)
 
-        serializer.save()
+        try:
+            clockin = clockin_actions.clock(self.employee.id, request_data['author'], serializer.validated_data)
+        except clockin_actions.ClockinError as e:
+            return Response(validators.error_object(str(e)), status=status.HTTP_400_BAD_REQUEST)
+
+        serializer = clockin_serializer.ClockinSerializer(clockin)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
 
@@ -25,12 +25,13 @@ from rest_framework import status
 from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
 
+from api.actions import invite_actions
 from api.mixins import EmployerView
 from api.models import (
     BankAccount, Clockin, Employee, EmployeePayment, FavoriteList, EmployerUsers, Employer, W4Form,I9Form,EmployeeDocument,
     PaymentTransaction, PayrollPeriod, PayrollPeriodPayment, Rate, Position,
     Shift, ShiftApplication, ShiftInvite, Venue,
-    APPROVED, PAID, SHIFT_STATUS_CHOICES, SHIFT_INVITE_STATUS_CHOICES, OPEN,
+    PAID, SHIFT_STATUS_CHOICES, SHIFT_INVITE_STATUS_CHOICES, OPEN,
     Shift, ShiftApplication, Employee, Profile, Payrates,
     ShiftInvite, Venue, FavoriteList,
     PayrollPeriod, Rate, Clockin, PayrollPeriodPayment, PERIOD_STATUS,
@@ -38,8 +39,8 @@ from api.models import (
     EmployerSubscription, EMPLOYER_STATUS, SubscriptionPlan, UserProfile, Payment
 )
 
-from api.utils import validators
-from api.pagination import HeaderLimitOffsetPagination
+from api.utils import employer_stats, metrics, notification_queue, payouts, validators
+from api.pagination import HeaderLimitOffsetPagination, get_list_paginator
 
 from api.serializers import (
     employer_serializer, user_serializer, shift_serializer,
@@ -80,6 +81,14 @@ class EmployerMeView(EmployerView):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
+class EmployerMeStatsView(EmployerView):
+    def get(self, request):
+        stats = employer_stats.get_stats(self.employer.id)
+        serializer = employer_serializer.EmployerStatsSerializer(stats, many=False)
+
+        return Response(serializer.data, status=status.HTTP_200_OK)
+
+
 class EmployerMeImageView(EmployerView):
 
     def put(self, request):
@@ -297,8 +306,8 @@ class EmployerShiftInviteView(EmployerView):
         return Response(serializer.data, status=status.HTTP_200_OK)
 
     def post(self, request, **kwargs):
-        invites = []
-
+        if 'shifts' not in request.data:
+            return Response(validators.error_object('Missing shifts for the invite'), status=status.HTTP_400_BAD_REQUEST)
         shifts = request.data['shifts']
 
         employees = None
@@ -315,31 +324,28 @@ class EmployerShiftInviteView(EmployerView):
         if not isinstance(employees, list):
             employees = [employees]
 
-        for shift in shifts:
-            for employee in employees:
-                data = {
-                    "employee": employee,
-                    "sender": request.user.profile.id,
-                    "shift": shift,
-                    "manually_created": True
-                }
-
-                serializer = shift_serializer.ShiftCreateInviteSerializer(
-                    data=data,
-                    context={
-                        "request": request
-                    })
-
-                if not serializer.is_valid():
-                    return Response(
-                        serializer.errors,
-                        status=status.HTTP_400_BAD_REQUEST
-                    )
+        try:
+            shifts = [int(shift) for shift in shifts]
+            employees = [int(employee) for employee in employees]
+        except (TypeError, ValueError):
+            return Response(validators.error_object('Invalid shifts or employees for the invite'),
+                            status=status.HTTP_400_BAD_REQUEST)
 
-                serializer.save()
-                invites.append(serializer.data)
+        if request.user.profile.employer is None:
+            return Response(validators.error_object('Only employers can invite talents'),
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        # all the pairs are checked and invited at once, the notifications go out after the commit
+        with transaction.atomic(), notification_queue.deferred(), employer_stats.deferred():
+            outcomes = invite_actions.invite_talents(request.user.profile, shifts, employees)
+
+        for outcome in outcomes:
+            if outcome['invite'] is not None:
+                outcome['invite'] = shift_serializer.ShiftCreateInviteSerializer(outcome['invite']).data
 
-        return Response(invites, status=status.HTTP_201_CREATED)
+        # the pairs without conflicts are invited anyway, the outcomes say which ones failed
+        failed = any(outcome['status'] not in invite_actions.SENT for outcome in outcomes)
+        return Response(outcomes, status=status.HTTP_400_BAD_REQUEST if failed else status.HTTP_201_CREATED)
 
     def delete(self, request, id):
 
@@ -612,6 +618,20 @@ class FavListEmployeeView(EmployerView):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
+def create_recurring_shifts(request):
+    """Creates the shift of the request on every one of its multiple_dates"""
+    serializer = shift_serializer.RecurringShiftPostSerializer(data=request.data, context={"request": request})
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+    with transaction.atomic(), notification_queue.deferred():
+        shifts = serializer.save()
+
+    created = shift_serializer.ShiftGetSerializer.setup_eager_loading(
+        Shift.objects.filter(id__in=[shift.id for shift in shifts])).order_by('id')
+    return Response(shift_serializer.ShiftGetSerializer(created, many=True).data, status=status.HTTP_201_CREATED)
+
+
 class EmployerShiftView(EmployerView, HeaderLimitOffsetPagination):
     def get(self, request, id=False):
         if id:
@@ -701,10 +721,6 @@ class EmployerShiftView(EmployerView, HeaderLimitOffsetPagination):
                 emp_list = qCandidateNot.split(',')
                 shifts = shifts.exclude(candidates__in=[int(emp) for emp in emp_list])
 
-            shifts = shifts.select_related('venue', 'position')
-            paginator = HeaderLimitOffsetPagination()
-            page = paginator.paginate_queryset(shifts.order_by('-starting_at'), request)
-
             defaultSerializer = shift_serializer.ShiftGetSmallSerializer
             
          
@@ -712,6 +728,11 @@ class EmployerShiftView(EmployerView, HeaderLimitOffsetPagination):
             if qSerializer is not None and qSerializer == "big":
                 defaultSerializer = shift_serializer.ShiftGetBigListSerializer
 
+            shifts = defaultSerializer.setup_eager_loading(shifts)
+            ordering = ('-starting_at', '-id')
+            paginator = get_list_paginator(request, ordering)
+            page = paginator.paginate_queryset(shifts.order_by(*ordering), request)
+
             if page is not None:
                 
                 serializer = defaultSerializer(page, many=True)
@@ -724,17 +745,7 @@ class EmployerShiftView(EmployerView, HeaderLimitOffsetPagination):
         _all_serializers = []
         request.data["employer"] = self.employer.id
         if 'multiple_dates' in request.data:
-            for date in request.data['multiple_dates']:
-                shift_date = dict(date)
-                data = dict(request.data)
-                data["starting_at"] = shift_date['starting_at']
-                data["ending_at"] = shift_date['ending_at']
-                data.pop('multiple_dates', None)
-                serializer = shift_serializer.ShiftPostSerializer( data=data, context={"request": request})
-                if serializer.is_valid():
-                    _all_serializers.append(serializer)
-                else:
-                    return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+            return create_recurring_shifts(request)
         else:
             serializer = shift_serializer.ShiftPostSerializer( data=request.data, context={"request": request})
             if serializer.is_valid():
@@ -864,15 +875,16 @@ class EmployerShiftNewView(EmployerView, HeaderLimitOffsetPagination):
                 emp_list = qCandidateNot.split(',')
                 shifts = shifts.exclude(candidates__in=[int(emp) for emp in emp_list])
 
-            shifts = shifts.select_related('venue', 'position')
-            paginator = HeaderLimitOffsetPagination()
-            page = paginator.paginate_queryset(shifts.order_by('-starting_at'), request)
-
             defaultSerializer = shift_serializer.ShiftGetSmallSerializer
             qSerializer = request.GET.get('serializer')
             if qSerializer is not None and qSerializer == "big":
                 defaultSerializer = shift_serializer.ShiftGetBigListSerializer
 
+            shifts = defaultSerializer.setup_eager_loading(shifts)
+            ordering = ('-starting_at', '-id')
+            paginator = get_list_paginator(request, ordering)
+            page = paginator.paginate_queryset(shifts.order_by(*ordering), request)
+
             if page is not None:
                 serializer = defaultSerializer(page, many=True)
                 return paginator.get_paginated_response(serializer.data)
@@ -883,17 +895,7 @@ class EmployerShiftNewView(EmployerView, HeaderLimitOffsetPagination):
         _all_serializers = []
         request.data["employer"] = self.employer.id
         if 'multiple_dates' in request.data:
-            for date in request.data['multiple_dates']:
-                shift_date = dict(date)
-                data = dict(request.data)
-                data["starting_at"] = shift_date['starting_at']
-                data["ending_at"] = shift_date['ending_at']
-                data.pop('multiple_dates', None)
-                serializer = shift_serializer.ShiftPostSerializer( data=data, context={"request": request})
-                if serializer.is_valid():
-                    _all_serializers.append(serializer)
-                else:
-                    return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+            return create_recurring_shifts(request)
         else:
             serializer = shift_serializer.ShiftPostSerializer(data=request.data, context={"request": request})
             if serializer.is_valid():
@@ -1151,7 +1153,8 @@ class EmployerMeEmployeePaymentListView(EmployerView):
 
     def get(self, request, period_id):
         ser_employer = payment_serializer.EmployerInfoPaymentSerializer(self.employer)
-        qs = self.get_queryset(period_id).order_by('id')
+        qs = payment_serializer.EmployeePaymentSerializer.setup_eager_loading(
+            self.get_queryset(period_id).order_by('id'))
         ser_payments = payment_serializer.EmployeePaymentSerializer(qs, many=True,
                                                                     context={'employer_id': self.employer.id})
         return Response({'employer': ser_employer.data, 'payroll_period': period_id, 'payments': ser_payments.data},
@@ -1186,60 +1189,71 @@ class EmployerMeEmployeePaymentView(EmployerView):
             employee_payment.deduction_list = request.data["deductions_list"]
             employee_payment.taxes = emp_pay_ser.data['taxes']
             employee_payment.amount = decimal.Decimal(emp_pay_ser.data['earnings']) - decimal.Decimal(request.data["deductions"])
-            with transaction.atomic():
-                employee_payment.save()
-                if serializer.validated_data['payment_type'] in [PaymentTransaction.ELECT_TRANSF,
-                                                                 PaymentTransaction.FAKE]:
-                    # make the payment using Stripe service
-                    sender_bank_acc = BankAccount.objects.get(
-                        id=serializer.validated_data['payment_data']['employer_bank_account_id'])
-                    receiver_bank_acc = BankAccount.objects.get(
-                        id=serializer.validated_data['payment_data']['employee_bank_account_id'])
-                    if serializer.validated_data['payment_type'] == PaymentTransaction.FAKE:
-                        transaction_id = 'ABC123'
-                    else:
-                        try:
-                            charge = stripe.Charge.create(amount='{:.0f}'.format(employee_payment.amount * 100),
-                                                          currency='usd',
-                                                          customer=sender_bank_acc.stripe_customer_id,
-                                                          source=sender_bank_acc.stripe_bankaccount_id,
-                                                          transfer_data={'destination': receiver_bank_acc.stripe_account_id}
-                                                          )
-                        except Exception as e:
-                            return Response({'details': 'Error with Stripe: ' + str(e)},
-                                            status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-                        transaction_id = charge.id
-                    payment_t = PaymentTransaction.objects.create(
-                        amount=employee_payment.amount,
-                        sender_user=sender_bank_acc.user.user,
-                        receiver_user=context_data['employee_user'],
-                        payment_type=serializer.validated_data['payment_type'],
-                        payment_data={"service_name": "Stripe",
-                                      "sender_stripe_token": sender_bank_acc.stripe_bankaccount_id,
-                                      "receiver_stripe_token": receiver_bank_acc.stripe_bankaccount_id,
-                                      "transaction_id": transaction_id
-                                      },
-                    )
-                else:
-                    payment_t = PaymentTransaction.objects.create(amount=employee_payment.amount,
-                                                                  sender_user=context_data['employer_user'],
-                                                                  receiver_user=context_data['employee_user'],
-                                                                  )
-                # set status for related entries as paid
-                employee_payment.payment_transaction = payment_t
-                employee_payment.paid = True
-                employee_payment.save()
-                PayrollPeriodPayment.objects.filter(payroll_period=employee_payment.payroll_period,
-                                                    employee=employee_payment.employee,
-                                                    employer=employee_payment.employer,
-                                                    status=APPROVED).update(status=PAID)
-                employee_payment.payroll_period.status = PAID
-                employee_payment.payroll_period.save()
+            payment_type = serializer.validated_data['payment_type']
+            sender_bank_acc = receiver_bank_acc = None
+            sender_user = context_data['employer_user']
+            if payment_type in [PaymentTransaction.ELECT_TRANSF, PaymentTransaction.FAKE]:
+                # make the payment using Stripe service
+                sender_bank_acc = BankAccount.objects.get(
+                    id=serializer.validated_data['payment_data']['employer_bank_account_id'])
+                receiver_bank_acc = BankAccount.objects.get(
+                    id=serializer.validated_data['payment_data']['employee_bank_account_id'])
+                sender_user = sender_bank_acc.user.user
+            # the payment cannot be charged while a payout or another request is paying it
+            try:
+                payouts.claim_employee_payment(employee_payment, receiver_bank_acc)
+            except payouts.PayoutError as e:
+                return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+            try:
+                payouts.pay_employee_payment(employee_payment, payment_type, sender_user,
+                                             context_data['employee_user'], sender_bank_acc)
+            except Exception as e:
+                return Response({'details': 'Error with Stripe: ' + str(e)},
+                                status=status.HTTP_500_INTERNAL_SERVER_ERROR)
             return Response({'message': 'success'}, status=status.HTTP_200_OK)
         else:
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
+class EmployerMePayrollPayoutView(EmployerView):
+    """To pay all the employee payments of a period, the charges are sent by the process_payouts worker"""
+
+    def get_period(self, period_id):
+        try:
+            return PayrollPeriod.objects.get(id=period_id, employer_id=self.employer.id)
+        except PayrollPeriod.DoesNotExist:
+            return None
+
+    def get(self, request, period_id):
+        period = self.get_period(period_id)
+        if period is None:
+            return Response(validators.error_object('The payroll period was not found'),
+                            status=status.HTTP_404_NOT_FOUND)
+        payout = period.payouts.order_by('-id').first()
+        if payout is None:
+            return Response(validators.error_object('The payroll period has not been paid'),
+                            status=status.HTTP_404_NOT_FOUND)
+        return Response(payouts.get_progress(payout), status=status.HTTP_200_OK)
+
+    def post(self, request, period_id):
+        period = self.get_period(period_id)
+        if period is None:
+            return Response(validators.error_object('The payroll period was not found'),
+                            status=status.HTTP_404_NOT_FOUND)
+        if period.status == OPEN:
+            return Response(validators.error_object('The payroll period has to be finalized before paying it'),
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        serializer = payment_serializer.PayrollPayoutSerializer(data=request.data, context={'employer': self.employer})
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        # starting the payout of a period that is being paid returns the payout in progress
+        payout = payouts.start_payout(period, serializer.validated_data['payment_type'], request.user,
+                                      serializer.validated_data['employer_bank_account'])
+        return Response(payouts.get_progress(payout), status=status.HTTP_202_ACCEPTED)
+
+
 class EmployeerRateView(EmployerView):
 
     def get_queryset(self):
@@ -1306,20 +1320,67 @@ class EmployeerRateView(EmployerView):
 
 
 class EmployerBatchActions(EmployerView):
+    """
+    Updates many shifts at once: {"changes": {"shifts": {"<shift id>": {<fields to update>}}}}.
+    Every change is validated first and they are applied in one transaction only if all of
+    them are valid, the notifications of all the shifts are queued together at the end.
+    """
+    entities = ('shifts', 'shift')
+
+    def _parse_changes(self, changes, results):
+        shift_changes = []
+        for entity, items in changes.items():
+            for key, data in (items.items() if isinstance(items, dict) else []):
+                result = {"entity": entity, "id": key}
+                results.append(result)
+                if entity not in self.entities:
+                    result.update(status="error", errors=["Unknown entity"])
+                elif not str(key).isdigit() or not isinstance(data, dict):
+                    result.update(status="error", errors=["Invalid change"])
+                else:
+                    shift_changes.append((int(key), data, result))
+        return shift_changes
 
     def post(self, request):
-
-        log = []
-        changes = request.data['changes']
-        for entity in changes:
-            for key in changes[entity]:
-                shift = Shift.objects.get(id=key)
-                serializer = shift_serializer.ShiftUpdateSerializer(shift, data=changes[entity][key], context={"request": request })
+        changes = request.data.get('changes')
+        if not isinstance(changes, dict):
+            return Response(validators.error_object('Missing changes'), status=status.HTTP_400_BAD_REQUEST)
+
+        results = []
+        with metrics.count_queries() as queries:
+            shift_changes = self._parse_changes(changes, results)
+            ids = [id for id, _, _ in shift_changes]
+            shifts = Shift.objects.filter(id__in=ids, employer_id=self.employer.id)\
+                .select_related('position', 'venue', 'employer').in_bulk()
+            shifts_with_clockins = set(Clockin.objects.filter(shift_id__in=ids).values_list('shift_id', flat=True))
+
+            serializers = []
+            for id, data, result in shift_changes:
+                if id not in shifts:
+                    result.update(status="error", errors=["This shift was not found"])
+                    continue
+                serializer = shift_serializer.ShiftUpdateSerializer(
+                    shifts[id], data=data, partial=True,
+                    context={"request": request, "shifts_with_clockins": shifts_with_clockins})
                 if serializer.is_valid():
-                    serializer.save()
-                    log.append("Updating "+entity+" ")
-
-        return Response(log, status=status.HTTP_200_OK)
+                    result.update(status="valid")
+                    serializers.append((serializer, result))
+                else:
+                    result.update(status="error", errors=serializer.errors)
+
+            applied = len(serializers) == len(results)
+            if applied:
+                with transaction.atomic(), notification_queue.deferred(), employer_stats.deferred():
+                    for serializer, result in serializers:
+                        serializer.save()
+                        result.update(status="updated")
+
+        return Response({
+            "applied": applied,
+            "results": results,
+            "queries": queries.queries,
+            "sql_time_ms": round(queries.sql_seconds * 1000, 2),
+        }, status=status.HTTP_200_OK if applied else status.HTTP_400_BAD_REQUEST)
 
 
 class EmployerPaymentDeductionView(EmployerView):
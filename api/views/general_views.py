@@ -9,8 +9,8 @@ import cloudinary.api
 
 from django.contrib.auth.models import User
 from django.contrib.postgres.search import SearchVector
-from django.db.models import Q, F
-from django.http import HttpResponse
+from django.db.models import Count, Q, F
+from django.http import HttpResponse, StreamingHttpResponse
 from django.utils import timezone
 
 from jwt.exceptions import DecodeError, ExpiredSignatureError
@@ -22,19 +22,20 @@ from rest_framework.permissions import (
 )
 from rest_framework.response import Response
 from rest_framework.serializers import ValidationError
+from rest_framework.utils.encoders import JSONEncoder
 from rest_framework.views import APIView
 from rest_framework_jwt.settings import api_settings
 
 from django.http import JsonResponse
 
 import api.utils.jwt
-from api.pagination import HeaderLimitOffsetPagination
+from api.pagination import HeaderLimitOffsetPagination, get_list_paginator
 
 from api.models import *
 from api.utils.notifier import notify_password_reset_code, notify_email_validation,notify_sms_validation, notify_company_invite_confirmation, notify_sms_validation
-from api.utils import validators
+from api.utils import reference_cache, talent_search, tokens, validators
 from api.utils.validators import html_error
-from api.utils.utils import get_aware_datetime
+from api.utils.utils import get_aware_datetime, parse_aware_datetime, stream_json_list
 
 from api.serializers import (
     user_serializer, profile_serializer, employee_serializer, other_serializer, payment_serializer, shift_serializer
@@ -52,7 +53,6 @@ import os
 from twilio.rest import Client
 
  
-jwt_decode_handler = api_settings.JWT_DECODE_HANDLER
 jwt_encode_handler = api_settings.JWT_ENCODE_HANDLER
 
 TODAY = datetime.datetime.now(tz=timezone.utc)
@@ -67,7 +67,7 @@ class ValidateEmailView(APIView):
         token = request.GET.get('token')
 
         try:
-            payload = jwt_decode_handler(token)
+            payload = tokens.decode(token)
         except (DecodeError, ExpiredSignatureError) as e:
             return html_error('Your email validation link has expired, please resend it and try again')
 
@@ -80,7 +80,11 @@ class ValidateEmailView(APIView):
             try:
                 # db_token = UserToken.objects.get(token=token, email=user.email)
                 # db_token.delete()
+                tokens.revoke(payload)
+            except DecodeError:
+                return html_error('Your email validation link has expired, please resend it and try again')
 
+            try:
                 user.profile.status = 'ACTIVE'  # email validation completed
                 user.profile.save()
 
@@ -184,7 +188,7 @@ class ValidateEmailCompanyView(APIView):
         token = request.GET.get('token')
 
         try:
-            payload = jwt_decode_handler(token)
+            payload = tokens.decode(token)
         except (DecodeError, ExpiredSignatureError) as e:
             return html_error('Your company invitation link has expired')
 
@@ -200,6 +204,11 @@ class ValidateEmailCompanyView(APIView):
             try:
                 # db_token = UserToken.objects.get(token=token, email=user.email)
                 # db_token.delete()
+                tokens.revoke(payload)
+            except DecodeError:
+                return html_error('Your company invitation link has expired')
+
+            try:
                 if user.profile.employer is None:
                    
                     employer = Employer.objects.get(id=payload["employer_id"])  
@@ -226,7 +235,7 @@ class ValidateEmailCompanyView(APIView):
                 jobcore_invites = JobCoreInvite.objects.all().filter(email=user.email, employer=employer)
 
                 jobcore_invites.update(status='ACCEPTED')
-                
+
                 return HttpResponse(template['html'])
 
             except UserToken.DoesNotExist:
@@ -311,7 +320,7 @@ class PasswordView(APIView):
 
         token = request.GET.get('token')
         try:
-            data = jwt_decode_handler(token)
+            data = tokens.decode(token)
         except DecodeError as e:
             return html_error('Invalid Token')
 
@@ -459,15 +468,7 @@ class EmployeeView(APIView, HeaderLimitOffsetPagination):
 
             qName = request.GET.get('full_name')
             if qName:
-                search_args = []
-                for term in qName.split():
-                    for query in ('profile__user__first_name__icontains',
-                                  'profile__user__last_name__icontains'):
-                        search_args.append(Q(**{query: term.lower()}))
-
-                print(search_args)
-                employees = employees.filter(
-                    functools.reduce(operator.or_, search_args))
+                employees = talent_search.filter_queryset(employees, qName)
             else:
                 qFirst = request.GET.get('first_name')
                 if qFirst:
@@ -491,8 +492,9 @@ class EmployeeView(APIView, HeaderLimitOffsetPagination):
             if qRating:
                 employees = employees.filter(rating__gte=qRating[0])
 
-            paginator = HeaderLimitOffsetPagination()
-            page = paginator.paginate_queryset(employees.order_by('-created_at'), request)
+            ordering = ('-created_at', '-id')
+            paginator = get_list_paginator(request, ordering)
+            page = paginator.paginate_queryset(employees.order_by(*ordering), request)
 
             defaultSerializer = employee_serializer.EmployeeGetSmallSerializer
             
@@ -651,20 +653,21 @@ class ProfileMeResumeView(APIView):
 class PositionView(APIView):
     def get(self, request, id=False):
         if (id):
-            try:
-                position = Position.objects.get(id=id)
-            except Position.DoesNotExist:
+            def build():
+                position = Position.objects.filter(id=id).first()
+                return position_serializer.PositionSerializer(position).data if position else None
+
+            response = reference_cache.cached_response(request, reference_cache.POSITIONS, 'id:{}'.format(id), build)
+            if response is None:
                 return Response(validators.error_object(
                     'Not found.'), status=status.HTTP_404_NOT_FOUND)
+            return response
 
-            serializer = position_serializer.PositionSerializer(
-                position, many=False)
-        else:
+        def build():
             positions = Position.objects.filter(status='ACTIVE').order_by('title')
-            serializer = position_serializer.PositionSerializer(
-                positions, many=True)
+            return position_serializer.PositionSerializer(positions, many=True).data
 
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        return reference_cache.cached_response(request, reference_cache.POSITIONS, 'list', build)
 
     def post(self, request):
         serializer = position_serializer.PositionSerializer(data=request.data)
@@ -708,62 +711,69 @@ class CityView(APIView):
 
     def get(self, request, id=None):
         if (id):
-            try:
-                city = City.objects.get(pk=id)
-            except City.DoesNotExist:
+            def build():
+                city = City.objects.filter(pk=id).first()
+                return other_serializer.CitySerializer(city).data if city else None
+
+            response = reference_cache.cached_response(request, reference_cache.CITIES, 'id:{}'.format(id), build)
+            if response is None:
                 return Response(validators.error_object(
                     'Not found.'), status=status.HTTP_404_NOT_FOUND)
+            return response
 
-            serializer = other_serializer.CitySerializer(city, many=False)
-
-        else:
-            cities = City.objects.all()
-            serializer = other_serializer.CitySerializer(cities, many=True)
+        def build():
+            return other_serializer.CitySerializer(City.objects.all(), many=True).data
 
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        return reference_cache.cached_response(request, reference_cache.CITIES, 'list', build)
 
 class SubscriptionsView(APIView):
     permission_classes = [AllowAny]
 
     def get(self, request, id=None):
         if (id):
-            try:
+            def build():
                 # aqui se esta haciendo un query al model de SubscriptionPlan
-                subscription = SubscriptionPlan.objects.get(pk=id)
-            except SubscriptionPlan.DoesNotExist:
+                subscription = SubscriptionPlan.objects.filter(pk=id).first()
+                return other_serializer.SubscriptionSerializer(subscription).data if subscription else None
+
+            response = reference_cache.cached_response(
+                request, reference_cache.SUBSCRIPTIONS, 'id:{}'.format(id), build)
+            if response is None:
                 return Response(validators.error_object(
                     'Not found.'), status=status.HTTP_404_NOT_FOUND)
+            return response
 
-            serializer = other_serializer.SubscriptionSerializer(subscription, many=False)
+        qsVisibility = request.GET.get('visibility')
+        visibility = 'all' if qsVisibility == 'all' else 'visible'
 
-        else:
+        def build():
             # aqui esta sacando todos los subc plans y los pone en una variable
-            subs = SubscriptionPlan.objects.all() 
-
-            qsVisibility = request.GET.get('visibility')
-            if qsVisibility is None or qsVisibility != 'all':
+            subs = SubscriptionPlan.objects.all()
+            if visibility != 'all':
                 subs = subs.filter(visible_to_users=True)
+            return other_serializer.SubscriptionSerializer(subs, many=True).data
 
-            serializer = other_serializer.SubscriptionSerializer(subs, many=True)
-
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        return reference_cache.cached_response(
+            request, reference_cache.SUBSCRIPTIONS, 'list:{}'.format(visibility), build)
 
 
 class BadgeView(APIView):
     def get(self, request, id=False):
         if (id):
-            try:
-                badge = Badge.objects.get(id=id)
-            except Badge.DoesNotExist:
+            def build():
+                badge = Badge.objects.filter(id=id).first()
+                return other_serializer.BadgeSerializer(badge).data if badge else None
+
+            response = reference_cache.cached_response(request, reference_cache.BADGES, 'id:{}'.format(id), build)
+            if response is None:
                 return Response(validators.error_object(
                     'Not found.'), status=status.HTTP_404_NOT_FOUND)
+            return response
 
-            serializer = other_serializer.BadgeSerializer(badge, many=False)
-        else:
-            badges = Badge.objects.all()
-            serializer = other_serializer.BadgeSerializer(badges, many=True)
+        def build():
+            return other_serializer.BadgeSerializer(Badge.objects.all(), many=True).data
 
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        return reference_cache.cached_response(request, reference_cache.BADGES, 'list', build)
 
     def post(self, request):
         permission_classes = (IsAdminUser,)
@@ -876,38 +886,39 @@ class CatalogView(APIView):
     def get(self, request, catalog_type):
 
         if catalog_type == 'employees':
-            employees = User.objects.exclude(employee__isnull=True)
+            qPositions = request.GET.getlist('positions')
+            qBadges = request.GET.getlist('badges')
 
             qName = request.GET.get('full_name')
             if qName:
-                search_args = []
-                for term in qName.split():  # first_name__unaccent__startswith
-                    for query in ('profile__user__first_name__unaccent__istartswith',
-                                  'profile__user__last_name__unaccent__istartswith'):
-                        search_args.append(Q(**{query: term}))
-
-                employees = employees.filter(
-                    functools.reduce(operator.or_, search_args))
+                # typeahead: the best matches of the name, email, positions and badges
+                talents = Employee.objects.select_related('user')
+                if qPositions:
+                    talents = talents.filter(positions__id__in=qPositions)
+                if qBadges:
+                    talents = talents.filter(badges__id__in=qBadges)
+                talents = talent_search.search(talents.distinct(), qName, talent_search.get_limit(request.GET.get('limit')))
+                return Response([{
+                    "label": emp.user.first_name + ' ' + emp.user.last_name,
+                    "value": emp.id
+                } for emp in talents], status=status.HTTP_200_OK)
 
-            qPositions = request.GET.getlist('positions')
+            employees = User.objects.exclude(employee__isnull=True)
             if qPositions:
-                employees = employees.filter(positions__id__in=qPositions)
-
-            qBadges = request.GET.getlist('badges')
+                employees = employees.filter(employee__positions__id__in=qPositions)
             if qBadges:
-                employees = employees.filter(badges__id__in=qBadges)
+                employees = employees.filter(employee__badges__id__in=qBadges)
 
-            employees = map(
-                lambda emp: {
-                    "label": emp["first_name"] +
-                             ' ' +
-                             emp["last_name"],
-                    "value": emp["profile__employee__id"]},
-                employees.values(
-                    'first_name',
-                    'last_name',
-                    'profile__employee__id'))
-            return Response(employees, status=status.HTTP_200_OK)
+            def build():
+                return [{
+                    "label": emp["first_name"] + ' ' + emp["last_name"],
+                    "value": emp["profile__employee__id"]
+                } for emp in employees.values('first_name', 'last_name', 'profile__employee__id')]
+
+            # only the unfiltered catalog is the same for everyone
+            if qPositions or qBadges:
+                return Response(build(), status=status.HTTP_200_OK)
+            return reference_cache.cached_response(request, reference_cache.TALENTS, 'employees', build)
 
         if catalog_type == 'profiles':
             profiles = User.objects.all()
@@ -922,43 +933,30 @@ class CatalogView(APIView):
 
                 profiles = profiles.filter(
                     functools.reduce(operator.or_, search_args))
-            
-            profiles = map(
-                lambda emp: {
-                    "label": emp["first_name"] +
-                             ' ' +
-                             emp["last_name"],
-                    "value": emp["profile__id"]},
-                profiles.values(
-                    'first_name',
-                    'last_name',
-                    'profile__id'))
-            return Response(profiles, status=status.HTTP_200_OK)
+
+            def build():
+                return [{
+                    "label": emp["first_name"] + ' ' + emp["last_name"],
+                    "value": emp["profile__id"]
+                } for emp in profiles.values('first_name', 'last_name', 'profile__id')]
+
+            if qName:
+                return Response(build(), status=status.HTTP_200_OK)
+            return reference_cache.cached_response(request, reference_cache.TALENTS, 'profiles', build)
 
         elif catalog_type == 'positions':
-            positions = Position.objects.exclude().order_by("title")
-            
-            positions = map(
-                lambda emp: {
-                    "label": emp["title"],
-                    "value": emp["id"]},
-                positions.values(
-                    'title',
-                    'id'))
+            def build():
+                positions = Position.objects.exclude().order_by("title")
+                return [{"label": pos["title"], "value": pos["id"]} for pos in positions.values('title', 'id')]
 
-        
-            return Response(positions, status=status.HTTP_200_OK)
+            return reference_cache.cached_response(request, reference_cache.POSITIONS, 'catalog', build)
 
         elif catalog_type == 'badges':
-            badges = Badge.objects.exclude().order_by("title")
-            badges = map(
-                lambda emp: {
-                    "label": emp["title"],
-                    "value": emp["id"]},
-                badges.values(
-                    'title',
-                    'id'))
-            return Response(badges, status=status.HTTP_200_OK)
+            def build():
+                badges = Badge.objects.exclude().order_by("title")
+                return [{"label": badge["title"], "value": badge["id"]} for badge in badges.values('title', 'id')]
+
+            return reference_cache.cached_response(request, reference_cache.BADGES, 'catalog', build)
         elif catalog_type == 'narrow-preferences':
             return Response({
                 'minimum_job_distance_miles': 20,
@@ -970,47 +968,46 @@ class CatalogView(APIView):
         return Response("no catalog", status=status.HTTP_200_OK)
 
 
+# longest range of dates the payroll of the clockins can be asked for
+PAYROLL_MAX_DAYS = 93
+
+
 class PayrollShiftsView(APIView, HeaderLimitOffsetPagination):
     def get(self, request):
 
-        clockins = Clockin.objects.all()
+        employer = request.user.profile.employer
+        if employer is None:
+            return Response(
+                validators.error_object("You don't seem to be an employer"),
+                status=status.HTTP_400_BAD_REQUEST)
+
+        clockins = Clockin.objects.filter(shift__employer_id=employer.id)
 
         qStatus = request.GET.get('status')
         if qStatus is not None:
-            clockins = Clockin.objects.filter(status=qStatus)
+            clockins = clockins.filter(status=qStatus)
 
         qShift = request.GET.get('shift')
         if qShift is not None and qShift != '':
             clockins = clockins.filter(shift=qShift)
         else:
-            qEnded_at = request.GET.get('ending_at')
-            if qEnded_at is not None and qEnded_at != '':
-                clockins = clockins.filter(ended_at__lte=qEnded_at)
-
-            qStarted_at = request.GET.get('starting_at')
-            if qStarted_at is not None and qStarted_at != '':
-                clockins = clockins.filter(started_at__gte=qStarted_at)
-
-        payrolDic = {}
-        for clockin in clockins:
-            clockinSerialized = clockin_serializer.ClockinGetSerializer(
-                clockin)
-            if str(clockin.employee.id) in payrolDic:
-                payrolDic[str(clockin.employee.id)]["clockins"].append(
-                    clockinSerialized.data)
-            else:
-                employeeSerialized = employee_serializer.EmployeeGetSmallSerializer(  # NOQA
-                    clockin.employee)
-                payrolDic[str(clockin.employee.id)] = {
-                    "clockins": [clockinSerialized.data],
-                    "talent": employeeSerialized.data
-                }
-
-        payrol = []
-        for key, value in payrolDic.items():
-            payrol.append(value)
+            starting_at = parse_aware_datetime(request.GET.get('starting_at') or '')
+            ending_at = parse_aware_datetime(request.GET.get('ending_at') or '')
+            if starting_at is None or ending_at is None:
+                return Response(
+                    validators.error_object('You need to specify a valid starting_at and ending_at, or a shift'),
+                    status=status.HTTP_400_BAD_REQUEST)
+            if ending_at < starting_at or ending_at - starting_at > datetime.timedelta(days=PAYROLL_MAX_DAYS):
+                return Response(
+                    validators.error_object(
+                        'The payroll can be retrieved for up to {} days at a time'.format(PAYROLL_MAX_DAYS)),
+                    status=status.HTTP_400_BAD_REQUEST)
+            clockins = clockins.filter(started_at__gte=starting_at, ended_at__lte=ending_at)
 
-        return Response(payrol, status=status.HTTP_200_OK)
+        # one talent at a time, the database does the grouping
+        return StreamingHttpResponse(
+            stream_json_list(clockin_serializer.iter_payroll_talents(clockins), encoder=JSONEncoder),
+            content_type='application/json')
 
     def put(self, request, id):
 
@@ -1271,11 +1268,12 @@ class OnboardingView(APIView):
             ]
         }
 
+        # the slides are static, the ETag lets the apps skip downloading them again
         if view_slug is None:
-            return Response(views, status=status.HTTP_200_OK)
+            return reference_cache.conditional_response(request, views)
         else:
             if view_slug in views:
-                return Response(views[view_slug], status=status.HTTP_200_OK)
+                return reference_cache.conditional_response(request, views[view_slug])
             else:
                 return Response([], status=status.HTTP_200_OK)
 
@@ -1338,9 +1336,11 @@ class PublicShiftView(APIView, HeaderLimitOffsetPagination):
             shifts = shifts.filter(
                 functools.reduce(operator.or_, search_args))
      
-        shifts = shifts.order_by('-starting_at')
+        shifts = shift_serializer.ShiftGetPublicTinySerializer.setup_eager_loading(shifts)
+        ordering = ('-starting_at', '-id')
+        shifts = shifts.order_by(*ordering)
 
-        paginator = HeaderLimitOffsetPagination()
+        paginator = get_list_paginator(request, ordering)
         page = paginator.paginate_queryset(shifts, request)
         if page is not None:
             serializer = shift_serializer.ShiftGetPublicTinySerializer(page, many=True)
@@ -1355,18 +1355,20 @@ class AppVersionView(APIView):
     def get(self, request, version=None):
 
         if version:
-            try:
+            def build():
                 if version == 'last':
                     app_version = AppVersion.objects.last()
                 else:
-                    app_version = AppVersion.objects.get(version=version)
-
-                serializer = other_serializer.AppVersionSerializer(app_version, many=False)
-                return Response(serializer.data, status=status.HTTP_200_OK)
+                    app_version = AppVersion.objects.filter(version=version).first()
+                return other_serializer.AppVersionSerializer(app_version).data if app_version else None
 
-            except AppVersion.DoesNotExist:
+            response = reference_cache.cached_response(
+                request, reference_cache.APP_VERSIONS, 'version:{}'.format(version), build)
+            if response is None:
                 return Response({"detail": "The app version was not found"}, status=status.HTTP_404_NOT_FOUND)
+            return response
+
+        def build():
+            return other_serializer.AppVersionSerializer(AppVersion.objects.all(), many=True).data
 
-        versions = AppVersion.objects.all()
-        serializer = other_serializer.AppVersionSerializer(versions, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
\ No newline at end of file
+        return reference_cache.cached_response(request, reference_cache.APP_VERSIONS, 'list', build)
\ No newline at end of file
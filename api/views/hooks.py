@@ -1,27 +1,21 @@
-import pytz
-utc = pytz.UTC
-from datetime import datetime, timedelta
 from rest_framework import status
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.permissions import AllowAny, IsAuthenticated, IsAuthenticatedOrReadOnly
 
-import cloudinary
-import cloudinary.uploader
-import cloudinary.api
-
-from django.db.models import F, Func, Count, Q
+from django.db.models import Func, Count
 
 from django.contrib.auth.models import User
-from api.models import (Employee, Shift, ShiftInvite, ShiftApplication, Clockin, Employer, AvailabilityBlock, FavoriteList, Venue, JobCoreInvite,
-                        Rate, FCMDevice, Notification, PayrollPeriod, PayrollPeriodPayment, Profile, Position, EmployeeDocument)
+from api.models import (Employee, ShiftInvite, Employer, AvailabilityBlock, FavoriteList, Venue, JobCoreInvite,
+                        Rate, FCMDevice, Notification, PayrollPeriod, PayrollPeriodPayment, Profile, Position)
 
-from api.actions import employee_actions
+from api.actions import employee_actions, shift_actions
 from api.serializers import clockin_serializer, payment_serializer, shift_serializer
 
 from rest_framework import serializers
 
 from api.utils.loggers import log_debug
+from api.utils import document_storage, notification_queue, payouts
 
 class ShiftInviteGetSmallSerializer(serializers.ModelSerializer):
     class Meta:
@@ -44,9 +38,37 @@ class ClockOutExpiredShifts(APIView):
 
     def get(self, request):
 
-        _status = process_expired_shifts()
+        summary = process_expired_shifts()
+
+        return Response(summary, status=status.HTTP_200_OK)
+
+class ProcessNotificationsView(APIView):
+    permission_classes = [AllowAny]
+
+    def get(self, request):
+
+        summary = notification_queue.process_queue()
+        summary['queue'] = notification_queue.queue_depth()
+
+        return Response(summary, status=status.HTTP_200_OK)
+
+class ProcessDocumentsView(APIView):
+    permission_classes = [AllowAny]
+
+    def get(self, request):
+
+        summary = document_storage.process_uploads()
 
-        return Response({"status": str(_status)}, status=status.HTTP_200_OK)
+        return Response(summary, status=status.HTTP_200_OK)
+
+class ProcessPayoutsView(APIView):
+    permission_classes = [AllowAny]
+
+    def get(self, request):
+
+        summary = payouts.process_payouts()
+
+        return Response(summary, status=status.HTTP_200_OK)
 
 class GeneratePeriodsView(APIView):
     permission_classes = [AllowAny]
@@ -98,52 +120,17 @@ class RemoveEmployeesWithoutProfile(APIView):
         return Response({ "ok" : str(total)+" user deleted" }, status=status.HTTP_200_OK)
 
 
-def process_expired_shifts():
-
-        NOW = utc.localize(datetime.now())
-        # if now > shift.ending_at + delta:
-        clockins = Clockin.objects.filter(
-            ended_at__isnull=True, 
-            status='PENDING',
-            shift__maximum_clockout_delay_minutes__isnull=False, 
-            shift__ending_at__lte= NOW - (timedelta(minutes=1) * F('shift__maximum_clockout_delay_minutes'))
-        ).select_related('shift')
-        for clockin in clockins:
-            clockin.ended_at = clockin.shift.ending_at + timedelta(minutes=clockin.shift.maximum_clockout_delay_minutes)
-            clockin.automatically_closed = True
-            clockin.save()
-
-        # also expire the shift if its still open or filled but it has ended (ended_at + delay)
-        Shift.objects.filter(maximum_clockout_delay_minutes__isnull=False, ending_at__lte= NOW - (timedelta(minutes=1) * F('maximum_clockout_delay_minutes')), status__in=['OPEN', 'FILLED']).update(status='EXPIRED')
-        # also expire shift if it has passed and no clockouts are pending (delay == null)
-        Shift.objects.annotate(
-            open_clockins=Count('clockin', filter=Q(clockin__ended_at__isnull=True))
-        ).filter(
-            maximum_clockout_delay_minutes__isnull=True, 
-            ending_at__lte= NOW, 
-            status__in=['OPEN', 'FILLED'], 
-            open_clockins=0
-        ).update(status='EXPIRED')
-
-        # expire pending invites with passed shifts
-        ShiftInvite.objects.filter(status= 'PENDING', shift__status='EXPIRED').update(status='EXPIRED')
-
-        # delete applications for expired shifts
-        ShiftApplication.objects.filter(shift__status='EXPIRED').delete()
-
-        return True
-
-
-def process_expired_documents():
-
-        NOW = utc.localize(datetime.now())
-        # if now > shift.ending_at + delta:
-        archived_documents = EmployeeDocument.objects.filter(expired_at__isnull=False, expired_at__lte= NOW).update(status='ARCHIVED')
-        
-        #delete documents from cloudnary
-        deleted_documents = EmployeeDocument.objects.filter(status='DELETED')
-        for doc in deleted_documents:
-            cloudinary.uploader.destroy(doc.public_id)
-            doc.delete()
-
-        return archived_documents
\ No newline at end of file
+def process_expired_shifts(batch_size=shift_actions.EXPIRATION_BATCH_SIZE, full_scan=False):
+
+        summary = shift_actions.process_expired_shifts(batch_size=batch_size, full_scan=full_scan)
+        log_debug("hooks", "process_expired_shifts: {}".format(summary))
+
+        return summary
+
+
+def process_expired_documents(progress=None):
+
+        summary = document_storage.process_expired_documents(progress=progress)
+        log_debug("hooks", "process_expired_documents: {}".format(summary))
+
+        return summary
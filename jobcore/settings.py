@@ -83,6 +83,7 @@ ROLLBAR = {
 }
 
 MIDDLEWARE = [
+    'api.utils.middleware.PerformanceMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -191,10 +192,16 @@ JWT_AUTH = {
     'JWT_RESPONSE_PAYLOAD_HANDLER': 'api.utils.jwt.jwt_response_payload_handler',
 }
 
+# signing keys of the emailed links as "key_id:secret,old_key_id:old_secret", the first one signs
+LINK_TOKEN_KEYS = [tuple(key.split(':', 1)) for key in os.environ.get('LINK_TOKEN_KEYS', '').split(',') if key] \
+    or [('k0', SECRET_KEY)]
+# also save every emailed token as a UserToken row
+LINK_TOKEN_AUDIT = (os.environ.get('LINK_TOKEN_AUDIT') == 'TRUE')
+
 REST_FRAMEWORK = {
     'DEFAULT_VERSIONING_CLASS': 'rest_framework.versioning.NamespaceVersioning',
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_jwt.authentication.JSONWebTokenAuthentication',
+        'api.authentication.CachedJSONWebTokenAuthentication',
         'rest_framework.authentication.SessionAuthentication',
         'rest_framework.authentication.BasicAuthentication',
     ),
@@ -290,3 +297,39 @@ LOGGING = {
 }
 
 EMAIL_NOTIFICATIONS_ENABLED = (os.environ.get('ENABLE_NOTIFICATIONS') == 'TRUE')
+
+# who delivers the queued notifications, use api.utils.notification_queue.StubTransport to work offline
+NOTIFICATION_TRANSPORT = os.environ.get('NOTIFICATION_TRANSPORT', 'api.utils.notification_queue.DefaultTransport')
+
+# who sends the payroll payout charges, use api.utils.payouts.FakeTransport to work offline
+PAYOUT_TRANSPORT = os.environ.get('PAYOUT_TRANSPORT', 'api.utils.payouts.StripeTransport')
+
+# where the uploaded employee documents are kept, api.utils.document_storage.LocalStorage keeps them
+# in DOCUMENT_STORAGE_ROOT
+DOCUMENT_STORAGE = os.environ.get('DOCUMENT_STORAGE', 'api.utils.document_storage.CloudinaryStorage')
+DOCUMENT_STORAGE_ROOT = os.environ.get('DOCUMENT_STORAGE_ROOT', os.path.join(BASE_DIR, 'media', 'documents'))
+DOCUMENT_STORAGE_URL = os.environ.get('DOCUMENT_STORAGE_URL', '/media/documents/')
+
+# performance metrics of the requests, served at /metrics (see api.utils.metrics) only to the bearer of
+# METRICS_TOKEN, SERVER_TIMING_HEADER adds the timings to the responses for the browser tools
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+SERVER_TIMING_HEADER = (os.environ.get('SERVER_TIMING_HEADER') == 'TRUE')
+SLOW_REQUEST_MS = int(os.environ.get('SLOW_REQUEST_MS', 1000))
+
+# cache of the reference data endpoints (positions, badges, cities...), any django cache backend
+# works, for example django.core.cache.backends.filebased.FileBasedCache or a redis backend. The local
+# memory default is not shared by the processes, its TIMEOUT is how stale another process can be
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'reference': {
+        'BACKEND': os.environ.get('REFERENCE_CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('REFERENCE_CACHE_LOCATION', 'reference'),
+        'TIMEOUT': int(os.environ.get('REFERENCE_CACHE_TIMEOUT', 60)),
+    },
+    'principals': {
+        'BACKEND': os.environ.get('PRINCIPAL_CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('PRINCIPAL_CACHE_LOCATION', 'principals'),
+    },
+}
@@ -18,10 +18,13 @@ from django.urls import path, include
 from rest_framework import permissions
 from rest_framework.documentation import include_docs_urls
 
+from api.utils.metrics import metrics_view
+
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', include('api.urls')),
     path('admin_tools/', include('admin_tools.urls')),
+    path('metrics', metrics_view, name='metrics'),
     path('docs/', include_docs_urls(title='JobCore', description='JobCore main API',
                     authentication_classes=[],
                     permission_classes=(permissions.AllowAny,)))